@@ -1,20 +1,59 @@
-from flask import Blueprint, request, jsonify, current_app
+from flask import Blueprint, Response, request, jsonify, current_app, url_for
+import json
 import os
+import time
 import uuid
-from services.ocr_service import OCRService
-from services.nlp_service import NLPService
-from services.validation_service import ValidationService
-from utils.file_handler import allowed_file, save_file
+from datetime import datetime, timezone
+from services.pipeline import get_pipeline
+from services.resource_governor import ocr_lane, LANE_INTERACTIVE
+from services.history_store import get_history_store, HISTORY_FILTERS
+from services.job_queue import get_job_queue, serialize_job, QueueFullError
+from utils.file_handler import allowed_file, save_file, SpooledUpload
+from utils.request_utils import parse_bool_arg, parse_timestamp_arg
+from utils.metrics import current_request_id, request_trace, timed_stage
 
 term_sheet_blueprint = Blueprint('term_sheet', __name__)
-ocr_service = OCRService()
-nlp_service = NLPService()
-validation_service = ValidationService()
+
+# Seconds a client is asked to wait before resubmitting when the job queue is full
+QUEUE_FULL_RETRY_AFTER_SECONDS = 30
+
+def process_term_sheet(source, filename, progress_callback=None, reuse_duplicates=False):
+    """
+    Run OCR, NLP analysis and validation on a term sheet, given as a saved
+    file path or a SpooledUpload
+    """
+    processed = get_pipeline().process(source, filename, progress_callback, reuse_duplicates=reuse_duplicates)
+    
+    return {
+        'status': 'success',
+        'filename': filename,
+        'document_id': processed['document_id'],
+        'field_evidence': processed['field_evidence'],
+        'validation_results': processed['validation_results'],
+        'duplicates': processed['duplicates'],
+        'truncated': processed['truncated']
+    }
+
+def run_term_sheet_job(file_path, filename, progress_callback=None, reuse_duplicates=False):
+    """
+    Process a queued term sheet and remove the uploaded file afterwards
+    """
+    try:
+        return process_term_sheet(file_path, filename, progress_callback, reuse_duplicates)
+    finally:
+        if os.path.exists(file_path):
+            os.remove(file_path)
 
 @term_sheet_blueprint.route('/validate', methods=['POST'])
 def validate_term_sheet():
     """
     Endpoint to validate term sheets uploaded as files
+
+    With ?async=true the file is queued and a job id is returned immediately;
+    poll /jobs/<job_id> for progress and the result. With ?reuse=true a
+    resubmitted or near-duplicate document gets the result of the one it
+    duplicates instead of being validated again. Synchronous uploads are
+    OCR'd in the interactive lane, ahead of queued jobs.
     """
     # Check if file is present in the request
     if 'file' not in request.files:
@@ -27,61 +66,230 @@ def validate_term_sheet():
         return jsonify({'error': 'No selected file'}), 400
     
     if file and allowed_file(file.filename, current_app.config['ALLOWED_EXTENSIONS']):
-        # Generate a unique filename
-        filename = str(uuid.uuid4()) + os.path.splitext(file.filename)[1]
-        file_path = save_file(file, filename, current_app.config['UPLOAD_FOLDER'])
-        
-        # Process the file
-        try:
-            # Extract text from the file using OCR
-            extracted_text = ocr_service.extract_text(file_path)
-            
-            # Analyze the text using NLP
-            nlp_analysis = nlp_service.analyze_text(extracted_text)
-            
-            # Validate the term sheet
-            validation_results = validation_service.validate_term_sheet(nlp_analysis)
+        reuse_duplicates = parse_bool_arg(request.args.get('reuse'))
+        if parse_bool_arg(request.args.get('async')):
+            # Queued jobs outlive the request, so their upload is saved
+            # under a unique filename
+            filename = str(uuid.uuid4()) + os.path.splitext(file.filename)[1]
+            file_path = save_file(file, filename, current_app.config['UPLOAD_FOLDER'])
+            try:
+                job_id = get_job_queue().submit(run_term_sheet_job, file_path, file.filename,
+                                                reuse_duplicates=reuse_duplicates)
+            except QueueFullError as e:
+                os.remove(file_path)
+                response = jsonify({'error': str(e)})
+                response.headers['Retry-After'] = str(QUEUE_FULL_RETRY_AFTER_SECONDS)
+                return response, 503
             
             return jsonify({
-                'status': 'success',
-                'filename': file.filename,
-                'validation_results': validation_results
-            })
+                'job_id': job_id,
+                'status': 'queued',
+                'status_url': url_for('term_sheet.get_job', job_id=job_id)
+            }), 202
+        
+        # Process the file from memory, without saving it
+        try:
+            with SpooledUpload(file.stream, file.filename) as upload, ocr_lane(LANE_INTERACTIVE):
+                result = process_term_sheet(upload, file.filename, reuse_duplicates=reuse_duplicates)
+            with timed_stage('serialize'):
+                response = jsonify(result)
+            return response
         except Exception as e:
             return jsonify({'error': str(e)}), 500
     else:
         return jsonify({'error': 'File type not allowed'}), 400
 
+@term_sheet_blueprint.route('/validate-bundle', methods=['POST'])
+def validate_term_sheet_bundle():
+    """
+    Endpoint to validate a file holding many term sheets, such as a bundled
+    PDF or a trade blotter
+
+    The file is extracted, then split into term sheets that are validated
+    one at a time and streamed back as NDJSON: one line per term sheet,
+    followed by a summary line with counts by outcome. The file is OCR'd
+    in the interactive lane; Excel workbooks are read as the response is
+    streamed.
+    """
+    if 'file' not in request.files:
+        return jsonify({'error': 'No file part'}), 400
+    
+    file = request.files['file']
+    if file.filename == '':
+        return jsonify({'error': 'No selected file'}), 400
+    if not allowed_file(file.filename, current_app.config['ALLOWED_EXTENSIONS']):
+        return jsonify({'error': 'File type not allowed'}), 400
+    
+    # Closed by stream_bundle_results once the response is sent
+    upload = None
+    try:
+        upload = SpooledUpload(file.stream, file.filename)
+        with ocr_lane(LANE_INTERACTIVE):
+            document_hash, truncated, term_sheets = get_pipeline().process_bundle(upload, file.filename)
+    except Exception as e:
+        if upload is not None:
+            upload.close()
+        return jsonify({'error': str(e)}), 500
+    
+    return Response(stream_bundle_results(term_sheets, file.filename, document_hash, current_request_id(),
+                                          truncated, upload),
+                    mimetype='application/x-ndjson')
+
+def stream_bundle_results(term_sheets, filename, document_hash, request_id=None, truncated=None, upload=None):
+    """
+    Yield an NDJSON line for each validated term sheet of a bundle, then a
+    summary, and close upload, if given, at the end
+    """
+    started = time.perf_counter()
+    counts = {'term_sheets': 0, 'valid': 0, 'invalid': 0}
+    with request_trace(request_id):
+        try:
+            for term_sheet in term_sheets:
+                counts['term_sheets'] += 1
+                counts['valid' if term_sheet['validation_results']['is_valid'] else 'invalid'] += 1
+                yield json.dumps({'type': 'term_sheet', 'filename': filename, **term_sheet}) + '\n'
+        except Exception as e:
+            yield json.dumps({'type': 'error', 'filename': filename, 'error': str(e)}) + '\n'
+        finally:
+            # Also reached when the client disconnects mid-stream
+            if upload is not None:
+                upload.close()
+        
+        yield json.dumps({
+            'type': 'summary',
+            'filename': filename,
+            'document_hash': document_hash,
+            **counts,
+            'truncated': truncated,
+            'elapsed_seconds': round(time.perf_counter() - started, 3)
+        }) + '\n'
+
+@term_sheet_blueprint.route('/jobs/<job_id>', methods=['GET'])
+def get_job(job_id):
+    """
+    Endpoint to poll the status, progress and result of an asynchronous validation
+    """
+    job = get_job_queue().get(job_id)
+    if job is None:
+        return jsonify({'error': 'Job not found'}), 404
+    
+    return jsonify(serialize_job(job))
+
 @term_sheet_blueprint.route('/history', methods=['GET'])
 def get_validation_history():
     """
-    Endpoint to retrieve validation history
-    """
-    # In a real implementation, this would fetch from a database
-    # For now, returning a mock response
-    mock_history = [
-        {
-            'id': '1',
-            'filename': 'term_sheet_1.pdf',
-            'timestamp': '2023-05-15T10:30:00Z',
-            'status': 'VALID',
-            'risk_score': 0.2,
-            'issues': []
-        },
-        {
-            'id': '2',
-            'filename': 'term_sheet_2.pdf',
-            'timestamp': '2023-05-14T14:45:00Z',
-            'status': 'INVALID',
-            'risk_score': 0.8,
-            'issues': [
-                {'field': 'counterparty', 'severity': 'HIGH', 'description': 'Counterparty not found in approved list'},
-                {'field': 'trade_date', 'severity': 'MEDIUM', 'description': 'Trade date is in the past'}
-            ]
-        }
-    ]
-    
-    return jsonify({'history': mock_history})
+    Endpoint to retrieve validation history, newest first
+
+    Optional filters: status, counterparty, issuer, document_hash, and
+    since/until as ISO 8601 timestamps or epoch seconds. Pass the returned
+    next_cursor as ?cursor= to fetch the next page.
+    """
+    try:
+        limit = min(max(int(request.args.get('limit', 50)), 1), 500)
+        filters = {name: request.args.get(name) for name in HISTORY_FILTERS}
+        if filters['status']:
+            filters['status'] = filters['status'].lower()
+        rows, next_cursor = get_history_store().query(
+            limit=limit,
+            cursor=request.args.get('cursor'),
+            since=parse_timestamp_arg(request.args.get('since')),
+            until=parse_timestamp_arg(request.args.get('until')),
+            **filters)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    history = [{
+        'id': str(row['id']),
+        'filename': row['filename'],
+        'timestamp': datetime.fromtimestamp(row['created_at'], timezone.utc).strftime('%Y-%m-%dT%H:%M:%S.%f')[:-3] + 'Z',
+        'status': row['status'].upper(),
+        'risk_score': row['risk_score'],
+        'issues': row['issues'],
+        'document_hash': row['document_hash'],
+        'counterparty': row['counterparty'],
+        'issuer': row['issuer'],
+        'fields': row['fields'],
+        'timings': row['timings'],
+        'reference_data_version': row['reference_data_version']
+    } for row in rows]
+    
+    return jsonify({'history': history, 'next_cursor': next_cursor})
+
+@term_sheet_blueprint.route('/duplicates/<cluster_id>', methods=['GET'])
+def get_duplicate_cluster(cluster_id):
+    """
+    Endpoint to list the documents of a duplicate cluster, oldest first
+    """
+    dedup_index = get_pipeline().dedup_index
+    if dedup_index is None:
+        return jsonify({'error': 'Deduplication is disabled'}), 404
+    
+    members = dedup_index.cluster(cluster_id)
+    if not members:
+        return jsonify({'error': 'Cluster not found'}), 404
+    
+    return jsonify({
+        'cluster_id': cluster_id,
+        'documents': [{
+            'document_hash': member['document_hash'],
+            'filename': member['filename'],
+            'submissions': member['seen_count'],
+            'first_seen': datetime.fromtimestamp(member['created_at'], timezone.utc).strftime('%Y-%m-%dT%H:%M:%S.%f')[:-3] + 'Z'
+        } for member in members]
+    })
+
+@term_sheet_blueprint.route('/cache/stats', methods=['GET'])
+def get_cache_stats():
+    """
+    Endpoint to report extraction cache hit/miss counters
+    """
+    cache = get_pipeline().ocr_service.cache
+    if cache is None:
+        return jsonify({'enabled': False})
+    
+    return jsonify({'enabled': True, **cache.stats()})
+
+@term_sheet_blueprint.route('/pipeline', methods=['GET'])
+def get_pipeline_info():
+    """
+    Endpoint to report the shared pipeline settings and warm-up time
+    """
+    return jsonify(get_pipeline().describe())
+
+@term_sheet_blueprint.route('/reference-data', methods=['GET'])
+def get_reference_data():
+    """
+    Endpoint to report the reference data version in use
+    """
+    return jsonify(get_pipeline().validation_service.reference_store.current().describe())
+
+@term_sheet_blueprint.route('/documents/changes', methods=['GET'])
+def get_document_status_changes():
+    """
+    Endpoint to list documents whose status changed when they were
+    re-validated after a reference data change
+
+    Pass the last seen change id as ?after= to page through changes.
+    """
+    try:
+        after_id = int(request.args.get('after', 0))
+        limit = min(int(request.args.get('limit', 100)), 1000)
+    except ValueError:
+        return jsonify({'error': 'after and limit must be integers'}), 400
+    
+    changes = get_pipeline().validation_service.document_store.status_changes(after_id, limit)
+    return jsonify({
+        'changes': changes,
+        'next_after': changes[-1]['id'] if changes else after_id
+    })
+
+@term_sheet_blueprint.route('/rules/timings', methods=['GET'])
+def get_rule_timings():
+    """
+    Endpoint to report time spent in each validation rule
+    """
+    reference = get_pipeline().validation_service.reference_store.current()
+    return jsonify({'reference_data_version': reference.version, **reference.rule_engine.timing_stats()})
 
 @term_sheet_blueprint.route('/chat', methods=['POST'])
 def chat_with_agent():
@@ -103,7 +311,7 @@ def chat_with_agent():
     
     return jsonify({
         'response': response,
-        'timestamp': validation_service._get_current_timestamp()
+        'timestamp': get_pipeline().validation_service._get_current_timestamp()
     })
 
 def generate_chat_response(message, term_sheet_data, validation_results, chat_history):
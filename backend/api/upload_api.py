@@ -0,0 +1,120 @@
+from flask import Blueprint, request, jsonify, current_app, url_for
+import os
+from api.term_sheet_api import run_term_sheet_job, QUEUE_FULL_RETRY_AFTER_SECONDS
+from services.job_queue import get_job_queue, QueueFullError
+from services.pipeline import get_pipeline
+from services.upload_store import (get_upload_store, UploadNotFoundError, UploadOffsetError,
+                                   UploadSizeError)
+from utils.file_handler import allowed_file
+
+upload_blueprint = Blueprint('uploads', __name__)
+
+def run_chunked_upload_job(file_path, filename, prefetch, progress_callback=None):
+    """
+    Validate a finalized chunked upload once its background extraction, if
+    any, has finished, so that the extraction is served from the cache
+    """
+    if prefetch is not None:
+        prefetch.result()
+    return run_term_sheet_job(file_path, filename, progress_callback)
+
+@upload_blueprint.route('', methods=['POST'])
+def create_upload():
+    """
+    Endpoint to start a chunked upload
+
+    Request JSON: {"filename": ..., "size": <bytes>, "sha256": <optional hex digest>}
+    Send the file with PUT /<upload_id>?offset=<bytes already sent>, one
+    chunk of at most chunk_max_bytes per request, then POST /<upload_id>/finalize
+    """
+    data = request.get_json(silent=True) or {}
+    filename = data.get('filename')
+    if not filename or not allowed_file(filename, current_app.config['ALLOWED_EXTENSIONS']):
+        return jsonify({'error': 'File type not allowed'}), 400
+    try:
+        size = int(data.get('size'))
+    except (TypeError, ValueError):
+        return jsonify({'error': 'size must be the file size in bytes'}), 400
+
+    try:
+        status = get_upload_store().create(filename, size, data.get('sha256'))
+    except UploadSizeError as e:
+        return jsonify({'error': str(e)}), 413
+
+    status['upload_url'] = url_for('uploads.upload_chunk', upload_id=status['upload_id'])
+    return jsonify(status), 201
+
+@upload_blueprint.route('/<upload_id>', methods=['GET'])
+def get_upload(upload_id):
+    """
+    Endpoint to report how many bytes of an upload were received, for
+    resuming after a failed chunk
+    """
+    try:
+        return jsonify(get_upload_store().status(upload_id))
+    except UploadNotFoundError as e:
+        return jsonify({'error': str(e)}), 404
+
+@upload_blueprint.route('/<upload_id>', methods=['PUT'])
+def upload_chunk(upload_id):
+    """
+    Endpoint to append one chunk, sent as the raw request body, at ?offset=
+
+    Returns 409 with the expected offset when the chunk does not start
+    where the upload ends.
+    """
+    try:
+        offset = int(request.args.get('offset', request.headers.get('Upload-Offset', '')))
+    except ValueError:
+        return jsonify({'error': 'offset must be the number of bytes already sent'}), 400
+
+    ocr_service = get_pipeline().ocr_service
+    # Extracting early only pays off when finalize can pick the result up
+    prefetch = ocr_service.extract_text if ocr_service.cache is not None else None
+    try:
+        return jsonify(get_upload_store().write_chunk(upload_id, offset, request.stream, prefetch))
+    except UploadNotFoundError as e:
+        return jsonify({'error': str(e)}), 404
+    except UploadOffsetError as e:
+        return jsonify({'error': str(e), 'offset': e.offset}), 409
+    except UploadSizeError as e:
+        return jsonify({'error': str(e)}), 413
+
+@upload_blueprint.route('/<upload_id>/finalize', methods=['POST'])
+def finalize_upload(upload_id):
+    """
+    Endpoint to verify a complete upload and queue it for validation
+
+    Request JSON: {"sha256": <hex digest of the whole file>}, optional if
+    given when the upload was created. Returns a job id to poll at
+    /api/term-sheets/jobs/<job_id>.
+    """
+    job_queue = get_job_queue()
+    # Checked first so that a busy queue leaves the upload in place for a retry
+    if job_queue.pending_count() >= job_queue.max_pending:
+        response = jsonify({'error': 'Job queue is full'})
+        response.headers['Retry-After'] = str(QUEUE_FULL_RETRY_AFTER_SECONDS)
+        return response, 503
+
+    data = request.get_json(silent=True) or {}
+    try:
+        file_path, filename, prefetch = get_upload_store().finalize(upload_id, data.get('sha256'))
+    except UploadNotFoundError as e:
+        return jsonify({'error': str(e)}), 404
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    try:
+        job_id = job_queue.submit(run_chunked_upload_job, file_path, filename, prefetch)
+    except QueueFullError as e:
+        # Filled up since the check above; the upload has to be sent again
+        os.remove(file_path)
+        response = jsonify({'error': str(e)})
+        response.headers['Retry-After'] = str(QUEUE_FULL_RETRY_AFTER_SECONDS)
+        return response, 503
+
+    return jsonify({
+        'job_id': job_id,
+        'status': 'queued',
+        'status_url': url_for('term_sheet.get_job', job_id=job_id)
+    }), 202
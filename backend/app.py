@@ -1,10 +1,14 @@
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, g, Response
 from flask_cors import CORS
 import os
+import time
 from routes.api_routes import api_bp
 from api.term_sheet_api import term_sheet_blueprint
-from services.validation_service import ValidationService
+from api.upload_api import upload_blueprint
+from services.pipeline import get_pipeline
 from utils.file_handler import allowed_file, save_file
+from utils.metrics import (get_metrics_registry, start_trace, finish_trace, current_request_id,
+                           REQUEST_ID_HEADER, REQUEST_SECONDS)
 
 app = Flask(__name__)
 CORS(app)
@@ -19,11 +23,44 @@ os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
 
 # Register blueprints
 app.register_blueprint(term_sheet_blueprint, url_prefix='/api/term-sheets')
+app.register_blueprint(upload_blueprint, url_prefix='/api/term-sheets/uploads')
 app.register_blueprint(api_bp, url_prefix='/api')
 
+@app.before_request
+def start_request_trace():
+    # Every log line and stage timing of the request carries its id
+    g.request_started = time.perf_counter()
+    g.trace_token = start_trace(request.headers.get(REQUEST_ID_HEADER))
+
+@app.after_request
+def add_request_id(response):
+    g.response_status = response.status_code
+    response.headers[REQUEST_ID_HEADER] = current_request_id()
+    return response
+
+@app.teardown_request
+def finish_request_trace(error=None):
+    token = g.pop('trace_token', None)
+    if token is None:
+        return
+    finish_trace(token)
+    endpoint = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+    get_metrics_registry().observe(
+        REQUEST_SECONDS, (endpoint, request.method, str(g.get('response_status', 500))),
+        time.perf_counter() - g.request_started)
+
 @app.route('/health', methods=['GET'])
 def health_check():
     return jsonify({"status": "healthy", "service": "TermSheet Validation API"})
 
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """
+    Endpoint exposing request, stage and rule timing histograms to Prometheus
+    """
+    return Response(get_metrics_registry().render(), mimetype='text/plain; version=0.0.4')
+
 if __name__ == '__main__':
+    # Build and warm the shared pipeline before serving the first request
+    get_pipeline()
     app.run(debug=True, host='0.0.0.0', port=2000) 
\ No newline at end of file
@@ -0,0 +1,383 @@
+"""
+ASGI entry point for serving the API from an event loop:
+
+    uvicorn asgi:app --host 0.0.0.0 --port 2000
+
+Synchronous validations (POST /api/validate-term-sheet,
+POST /api/term-sheets/validate and the batch and bundle endpoints, which
+stream their results) run the Flask view in a pool of worker processes, so
+OCR, extraction and rule evaluation never hold the server process's GIL.
+Every other request goes to the Flask app on a pool of ASGI_THREAD_WORKERS
+threads, and stays responsive while validations and uploads run. At most
+ASGI_MAX_PENDING validations are accepted at a time; beyond that the server
+answers 429 with Retry-After instead of queueing without bound.
+
+Request bodies are never held in memory whole: a validation's body is
+written to a private temporary file whose path is passed to the worker, and
+other requests spool theirs to a SpooledTemporaryFile. Timings recorded in a
+worker are sent back with each response and merged into the server
+process's /metrics.
+"""
+import asyncio
+import multiprocessing
+import os
+import queue
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from urllib.parse import parse_qs
+from asgiref.sync import async_to_sync, sync_to_async
+from werkzeug.datastructures import Headers
+from werkzeug.test import EnvironBuilder, run_wsgi_app
+from app import app as flask_app
+from utils.request_utils import parse_bool_arg
+from utils.metrics import get_metrics_registry, new_request_id, log, REQUEST_ID_HEADER, REQUEST_SECONDS
+
+# Worker processes running validations
+ASGI_PROCESS_WORKERS = int(os.environ.get('ASGI_PROCESS_WORKERS', os.cpu_count() or 1))
+
+# Validations running or waiting for a worker before new ones get 429
+ASGI_MAX_PENDING = int(os.environ.get('ASGI_MAX_PENDING', 2 * ASGI_PROCESS_WORKERS))
+
+# Threads serving the requests that are not offloaded to worker processes
+ASGI_THREAD_WORKERS = int(os.environ.get('ASGI_THREAD_WORKERS', 32))
+
+# Request bodies of the threaded path up to this size stay in memory
+ASGI_SPOOL_MAX_BYTES = 1024 * 1024
+
+# Seconds a client is asked to wait before retrying a rejected validation
+BUSY_RETRY_AFTER_SECONDS = 5
+
+# How often a streamed response checks whether its worker has died
+STREAM_POLL_SECONDS = 1
+
+# Requests handled in the worker processes. With ?async=true these routes
+# only queue a job, so they stay on the Flask thread path.
+OFFLOADED_ROUTES = {
+    ('POST', '/api/validate-term-sheet'),
+    ('POST', '/api/term-sheets/validate'),
+}
+
+# Requests handled in the worker processes whose NDJSON responses are
+# streamed back to the client as the worker writes them
+STREAMED_ROUTES = {
+    ('POST', '/api/validate-term-sheet/batch'),
+    ('POST', '/api/term-sheets/validate-bundle'),
+}
+
+_threads = ThreadPoolExecutor(max_workers=ASGI_THREAD_WORKERS, thread_name_prefix='sheetwise-asgi')
+
+
+def _init_worker():
+    """
+    Build and warm the pipeline once per worker process. The pool is the
+    parallelism, so each worker OCRs the pages of a PDF serially.
+    """
+    from services.ocr_service import OCRService
+    from services.pipeline import init_pipeline
+    init_pipeline(ocr_service=OCRService(max_workers=1))
+
+
+def _request_info(scope):
+    """
+    Return the parts of an ASGI scope needed to rebuild the request in
+    another thread or process
+    """
+    return {
+        'method': scope['method'],
+        'path': scope['path'],
+        'root_path': scope.get('root_path', ''),
+        'scheme': scope.get('scheme', 'http'),
+        'query_string': scope.get('query_string', b'').decode('latin-1'),
+        'headers': [(name.decode('latin-1'), value.decode('latin-1')) for name, value in scope['headers']
+                    if name.lower() != b'content-length'],
+        'client': scope['client'][0] if scope.get('client') else ''
+    }
+
+
+def _build_environ(request, body, size):
+    """
+    Build the WSGI environ of a request from _request_info, reading its
+    body of size bytes from the binary stream body
+    """
+    path = request['path']
+    if request['root_path'] and path.startswith(request['root_path']):
+        path = path[len(request['root_path']):]
+    return EnvironBuilder(
+        method=request['method'],
+        path=path,
+        query_string=request['query_string'],
+        headers=Headers(request['headers']),
+        input_stream=body,
+        content_length=size,
+        multithread=True,
+        multiprocess=True,
+        environ_overrides={'REMOTE_ADDR': request['client'], 'SCRIPT_NAME': request['root_path'],
+                           'wsgi.url_scheme': request['scheme']}
+    ).get_environ()
+
+
+def _encode_headers(headers):
+    return [(name.lower().encode('latin-1'), value.encode('latin-1')) for name, value in headers]
+
+
+def _run_request(request, body_path):
+    """
+    Run one HTTP request, whose body was written to body_path, through the
+    Flask app in a worker process and return its status code, headers, body
+    and the metrics it recorded
+    """
+    with open(body_path, 'rb') as body:
+        environ = _build_environ(request, body, os.fstat(body.fileno()).st_size)
+        app_iter, status, headers = run_wsgi_app(flask_app, environ, buffered=True)
+        try:
+            response_body = b''.join(app_iter)
+        finally:
+            if hasattr(app_iter, 'close'):
+                app_iter.close()
+    metrics = get_metrics_registry().collect(reset=True)
+    return int(status.split(' ', 1)[0]), headers.to_wsgi_list(), response_body, metrics
+
+
+def _stream_request(request, body_path, messages):
+    """
+    Run one HTTP request, whose body was written to body_path, through the
+    Flask app in a worker process, putting its response on the messages
+    queue as it is produced: ('start', status code, headers), then ('body',
+    chunk) for each chunk, then ('end', metrics recorded)
+    """
+    with open(body_path, 'rb') as body:
+        _relay_response(flask_app, _build_environ(request, body, os.fstat(body.fileno()).st_size), messages)
+    messages.put(('end', get_metrics_registry().collect(reset=True)))
+
+
+def _relay_response(wsgi_app, environ, messages):
+    """
+    Run wsgi_app and put its status code and headers, then each chunk of
+    its response, on messages as _stream_request describes
+    """
+    app_iter, status, headers = run_wsgi_app(wsgi_app, environ)
+    try:
+        messages.put(('start', int(status.split(' ', 1)[0]), headers.to_wsgi_list()))
+        for chunk in app_iter:
+            if chunk:
+                messages.put(('body', chunk))
+    finally:
+        if hasattr(app_iter, 'close'):
+            app_iter.close()
+
+
+class _SendMessages:
+    """
+    Stand-in for the messages queue of _relay_response that sends each
+    message as ASGI events from a pool thread
+    """
+
+    def __init__(self, send):
+        self._send = async_to_sync(send)
+
+    def put(self, message):
+        if message[0] == 'start':
+            self._send({'type': 'http.response.start', 'status': message[1], 'headers': _encode_headers(message[2])})
+        else:
+            self._send({'type': 'http.response.body', 'body': message[1], 'more_body': True})
+
+
+async def _send_response(send, status, headers, body):
+    await send({
+        'type': 'http.response.start',
+        'status': status,
+        'headers': _encode_headers(headers)
+    })
+    await send({'type': 'http.response.body', 'body': body})
+
+
+class AsgiApp:
+    """
+    ASGI front end of the Flask app that offloads validations to a bounded
+    process pool
+    """
+
+    def __init__(self, wsgi_app, process_workers=ASGI_PROCESS_WORKERS, max_pending=ASGI_MAX_PENDING):
+        self.wsgi_app = wsgi_app
+        self.process_workers = process_workers
+        self.max_pending = max_pending
+        self.pending = 0
+        self._pool = None
+        self._manager = None
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self._lifespan(receive, send)
+        elif scope['type'] == 'http' and self._is_offloaded(scope):
+            await self._offload(scope, receive, send)
+        elif scope['type'] == 'http':
+            await self._run_threaded(scope, receive, send)
+        else:
+            raise ValueError(f"Unsupported ASGI scope type: {scope['type']}")
+
+    def _is_offloaded(self, scope):
+        route = (scope['method'], scope['path'])
+        if route in STREAMED_ROUTES:
+            return True
+        if route not in OFFLOADED_ROUTES:
+            return False
+        query = parse_qs(scope.get('query_string', b'').decode('latin-1'))
+        return not parse_bool_arg(query.get('async', [None])[0])
+
+    def _start_pool(self):
+        """
+        Start the worker processes and warm each one's pipeline
+
+        Workers are spawned rather than forked: the server process already
+        runs threads (history writer, reference data listeners) and holds
+        SQLite connections that must not be copied into children.
+        """
+        if self._pool is None:
+            context = multiprocessing.get_context('spawn')
+            self._pool = ProcessPoolExecutor(max_workers=self.process_workers, mp_context=context,
+                                             initializer=_init_worker)
+            # Relays the chunks of streamed responses from the workers
+            self._manager = context.Manager()
+        return self._pool
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                loop = asyncio.get_running_loop()
+                pool = self._start_pool()
+                # Start every worker now rather than on the first requests
+                await asyncio.gather(*[loop.run_in_executor(pool, os.getpid)
+                                       for _ in range(self.process_workers)])
+                log(f"Validation worker pool started with {self.process_workers} processes")
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                if self._pool is not None:
+                    self._pool.shutdown(wait=True, cancel_futures=True)
+                    self._pool = None
+                    self._manager.shutdown()
+                    self._manager = None
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    async def _run_threaded(self, scope, receive, send):
+        """
+        Run a request through the Flask app on the server's thread pool
+
+        asgiref's WsgiToAsgi runs the app with thread_sensitive=True, which
+        puts every request on one shared thread, so a slow upload would hold
+        up /health.
+        """
+        with tempfile.SpooledTemporaryFile(max_size=ASGI_SPOOL_MAX_BYTES) as body:
+            # Flask answers 413 itself from the declared length
+            size = await self._read_body(receive, body, limit=None)
+            body.seek(0)
+            environ = _build_environ(_request_info(scope), body, size)
+            await sync_to_async(_relay_response, thread_sensitive=False, executor=_threads)(
+                self.wsgi_app, environ, _SendMessages(send))
+        await send({'type': 'http.response.body', 'body': b''})
+
+    async def _offload(self, scope, receive, send):
+        limit = self.wsgi_app.config.get('MAX_CONTENT_LENGTH')
+        # Only the event loop thread touches the counter
+        if self.pending >= self.max_pending:
+            started = time.perf_counter()
+            # Drained without being kept, as clients only read the response
+            # once they have sent the whole request
+            await self._read_body(receive, None, limit)
+            request_id = new_request_id(dict(scope['headers']).get(REQUEST_ID_HEADER.lower().encode(),
+                                                                   b'').decode('latin-1'))
+            await _send_response(send, 429, [
+                ('Content-Type', 'application/json'),
+                ('Retry-After', str(BUSY_RETRY_AFTER_SECONDS)),
+                (REQUEST_ID_HEADER, request_id)
+            ], b'{"error": "Too many validations in progress, retry later"}')
+            get_metrics_registry().observe(REQUEST_SECONDS, (scope['path'], scope['method'], '429'),
+                                           time.perf_counter() - started)
+            return
+
+        self.pending += 1
+        # The worker reads the body from this file, so it is never pickled
+        fd, body_path = tempfile.mkstemp(prefix='sheetwise-request-')
+        try:
+            with os.fdopen(fd, 'wb') as body:
+                size = await self._read_body(receive, body, limit)
+            if size is None:
+                await _send_response(send, 413, [('Content-Type', 'application/json')],
+                                     b'{"error": "File too large"}')
+                return
+
+            request = _request_info(scope)
+            if (scope['method'], scope['path']) in STREAMED_ROUTES:
+                await self._stream(request, body_path, send)
+                return
+            loop = asyncio.get_running_loop()
+            status, headers, response_body, metrics = await loop.run_in_executor(
+                self._start_pool(), _run_request, request, body_path)
+            get_metrics_registry().merge(metrics)
+            await _send_response(send, status, headers, response_body)
+        finally:
+            self.pending -= 1
+            os.remove(body_path)
+
+    async def _stream(self, request, body_path, send):
+        """
+        Run a request in a worker process and send its response on as the
+        worker produces it
+        """
+        loop = asyncio.get_running_loop()
+        pool = self._start_pool()
+        messages = self._manager.Queue()
+        future = loop.run_in_executor(pool, _stream_request, request, body_path, messages)
+        started = False
+        while True:
+            try:
+                message = await loop.run_in_executor(_threads, messages.get, True, STREAM_POLL_SECONDS)
+            except queue.Empty:
+                if not future.done():
+                    continue
+                # The worker failed without finishing the response
+                error = future.exception()
+                log(f"Streamed request failed in its worker: {error}")
+                if not started:
+                    await _send_response(send, 500, [('Content-Type', 'application/json')],
+                                         b'{"error": "Validation worker failed"}')
+                else:
+                    await send({'type': 'http.response.body', 'body': b''})
+                return
+
+            if message[0] == 'start':
+                started = True
+                await send({'type': 'http.response.start', 'status': message[1],
+                            'headers': _encode_headers(message[2])})
+            elif message[0] == 'body':
+                await send({'type': 'http.response.body', 'body': message[1], 'more_body': True})
+            else:
+                get_metrics_registry().merge(message[1])
+                await send({'type': 'http.response.body', 'body': b''})
+                await future
+                return
+
+    async def _read_body(self, receive, target, limit):
+        """
+        Read the request body into the binary file target and return its
+        size, or None once it exceeds limit bytes. With target None the body
+        is read and discarded.
+        """
+        size = 0
+        while True:
+            message = await receive()
+            if message['type'] == 'http.disconnect':
+                raise asyncio.CancelledError('Client disconnected')
+            chunk = message.get('body', b'')
+            size += len(chunk)
+            if limit is not None and size > limit:
+                return None
+            if target is not None:
+                target.write(chunk)
+            if not message.get('more_body', False):
+                return size
+
+
+app = AsgiApp(flask_app)
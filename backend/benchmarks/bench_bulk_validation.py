@@ -0,0 +1,69 @@
+"""
+Benchmark bulk (column-wise) validation of a DataFrame of term sheets
+against validating the same records one at a time, and check that both
+paths return identical results.
+
+Run from the backend directory:
+
+    python -m benchmarks.bench_bulk_validation --records 200000
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+from datetime import datetime
+
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.bench_rule_engine import make_records
+from services.bulk_validation import BulkValidator
+from services.reference_data import get_reference_store
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--records', type=int, default=200000)
+    parser.add_argument('--missing-ratio', type=float, default=0.05)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    reference = get_reference_store().current()
+    records = make_records(args.records, random.Random(args.seed), args.missing_ratio)
+    frame = pd.DataFrame.from_records(records)
+    now = datetime.now()
+
+    # A fresh engine, so approved-list lookups start with a cold cache as
+    # they do after a reference data change
+    engine = type(reference.rule_engine)(reference.rules, reference.lists, timing=False)
+    started = time.perf_counter()
+    scalar = [engine.evaluate(record, now) for record in records]
+    scalar_scores = [engine.score(issues) for issues in scalar]
+    scalar_seconds = time.perf_counter() - started
+
+    started = time.perf_counter()
+    result = BulkValidator(reference).validate(frame, now)
+    bulk_seconds = time.perf_counter() - started
+
+    bulk = result.to_dicts()
+    for position, (issues, (risk_score, is_valid)) in enumerate(zip(scalar, scalar_scores)):
+        expected = {'is_valid': is_valid, 'risk_score': risk_score, 'issues': issues,
+                    'reference_data_version': reference.version}
+        if bulk[position] != expected:
+            raise AssertionError(f"Row {position} differs: {bulk[position]} != {expected}")
+
+    print(json.dumps({
+        'records': len(records),
+        'issues': len(result.issues),
+        'scalar_seconds': round(scalar_seconds, 3),
+        'bulk_seconds': round(bulk_seconds, 3),
+        'bulk_records_per_second': round(len(records) / bulk_seconds),
+        'speedup': round(scalar_seconds / bulk_seconds, 1)
+    }, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,141 @@
+"""
+Benchmark the duplicate index: lookup cost as it grows, and how well it
+tells resubmissions of a term sheet from other trades.
+
+Indexes --documents synthetic term sheets of --pages pages (the key terms
+page plus boilerplate clauses shared by all of them), timing fingerprinting
+and lookups at each of --checkpoints. Then looks up --probes variants of
+indexed term sheets and reports the share flagged as near-duplicates:
+
+- reformatted: the same text laid out as Word extraction does, one
+  paragraph per line with blank lines between them (should be flagged)
+- ocr_<rate>: characters misread at that rate, as from a re-scan (should
+  be flagged when no key term was misread; the share where none was is
+  reported as terms_intact)
+- amended: one boilerplate clause reworded; flagged when the change is as
+  small as a re-scan's, and validation, which only reads the extracted
+  fields, does not notice it either
+- new_trade: another term sheet on the same template (should not be flagged)
+
+Run from the backend directory:
+
+    python -m benchmarks.bench_dedup --documents 50000 --pages 3
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.dedup_index import DedupIndex, simhash, key_terms
+from services.nlp_service import NLPService
+from benchmarks.bench_reference_index import percentiles
+from benchmarks.corpus import make_term_sheet, load_reference_lists, render_txt
+
+OCR_RATES = (0.002, 0.005, 0.01, 0.02)
+
+# Characters Tesseract commonly confuses
+OCR_CONFUSIONS = {'e': 'c', 'c': 'e', 'l': 'I', 'I': 'l', 'o': '0', 'O': '0', '0': 'O', '1': 'l', '5': 'S',
+                  'S': '5', 'n': 'h', 'h': 'n', 'm': 'rn', 'a': 'o', 'i': 'l', 't': 'f', '8': 'B', 'B': '8'}
+
+
+def misread(text, rate, rng):
+    return ''.join(OCR_CONFUSIONS.get(char, char) if rng.random() < rate else char for char in text)
+
+
+def reformat(text):
+    return '\n\n'.join(' '.join(line.split()) for line in text.replace('\f', '\n').splitlines() if line.strip())
+
+
+def amend(text, rng):
+    sentences = [sentence for sentence in text.split('. ') if len(sentence) > 60]
+    sentence = rng.choice(sentences)
+    words = sentence.split(' ')
+    for _ in range(len(words) // 3):
+        words[rng.randrange(len(words))] = rng.choice(['not', 'prior', 'written', 'notice', 'each', 'other'])
+    return text.replace(sentence, ' '.join(words), 1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--documents', type=int, default=50000)
+    parser.add_argument('--pages', type=int, default=3)
+    parser.add_argument('--checkpoints', default='1000,10000,50000')
+    parser.add_argument('--probes', type=int, default=300)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    lists = load_reference_lists()
+    nlp_service = NLPService()
+    checkpoints = {int(value) for value in args.checkpoints.split(',')}
+
+    def make_document():
+        _, page_lines = make_term_sheet(rng, lists, args.pages)
+        return render_txt(page_lines).decode('utf-8')
+
+    report = {'documents': args.documents, 'pages': args.pages, 'lookups': {}, 'variants': {}}
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        index = DedupIndex(os.path.join(tmp_dir, 'dedup.db'))
+        texts = []
+        fingerprint_timings = []
+        add_timings = []
+        for position in range(args.documents):
+            text = make_document()
+            fields = nlp_service.analyze_text(text)
+            started = time.perf_counter()
+            fingerprint = simhash(text)
+            fingerprint_timings.append(time.perf_counter() - started)
+            started = time.perf_counter()
+            index.add(f"{position:064x}", f"term_sheet_{position}.txt", fingerprint, fields, {})
+            add_timings.append(time.perf_counter() - started)
+            if len(texts) < args.probes:
+                texts.append((f"{position:064x}", text, fields))
+
+            if position + 1 in checkpoints:
+                timings = []
+                for _ in range(100):
+                    probe = make_document()
+                    probe_fields = nlp_service.analyze_text(probe)
+                    started = time.perf_counter()
+                    index.find_near_duplicate(simhash(probe), probe_fields)
+                    timings.append(time.perf_counter() - started)
+                report['lookups'][position + 1] = percentiles(timings)
+        report['fingerprint'] = percentiles(fingerprint_timings)
+        report['add'] = percentiles(add_timings)
+
+        variants = {'reformatted': lambda text: reformat(text)}
+        for rate in OCR_RATES:
+            variants[f'ocr_{rate:g}'] = lambda text, rate=rate: misread(text, rate, rng)
+        if args.pages > 1:
+            variants['amended'] = lambda text: amend(text, rng)
+        variants['new_trade'] = lambda text: make_document()
+
+        for name, make_variant in variants.items():
+            flagged = 0
+            intact = 0
+            distances = []
+            for document_hash, text, fields in texts:
+                variant = make_variant(text)
+                variant_fields = nlp_service.analyze_text(variant)
+                terms_intact = key_terms(variant_fields) == key_terms(fields)
+                intact += terms_intact
+                match = index.find_near_duplicate(simhash(variant), variant_fields)
+                if match is not None:
+                    flagged += 1
+                    distances.append(match[1])
+            report['variants'][name] = {
+                'flagged': round(flagged / len(texts), 4),
+                'terms_intact': round(intact / len(texts), 4),
+                'mean_distance': round(sum(distances) / len(distances), 2) if distances else None
+            }
+
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,283 @@
+"""
+End-to-end benchmark over a synthetic term sheet corpus.
+
+Generates term sheets in every supported format and page count (see
+benchmarks/corpus.py), then times each stage on every document:
+
+- ocr: OCRService.extract_text, with the extraction cache disabled
+- nlp: NLPService.analyze_text on the extracted text
+- validation: ValidationService.validate_term_sheet on the extracted fields
+- http: POST /api/term-sheets/validate through the Flask test client
+
+Each format runs in its own interpreter, so the peak RSS reported for it
+(of the process, and of its largest child such as an OCR pool worker) is
+its own. Also reported per format and page count: throughput in documents
+per second, latency percentiles, how many documents fell back to the mock
+text (for example without Tesseract or poppler), and the share of key
+terms that field extraction recovered.
+
+The JSON report includes the commit and environment, so results can be
+compared across commits:
+
+    python -m benchmarks.bench_end_to_end --pages 1,10 --output before.json
+    git checkout <other commit>
+    python -m benchmarks.bench_end_to_end --pages 1,10 --baseline before.json
+
+Run from the backend directory.
+"""
+import argparse
+import io
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+from benchmarks.bench_reference_index import percentiles
+from benchmarks.corpus import FORMATS, generate_corpus, parse_page_counts
+
+STAGES = ('ocr', 'nlp', 'validation', 'http')
+
+# ru_maxrss is in kilobytes on Linux and bytes on macOS
+RU_MAXRSS_PER_MB = 1024 * 1024 if sys.platform == 'darwin' else 1024
+
+# Key terms compared against the corpus manifest for field_accuracy
+ACCURACY_FIELDS = ('trade_date', 'settlement_date', 'issuer', 'counterparty', 'product',
+                   'currency', 'principal_amount', 'maturity_date', 'governing_law')
+
+
+def peak_rss_mb():
+    """
+    Return the peak resident set size of this process in megabytes
+
+    On Linux this is VmHWM, since ru_maxrss carries over the peak of the
+    parent process across fork and exec.
+    """
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return round(int(line.split()[1]) / 1024, 1)
+    except OSError:
+        pass
+    return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / RU_MAXRSS_PER_MB, 1)
+
+
+def summarize(timings):
+    """
+    Return the throughput and latency percentiles of a list of timings
+    """
+    total = sum(timings)
+    return {
+        'documents': len(timings),
+        'throughput_per_s': round(len(timings) / total, 2) if total else None,
+        **percentiles(timings)
+    }
+
+
+def field_accuracy(extracted, expected):
+    matched = sum(1 for field in ACCURACY_FIELDS if extracted.get(field) == expected[field])
+    return matched / len(ACCURACY_FIELDS)
+
+
+def run_format(manifest, stages, rounds):
+    """
+    Run in a fresh interpreter: time every stage on the documents of one
+    format and return the results by page count
+    """
+    from app import app
+    from services.nlp_service import NLPService
+    from services.ocr_service import OCRService
+    from services.pipeline import get_pipeline
+    from services.validation_service import ValidationService
+
+    pipeline = get_pipeline()
+    ocr_service = OCRService(use_cache=False)
+    nlp_service = NLPService()
+    validation_service = ValidationService()
+    client = app.test_client()
+
+    by_pages = {}
+    for entry in manifest:
+        by_pages.setdefault(entry['pages'], []).append(entry)
+
+    results = {}
+    for pages, entries in sorted(by_pages.items()):
+        timings = {stage: [] for stage in stages}
+        fallbacks = 0
+        accuracy = []
+        for _ in range(rounds):
+            for entry in entries:
+                started = time.perf_counter()
+                text = ocr_service.extract_text(entry['path'])
+                extracted = time.perf_counter()
+                fields = nlp_service.analyze_text(text)
+                analyzed = time.perf_counter()
+                validation_service.validate_term_sheet(fields)
+                validated = time.perf_counter()
+                if 'ocr' in timings:
+                    timings['ocr'].append(extracted - started)
+                if 'nlp' in timings:
+                    timings['nlp'].append(analyzed - extracted)
+                if 'validation' in timings:
+                    timings['validation'].append(validated - analyzed)
+
+                if pipeline.is_mock_text(text):
+                    fallbacks += 1
+                else:
+                    accuracy.append(field_accuracy(fields, entry['fields']))
+
+                if 'http' in timings:
+                    with open(entry['path'], 'rb') as f:
+                        data = f.read()
+                    started = time.perf_counter()
+                    response = client.post('/api/term-sheets/validate',
+                                           data={'file': (io.BytesIO(data), os.path.basename(entry['path']))},
+                                           content_type='multipart/form-data')
+                    timings['http'].append(time.perf_counter() - started)
+                    if response.status_code != 200:
+                        raise RuntimeError(f"HTTP {response.status_code} for {entry['path']}: {response.data[:200]}")
+
+        results[str(pages)] = {
+            'bytes_mean': round(sum(entry['bytes'] for entry in entries) / len(entries)),
+            'fallbacks': fallbacks,
+            'field_accuracy': round(sum(accuracy) / len(accuracy), 4) if accuracy else None,
+            **{stage: summarize(values) for stage, values in timings.items()}
+        }
+
+    return {
+        'pages': results,
+        'peak_rss_mb': peak_rss_mb(),
+        # Largest child (OCR pool worker, Tesseract, pdftoppm), counting
+        # what it shared with this process when forked
+        'peak_rss_children_mb': round(resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / RU_MAXRSS_PER_MB, 1),
+        'pipeline': pipeline.describe()
+    }
+
+
+def run_format_subprocess(file_format, corpus_dir, stages, rounds, work_dir):
+    """
+    Benchmark one format in a subprocess with its own state directories
+    """
+    state_dir = os.path.join(work_dir, file_format)
+    output = subprocess.run(
+        [sys.executable, '-m', 'benchmarks.bench_end_to_end', '--format-worker', file_format,
+         '--corpus', corpus_dir, '--stages', ','.join(stages), '--rounds', str(rounds)],
+        cwd=BACKEND_DIR, capture_output=True, text=True,
+        env=dict(os.environ,
+                 # Every request does the full extraction
+                 EXTRACTION_CACHE_MAX_MB='0',
+                 REFERENCE_SNAPSHOT_DIR=os.path.join(state_dir, 'reference'),
+                 DOCUMENT_STORE_DB=os.path.join(state_dir, 'documents.db'),
+                 HISTORY_DB=os.path.join(state_dir, 'history.db'),
+                 JOB_QUEUE_DB=os.path.join(state_dir, 'jobs.db')))
+    if output.returncode != 0:
+        raise RuntimeError(f"Benchmark of {file_format} failed:\n{output.stderr[-4000:]}")
+    return json.loads(output.stdout.strip().splitlines()[-1])
+
+
+def environment():
+    """
+    Describe the commit and machine the benchmark ran on
+    """
+    def git(*args):
+        try:
+            return subprocess.run(['git', *args], cwd=BACKEND_DIR, capture_output=True, text=True,
+                                  check=True).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            return None
+
+    return {
+        'commit': git('rev-parse', 'HEAD'),
+        'dirty': bool(git('status', '--porcelain', '--untracked-files=no')),
+        'timestamp': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count()
+    }
+
+
+def compare(report, baseline):
+    """
+    Return the ratio of each stage's p50, p95 and throughput to the
+    baseline report's, for the formats and page counts both cover
+    """
+    comparison = {}
+    for file_format, result in report['formats'].items():
+        base_format = baseline.get('formats', {}).get(file_format)
+        if base_format is None:
+            continue
+        for pages, stages in result['pages'].items():
+            base_stages = base_format['pages'].get(pages)
+            if base_stages is None:
+                continue
+            for stage in STAGES:
+                if stage not in stages or stage not in base_stages:
+                    continue
+                current, base = stages[stage], base_stages[stage]
+                comparison[f'{file_format}/{pages}p/{stage}'] = {
+                    name: round(current[name] / base[name], 3) if current[name] and base[name] else None
+                    for name in ('p50_ms', 'p95_ms', 'throughput_per_s')
+                }
+        comparison[f'{file_format}/peak_rss_mb'] = round(result['peak_rss_mb'] / base_format['peak_rss_mb'], 3)
+    return comparison
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--formats', default=','.join(FORMATS))
+    parser.add_argument('--pages', default='1,5', help='comma-separated page counts')
+    parser.add_argument('--count', type=int, default=5, help='term sheets per format and page count')
+    parser.add_argument('--rounds', type=int, default=3, help='times each term sheet is processed')
+    parser.add_argument('--stages', default=','.join(STAGES))
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--corpus', help='existing corpus directory to reuse instead of generating one')
+    parser.add_argument('--output', help='also write the JSON report to this file')
+    parser.add_argument('--baseline', help='JSON report of an earlier run to compare against')
+    parser.add_argument('--format-worker', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    stages = [stage for stage in args.stages.split(',') if stage]
+
+    if args.format_worker:
+        with open(os.path.join(args.corpus, 'manifest.json')) as f:
+            manifest = [entry for entry in json.load(f) if entry['format'] == args.format_worker]
+        print(json.dumps(run_format(manifest, stages, args.rounds)))
+        return
+
+    formats = args.formats.split(',')
+    with tempfile.TemporaryDirectory() as work_dir:
+        corpus_dir = args.corpus
+        if corpus_dir is None:
+            corpus_dir = os.path.join(work_dir, 'corpus')
+            generate_corpus(corpus_dir, formats, parse_page_counts(args.pages), args.count, args.seed)
+
+        report = {
+            'environment': environment(),
+            'parameters': {'formats': formats, 'pages': args.pages, 'count': args.count,
+                           'rounds': args.rounds, 'stages': stages, 'seed': args.seed},
+            'formats': {}
+        }
+        for file_format in formats:
+            print(f"Benchmarking {file_format}", file=sys.stderr)
+            report['formats'][file_format] = run_format_subprocess(file_format, corpus_dir, stages,
+                                                                   args.rounds, work_dir)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            report['comparison'] = compare(report, json.load(f))
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
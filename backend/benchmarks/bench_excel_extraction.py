@@ -0,0 +1,163 @@
+"""
+Benchmark Excel extraction on a large multi-sheet trade blotter.
+
+Writes a workbook with a two-column term sheet on its first sheet and a
+trade blotter of --rows rows on each of --sheets further sheets, then
+extracts it, each in a fresh interpreter:
+
+- pandas: the previous extractor, pd.read_excel (first sheet only) and
+  DataFrame.to_string
+- pandas_all_sheets: the same over every sheet, which is what reading the
+  blotters with pandas would cost
+- streaming: WorkbookReader, as OCRService now uses
+
+and reports the time taken, peak RSS, length of the extracted text and
+the share of the term sheet's key terms found in it.
+
+Run from the backend directory:
+
+    python -m benchmarks.bench_excel_extraction --rows 100000
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import zipfile
+from datetime import datetime, timedelta
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+from benchmarks.bench_end_to_end import field_accuracy, peak_rss_mb
+
+METHODS = ('pandas', 'pandas_all_sheets', 'streaming')
+
+TERM_SHEET = [
+    ('Trade Date', datetime(2024, 3, 1)),
+    ('Settlement Date', datetime(2024, 3, 5)),
+    ('Issuer', 'Barclays Bank PLC'),
+    ('Counterparty', 'Acme Corporation'),
+    ('Product', 'Fixed Rate Note'),
+    ('Principal Amount', 'USD 25,000,000'),
+    ('Maturity Date', datetime(2029, 3, 5)),
+    ('Coupon Rate', 0.0425),
+    ('Governing Law', 'English Law'),
+]
+
+EXPECTED_FIELDS = {
+    'trade_date': '2024-03-01',
+    'settlement_date': '2024-03-05',
+    'issuer': 'Barclays Bank PLC',
+    'counterparty': 'Acme Corporation',
+    'product': 'Fixed Rate Note',
+    'currency': 'USD',
+    'principal_amount': 25000000.0,
+    'maturity_date': '2029-03-05',
+    'governing_law': 'English Law',
+}
+
+BLOTTER_COLUMNS = ('Trade ID', 'Trade Date', 'Counterparty', 'Product', 'Currency', 'Notional', 'Rate', 'Book')
+
+
+def write_workbook(path, rows, sheets):
+    from openpyxl import Workbook
+    from openpyxl.cell import WriteOnlyCell
+
+    workbook = Workbook(write_only=True)
+    term_sheet = workbook.create_sheet('Term Sheet')
+    for label, value in TERM_SHEET:
+        cell = WriteOnlyCell(term_sheet, value)
+        if label == 'Coupon Rate':
+            cell.number_format = '0.00%'
+        term_sheet.append([label, cell])
+
+    start = datetime(2024, 1, 1)
+    for number in range(sheets):
+        blotter = workbook.create_sheet(f'Blotter {number + 1}')
+        blotter.append(BLOTTER_COLUMNS)
+        for row in range(rows):
+            blotter.append([f'T{number}-{row:07d}', start + timedelta(days=row % 365),
+                            f'Counterparty {row % 250}', 'Interest Rate Swap', 'EUR',
+                            1000000 * (1 + row % 50), 0.01 + (row % 400) / 10000, f'BOOK{row % 12}'])
+    workbook.save(path)
+    add_dimensions(path, [len(TERM_SHEET)] + [rows + 1] * sheets, [2] + [len(BLOTTER_COLUMNS)] * sheets)
+
+
+def add_dimensions(path, rows, columns):
+    """
+    Add the <dimension> element that Excel writes, and openpyxl's write-only
+    mode leaves out, to each sheet; without it openpyxl scans every sheet
+    once just to size it when opening the workbook read-only
+    """
+    from openpyxl.utils import get_column_letter
+
+    rewritten = path + '.tmp'
+    with zipfile.ZipFile(path) as source, zipfile.ZipFile(rewritten, 'w', zipfile.ZIP_DEFLATED) as target:
+        for item in source.infolist():
+            data = source.read(item.filename)
+            if item.filename.startswith('xl/worksheets/sheet'):
+                index = int(item.filename[len('xl/worksheets/sheet'):-len('.xml')]) - 1
+                dimension = f'<dimension ref="A1:{get_column_letter(columns[index])}{rows[index]}"/>'
+                data = data.replace(b'<sheetViews>', dimension.encode() + b'<sheetViews>', 1)
+            target.writestr(item, data)
+    os.replace(rewritten, path)
+
+
+def run_method(method, path):
+    """
+    Run in a fresh interpreter: extract the workbook with one method
+    """
+    from services.nlp_service import NLPService
+
+    started = time.perf_counter()
+    if method == 'pandas':
+        import pandas as pd
+        text = pd.read_excel(path).to_string()
+    elif method == 'pandas_all_sheets':
+        import pandas as pd
+        text = '\n'.join(frame.to_string() for frame in pd.read_excel(path, sheet_name=None).values())
+    else:
+        from services.excel_reader import WorkbookReader
+        text = WorkbookReader().read_text(path)
+    seconds = time.perf_counter() - started
+
+    return {
+        'seconds': round(seconds, 3),
+        'peak_rss_mb': peak_rss_mb(),
+        'text_chars': len(text),
+        'field_accuracy': round(field_accuracy(NLPService().analyze_text(text), EXPECTED_FIELDS), 4)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=100000, help='rows per blotter sheet')
+    parser.add_argument('--sheets', type=int, default=2, help='blotter sheets')
+    parser.add_argument('--methods', default=','.join(METHODS))
+    parser.add_argument('--method-worker', help=argparse.SUPPRESS)
+    parser.add_argument('--workbook', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.method_worker:
+        print(json.dumps(run_method(args.method_worker, args.workbook)))
+        return
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        path = os.path.join(work_dir, 'blotter.xlsx')
+        write_workbook(path, args.rows, args.sheets)
+        report = {'rows': args.rows, 'sheets': args.sheets, 'bytes': os.path.getsize(path), 'methods': {}}
+        for method in args.methods.split(','):
+            output = subprocess.run(
+                [sys.executable, '-m', 'benchmarks.bench_excel_extraction', '--method-worker', method,
+                 '--workbook', path],
+                cwd=BACKEND_DIR, capture_output=True, text=True, check=True)
+            report['methods'][method] = json.loads(output.stdout.strip().splitlines()[-1])
+
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
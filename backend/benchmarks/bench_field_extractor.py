@@ -0,0 +1,165 @@
+"""
+Micro-benchmark of the compiled FieldExtractor against the previous
+NLPService implementation, which ran one uncompiled re.search per field.
+
+Run from the backend directory:
+
+    python -m benchmarks.bench_field_extractor --sizes 0.1 1 10 --repeat 5
+"""
+import argparse
+import json
+import os
+import random
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.field_extractor import DEFAULT_FIELD_EXTRACTOR
+
+FIELD_LINES = [
+    "Trade Date: 2023-06-15",
+    "Settlement Date: 2023-06-20",
+    "Issuer: Barclays Bank PLC",
+    "Counterparty: Acme Corporation",
+    "Product: Fixed Rate Note",
+    "Principal Amount: USD 10,000,000",
+    "Maturity Date: 2028-06-15",
+    "Coupon Rate: 5.25% per annum",
+    "Coupon Payment Frequency: Semi-annual",
+    "Governing Law: English Law",
+    "Risk Disclosure: The investment involves market risk and may result in loss of principal.",
+]
+
+# Includes colons (times of day, section references) as found in real OCR output
+FILLER_WORDS = ("the issuer shall pay coupon amounts on each interest payment date subject to "
+                "the business day convention at 11:00 London time and the terms of the "
+                "programme memorandum Note: section 4.2:").split()
+
+
+def legacy_analyze_text(text):
+    """
+    The field extraction of NLPService.analyze_text before FieldExtractor
+    """
+    term_sheet_data = {}
+
+    trade_date_match = re.search(r'Trade Date:\s*(\d{4}-\d{2}-\d{2})', text)
+    if trade_date_match:
+        term_sheet_data['trade_date'] = trade_date_match.group(1)
+
+    settlement_date_match = re.search(r'Settlement Date:\s*(\d{4}-\d{2}-\d{2})', text)
+    if settlement_date_match:
+        term_sheet_data['settlement_date'] = settlement_date_match.group(1)
+
+    issuer_match = re.search(r'Issuer:\s*([^\n]+)', text)
+    if issuer_match:
+        term_sheet_data['issuer'] = issuer_match.group(1).strip()
+
+    counterparty_match = re.search(r'Counterparty:\s*([^\n]+)', text)
+    if counterparty_match:
+        term_sheet_data['counterparty'] = counterparty_match.group(1).strip()
+
+    product_match = re.search(r'Product:\s*([^\n]+)', text)
+    if product_match:
+        term_sheet_data['product'] = product_match.group(1).strip()
+
+    principal_match = re.search(r'Principal Amount:\s*([^\n]+)', text)
+    if principal_match:
+        principal_text = principal_match.group(1).strip()
+        currency_amount_match = re.search(r'([A-Z]{3})\s*([\d,]+(?:\.\d+)?)', principal_text)
+        if currency_amount_match:
+            term_sheet_data['currency'] = currency_amount_match.group(1)
+            amount_str = currency_amount_match.group(2).replace(',', '')
+            term_sheet_data['principal_amount'] = float(amount_str)
+
+    maturity_date_match = re.search(r'Maturity Date:\s*(\d{4}-\d{2}-\d{2})', text)
+    if maturity_date_match:
+        term_sheet_data['maturity_date'] = maturity_date_match.group(1)
+
+    coupon_rate_match = re.search(r'Coupon Rate:\s*([\d.]+)%', text)
+    if coupon_rate_match:
+        term_sheet_data['coupon_rate'] = float(coupon_rate_match.group(1))
+
+    coupon_frequency_match = re.search(r'Coupon Payment Frequency:\s*([^\n]+)', text)
+    if coupon_frequency_match:
+        term_sheet_data['coupon_frequency'] = coupon_frequency_match.group(1).strip()
+
+    governing_law_match = re.search(r'Governing Law:\s*([^\n]+)', text)
+    if governing_law_match:
+        term_sheet_data['governing_law'] = governing_law_match.group(1).strip()
+
+    risk_disclosure_match = re.search(r'Risk Disclosure:\s*([^\n]+)', text)
+    if risk_disclosure_match:
+        term_sheet_data['risk_disclosure'] = risk_disclosure_match.group(1).strip()
+
+    return term_sheet_data
+
+
+def make_document(size_bytes, rng, missing=0):
+    """
+    Build a synthetic OCR-like document of roughly size_bytes with the field
+    lines scattered through filler text. The last `missing` fields are left
+    out, which forces a full scan for them.
+    """
+    field_lines = FIELD_LINES[:len(FIELD_LINES) - missing]
+    filler_lines = []
+    length = 0
+    while length < size_bytes:
+        line = ' '.join(rng.choice(FILLER_WORDS) for _ in range(12))
+        filler_lines.append(line)
+        length += len(line) + 1
+
+    for line in field_lines:
+        filler_lines.insert(rng.randrange(len(filler_lines) + 1), line)
+    return '\n'.join(filler_lines)
+
+
+def best_of(func, text, repeat):
+    """
+    Return the fastest of `repeat` timed calls in seconds
+    """
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func(text)
+        timings.append(time.perf_counter() - started)
+    return min(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=float, nargs='+', default=[0.01, 0.1, 1, 10],
+                        help='document sizes in MB')
+    parser.add_argument('--missing', type=int, default=0,
+                        help='fields left out of each document; a missing field also '
+                             'costs a search for each of its synonyms')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    results = []
+    for size_mb in args.sizes:
+        text = make_document(int(size_mb * 1024 * 1024), rng, args.missing)
+
+        legacy = legacy_analyze_text(text)
+        current = DEFAULT_FIELD_EXTRACTOR.extract(text)
+        if legacy != current:
+            raise AssertionError(f"Extraction differs for {size_mb} MB document: {legacy} != {current}")
+
+        legacy_seconds = best_of(legacy_analyze_text, text, args.repeat)
+        current_seconds = best_of(DEFAULT_FIELD_EXTRACTOR.extract, text, args.repeat)
+        results.append({
+            'size_mb': size_mb,
+            'fields_found': len(current),
+            'legacy_ms': round(legacy_seconds * 1000, 3),
+            'field_extractor_ms': round(current_seconds * 1000, 3),
+            'speedup': round(legacy_seconds / current_seconds, 2) if current_seconds else None
+        })
+
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,109 @@
+"""
+Benchmark HistoryStore writes and paginated, filtered history queries.
+
+Records synthetic validations through record(), so the write rate includes
+the batching writer thread, then pages through the history with and
+without filters. Deep pages should cost the same as the first one.
+
+Run from the backend directory:
+
+    python -m benchmarks.bench_history_store --rows 200000 --pages 200
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.history_store import HistoryStore, HISTORY_QUEUE_SIZE
+from benchmarks.bench_reference_index import percentiles
+from benchmarks.bench_rule_engine import FIELD_VALUES
+
+STATUSES = ['valid', 'warning', 'invalid']
+
+
+def make_validation(rng):
+    """
+    Return synthetic (fields, validation_results) for one term sheet
+    """
+    fields = {field: rng.choice(values) for field, values in FIELD_VALUES.items()}
+    status = rng.choice(STATUSES)
+    issues = [] if status == 'valid' else [{
+        'rule_id': 'counterparty_check',
+        'description': f"Counterparty '{fields['counterparty']}' is not on the approved list",
+        'severity': 'HIGH' if status == 'invalid' else 'LOW'
+    }]
+    return fields, {
+        'is_valid': status != 'invalid',
+        'risk_score': round(rng.random(), 4),
+        'issues': issues,
+        'reference_data_version': '2024.2+0123456789ab'
+    }
+
+
+def time_pages(store, pages, limit, **filters):
+    """
+    Follow next_cursor for up to `pages` pages and return the per-page
+    timings and the number of rows read
+    """
+    timings = []
+    rows_read = 0
+    cursor = None
+    for _ in range(pages):
+        started = time.perf_counter()
+        rows, cursor = store.query(limit=limit, cursor=cursor, **filters)
+        timings.append(time.perf_counter() - started)
+        rows_read += len(rows)
+        if cursor is None:
+            break
+    return timings, rows_read
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=200000)
+    parser.add_argument('--pages', type=int, default=200)
+    parser.add_argument('--limit', type=int, default=50)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    validations = [make_validation(rng) for _ in range(args.rows)]
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        store = HistoryStore(os.path.join(tmp_dir, 'history.db'))
+        started = time.perf_counter()
+        for position, (fields, results) in enumerate(validations):
+            store.record(f"{position:064x}", f"term_sheet_{position}.pdf", fields, results,
+                         {'total_ms': 1.0})
+            # Stay under the queue bound so no row is dropped
+            if position % (HISTORY_QUEUE_SIZE // 2) == 0:
+                store.flush()
+        store.flush()
+        write_seconds = time.perf_counter() - started
+
+        counterparty = FIELD_VALUES['counterparty'][0]
+        report = {
+            'rows': args.rows,
+            'dropped': store.dropped,
+            'written_rows_per_second': round(args.rows / write_seconds),
+            'queries': {}
+        }
+        for name, filters in [('unfiltered', {}),
+                              ('status', {'status': 'invalid'}),
+                              ('counterparty', {'counterparty': counterparty}),
+                              ('status_since', {'status': 'warning', 'since': time.time() - 3600})]:
+            timings, rows_read = time_pages(store, args.pages, args.limit, **filters)
+            report['queries'][name] = dict(percentiles(timings), pages=len(timings), rows=rows_read,
+                                           last_page_ms=round(timings[-1] * 1000, 4))
+        store.close()
+
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
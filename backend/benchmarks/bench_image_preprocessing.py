@@ -0,0 +1,172 @@
+"""
+Benchmark OCR of page images with and without preprocessing.
+
+Renders key-terms pages of synthetic term sheets (benchmarks/corpus.py) in
+several scan conditions: clean, skewed by a known angle, speckled, framed
+by a dark scanner border, shaded across the page, photographed at a high
+resolution, and blank. For each condition it reports, before (raw image)
+and after preprocessing:
+
+- pixels sent to Tesseract per page
+- OCR time per page, and preprocessing time
+- field-extraction hit rate: the share of key terms NLPService recovers
+  from the OCR text
+
+plus how far the corrected skew is from the applied one and whether blank
+pages were detected. OCR time and hit rate need Tesseract and are null
+without it.
+
+Run from the backend directory:
+
+    python -m benchmarks.bench_image_preprocessing --pages 10
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+from PIL import Image, ImageDraw
+
+from benchmarks.bench_end_to_end import field_accuracy
+from benchmarks.corpus import PAGE_WIDTH, PAGE_HEIGHT, load_reference_lists, make_term_sheet, render_page_image
+
+# Resolution the corpus renders pages at
+RENDER_DPI = 200
+
+
+def skewed(image, rng):
+    angle = rng.uniform(-4, 4)
+    return image.rotate(angle, resample=Image.BILINEAR, fillcolor=255), angle
+
+
+def speckled(image, rng):
+    return render_noise(image, rng), 0.0
+
+
+def render_noise(image, rng):
+    pixels = np.array(image)
+    count = pixels.size // 500
+    rows = np.array([rng.randrange(pixels.shape[0]) for _ in range(count)])
+    cols = np.array([rng.randrange(pixels.shape[1]) for _ in range(count)])
+    pixels[rows, cols] = 90
+    return Image.fromarray(pixels)
+
+
+def bordered(image, rng):
+    image = image.copy()
+    draw = ImageDraw.Draw(image)
+    draw.rectangle((0, 0, PAGE_WIDTH - 1, rng.randrange(40, 120)), fill=25)
+    draw.rectangle((0, 0, rng.randrange(40, 120), PAGE_HEIGHT - 1), fill=25)
+    return image, 0.0
+
+
+def shaded(image, rng):
+    gradient = np.linspace(rng.uniform(0.35, 0.55), 1.0, PAGE_WIDTH, dtype=np.float32)
+    return Image.fromarray((np.asarray(image) * gradient[None, :]).astype(np.uint8)), 0.0
+
+
+def high_resolution(image, rng):
+    # A 600 dpi scan or phone photo of the same page
+    return image.resize((PAGE_WIDTH * 3, PAGE_HEIGHT * 3), Image.BICUBIC), 0.0
+
+
+CONDITIONS = {
+    'clean': lambda image, rng: (image, 0.0),
+    'skewed': skewed,
+    'speckled': speckled,
+    'bordered': bordered,
+    'shaded': shaded,
+    'high_resolution': high_resolution,
+}
+
+# Source resolution of each condition's images, for the raw OCR path
+CONDITION_DPI = {'high_resolution': RENDER_DPI * 3}
+
+
+def tesseract_available():
+    try:
+        import pytesseract
+        pytesseract.get_tesseract_version()
+        return True
+    except Exception:
+        return False
+
+
+def summarize(values):
+    if not values:
+        return None
+    values = sorted(values)
+    return {
+        'mean': round(sum(values) / len(values), 4),
+        'p50': round(values[len(values) // 2], 4),
+        'max': round(values[-1], 4)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--pages', type=int, default=10, help='pages per condition')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    from services.image_preprocessing import ImagePreprocessor, estimate_skew
+    from services.nlp_service import NLPService
+    from services.ocr_service import _ocr_image
+
+    preprocessor = ImagePreprocessor()
+    nlp_service = NLPService()
+    lists = load_reference_lists()
+    has_tesseract = tesseract_available()
+
+    report = {'tesseract': has_tesseract, 'conditions': {}}
+    for condition, degrade in CONDITIONS.items():
+        rng = random.Random(f'{args.seed}-{condition}')
+        results = {'raw': {'pixels': [], 'ocr_ms': [], 'hit_rate': []},
+                   'preprocessed': {'pixels': [], 'preprocess_ms': [], 'ocr_ms': [], 'hit_rate': []},
+                   'skew_error_degrees': []}
+        for _ in range(args.pages):
+            fields, page_lines = make_term_sheet(rng, lists, 1)
+            image, angle = degrade(render_page_image(page_lines[0]), rng)
+
+            started = time.perf_counter()
+            page, details = preprocessor.process(image, CONDITION_DPI.get(condition, RENDER_DPI))
+            results['preprocessed']['preprocess_ms'].append((time.perf_counter() - started) * 1000)
+            results['raw']['pixels'].append(image.width * image.height)
+            results['preprocessed']['pixels'].append(page.width * page.height if page is not None else 0)
+            if angle:
+                # The skew left after correction, measured on the output
+                residual = estimate_skew(np.asarray(page) < 128, preprocessor.deskew_max_angle)
+                results['skew_error_degrees'].append(abs(residual))
+
+            if has_tesseract:
+                for mode, mode_preprocessor in (('raw', None), ('preprocessed', preprocessor)):
+                    result = _ocr_image(image, CONDITION_DPI.get(condition, RENDER_DPI), mode_preprocessor)
+                    results[mode]['ocr_ms'].append(result['ocr_seconds'] * 1000)
+                    results[mode]['hit_rate'].append(field_accuracy(nlp_service.analyze_text(result['text']),
+                                                                    fields))
+
+        report['conditions'][condition] = {
+            mode: {name: summarize(values) for name, values in results[mode].items()}
+            for mode in ('raw', 'preprocessed')
+        }
+        report['conditions'][condition]['skew_error_degrees'] = summarize(results['skew_error_degrees'])
+
+    # Blank pages: scanner noise only, which should never reach Tesseract
+    rng = random.Random(f'{args.seed}-blank')
+    detected = 0
+    for _ in range(args.pages):
+        blank = render_noise(Image.new('L', (PAGE_WIDTH, PAGE_HEIGHT), 255), rng)
+        page, details = preprocessor.process(blank, RENDER_DPI)
+        detected += page is None
+    report['blank_pages'] = {'pages': args.pages, 'detected': detected}
+
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,69 @@
+"""
+Benchmark the overhead of stage timing instrumentation on validation
+requests.
+
+Small text term sheets are posted to POST /api/term-sheets/validate through
+the Flask test client, alternating between requests with METRICS_ENABLED
+on and off, so both see the same document and history store sizes. Text
+documents are the cheapest to process, so this is the worst case for the
+relative overhead. Also reports the time to render /metrics afterwards.
+
+Run from the backend directory:
+
+    python -m benchmarks.bench_metrics --requests 2000
+"""
+import argparse
+import io
+import json
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.bench_reference_index import percentiles
+from benchmarks.bench_pipeline import TERM_SHEET_TEXT
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--requests', type=int, default=2000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        os.environ.update(EXTRACTION_CACHE_DIR=os.path.join(work_dir, 'extractions'),
+                          REFERENCE_SNAPSHOT_DIR=os.path.join(work_dir, 'reference'),
+                          DOCUMENT_STORE_DB=os.path.join(work_dir, 'documents.db'),
+                          HISTORY_DB=os.path.join(work_dir, 'history.db'))
+        from app import app
+        from services.pipeline import get_pipeline
+        from utils import metrics
+
+        get_pipeline()
+        client = app.test_client()
+        timings = {'metrics_off': [], 'metrics_on': []}
+        for position in range(args.requests * 2):
+            enabled = position % 2 == 1
+            metrics.METRICS_ENABLED = enabled
+            # Distinct documents so that none is served from the extraction cache
+            body = TERM_SHEET_TEXT.format(reference=position).encode('utf-8')
+            started = time.perf_counter()
+            response = client.post('/api/term-sheets/validate',
+                                   data={'file': (io.BytesIO(body), 'term_sheet.txt')},
+                                   content_type='multipart/form-data')
+            timings['metrics_on' if enabled else 'metrics_off'].append(time.perf_counter() - started)
+            assert response.status_code == 200, response.data
+
+        started = time.perf_counter()
+        exposition = client.get('/metrics').data
+        render_seconds = time.perf_counter() - started
+
+        report = {name: percentiles(values) for name, values in timings.items()}
+        report['metrics_render'] = {'ms': round(render_seconds * 1000, 3), 'bytes': len(exposition)}
+
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
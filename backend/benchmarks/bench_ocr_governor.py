@@ -0,0 +1,105 @@
+"""
+Benchmark how the OCR governor shares Tesseract slots between batch jobs
+and interactive uploads.
+
+--batch-jobs batch documents of --batch-pages pages each, as from queued
+jobs and batch uploads, are OCR'd --workers pages at a time, as OCRService
+does over its process pool, while interactive documents of
+--interactive-pages pages arrive every --interval seconds. Each page holds
+a slot for --page-seconds, standing in for a Tesseract run, which happens in
+a child process and does not hold the GIL. Reports the latency of the
+interactive documents and the batch throughput with priority lanes, and
+with every document in one lane (first come, first served):
+
+    python -m benchmarks.bench_ocr_governor --slots 4 --batch-jobs 4 --batch-pages 300
+"""
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.resource_governor import OCRGovernor, LANE_BATCH, LANE_INTERACTIVE
+from benchmarks.bench_reference_index import percentiles
+
+
+def ocr_document(governor, lane, pages, workers, page_seconds):
+    """
+    OCR a simulated document, keeping at most workers pages in flight
+    """
+    def ocr_page(_):
+        governor.acquire(lane)
+        try:
+            time.sleep(page_seconds)
+        finally:
+            governor.release()
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        list(pool.map(ocr_page, range(pages)))
+
+
+def run(args, interactive_lane):
+    governor = OCRGovernor(args.slots)
+    batch_done = threading.Event()
+
+    def run_batch():
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=args.batch_jobs) as jobs:
+            for _ in range(args.batch_jobs):
+                jobs.submit(ocr_document, governor, LANE_BATCH, args.batch_pages, args.workers, args.page_seconds)
+        run_batch.seconds = time.perf_counter() - started
+        batch_done.set()
+
+    batch = threading.Thread(target=run_batch)
+    batch.start()
+    # Let the batch jobs fill every slot and queue their next pages
+    time.sleep(args.page_seconds)
+
+    latencies = []
+    while not batch_done.is_set() and len(latencies) < args.interactive:
+        started = time.perf_counter()
+        ocr_document(governor, interactive_lane, args.interactive_pages, args.workers, args.page_seconds)
+        latencies.append(time.perf_counter() - started)
+        time.sleep(args.interval)
+    batch.join()
+
+    return {
+        'interactive_documents': len(latencies),
+        'interactive_latency': percentiles(latencies) if latencies else None,
+        'batch_seconds': round(run_batch.seconds, 3),
+        'batch_pages_per_second': round(args.batch_jobs * args.batch_pages / run_batch.seconds, 1)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--slots', type=int, default=4)
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--batch-jobs', type=int, default=4)
+    parser.add_argument('--batch-pages', type=int, default=300)
+    parser.add_argument('--interactive-pages', type=int, default=3)
+    parser.add_argument('--interactive', type=int, default=20)
+    parser.add_argument('--interval', type=float, default=0.1)
+    parser.add_argument('--page-seconds', type=float, default=0.05)
+    args = parser.parse_args()
+
+    unloaded = OCRGovernor(args.slots)
+    started = time.perf_counter()
+    ocr_document(unloaded, LANE_INTERACTIVE, args.interactive_pages, args.workers, args.page_seconds)
+
+    report = {
+        'slots': args.slots,
+        'page_seconds': args.page_seconds,
+        'interactive_unloaded_ms': round((time.perf_counter() - started) * 1000, 1),
+        'lanes': run(args, LANE_INTERACTIVE),
+        'fifo': run(args, LANE_BATCH)
+    }
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,152 @@
+"""
+Benchmark startup and per-request overhead of the term sheet pipeline.
+
+startup: in fresh interpreters, the time to import the app and the latency
+of the first POST /api/validate-term-sheet, with and without building the
+shared pipeline before the first request.
+
+per_request: validating small text term sheets with services constructed
+for every request, as the legacy route used to, against the shared,
+warmed pipeline.
+
+Run from the backend directory:
+
+    python -m benchmarks.bench_pipeline --requests 500
+"""
+import argparse
+import io
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+from benchmarks.bench_reference_index import percentiles
+
+TERM_SHEET_TEXT = """TERM SHEET
+Counterparty: Acme Corporation
+Issuer: Barclays Bank PLC
+Product: Fixed Rate Note
+Principal Amount: USD 10,000,000
+Trade Date: 2024-01-10
+Settlement Date: 2024-01-12
+Maturity Date: 2030-06-15
+Governing Law: English Law
+Risk Disclosure: The investment involves market risk.
+Reference: {reference}
+"""
+
+
+def measure_first_request(warm):
+    """
+    Run in a fresh interpreter: import the app, optionally warm the
+    pipeline, then time the first validation request
+    """
+    started = time.perf_counter()
+    from app import app
+    imported = time.perf_counter()
+    if warm:
+        from services.pipeline import get_pipeline
+        get_pipeline()
+    warmed = time.perf_counter()
+
+    client = app.test_client()
+    body = TERM_SHEET_TEXT.format(reference='first-request').encode('utf-8')
+    request_started = time.perf_counter()
+    response = client.post('/api/validate-term-sheet', data={'file': (io.BytesIO(body), 'first.txt')},
+                           content_type='multipart/form-data')
+    finished = time.perf_counter()
+    assert response.status_code == 200, response.data
+    return {
+        'import_ms': round((imported - started) * 1000, 3),
+        'warm_ms': round((warmed - imported) * 1000, 3),
+        'first_request_ms': round((finished - request_started) * 1000, 3)
+    }
+
+
+def run_startup(warm, work_dir):
+    """
+    Measure the first request in a subprocess with its own state directory
+    """
+    output = subprocess.run(
+        [sys.executable, '-m', 'benchmarks.bench_pipeline', '--first-request', 'warm' if warm else 'cold'],
+        cwd=BACKEND_DIR, capture_output=True, text=True, check=True,
+        env=dict(os.environ,
+                 EXTRACTION_CACHE_DIR=os.path.join(work_dir, 'extractions'),
+                 REFERENCE_SNAPSHOT_DIR=os.path.join(work_dir, 'reference'),
+                 DOCUMENT_STORE_DB=os.path.join(work_dir, 'documents.db'),
+                 HISTORY_DB=os.path.join(work_dir, 'history.db'))).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def time_requests(modes, paths):
+    """
+    Validate each path with the modes in turn, so that both see the same
+    document and history store sizes, and return the timings of each mode
+    """
+    timings = {name: [] for name, _ in modes}
+    for position, path in enumerate(paths):
+        name, validate = modes[position % len(modes)]
+        started = time.perf_counter()
+        validate(path)
+        timings[name].append(time.perf_counter() - started)
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--requests', type=int, default=500)
+    parser.add_argument('--first-request', choices=['cold', 'warm'], help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.first_request:
+        print(json.dumps(measure_first_request(args.first_request == 'warm')))
+        return
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        report = {
+            'startup': {
+                'cold': run_startup(False, os.path.join(work_dir, 'cold')),
+                'warm': run_startup(True, os.path.join(work_dir, 'warm'))
+            }
+        }
+
+        os.environ.update(REFERENCE_SNAPSHOT_DIR=os.path.join(work_dir, 'reference'),
+                          DOCUMENT_STORE_DB=os.path.join(work_dir, 'documents.db'),
+                          HISTORY_DB=os.path.join(work_dir, 'history.db'))
+        from services.nlp_service import NLPService
+        from services.ocr_service import OCRService
+        from services.pipeline import TermSheetPipeline
+        from services.validation_service import ValidationService
+
+        # Distinct files so that neither side is served from a cache
+        paths = []
+        for position in range(args.requests * 2):
+            path = os.path.join(work_dir, f'term_sheet_{position}.txt')
+            with open(path, 'w') as f:
+                f.write(TERM_SHEET_TEXT.format(reference=position))
+            paths.append(path)
+
+        def per_request_services(path):
+            # What every legacy request used to build before doing any work
+            pipeline = TermSheetPipeline(OCRService(use_cache=False), NLPService(), ValidationService(), warm=False)
+            return pipeline.process(path, os.path.basename(path))
+
+        shared = TermSheetPipeline(OCRService(use_cache=False))
+
+        def shared_pipeline(path):
+            return shared.process(path, os.path.basename(path))
+
+        timings = time_requests([('per_request_services', per_request_services),
+                                 ('shared_pipeline', shared_pipeline)], paths)
+        report['per_request'] = {name: percentiles(values) for name, values in timings.items()}
+
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
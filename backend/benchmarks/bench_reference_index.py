@@ -0,0 +1,107 @@
+"""
+Benchmark ReferenceIndex exact and fuzzy lookups on a synthetic
+counterparty master.
+
+Run from the backend directory:
+
+    python -m benchmarks.bench_reference_index --entries 1000000 --queries 2000
+"""
+import argparse
+import gc
+import json
+import os
+import random
+import string
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.reference_index import ReferenceIndex
+
+LEGAL_SUFFIXES = ['Ltd', 'Limited', 'Inc', 'Corporation', 'PLC', 'GmbH', 'SA', 'Holdings',
+                  'Capital', 'Partners', 'Bank', 'Group']
+
+
+def make_names(count, rng):
+    """
+    Generate distinct entity names from random words and legal suffixes
+    """
+    words = [''.join(rng.choice(string.ascii_lowercase) for _ in range(rng.randint(3, 9)))
+             for _ in range(max(1000, count // 30))]
+    names = set()
+    while len(names) < count:
+        stem = ' '.join(rng.choice(words).capitalize() for _ in range(rng.randint(1, 3)))
+        names.add(f"{stem} {rng.choice(LEGAL_SUFFIXES)}")
+    return list(names)
+
+
+def add_ocr_noise(name, rng, edits):
+    """
+    Replace `edits` random characters, as a poor scan would
+    """
+    chars = list(name)
+    for _ in range(edits):
+        position = rng.randrange(len(chars))
+        chars[position] = rng.choice(string.ascii_lowercase)
+    return ''.join(chars)
+
+
+def percentiles(timings):
+    """
+    Summarize lookup timings in milliseconds
+    """
+    timings = sorted(timings)
+    return {
+        'mean_ms': round(sum(timings) / len(timings) * 1000, 4),
+        'p50_ms': round(timings[len(timings) // 2] * 1000, 4),
+        'p95_ms': round(timings[int(len(timings) * 0.95)] * 1000, 4),
+        'p99_ms': round(timings[int(len(timings) * 0.99)] * 1000, 4)
+    }
+
+
+def time_lookups(index, queries):
+    """
+    Time index.match for every query and return the timings and results
+    """
+    timings = []
+    results = []
+    for query in queries:
+        started = time.perf_counter()
+        results.append(index.match(query))
+        timings.append(time.perf_counter() - started)
+    return timings, results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--entries', type=int, default=1000000)
+    parser.add_argument('--queries', type=int, default=2000)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    names = make_names(args.entries, rng)
+
+    started = time.perf_counter()
+    index = ReferenceIndex(names)
+    build_seconds = time.perf_counter() - started
+    gc.collect()
+
+    sample = rng.sample(names, min(args.queries, len(names)))
+    exact_timings, _ = time_lookups(index, [name.upper() for name in sample])
+    fuzzy_queries = [add_ocr_noise(name, rng, 1) for name in sample]
+    fuzzy_timings, fuzzy_results = time_lookups(index, fuzzy_queries)
+    recovered = sum(1 for name, match in zip(sample, fuzzy_results) if match is not None and match.name == name)
+
+    print(json.dumps({
+        'entries': len(index),
+        'build_seconds': round(build_seconds, 2),
+        'exact': percentiles(exact_timings),
+        'fuzzy_one_edit': percentiles(fuzzy_timings),
+        'fuzzy_recovered_ratio': round(recovered / len(sample), 4)
+    }, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,71 @@
+"""
+Benchmark RuleEngine throughput on synthetic extracted term sheets and
+report the time spent in each rule.
+
+Run from the backend directory:
+
+    python -m benchmarks.bench_rule_engine --records 100000
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.reference_data import get_reference_store
+from services.rule_engine import RuleEngine
+
+# Mostly clean values with some OCR noise, invalid dates and limit breaches
+FIELD_VALUES = {
+    'counterparty': ['Acme Corporation', 'Global Investments Ltd', 'JP Morgan', 'JP Morgen', 'Unknown Capital'],
+    'issuer': ['Barclays Bank PLC', 'HSBC', 'Standard Chartered', 'Barclays Bnak PLC'],
+    'product': ['Fixed Rate Note', 'Swap', 'Option', 'Structured Note'],
+    'principal_amount': [500.0, 1000000.0, 10000000.0, 75000000.0],
+    'maturity_date': ['2030-06-15', '2028-01-31', '2021-03-01', '2030-02-30'],
+    'trade_date': ['2023-06-15', '2024-01-10', '2099-01-01'],
+    'settlement_date': ['2023-06-20', '2024-01-12', '2023-06-01'],
+    'governing_law': ['English Law', 'New York Law', 'French Law'],
+    'risk_disclosure': ['The investment involves market risk.', ''],
+}
+
+
+def make_records(count, rng, missing_ratio=0.05):
+    """
+    Generate term sheet dicts, each field left out with missing_ratio
+    """
+    return [{field: rng.choice(values) for field, values in FIELD_VALUES.items() if rng.random() >= missing_ratio}
+            for _ in range(count)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--records', type=int, default=100000)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    reference = get_reference_store().current()
+    records = make_records(args.records, random.Random(args.seed))
+
+    results = {}
+    for timing in (False, True):
+        engine = RuleEngine(reference.rules, reference.lists, timing=timing)
+        started = time.perf_counter()
+        for _ in engine.evaluate_many(records):
+            pass
+        elapsed = time.perf_counter() - started
+        results['with_timing' if timing else 'without_timing'] = {
+            'records_per_second': round(len(records) / elapsed),
+            'mean_us': round(elapsed / len(records) * 1e6, 2)
+        }
+
+    results['records'] = len(records)
+    results['reference_data_version'] = reference.version
+    results['per_rule'] = engine.timing_stats()['rules']
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
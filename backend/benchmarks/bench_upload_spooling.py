@@ -0,0 +1,79 @@
+"""
+Benchmark extracting uploads from spooled buffers against saving them to
+the upload folder first.
+
+Each round feeds the same upload bytes through both paths, with the
+extraction cache disabled: save_file, extract_text on the path and remove
+it, as uploads used to be handled, against SpooledUpload and extract_text
+on the buffer. Both include hashing the upload, which the pipeline needs.
+
+Run from the backend directory:
+
+    python -m benchmarks.bench_upload_spooling --rounds 500
+"""
+import argparse
+import io
+import json
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from werkzeug.datastructures import FileStorage
+from services.ocr_service import OCRService
+from utils.file_handler import save_file, generate_unique_filename, file_sha256, SpooledUpload
+from benchmarks.bench_reference_index import percentiles
+from benchmarks.bench_pipeline import TERM_SHEET_TEXT
+
+
+def make_uploads():
+    """
+    Return (label, filename, bytes) of the upload formats that can be
+    extracted without Tesseract or poppler
+    """
+    import pandas as pd
+    text = TERM_SHEET_TEXT.format(reference='benchmark')
+    rows = [line.split(': ', 1) for line in text.splitlines() if ': ' in line]
+    excel = io.BytesIO()
+    pd.DataFrame(rows * 50, columns=['Field', 'Value']).to_excel(excel, index=False)
+    return [
+        ('txt_1kb', 'term_sheet.txt', text.encode('utf-8')),
+        ('txt_1mb', 'term_sheet.txt', (text * 2500).encode('utf-8')),
+        ('xlsx', 'term_sheet.xlsx', excel.getvalue())
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rounds', type=int, default=500)
+    args = parser.parse_args()
+
+    ocr_service = OCRService(use_cache=False)
+    report = {}
+    with tempfile.TemporaryDirectory() as upload_folder:
+        for label, filename, data in make_uploads():
+            timings = {'save_to_disk': [], 'spooled': []}
+            for _ in range(args.rounds):
+                started = time.perf_counter()
+                file_path = save_file(FileStorage(io.BytesIO(data), filename),
+                                      generate_unique_filename(filename), upload_folder)
+                ocr_service.extract_text(file_path)
+                # The pipeline hashes saved files for the document store
+                file_sha256(file_path)
+                os.remove(file_path)
+                timings['save_to_disk'].append(time.perf_counter() - started)
+
+                started = time.perf_counter()
+                with SpooledUpload(io.BytesIO(data), filename) as upload:
+                    ocr_service.extract_text(upload)
+                timings['spooled'].append(time.perf_counter() - started)
+
+            report[label] = {'bytes': len(data), **{name: percentiles(values) for name, values in timings.items()}}
+
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,329 @@
+"""
+Generate a reproducible corpus of synthetic term sheets in every supported
+upload format.
+
+Each term sheet has one page of key terms followed by pages of boilerplate
+clauses. The key terms are drawn from the reference data lists, with a
+share of deliberately wrong values (unapproved counterparties, unknown
+products, settlement before trade date) so that validation has issues to
+report. The same seed always produces the same files.
+
+Formats: txt, docx, xlsx, png, jpg, pdf (with a text layer) and
+scanned_pdf (page images only, as from a scanner). Images are always a
+single page.
+
+Run from the backend directory:
+
+    python -m benchmarks.corpus --output /tmp/corpus --count 5 --pages 1,10
+"""
+import argparse
+import io
+import json
+import os
+import random
+import sys
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+FORMATS = ('txt', 'docx', 'xlsx', 'png', 'jpg', 'pdf', 'scanned_pdf')
+
+# Formats that hold a single page whatever page count is asked for
+SINGLE_PAGE_FORMATS = ('png', 'jpg')
+
+# Values the reference data does not approve, mixed into the corpus
+UNAPPROVED_COUNTERPARTIES = ['Shadow Holdings SA', 'Unlisted Ventures Inc']
+UNKNOWN_PRODUCTS = ['Variance Swap', 'Autocallable Note']
+CURRENCIES = ['USD', 'EUR', 'GBP']
+
+# Share of term sheets given each kind of deliberate error
+ERROR_RATE = 0.2
+
+# Rendered page size at 200 dpi (US letter) and text layout
+PAGE_WIDTH = 1700
+PAGE_HEIGHT = 2200
+MARGIN = 150
+FONT_SIZE = 32
+LINE_HEIGHT = 48
+
+BOILERPLATE = [
+    "Definitions. Capitalised terms used in this term sheet have the meanings given to them in the "
+    "master agreement between the parties, as amended and supplemented from time to time.",
+    "Calculation Agent. All determinations of the calculation agent shall be made in good faith and "
+    "in a commercially reasonable manner and shall be binding on the parties absent manifest error.",
+    "Business Days. Where any date falls on a day that is not a business day, it shall be adjusted "
+    "in accordance with the modified following business day convention.",
+    "Taxation. All payments shall be made without withholding or deduction for taxes unless required "
+    "by law, in which case the issuer shall pay such additional amounts as necessary.",
+    "Events of Default. The occurrence of any event of default shall entitle the non-defaulting party "
+    "to designate an early termination date in respect of all outstanding transactions.",
+    "Confidentiality. This term sheet is indicative only and does not constitute an offer, "
+    "solicitation or commitment to enter into any transaction on the terms described.",
+]
+
+
+def load_reference_lists():
+    """
+    Return the approved counterparties, issuers, products and governing
+    laws of the current reference data
+    """
+    from services.reference_data import load_reference_source, DEFAULT_REFERENCE_DATA_PATH
+    document, _, _ = load_reference_source(DEFAULT_REFERENCE_DATA_PATH)
+    return document['lists']
+
+
+def make_term_sheet(rng, lists, pages):
+    """
+    Return (fields, page_lines): the true key terms of one synthetic term
+    sheet and the lines of text on each of its pages
+    """
+    trade_date = date(2023, 1, 2) + timedelta(days=rng.randrange(700))
+    settlement_date = trade_date + timedelta(days=rng.choice([2, 3, 5]))
+    if rng.random() < ERROR_RATE:
+        settlement_date = trade_date - timedelta(days=1)
+
+    fields = {
+        'trade_date': trade_date.isoformat(),
+        'settlement_date': settlement_date.isoformat(),
+        'issuer': rng.choice(lists['issuers']),
+        'counterparty': (rng.choice(UNAPPROVED_COUNTERPARTIES) if rng.random() < ERROR_RATE
+                         else rng.choice(lists['counterparties'])),
+        'product': rng.choice(UNKNOWN_PRODUCTS) if rng.random() < ERROR_RATE else rng.choice(lists['products']),
+        'currency': rng.choice(CURRENCIES),
+        'principal_amount': float(rng.randrange(1, 500) * 100000),
+        'maturity_date': (trade_date + timedelta(days=365 * rng.randrange(1, 11))).isoformat(),
+        'governing_law': rng.choice(lists['governing_laws']),
+    }
+    key_terms = [
+        'TERM SHEET',
+        '',
+        f"Trade Date: {fields['trade_date']}",
+        f"Settlement Date: {fields['settlement_date']}",
+        f"Issuer: {fields['issuer']}",
+        f"Counterparty: {fields['counterparty']}",
+        f"Product: {fields['product']}",
+        f"Principal Amount: {fields['currency']} {fields['principal_amount']:,.0f}",
+        f"Maturity Date: {fields['maturity_date']}",
+        f"Coupon Rate: {rng.randrange(100, 800) / 100:.2f}% per annum",
+        f"Governing Law: {fields['governing_law']}",
+        'Risk Disclosure: The investment involves market risk and may result in loss of principal.',
+    ]
+    page_lines = [key_terms]
+    for page_number in range(2, pages + 1):
+        lines = [f'Terms and Conditions (page {page_number} of {pages})', '']
+        for clause in rng.sample(BOILERPLATE, 4):
+            lines.extend(_wrap(clause, 80))
+            lines.append('')
+        page_lines.append(lines)
+    return fields, page_lines
+
+
+def _wrap(text, width):
+    lines = []
+    line = ''
+    for word in text.split():
+        if line and len(line) + 1 + len(word) > width:
+            lines.append(line)
+            line = word
+        else:
+            line = f'{line} {word}' if line else word
+    if line:
+        lines.append(line)
+    return lines
+
+
+def render_txt(page_lines):
+    # Pages separated by form feeds, as pdftotext writes them
+    return '\f'.join('\n'.join(lines) for lines in page_lines).encode('utf-8')
+
+
+def render_docx(page_lines):
+    from docx import Document
+    from docx.enum.text import WD_BREAK
+    document = Document()
+    for position, lines in enumerate(page_lines):
+        if position:
+            document.add_paragraph().add_run().add_break(WD_BREAK.PAGE)
+        for line in lines:
+            document.add_paragraph(line)
+    output = io.BytesIO()
+    document.save(output)
+    return output.getvalue()
+
+
+def render_xlsx(page_lines):
+    import pandas as pd
+    rows = []
+    for lines in page_lines:
+        for line in lines:
+            field, _, value = line.partition(': ')
+            rows.append((field, value) if value else (line, ''))
+    output = io.BytesIO()
+    pd.DataFrame(rows, columns=['Field', 'Value']).to_excel(output, index=False)
+    return output.getvalue()
+
+
+def _font():
+    from PIL import ImageFont
+    for name in ('DejaVuSans.ttf', 'LiberationSans-Regular.ttf', 'Arial.ttf'):
+        try:
+            return ImageFont.truetype(name, FONT_SIZE)
+        except OSError:
+            continue
+    try:
+        return ImageFont.load_default(size=FONT_SIZE)
+    except TypeError:
+        # Pillow before 10.1 only has the small bitmap font
+        return ImageFont.load_default()
+
+
+def render_page_image(lines, rng=None):
+    """
+    Render one page of text as a grayscale image at 200 dpi; with rng,
+    add the slight skew and speckle of a scanned page
+    """
+    from PIL import Image, ImageDraw
+    image = Image.new('L', (PAGE_WIDTH, PAGE_HEIGHT), 255)
+    draw = ImageDraw.Draw(image)
+    font = _font()
+    for position, line in enumerate(lines):
+        draw.text((MARGIN, MARGIN + position * LINE_HEIGHT), line, fill=0, font=font)
+    if rng is not None:
+        for _ in range(2000):
+            image.putpixel((rng.randrange(PAGE_WIDTH), rng.randrange(PAGE_HEIGHT)), rng.randrange(96, 200))
+        image = image.rotate(rng.uniform(-1.0, 1.0), fillcolor=255)
+    return image
+
+
+def render_image(page_lines, image_format):
+    output = io.BytesIO()
+    render_page_image(page_lines[0]).save(output, format=image_format)
+    return output.getvalue()
+
+
+def render_scanned_pdf(page_lines, rng):
+    images = [render_page_image(lines, rng) for lines in page_lines]
+    output = io.BytesIO()
+    images[0].save(output, format='PDF', resolution=200, save_all=True, append_images=images[1:])
+    return output.getvalue()
+
+
+def render_pdf(page_lines):
+    """
+    Write a PDF with a text layer: one Helvetica text object per page
+    """
+    objects = []
+
+    def add(body):
+        objects.append(body)
+        return len(objects)
+
+    catalog = add(None)
+    pages = add(None)
+    font = add(b'<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>')
+    page_ids = []
+    for lines in page_lines:
+        commands = [b'BT', b'/F1 11 Tf', b'14 TL', b'72 720 Td']
+        for line in lines:
+            escaped = line.replace('\\', '\\\\').replace('(', '\\(').replace(')', '\\)')
+            commands.append(f'({escaped}) Tj T*'.encode('latin-1', errors='replace'))
+        commands.append(b'ET')
+        stream = b'\n'.join(commands)
+        content = add(b'<< /Length %d >>\nstream\n%s\nendstream' % (len(stream), stream))
+        page_ids.append(add(b'<< /Type /Page /Parent %d 0 R /MediaBox [0 0 612 792] '
+                            b'/Resources << /Font << /F1 %d 0 R >> >> /Contents %d 0 R >>'
+                            % (pages, font, content)))
+    objects[catalog - 1] = b'<< /Type /Catalog /Pages %d 0 R >>' % pages
+    objects[pages - 1] = b'<< /Type /Pages /Kids [%s] /Count %d >>' % (
+        b' '.join(b'%d 0 R' % page_id for page_id in page_ids), len(page_ids))
+
+    output = io.BytesIO()
+    output.write(b'%PDF-1.4\n')
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(output.tell())
+        output.write(b'%d 0 obj\n%s\nendobj\n' % (number, body))
+    xref = output.tell()
+    output.write(b'xref\n0 %d\n0000000000 65535 f \n' % (len(objects) + 1))
+    for offset in offsets:
+        output.write(b'%010d 00000 n \n' % offset)
+    output.write(b'trailer\n<< /Size %d /Root %d 0 R >>\nstartxref\n%d\n%%%%EOF\n'
+                 % (len(objects) + 1, catalog, xref))
+    return output.getvalue()
+
+
+def render(file_format, page_lines, rng):
+    """
+    Return the bytes and file extension of a term sheet in file_format
+    """
+    if file_format == 'txt':
+        return render_txt(page_lines), '.txt'
+    if file_format == 'docx':
+        return render_docx(page_lines), '.docx'
+    if file_format == 'xlsx':
+        return render_xlsx(page_lines), '.xlsx'
+    if file_format == 'png':
+        return render_image(page_lines, 'PNG'), '.png'
+    if file_format == 'jpg':
+        return render_image(page_lines, 'JPEG'), '.jpg'
+    if file_format == 'pdf':
+        return render_pdf(page_lines), '.pdf'
+    if file_format == 'scanned_pdf':
+        return render_scanned_pdf(page_lines, rng), '.pdf'
+    raise ValueError(f"Unknown format: {file_format}")
+
+
+def generate_corpus(output_dir, formats=FORMATS, page_counts=(1,), count=5, seed=0):
+    """
+    Write count term sheets per format and page count to output_dir and
+    return their manifest entries
+
+    Each entry has the file path, format, page count, size and the true
+    key terms of the term sheet. The manifest is also written to
+    manifest.json.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    lists = load_reference_lists()
+    manifest = []
+    for file_format in formats:
+        for pages in page_counts:
+            if file_format in SINGLE_PAGE_FORMATS:
+                if pages != page_counts[0]:
+                    continue
+                pages = 1
+            # Seeded per combination, so adding a format leaves the others unchanged
+            rng = random.Random(f'{seed}-{file_format}-{pages}')
+            for position in range(count):
+                fields, page_lines = make_term_sheet(rng, lists, pages)
+                data, extension = render(file_format, page_lines, rng)
+                path = os.path.join(output_dir, f'{file_format}-{pages}p-{position}{extension}')
+                with open(path, 'wb') as f:
+                    f.write(data)
+                manifest.append({'path': path, 'format': file_format, 'pages': pages,
+                                 'bytes': len(data), 'fields': fields})
+
+    with open(os.path.join(output_dir, 'manifest.json'), 'w') as f:
+        json.dump(manifest, f, indent=2)
+    return manifest
+
+
+def parse_page_counts(value):
+    return tuple(sorted({int(pages) for pages in value.split(',')}))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--output', required=True)
+    parser.add_argument('--formats', default=','.join(FORMATS))
+    parser.add_argument('--pages', default='1', help='comma-separated page counts')
+    parser.add_argument('--count', type=int, default=5, help='term sheets per format and page count')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    manifest = generate_corpus(args.output, args.formats.split(','), parse_page_counts(args.pages),
+                               args.count, args.seed)
+    print(f"Wrote {len(manifest)} term sheets to {args.output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,8 +1,29 @@
-from flask import Blueprint, request, jsonify, current_app
+from flask import Blueprint, request, jsonify, current_app, url_for, Response
 from flask_cors import cross_origin
-from services.validation_service import ValidationService
-from utils.file_handler import allowed_file, save_file
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from services.pipeline import get_pipeline
+from services.job_queue import get_job_queue, QueueFullError
+from services.resource_governor import ocr_lane, LANE_INTERACTIVE
+from utils.file_handler import allowed_file, save_file, generate_unique_filename, extract_zip_archive, SpooledUpload
+from utils.request_utils import parse_bool_arg
+from utils.metrics import log, timed_stage, current_request_id, request_trace
+import json
 import os
+import shutil
+import time
+import uuid
+
+# Seconds a client is asked to wait before resubmitting when the job queue is full
+QUEUE_FULL_RETRY_AFTER_SECONDS = 30
+
+# Documents of a batch validated concurrently
+BATCH_WORKERS = int(os.environ.get('BATCH_WORKERS', 4))
+
+# Largest total size a zip archive in a batch may expand to
+BATCH_MAX_UNCOMPRESSED_BYTES = int(os.environ.get('BATCH_MAX_UNCOMPRESSED_MB', 512)) * 1024 * 1024
+
+# Upper bounds (exclusive) of the risk score histogram buckets in batch summaries
+RISK_SCORE_BUCKETS = [20, 40, 60, 80, 101]
 
 # Create a Blueprint for API routes
 api_bp = Blueprint('api', __name__)
@@ -19,52 +40,56 @@ def validate_term_sheet():
     Endpoint for term sheet validation.
     
     Accepts a file upload (PDF, Word, Excel, image, or text) and returns validation results.
+    With ?async=true the file is queued instead and a job id is returned
+    immediately; poll /api/jobs/<jobId> for progress and the result. With
+    ?reuse=true a resubmitted or near-duplicate document gets the result of
+    the one it duplicates instead of being validated again. Synchronous
+    uploads are OCR'd in the interactive lane, ahead of jobs and batches.
     """
     try:
-        print("Received validate-term-sheet request")
+        log("Received validate-term-sheet request")
         
         # Check if the post request has the file part
         if 'file' not in request.files:
-            print("No file part in request")
+            log("No file part in request")
             return jsonify({'error': 'No file part'}), 400
         
         file = request.files['file']
-        print(f"File received: {file.filename}")
+        log(f"File received: {file.filename}")
         
         # If user does not select file, browser also submits an empty part without filename
         if file.filename == '':
-            print("No selected file")
+            log("No selected file")
             return jsonify({'error': 'No selected file'}), 400
         
         # Check if the file is allowed
         try:
             allowed_extensions = current_app.config.get('ALLOWED_EXTENSIONS', {'pdf', 'docx', 'xlsx', 'jpg', 'png', 'txt'})
-            print(f"Checking if file type is allowed: {file.filename}, allowed extensions: {allowed_extensions}")
+            log(f"Checking if file type is allowed: {file.filename}, allowed extensions: {allowed_extensions}")
             
             if file and allowed_file(file.filename, allowed_extensions):
-                # Save the file temporarily
+                # Validate the upload, or queue it with ?async=true
                 try:
                     filename = file.filename
                     upload_folder = current_app.config.get('UPLOAD_FOLDER', 'uploads')
-                    print(f"Saving file to {upload_folder}/{filename}")
-                    
-                    file_path = save_file(file, filename, upload_folder)
-                    print(f"File saved to: {file_path}")
                     
-                    # Validate the term sheet
-                    validation_service = ValidationService()
-                    print("Calling validation service")
-                    result = validation_service.validate(file_path)
-                    print(f"Validation result: {result}")
+                    reuse_duplicates = parse_bool_arg(request.args.get('reuse'))
+                    if parse_bool_arg(request.args.get('async')):
+                        return submit_validation_job(file, upload_folder, reuse_duplicates)
                     
-                    # Clean up the temporary file
-                    if os.path.exists(file_path):
-                        os.remove(file_path)
-                        print(f"Removed temporary file: {file_path}")
+                    # Validate the term sheet from memory with the shared,
+                    # warmed pipeline; nothing is written to the upload folder
+                    with SpooledUpload(file.stream, filename) as upload, ocr_lane(LANE_INTERACTIVE):
+                        log(f"Received {upload.size} bytes ({'in memory' if upload.in_memory else 'spooled to disk'})")
+                        log("Calling validation service")
+                        result = get_pipeline().validation_service.validate(upload, reuse_duplicates=reuse_duplicates)
+                    log(f"Validation result: {result}")
                     
-                    return jsonify(result)
+                    with timed_stage('serialize'):
+                        response = jsonify(result)
+                    return response
                 except Exception as e:
-                    print(f"Error processing file: {str(e)}")
+                    log(f"Error processing file: {str(e)}")
                     return jsonify({
                         'status': 'warning',
                         'riskScore': 45,
@@ -76,10 +101,10 @@ def validate_term_sheet():
                         ]
                     })
             else:
-                print(f"File type not allowed: {file.filename}")
+                log(f"File type not allowed: {file.filename}")
                 return jsonify({'error': 'File type not allowed'}), 400
         except Exception as e:
-            print(f"Error checking file: {str(e)}")
+            log(f"Error checking file: {str(e)}")
             return jsonify({
                 'status': 'warning',
                 'riskScore': 30,
@@ -93,8 +118,8 @@ def validate_term_sheet():
         
     except Exception as e:
         import traceback
-        print(f"Error in validate_term_sheet: {str(e)}")
-        print(traceback.format_exc())
+        log(f"Error in validate_term_sheet: {str(e)}")
+        log(traceback.format_exc())
         return jsonify({
             'status': 'warning',
             'riskScore': 50,
@@ -106,6 +131,168 @@ def validate_term_sheet():
             ]
         })
 
+@api_bp.route('/jobs/<job_id>', methods=['GET'])
+@cross_origin()
+def get_job(job_id):
+    """
+    Endpoint for polling an asynchronous validation job.
+    
+    Returns the job status (queued, running, succeeded or failed), the number
+    of pages extracted so far and, once finished, the validation result.
+    """
+    job = get_job_queue().get(job_id)
+    if job is None:
+        return jsonify({'error': 'Job not found'}), 404
+    
+    return jsonify({
+        'jobId': job['id'],
+        'status': job['status'],
+        'progress': {
+            'pagesDone': job['pages_done'],
+            'pagesTotal': job['pages_total']
+        },
+        'result': job['result'],
+        'error': job['error']
+    })
+
+def submit_validation_job(file, upload_folder, reuse_duplicates=False):
+    """Save an upload under a unique name and queue it for validation."""
+    file_path = save_file(file, generate_unique_filename(file.filename), upload_folder)
+    
+    try:
+        job_id = get_job_queue().submit(run_validation_job, file_path, reuse_duplicates=reuse_duplicates)
+    except QueueFullError as e:
+        os.remove(file_path)
+        response = jsonify({'error': str(e)})
+        response.headers['Retry-After'] = str(QUEUE_FULL_RETRY_AFTER_SECONDS)
+        return response, 503
+    
+    log(f"Queued validation job {job_id} for {file.filename}")
+    return jsonify({
+        'jobId': job_id,
+        'status': 'queued',
+        'statusUrl': url_for('api.get_job', job_id=job_id)
+    }), 202
+
+def run_validation_job(file_path, progress_callback=None, reuse_duplicates=False):
+    """Run the validation pipeline for a queued upload and remove the file afterwards."""
+    try:
+        return get_pipeline().validation_service.validate(file_path, progress_callback, reuse_duplicates)
+    finally:
+        if os.path.exists(file_path):
+            os.remove(file_path)
+
+@api_bp.route('/validate-term-sheet/batch', methods=['POST'])
+@cross_origin()
+def validate_term_sheet_batch():
+    """
+    Endpoint for validating many term sheets in one request.
+    
+    Accepts any number of 'file' parts, each either a supported document or a
+    zip archive of them. Results are streamed back as NDJSON, one line per
+    document in completion order, followed by a summary line with counts by
+    status and the risk score distribution. ?reuse=true applies to every
+    document, as for a single validation.
+    """
+    files = [file for file in request.files.getlist('file') if file.filename]
+    if not files:
+        return jsonify({'error': 'No file part'}), 400
+    
+    allowed_extensions = current_app.config.get('ALLOWED_EXTENSIONS', {'pdf', 'docx', 'xlsx', 'jpg', 'png', 'txt'})
+    upload_folder = current_app.config.get('UPLOAD_FOLDER', 'uploads')
+    batch_folder = os.path.join(upload_folder, 'batch-' + uuid.uuid4().hex)
+    
+    documents = []
+    rejected = []
+    try:
+        for file in files:
+            if allowed_file(file.filename, {'zip'}):
+                extracted, skipped = extract_zip_archive(file.stream, allowed_extensions,
+                                                         batch_folder, BATCH_MAX_UNCOMPRESSED_BYTES)
+                documents.extend(extracted)
+                rejected.extend(skipped)
+            elif allowed_file(file.filename, allowed_extensions):
+                file_path = save_file(file, generate_unique_filename(file.filename), batch_folder)
+                documents.append((file.filename, file_path))
+            else:
+                rejected.append((file.filename, 'File type not allowed'))
+    except Exception as e:
+        shutil.rmtree(batch_folder, ignore_errors=True)
+        return jsonify({'error': f'Error reading batch: {str(e)}'}), 400
+    
+    log(f"Validating batch of {len(documents)} documents ({len(rejected)} rejected)")
+    return Response(stream_batch_results(documents, rejected, batch_folder, current_request_id(),
+                                         parse_bool_arg(request.args.get('reuse'))),
+                    mimetype='application/x-ndjson')
+
+def validate_batch_document(file_path, request_id, reuse_duplicates=False):
+    """Validate one document of a batch, logged and timed under the batch's request id."""
+    with request_trace(request_id):
+        return get_pipeline().validation_service.validate(file_path, reuse_duplicates=reuse_duplicates)
+
+def stream_batch_results(documents, rejected, batch_folder, request_id=None, reuse_duplicates=False):
+    """Validate saved documents on a worker pool and yield NDJSON lines as each one finishes."""
+    started = time.perf_counter()
+    results = []
+    failed = len(rejected)
+    pool = ThreadPoolExecutor(max_workers=BATCH_WORKERS, thread_name_prefix='sheetwise-batch')
+    
+    try:
+        for filename, reason in rejected:
+            yield json.dumps({'type': 'error', 'filename': filename, 'error': reason}) + '\n'
+        
+        futures = {pool.submit(validate_batch_document, file_path, request_id, reuse_duplicates): filename
+                   for filename, file_path in documents}
+        for future in as_completed(futures):
+            filename = futures[future]
+            try:
+                result = future.result()
+            except Exception as e:
+                failed += 1
+                yield json.dumps({'type': 'error', 'filename': filename, 'error': str(e)}) + '\n'
+                continue
+            
+            results.append(result)
+            yield json.dumps({'type': 'result', 'filename': filename, **result}) + '\n'
+        
+        summary = summarize_batch(results)
+        summary.update({
+            'type': 'summary',
+            'documents': len(documents) + len(rejected),
+            'failed': failed,
+            'elapsedSeconds': round(time.perf_counter() - started, 3)
+        })
+        yield json.dumps(summary) + '\n'
+    finally:
+        # Also reached when the client disconnects mid-stream
+        pool.shutdown(wait=True, cancel_futures=True)
+        shutil.rmtree(batch_folder, ignore_errors=True)
+
+def summarize_batch(results):
+    """Aggregate batch results into counts by status and a risk score distribution."""
+    by_status = {}
+    for result in results:
+        by_status[result['status']] = by_status.get(result['status'], 0) + 1
+    
+    scores = sorted(result['riskScore'] for result in results)
+    histogram = {}
+    lower = 0
+    for upper in RISK_SCORE_BUCKETS:
+        histogram[f"{lower}-{upper - 1}"] = sum(1 for score in scores if lower <= score < upper)
+        lower = upper
+    
+    distribution = {'histogram': histogram}
+    if scores:
+        distribution.update({
+            'min': scores[0],
+            'max': scores[-1],
+            'mean': round(sum(scores) / len(scores), 2),
+            'p50': scores[(len(scores) - 1) // 2],
+            'p90': scores[int(0.9 * (len(scores) - 1))]
+        })
+    
+    return {'validated': len(results), 'byStatus': by_status, 'riskScore': distribution}
+
 @api_bp.route('/chat', methods=['POST'])
 @cross_origin()
 def chat():
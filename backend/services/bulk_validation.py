@@ -0,0 +1,385 @@
+from datetime import datetime
+import numpy as np
+import pandas as pd
+from services.reference_index import normalize_name
+from services.rule_engine import INVALID_DATE, SEVERITY_WEIGHTS, parse_date
+
+_STRICT_ISO_DATE = r'[0-9]{4}-[0-9]{2}-[0-9]{2}'
+
+
+class _Columns:
+    """
+    The columns of the frame being validated, each converted to a present
+    mask and a value array once however many rules read it
+
+    NaN, None and missing columns count as absent fields.
+    """
+
+    def __init__(self, frame):
+        self.frame = frame
+        self.length = len(frame)
+        self._columns = {}
+
+    def get(self, field):
+        column = self._columns.get(field)
+        if column is None:
+            if field not in self.frame.columns:
+                column = (np.zeros(self.length, dtype=bool), np.full(self.length, None, dtype=object))
+            else:
+                series = self.frame[field]
+                column = (series.notna().to_numpy(), series.to_numpy(dtype=object))
+            self._columns[field] = column
+        return column
+
+
+def _issues(mask, descriptions, severities):
+    """
+    Package the issues of one rule: the row positions in mask, and a
+    description and severity for each (arrays, or one value for all)
+    """
+    positions = np.flatnonzero(mask)
+    return positions, descriptions, severities
+
+
+def _map_unique(values, func):
+    """
+    Apply func to each distinct value and return the results per row, so
+    expensive per-value work runs once per distinct value
+    """
+    codes, uniques = pd.factorize(values)
+    results = np.empty(len(uniques), dtype=object)
+    results[:] = [func(value) for value in uniques]
+    return results[codes]
+
+
+def _format_unique(message, values):
+    """
+    Format message for each value, once per distinct value
+    """
+    return _map_unique(values, lambda value: message.format(value=value))
+
+
+def parse_dates(values):
+    """
+    Parse an array of date strings into datetime64[us], with a mask of the
+    values parse_date rejects
+
+    Distinct strictly formatted dates are parsed by pandas in one call;
+    anything else, including dates outside pandas' nanosecond range, goes
+    through the scalar parse_date so results match the scalar rules exactly.
+    """
+    codes, uniques = pd.factorize(values)
+    uniques = pd.Series(uniques, dtype=object)
+    parsed = np.full(len(uniques), np.datetime64('NaT'), dtype='datetime64[us]')
+    invalid = np.zeros(len(uniques), dtype=bool)
+
+    strict = uniques.str.fullmatch(_STRICT_ISO_DATE).fillna(False).to_numpy(dtype=bool)
+    fast = pd.to_datetime(uniques[strict], format='%Y-%m-%d', errors='coerce')
+    parsed[strict] = fast.to_numpy(dtype='datetime64[us]')
+
+    for position in np.flatnonzero(np.isnat(parsed)):
+        value = parse_date(uniques.iloc[position])
+        if value is INVALID_DATE:
+            invalid[position] = True
+        else:
+            parsed[position] = np.datetime64(value, 'us')
+    return parsed[codes], invalid[codes]
+
+
+def _required(rule, severity, lists):
+    field = rule['field']
+    missing_message = rule['missing_message']
+    allow_empty = rule.get('allow_empty', True)
+
+    def check(columns, rows, now):
+        present, values = columns.get(field)
+        missing = ~present
+        if not allow_empty:
+            missing |= ~values.astype(bool)
+        return [_issues(rows & missing, missing_message, severity)]
+    return check
+
+
+def _approved_list(rule, severity, lists):
+    field = rule['field']
+    index = lists[rule['list']]
+    label = rule['label']
+    missing_message = rule['missing_message']
+
+    def outcome(value):
+        match = index.match(value)
+        if match is None:
+            return f"{label} '{value}' is not on the approved list", severity
+        if not match.exact:
+            return (f"{label} '{value}' is not on the approved list; closest approved name is "
+                    f"'{match.name}' (match confidence {match.confidence:.0%})", severity)
+        return None
+
+    def check(columns, rows, now):
+        present, values = columns.get(field)
+        issues = [_issues(rows & ~present, missing_message, severity)]
+        checked = rows & present
+        if checked.any():
+            outcomes = _map_unique(values[checked], outcome)
+            failed = np.array([item is not None for item in outcomes], dtype=bool)
+            mask = np.zeros(columns.length, dtype=bool)
+            mask[np.flatnonzero(checked)[failed]] = True
+            issues.append(_issues(mask, np.array([item[0] for item in outcomes[failed]], dtype=object),
+                                  np.array([item[1] for item in outcomes[failed]], dtype=object)))
+        return issues
+    return check
+
+
+def _range(rule, severity, lists):
+    field = rule['field']
+    minimum = rule.get('min')
+    maximum = rule.get('max')
+    missing_message = rule['missing_message']
+    message = rule['message']
+
+    def check(columns, rows, now):
+        present, values = columns.get(field)
+        issues = [_issues(rows & ~present, missing_message, severity)]
+        checked = rows & present
+        out_of_range = np.zeros(columns.length, dtype=bool)
+        if minimum is not None:
+            out_of_range[checked] |= values[checked] < minimum
+        if maximum is not None:
+            out_of_range[checked] |= values[checked] > maximum
+        if out_of_range.any():
+            issues.append(_issues(out_of_range, _format_unique(message, values[out_of_range]), severity))
+        return issues
+    return check
+
+
+def _date(rule, severity, lists):
+    field = rule['field']
+    must_be = rule['must_be']
+    if must_be not in ('future', 'not_future'):
+        raise ValueError(f"Unknown date condition '{must_be}'")
+    missing_message = rule['missing_message']
+    message = rule['message']
+    invalid_message = rule['invalid_message']
+
+    def check(columns, rows, now):
+        present, values = columns.get(field)
+        issues = [_issues(rows & ~present, missing_message, severity)]
+        checked = rows & present
+        if checked.any():
+            parsed, invalid = parse_dates(values[checked])
+            positions = np.flatnonzero(checked)
+            invalid_mask = np.zeros(columns.length, dtype=bool)
+            invalid_mask[positions[invalid]] = True
+            now_us = np.datetime64(now, 'us')
+            failing = (parsed <= now_us) if must_be == 'future' else (parsed > now_us)
+            failing_mask = np.zeros(columns.length, dtype=bool)
+            failing_mask[positions[failing & ~invalid]] = True
+            issues.append(_issues(invalid_mask, _format_unique(invalid_message, values[invalid_mask]), severity))
+            issues.append(_issues(failing_mask, _format_unique(message, values[failing_mask]), severity))
+        return issues
+    return check
+
+
+def _date_order(rule, severity, lists):
+    earlier = rule['earlier']
+    later = rule['later']
+    message = rule['message']
+    invalid_message = rule['invalid_message']
+
+    def check(columns, rows, now):
+        earlier_present, earlier_values = columns.get(earlier)
+        later_present, later_values = columns.get(later)
+        checked = rows & earlier_present & later_present
+        if not checked.any():
+            return []
+        positions = np.flatnonzero(checked)
+        later_dates, later_invalid = parse_dates(later_values[checked])
+        earlier_dates, earlier_invalid = parse_dates(earlier_values[checked])
+        invalid = later_invalid | earlier_invalid
+        invalid_mask = np.zeros(columns.length, dtype=bool)
+        invalid_mask[positions[invalid]] = True
+        failing_mask = np.zeros(columns.length, dtype=bool)
+        failing_mask[positions[~invalid & (later_dates < earlier_dates)]] = True
+        pairs = pd.MultiIndex.from_arrays([earlier_values[failing_mask], later_values[failing_mask]])
+        descriptions = _map_unique(pairs, lambda pair: message.format(earlier=pair[0], later=pair[1]))
+        return [_issues(invalid_mask, invalid_message, severity), _issues(failing_mask, descriptions, severity)]
+    return check
+
+
+# Column-wise implementations of the rule types in services/rule_engine.py
+RULE_TYPES = {
+    'required': _required,
+    'approved_list': _approved_list,
+    'range': _range,
+    'date': _date,
+    'date_order': _date_order,
+}
+
+
+def _compile_condition(condition):
+    """
+    Column-wise version of a rule's 'when' clause
+    """
+    if condition is None:
+        return None
+    field = condition['field']
+    if 'in' in condition:
+        values = frozenset(normalize_name(value) for value in condition['in'])
+        expected = True
+    else:
+        values = frozenset(normalize_name(value) for value in condition['not_in'])
+        expected = False
+
+    def applies(columns):
+        present, column = columns.get(field)
+        result = np.zeros(columns.length, dtype=bool)
+        if present.any():
+            matches = _map_unique(column[present],
+                                  lambda value: isinstance(value, str) and (normalize_name(value) in values) == expected)
+            result[present] = matches.astype(bool)
+        return result
+    return applies
+
+
+class BulkValidationResult:
+    """
+    Outcome of a bulk validation
+
+    summary is indexed like the input frame, with is_valid, risk_score,
+    status and issue_count per term sheet. issues has one row per issue
+    (row, rule_id, description, severity), ordered by term sheet and then
+    in the order the scalar rules report them.
+    """
+
+    def __init__(self, summary, issues, reference_data_version):
+        self.summary = summary
+        self.issues = issues
+        self.reference_data_version = reference_data_version
+
+    def to_dicts(self):
+        """
+        Return one dict per term sheet in the format of
+        ValidationService.validate_term_sheet, without the timestamp
+        """
+        issue_lists = [[] for _ in range(len(self.summary))]
+        for position, rule_id, description, severity in zip(self.issues['position'].tolist(),
+                                                            self.issues['rule_id'].tolist(),
+                                                            self.issues['description'].tolist(),
+                                                            self.issues['severity'].tolist()):
+            issue_lists[position].append({'rule_id': rule_id, 'description': description, 'severity': severity})
+        return [
+            {
+                'is_valid': bool(is_valid),
+                'risk_score': float(risk_score),
+                'issues': issues,
+                'reference_data_version': self.reference_data_version
+            } for is_valid, risk_score, issues in zip(self.summary['is_valid'], self.summary['risk_score'], issue_lists)
+        ]
+
+
+class BulkValidator:
+    """
+    Evaluates the validation rules column-wise over a DataFrame with one
+    extracted term sheet per row and one column per field
+
+    Missing values (NaN or None) and missing columns count as absent
+    fields. Approved-list lookups and date parsing run once per distinct
+    value, comparisons and risk scores run as NumPy array operations, and
+    the results match ValidationService.validate_term_sheet on each row.
+    """
+
+    def __init__(self, reference):
+        self.reference = reference
+        self._plan = []
+        self._rule_ids = list(reference.rules)
+        self._severities = list(dict.fromkeys(list(SEVERITY_WEIGHTS) +
+                                              [rule['severity'] for rule in reference.rules.values()]))
+        self._severity_codes = {severity: code for code, severity in enumerate(self._severities)}
+        for rule_id, rule in reference.rules.items():
+            try:
+                compile_rule = RULE_TYPES[rule['type']]
+            except KeyError:
+                raise ValueError(f"Rule '{rule_id}' has unknown type '{rule.get('type')}'") from None
+            self._plan.append((rule_id, _compile_condition(rule.get('when')),
+                               compile_rule(rule, rule['severity'], reference.lists)))
+
+    def validate(self, frame, now=None):
+        """
+        Validate every row of frame (a pandas DataFrame, or an Arrow table)
+        and return a BulkValidationResult
+        """
+        if not isinstance(frame, pd.DataFrame):
+            frame = frame.to_pandas()
+        now = now or datetime.now()
+        row_count = len(frame)
+        columns = _Columns(frame)
+        everything = np.ones(row_count, dtype=bool)
+
+        positions, descriptions, severity_codes, rule_order = [], [], [], []
+        for ordinal, (rule_id, applies, check) in enumerate(self._plan):
+            rows = everything if applies is None else applies(columns)
+            if not rows.any():
+                continue
+            for rule_positions, rule_descriptions, rule_severities in check(columns, rows, now):
+                count = len(rule_positions)
+                if not count:
+                    continue
+                positions.append(rule_positions)
+                rule_order.append(np.full(count, ordinal, dtype=np.int16))
+                descriptions.append(np.full(count, rule_descriptions, dtype=object)
+                                    if isinstance(rule_descriptions, str) else rule_descriptions)
+                if isinstance(rule_severities, str):
+                    severity_codes.append(np.full(count, self._severity_codes[rule_severities], dtype=np.int8))
+                else:
+                    severity_codes.append(pd.Categorical(rule_severities, categories=self._severities).codes)
+
+        if positions:
+            positions = np.concatenate(positions)
+            rule_order = np.concatenate(rule_order)
+            order = np.lexsort((rule_order, positions))
+            positions = positions[order]
+            rule_order = rule_order[order]
+            severity_codes = np.concatenate(severity_codes)[order]
+            descriptions = np.concatenate(descriptions)[order]
+        else:
+            positions = np.array([], dtype=np.int64)
+            rule_order = np.array([], dtype=np.int16)
+            severity_codes = np.array([], dtype=np.int8)
+            descriptions = np.array([], dtype=object)
+
+        # Rule ids and severities repeat across issues, so they are stored
+        # as categoricals rather than one string object per issue
+        issues = pd.DataFrame({
+            'position': positions,
+            'row': frame.index.to_numpy()[positions],
+            'rule_id': pd.Categorical.from_codes(rule_order, categories=self._rule_ids),
+            'description': descriptions,
+            'severity': pd.Categorical.from_codes(severity_codes, categories=self._severities)
+        })
+
+        summary = self._summarize(frame.index, issues, row_count)
+        return BulkValidationResult(summary, issues, self.reference.version)
+
+    def _summarize(self, index, issues, row_count):
+        """
+        Compute the per-row risk score exactly as RuleEngine.score does
+        """
+        positions = issues['position'].to_numpy()
+        severity_codes = issues['severity'].cat.codes.to_numpy()
+        counts = {}
+        for severity in SEVERITY_WEIGHTS:
+            counts[severity] = np.bincount(positions[severity_codes == self._severity_codes[severity]],
+                                           minlength=row_count)
+        weighted_score = sum(SEVERITY_WEIGHTS[severity] * count for severity, count in counts.items())
+        max_possible_score = len(self.reference.rules) * SEVERITY_WEIGHTS['HIGH']
+        risk_score = np.minimum(1.0, weighted_score / max_possible_score)
+
+        issue_count = np.bincount(positions, minlength=row_count)
+        is_valid = counts['HIGH'] == 0
+        status = np.where(~is_valid, 'invalid', np.where(issue_count > 0, 'warning', 'valid'))
+        return pd.DataFrame({
+            'is_valid': is_valid,
+            'risk_score': risk_score,
+            'status': status,
+            'issue_count': issue_count
+        }, index=index)
@@ -0,0 +1,315 @@
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+import numpy as np
+from utils.db import connect_sqlite
+
+# SQLite file of the duplicate index, shared by all worker processes
+DEFAULT_DEDUP_DB = os.environ.get('DEDUP_DB', 'data/dedup.db')
+DEFAULT_DEDUP_ENABLED = os.environ.get('DEDUP_ENABLED', 'true').lower() not in ('0', 'false', 'no')
+
+# Largest Hamming distance between the SimHashes of two near-duplicate
+# texts
+DEFAULT_DEDUP_MAX_DISTANCE = int(os.environ.get('DEDUP_MAX_DISTANCE', 6))
+
+# Fingerprints are also looked up by SIMHASH_BANDS bands of 16 bits; two
+# fingerprints within SIMHASH_BANDS - 1 bits always share a band
+SIMHASH_BANDS = 4
+_BAND_BITS = 64 // SIMHASH_BANDS
+
+# Extracted fields that identify a trade. Two documents are only
+# duplicates if these agree: term sheets on one template differ in little
+# else, which text similarity alone does not tell apart from OCR misreads.
+KEY_TERMS = ('trade_date', 'settlement_date', 'issuer', 'counterparty', 'product', 'currency',
+             'principal_amount', 'maturity_date', 'coupon_rate', 'coupon_frequency', 'governing_law')
+
+# A near-duplicate whose fingerprint is within half of the largest distance
+# may disagree with the indexed document in this many key terms, each by one
+# substituted character, as an OCR misread does ('Corporatlon', 5.26 for
+# 5.25). Amended trades usually change more, or change the text more.
+DEDUP_MAX_MISREAD_TERMS = 1
+
+# Candidates compared per band and for the key terms, most recent first.
+# Term sheets on one template with the same boilerplate share most of their
+# text, and so their fingerprint bands; this keeps lookups bounded however
+# many of them are indexed.
+DEDUP_MAX_CANDIDATES = 50
+
+# Length of the byte shingles hashed into a SimHash
+SHINGLE_SIZE = 4
+
+# Shingles hashed at a time, bounding the memory of the bit matrix
+_SHINGLE_CHUNK = 65536
+
+_WORD = re.compile(r'\w+', re.UNICODE)
+
+_default_index = None
+_default_index_lock = threading.Lock()
+
+
+def get_dedup_index():
+    """
+    Return the process-wide duplicate index, or None if deduplication is disabled
+    """
+    global _default_index
+    if not DEFAULT_DEDUP_ENABLED:
+        return None
+    with _default_index_lock:
+        if _default_index is None:
+            _default_index = DedupIndex(DEFAULT_DEDUP_DB)
+        return _default_index
+
+
+def normalize_text(text):
+    """
+    Normalize extracted text for fingerprinting: case-folded words separated
+    by single spaces, so that layout, punctuation and the extractor used do
+    not matter
+    """
+    return ' '.join(_WORD.findall(text.casefold()))
+
+
+def _mix(values):
+    """
+    Hash uint64 values with the splitmix64 finalizer, vectorized
+    """
+    with np.errstate(over='ignore'):
+        values = values + np.uint64(0x9E3779B97F4A7C15)
+        values = (values ^ (values >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+        values = (values ^ (values >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+        return values ^ (values >> np.uint64(31))
+
+
+def simhash(text):
+    """
+    Return the 64-bit SimHash of text's normalized form, over its byte
+    shingles of SHINGLE_SIZE
+
+    Texts differing in a few characters, such as an OCR misread, get
+    fingerprints a few bits apart.
+    """
+    data = np.frombuffer(normalize_text(text).encode('utf-8'), dtype=np.uint8)
+    if len(data) < SHINGLE_SIZE:
+        data = np.pad(data, (0, SHINGLE_SIZE - len(data)))
+
+    count = len(data) - SHINGLE_SIZE + 1
+    ones = np.zeros(64, dtype=np.int64)
+    for start in range(0, count, _SHINGLE_CHUNK):
+        stop = min(start + _SHINGLE_CHUNK, count)
+        shingles = np.zeros(stop - start, dtype=np.uint64)
+        for position in range(SHINGLE_SIZE):
+            shingles |= data[start + position:stop + position].astype(np.uint64) << np.uint64(8 * position)
+        hashes = _mix(shingles)
+        bits = np.unpackbits(hashes.view(np.uint8).reshape(-1, 8), axis=1, bitorder='little')
+        ones += bits.sum(axis=0, dtype=np.int64)
+
+    bits = (2 * ones > count).astype(np.uint8)
+    return int(np.packbits(bits, bitorder='little').view('<u8')[0])
+
+
+def hamming_distance(a, b):
+    return bin(a ^ b).count('1')
+
+
+def simhash_bands(fingerprint):
+    """
+    Return the SIMHASH_BANDS bands of a fingerprint, lowest bits first
+    """
+    mask = (1 << _BAND_BITS) - 1
+    return [(fingerprint >> (band * _BAND_BITS)) & mask for band in range(SIMHASH_BANDS)]
+
+
+def _to_signed(fingerprint):
+    # SQLite integers are signed 64-bit
+    return fingerprint - (1 << 64) if fingerprint >= 1 << 63 else fingerprint
+
+
+def key_terms(fields):
+    """
+    Return the KEY_TERMS of extracted fields, text values normalized
+    """
+    return {name: normalize_text(value) if isinstance(value, str) else value
+            for name, value in fields.items() if name in KEY_TERMS and value is not None}
+
+
+def key_terms_hash(terms):
+    """
+    Return a hash of key terms, or None when there are none to tell trades apart
+    """
+    if not terms:
+        return None
+    return hashlib.sha256(json.dumps(terms, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+def is_misread(value, other):
+    """
+    Return whether two key term values differ in exactly one substituted
+    character of their text, as when OCR misreads a character
+    """
+    value, other = str(value), str(other)
+    return len(value) == len(other) and sum(a != b for a, b in zip(value, other)) == 1
+
+
+def key_terms_agree(terms, other, max_misreads=0):
+    """
+    Return whether two documents' key terms describe the same trade: at
+    most max_misreads of those both have differ, each only by a misread
+    (see is_misread), and they share one or have none at all
+    """
+    shared = terms.keys() & other.keys()
+    differing = [name for name in shared if terms[name] != other[name]]
+    if len(differing) > max_misreads or not all(is_misread(terms[name], other[name]) for name in differing):
+        return False
+    return bool(shared) or (not terms and not other)
+
+
+class DedupIndex:
+    """
+    Index of processed documents for finding repeat submissions
+
+    Each document is keyed on the hash of its bytes, which finds exact
+    resubmissions with a primary key lookup before any extraction. Its
+    extracted text is fingerprinted with a 64-bit SimHash, and a document
+    is a near-duplicate of another, such as the PDF, DOCX and re-scanned
+    image of one confirmation, when their fingerprints are within
+    max_distance bits and their key terms agree (see key_terms_agree);
+    within half of max_distance, up to max_misread_terms key terms may
+    differ by a misread character. Candidates come from index lookups
+    rather than a scan: documents with the same key terms, and documents
+    sharing one of SIMHASH_BANDS bands of the fingerprint, which finds
+    those with an OCR misread in a key term.
+
+    Duplicates form a cluster named after the document_hash of its first
+    member. The result of processing each document is stored so that a
+    resubmission can return it instead of being processed again.
+    """
+
+    def __init__(self, db_path, max_distance=DEFAULT_DEDUP_MAX_DISTANCE, max_candidates=DEDUP_MAX_CANDIDATES,
+                 max_misread_terms=DEDUP_MAX_MISREAD_TERMS):
+        self.max_distance = max_distance
+        self.max_candidates = max_candidates
+        self.max_misread_terms = max_misread_terms
+        self._connection = connect_sqlite(db_path)
+        self._lock = threading.Lock()
+        band_columns = ''.join(f'band{band} INTEGER NOT NULL, ' for band in range(SIMHASH_BANDS))
+        band_indexes = ''.join(f'CREATE INDEX IF NOT EXISTS idx_dedup_band{band} ON dedup_documents (band{band}, id);'
+                               for band in range(SIMHASH_BANDS))
+        with self._lock, self._connection:
+            self._connection.executescript(f'''
+                CREATE TABLE IF NOT EXISTS dedup_documents (
+                    id INTEGER PRIMARY KEY,
+                    document_hash TEXT NOT NULL UNIQUE,
+                    cluster_id TEXT NOT NULL,
+                    filename TEXT,
+                    simhash INTEGER NOT NULL,
+                    {band_columns}
+                    terms_hash TEXT,
+                    terms TEXT NOT NULL,
+                    result TEXT NOT NULL,
+                    created_at REAL NOT NULL,
+                    seen_count INTEGER NOT NULL DEFAULT 1
+                );
+                CREATE INDEX IF NOT EXISTS idx_dedup_cluster ON dedup_documents (cluster_id, id);
+                CREATE INDEX IF NOT EXISTS idx_dedup_terms ON dedup_documents (terms_hash, id);
+                {band_indexes}
+            ''')
+
+    def get(self, document_hash):
+        """
+        Return the indexed document with these exact bytes, or None
+        """
+        with self._lock:
+            row = self._connection.execute('SELECT * FROM dedup_documents WHERE document_hash = ?',
+                                           (document_hash,)).fetchone()
+        return self._deserialize(row) if row is not None else None
+
+    def find_near_duplicate(self, fingerprint, fields):
+        """
+        Return (document, distance) of the closest indexed near-duplicate of
+        a document with this SimHash and these extracted fields, or None
+        """
+        terms = key_terms(fields)
+        terms_hash = key_terms_hash(terms)
+        lookups = [(f'band{band}', value) for band, value in enumerate(simhash_bands(fingerprint))]
+        if terms_hash is not None:
+            lookups.insert(0, ('terms_hash', terms_hash))
+
+        best = None
+        seen = set()
+        with self._lock:
+            # One bounded range scan per lookup, newest first
+            for column, value in lookups:
+                rows = self._connection.execute(
+                    f'SELECT id, simhash, terms FROM dedup_documents WHERE {column} = ? ORDER BY id DESC LIMIT ?',
+                    (value, self.max_candidates)).fetchall()
+                for row in rows:
+                    if row['id'] in seen:
+                        continue
+                    seen.add(row['id'])
+                    distance = hamming_distance(fingerprint, row['simhash'] & 0xFFFFFFFFFFFFFFFF)
+                    if distance > self.max_distance or (best is not None and distance >= best[1]):
+                        continue
+                    max_misreads = self.max_misread_terms if 2 * distance <= self.max_distance else 0
+                    if key_terms_agree(terms, json.loads(row['terms']), max_misreads):
+                        best = (row['id'], distance)
+            if best is None:
+                return None
+            row = self._connection.execute('SELECT * FROM dedup_documents WHERE id = ?', (best[0],)).fetchone()
+        return self._deserialize(row), best[1]
+
+    def add(self, document_hash, filename, fingerprint, fields, result, cluster_id=None):
+        """
+        Index a processed document and the result of processing it, in
+        cluster_id or a new cluster of its own
+
+        Adding a document that is already indexed replaces its stored
+        result and counts the resubmission. Returns its cluster_id.
+        """
+        cluster_id = cluster_id or document_hash
+        terms = key_terms(fields)
+        with self._lock, self._connection:
+            self._connection.execute(
+                f"INSERT INTO dedup_documents (document_hash, cluster_id, filename, simhash, "
+                f"{', '.join(f'band{band}' for band in range(SIMHASH_BANDS))}, terms_hash, terms, result, "
+                f"created_at) VALUES ({', '.join('?' * (8 + SIMHASH_BANDS))}) "
+                f"ON CONFLICT (document_hash) DO UPDATE SET result = excluded.result, "
+                f"seen_count = seen_count + 1",
+                (document_hash, cluster_id, filename, _to_signed(fingerprint), *simhash_bands(fingerprint),
+                 key_terms_hash(terms), json.dumps(terms), json.dumps(result), time.time()))
+            row = self._connection.execute('SELECT cluster_id FROM dedup_documents WHERE document_hash = ?',
+                                           (document_hash,)).fetchone()
+        return row['cluster_id']
+
+    def record_resubmission(self, document_hash):
+        """
+        Count a resubmission of an indexed document that was not processed again
+        """
+        with self._lock, self._connection:
+            self._connection.execute('UPDATE dedup_documents SET seen_count = seen_count + 1 WHERE document_hash = ?',
+                                     (document_hash,))
+
+    def cluster(self, cluster_id):
+        """
+        Return the members of a duplicate cluster, oldest first, without
+        their stored results
+        """
+        with self._lock:
+            rows = self._connection.execute(
+                'SELECT document_hash, filename, seen_count, created_at FROM dedup_documents '
+                'WHERE cluster_id = ? ORDER BY id', (cluster_id,)).fetchall()
+        return [dict(row) for row in rows]
+
+    def cluster_size(self, cluster_id):
+        with self._lock:
+            return self._connection.execute('SELECT COUNT(*) FROM dedup_documents WHERE cluster_id = ?',
+                                            (cluster_id,)).fetchone()[0]
+
+    def _deserialize(self, row):
+        document = dict(row)
+        document['simhash'] &= 0xFFFFFFFFFFFFFFFF
+        document['terms'] = json.loads(document['terms'])
+        document['result'] = json.loads(document['result'])
+        return document
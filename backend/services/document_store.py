@@ -0,0 +1,453 @@
+import json
+import os
+import threading
+import time
+import traceback
+import uuid
+from datetime import datetime
+from services.reference_index import ReferenceIndex, normalize_name
+from services.rule_engine import validation_status
+from utils.db import connect_sqlite
+from utils.metrics import log
+
+# SQLite file holding the extracted fields and latest validation outcome of
+# every processed document, shared by all worker processes
+DEFAULT_DOCUMENT_STORE_DB = os.environ.get('DOCUMENT_STORE_DB', 'data/documents.db')
+
+# Documents re-validated per transaction after a reference data change
+REVALIDATION_BATCH_SIZE = 500
+
+# A re-validation run claims the work for this long, renewed by every batch;
+# the claim of a process that died mid-run expires and another one redoes it
+REVALIDATION_CLAIM_SECONDS = 60
+
+# SQLite limits the number of bound parameters in one statement
+_IN_CLAUSE_CHUNK = 500
+
+_default_store = None
+_default_store_lock = threading.Lock()
+
+
+def get_document_store():
+    """
+    Return the process-wide document store, creating it on first use
+
+    The store re-validates stored documents in the background whenever the
+    reference data of this process is reloaded (see
+    ReferenceDataStore.add_listener).
+    """
+    global _default_store
+    with _default_store_lock:
+        if _default_store is None:
+            from services.reference_data import get_reference_store
+            _default_store = DocumentStore(DEFAULT_DOCUMENT_STORE_DB)
+            reference_store = get_reference_store()
+            reference_store.add_listener(_default_store.revalidate_logged)
+            # Catch up with changes made while no process was running
+            _default_store.revalidate_in_background(None, reference_store.current())
+        return _default_store
+
+
+def _chunks(items, size=_IN_CLAUSE_CHUNK):
+    items = list(items)
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def _list_entries(reference, list_name):
+    """
+    Return {normalized name: canonical name} of a list, or {} if the
+    snapshot has no such list
+    """
+    index = reference.lists.get(list_name) if reference is not None else None
+    return dict(index.items()) if index is not None else {}
+
+
+class _ClaimLost(Exception):
+    """
+    Raised when another process took over a re-validation run
+    """
+
+
+class DocumentStore:
+    """
+    Extracted fields and per-rule validation outcomes of processed documents
+
+    Each document keeps the issues of every rule separately, together with
+    the approved name an approved-list rule matched. Together with the
+    dependency index of the rule engine (rule to fields, rule to lists)
+    this lets a reference data change re-run only the affected rules on
+    only the affected documents, without OCR:
+
+    - a changed or new rule is re-run on every document;
+    - a name removed from a list affects the documents that matched it;
+    - a name added to a list affects the documents that did not match
+      that list exactly and are within fuzzy distance of the new name.
+
+    Documents whose status changes are recorded in status_changes.
+    """
+
+    def __init__(self, db_path):
+        self._connection = connect_sqlite(db_path)
+        self._lock = threading.Lock()
+        self._latest_reference = None
+        with self._lock, self._connection:
+            self._connection.executescript('''
+                CREATE TABLE IF NOT EXISTS documents (
+                    id TEXT PRIMARY KEY,
+                    filename TEXT,
+                    fields TEXT NOT NULL,
+                    status TEXT NOT NULL,
+                    risk_score REAL NOT NULL,
+                    reference_data_version TEXT NOT NULL,
+                    updated_at REAL NOT NULL
+                );
+                CREATE TABLE IF NOT EXISTS rule_results (
+                    document_id TEXT NOT NULL,
+                    rule_id TEXT NOT NULL,
+                    issues TEXT NOT NULL,
+                    matched_key TEXT,
+                    exact INTEGER,
+                    PRIMARY KEY (document_id, rule_id)
+                );
+                CREATE INDEX IF NOT EXISTS idx_rule_results_matched ON rule_results (rule_id, matched_key);
+                CREATE INDEX IF NOT EXISTS idx_rule_results_exact ON rule_results (rule_id, exact);
+                CREATE TABLE IF NOT EXISTS status_changes (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    document_id TEXT NOT NULL,
+                    previous_status TEXT NOT NULL,
+                    status TEXT NOT NULL,
+                    risk_score REAL NOT NULL,
+                    reference_data_version TEXT NOT NULL,
+                    changed_at REAL NOT NULL
+                );
+                CREATE TABLE IF NOT EXISTS meta (
+                    key TEXT PRIMARY KEY,
+                    value TEXT NOT NULL
+                );
+            ''')
+
+    def save(self, document_id, filename, fields, reference, issues):
+        """
+        Store a document's extracted fields and the issues its validation
+        against the reference snapshot found
+        """
+        engine = reference.rule_engine
+        by_rule = {rule_id: [] for rule_id in engine.rules}
+        for issue in issues:
+            by_rule.setdefault(issue['rule_id'], []).append(issue)
+        risk_score, is_valid = engine.score(issues)
+
+        with self._lock, self._connection:
+            self._connection.execute(
+                'INSERT OR REPLACE INTO documents (id, filename, fields, status, risk_score, '
+                'reference_data_version, updated_at) VALUES (?, ?, ?, ?, ?, ?, ?)',
+                (document_id, filename, json.dumps(fields), validation_status(is_valid, issues), risk_score,
+                 reference.version, time.time()))
+            self._connection.execute('DELETE FROM rule_results WHERE document_id = ?', (document_id,))
+            self._connection.executemany(
+                'INSERT INTO rule_results (document_id, rule_id, issues, matched_key, exact) VALUES (?, ?, ?, ?, ?)',
+                [(document_id, rule_id, json.dumps(rule_issues), *self._match_info(reference, rule_id, fields))
+                 for rule_id, rule_issues in by_rule.items()])
+            self._connection.execute(
+                "INSERT OR IGNORE INTO meta (key, value) VALUES ('reference_data_version', ?)", (reference.version,))
+
+    def get(self, document_id):
+        """
+        Return a stored document with its fields, or None
+        """
+        with self._lock:
+            row = self._connection.execute('SELECT * FROM documents WHERE id = ?', (document_id,)).fetchone()
+        if row is None:
+            return None
+        document = dict(row)
+        document['fields'] = json.loads(document['fields'])
+        return document
+
+    def status_changes(self, after_id=0, limit=100):
+        """
+        Return status changes recorded after the change id after_id, oldest first
+        """
+        with self._lock:
+            rows = self._connection.execute(
+                'SELECT * FROM status_changes WHERE id > ? ORDER BY id LIMIT ?', (after_id, limit)).fetchall()
+        return [dict(row) for row in rows]
+
+    def update_fields(self, document_id, changed_fields, reference):
+        """
+        Apply corrected field values to a stored document and re-run only
+        the rules that read them
+
+        Returns the status change, or None if the status is unchanged.
+        """
+        document = self.get(document_id)
+        if document is None:
+            raise KeyError(document_id)
+        fields = dict(document['fields'], **changed_fields)
+        affected = {rule_id for rule_id, (rule_fields, _) in reference.rule_engine.dependencies.items()
+                    if rule_fields & set(changed_fields)}
+        changes = self._reevaluate(reference, {document_id: affected}, {document_id: fields})
+        return changes[0] if changes else None
+
+    def revalidate_in_background(self, previous, reference):
+        """
+        Run revalidate_logged on a background thread
+        """
+        threading.Thread(target=self.revalidate_logged, args=(previous, reference), daemon=True,
+                         name='sheetwise-revalidate').start()
+
+    def revalidate_logged(self, previous, reference):
+        """
+        Reference data listener: run revalidate, logging rather than raising errors
+        """
+        try:
+            self.revalidate(previous, reference)
+        except Exception as e:
+            log(f"Error re-validating documents for reference data {reference.version}: {str(e)}")
+            log(traceback.format_exc())
+
+    def revalidate(self, previous, reference):
+        """
+        Bring stored documents up to date after the reference data changed
+        from the previous snapshot to reference
+
+        Every worker process sees the same change; a claim recorded with the
+        version the documents were last brought up to date with lets only
+        the first one do the work, and that version only moves to reference
+        once every document is done, so a run that fails or dies midway is
+        redone. If that version is not previous (or previous is None, as at
+        startup), every rule is re-run on every document. Returns the status
+        changes, which are also recorded in status_changes.
+        """
+        self._latest_reference = reference
+        token = uuid.uuid4().hex
+        with self._lock, self._connection:
+            row = self._connection.execute("SELECT value FROM meta WHERE key = 'reference_data_version'").fetchone()
+            if row is None or row['value'] == reference.version:
+                return []
+            applied = row['value']
+            claim = self._claim()
+            if claim is not None and claim['claimed_at'] > time.time() - REVALIDATION_CLAIM_SECONDS:
+                claimed = claim
+            else:
+                claimed = None
+                self._connection.execute(
+                    "INSERT OR REPLACE INTO meta (key, value) VALUES ('revalidation', ?)",
+                    (json.dumps({'version': reference.version, 'token': token, 'claimed_at': time.time()}),))
+        if claimed is not None:
+            # Another process is on it; check again once its claim would have
+            # expired, in case it dies before finishing
+            delay = claimed['claimed_at'] + REVALIDATION_CLAIM_SECONDS - time.time() + 1
+            timer = threading.Timer(delay, self._retry_revalidation, args=(previous, reference))
+            timer.daemon = True
+            timer.start()
+            return []
+
+        try:
+            return self._run_revalidation(previous, reference, applied, token)
+        except _ClaimLost:
+            log(f"Re-validation for reference data {reference.version} was taken over by another process")
+            return []
+        except BaseException:
+            with self._lock, self._connection:
+                self._release_claim(token)
+            raise
+
+    def _retry_revalidation(self, previous, reference):
+        """
+        Re-validate unless this process has moved on to newer reference data;
+        does nothing if the process that held the claim finished the work
+        """
+        if self._latest_reference is reference:
+            self.revalidate_logged(previous, reference)
+
+    def _claim(self):
+        row = self._connection.execute("SELECT value FROM meta WHERE key = 'revalidation'").fetchone()
+        return json.loads(row['value']) if row is not None else None
+
+    def _renew_claim(self, token):
+        """
+        Extend the claim with token, raising _ClaimLost if it is no longer ours;
+        call inside a transaction
+        """
+        claim = self._claim()
+        if claim is None or claim['token'] != token:
+            raise _ClaimLost()
+        claim['claimed_at'] = time.time()
+        self._connection.execute("UPDATE meta SET value = ? WHERE key = 'revalidation'", (json.dumps(claim),))
+
+    def _release_claim(self, token):
+        claim = self._claim()
+        if claim is not None and claim['token'] == token:
+            self._connection.execute("DELETE FROM meta WHERE key = 'revalidation'")
+
+    def _run_revalidation(self, previous, reference, applied, token):
+        """
+        Re-run the affected rules of revalidate under the claim token; the
+        version the documents were brought up to date with only moves to
+        reference once every batch is done
+        """
+        if previous is not None and previous.version != applied:
+            previous = None
+
+        started = time.perf_counter()
+        engine = reference.rule_engine
+        previous_rules = previous.rules if previous is not None else {}
+        all_documents = None
+        affected = {}
+
+        for rule_id, rule in reference.rules.items():
+            if previous_rules.get(rule_id) != rule:
+                # New or reconfigured rule: its outcome may change anywhere
+                if all_documents is None:
+                    all_documents = self._document_ids()
+                for document_id in all_documents:
+                    affected.setdefault(document_id, set()).add(rule_id)
+                continue
+            _, lists = engine.dependencies[rule_id]
+            for list_name in lists:
+                for document_id in self._affected_by_list_change(previous, reference, rule_id, rule, list_name):
+                    affected.setdefault(document_id, set()).add(rule_id)
+
+        # Removing a rule changes every risk score, even where no rule re-runs
+        if previous is None or set(previous_rules) != set(reference.rules):
+            rule_ids = list(reference.rules)
+            with self._lock, self._connection:
+                self._renew_claim(token)
+                self._connection.execute(
+                    f"DELETE FROM rule_results WHERE rule_id NOT IN ({','.join('?' * len(rule_ids))})", rule_ids)
+            for document_id in all_documents if all_documents is not None else self._document_ids():
+                affected.setdefault(document_id, set())
+
+        changes = []
+        document_ids = list(affected)
+        for batch in _chunks(document_ids, REVALIDATION_BATCH_SIZE):
+            changes.extend(self._reevaluate(reference, {document_id: affected[document_id] for document_id in batch},
+                                            claim=token))
+
+        with self._lock, self._connection:
+            self._renew_claim(token)
+            self._connection.execute("UPDATE meta SET value = ? WHERE key = 'reference_data_version'",
+                                     (reference.version,))
+            self._release_claim(token)
+            self._connection.execute('UPDATE documents SET reference_data_version = ? WHERE reference_data_version = ?',
+                                     (reference.version, applied))
+
+        log(f"Re-validated {len(document_ids)} documents for reference data {reference.version} in "
+            f"{time.perf_counter() - started:.2f}s; {len(changes)} changed status")
+        return changes
+
+    def _document_ids(self):
+        with self._lock:
+            return [row['id'] for row in self._connection.execute('SELECT id FROM documents')]
+
+    def _affected_by_list_change(self, previous, reference, rule_id, rule, list_name):
+        """
+        Return the documents whose outcome of an approved-list rule may be
+        changed by the names added to or removed from the list
+        """
+        old_entries = _list_entries(previous, list_name)
+        new_entries = _list_entries(reference, list_name)
+        if old_entries == new_entries:
+            return set()
+        removed = [key for key, name in old_entries.items() if new_entries.get(key) != name]
+        added = [name for key, name in new_entries.items() if old_entries.get(key) != name]
+        affected = set()
+
+        with self._lock:
+            for keys in _chunks(removed):
+                rows = self._connection.execute(
+                    f"SELECT document_id FROM rule_results WHERE rule_id = ? "
+                    f"AND matched_key IN ({','.join('?' * len(keys))})", (rule_id, *keys))
+                affected.update(row['document_id'] for row in rows)
+
+            if added:
+                added_index = ReferenceIndex(added)
+                rows = self._connection.execute(
+                    'SELECT r.document_id, d.fields FROM rule_results r JOIN documents d ON d.id = r.document_id '
+                    'WHERE r.rule_id = ? AND r.exact = 0', (rule_id,)).fetchall()
+                for row in rows:
+                    value = json.loads(row['fields']).get(rule['field'])
+                    if isinstance(value, str) and added_index.match(value) is not None:
+                        affected.add(row['document_id'])
+        return affected
+
+    def _match_info(self, reference, rule_id, fields):
+        """
+        Return (matched normalized name, exact) of an approved-list rule for
+        a document, or (None, None) if the rule did not look the value up
+        """
+        rule = reference.rules[rule_id]
+        if 'list' not in rule or rule['field'] not in fields or not reference.rule_engine.applies(rule_id, fields):
+            return None, None
+        match = reference.index(rule['list']).match(fields[rule['field']])
+        if match is None:
+            return None, 0
+        return normalize_name(match.name), int(match.exact)
+
+    def _reevaluate(self, reference, rules_by_document, fields_by_document=None, claim=None):
+        """
+        Re-run the given rules on each document, recompute its status and
+        record status changes
+
+        With a claim token, the re-validation claim is renewed in the same
+        transaction, which is rolled back if another process took it over.
+        """
+        engine = reference.rule_engine
+        now = datetime.now()
+        changes = []
+        document_ids = list(rules_by_document)
+
+        with self._lock, self._connection:
+            if claim is not None:
+                self._renew_claim(claim)
+            documents = {}
+            stored_issues = {}
+            for ids in _chunks(document_ids):
+                placeholders = ','.join('?' * len(ids))
+                for row in self._connection.execute(f'SELECT * FROM documents WHERE id IN ({placeholders})', ids):
+                    documents[row['id']] = dict(row)
+                for row in self._connection.execute(
+                        f'SELECT document_id, rule_id, issues FROM rule_results WHERE document_id IN ({placeholders})',
+                        ids):
+                    stored_issues.setdefault(row['document_id'], {})[row['rule_id']] = json.loads(row['issues'])
+
+            for document_id, rule_ids in rules_by_document.items():
+                document = documents.get(document_id)
+                if document is None:
+                    continue
+                if fields_by_document and document_id in fields_by_document:
+                    fields = fields_by_document[document_id]
+                else:
+                    fields = json.loads(document['fields'])
+                by_rule = stored_issues.get(document_id, {})
+                if rule_ids:
+                    fresh = engine.evaluate_rules(fields, rule_ids, now)
+                    by_rule.update(fresh)
+                    self._connection.executemany(
+                        'INSERT OR REPLACE INTO rule_results (document_id, rule_id, issues, matched_key, exact) '
+                        'VALUES (?, ?, ?, ?, ?)',
+                        [(document_id, rule_id, json.dumps(rule_issues), *self._match_info(reference, rule_id, fields))
+                         for rule_id, rule_issues in fresh.items()])
+
+                issues = [issue for rule_id in engine.rules for issue in by_rule.get(rule_id, [])]
+                risk_score, is_valid = engine.score(issues)
+                status = validation_status(is_valid, issues)
+                self._connection.execute(
+                    'UPDATE documents SET fields = ?, status = ?, risk_score = ?, reference_data_version = ?, '
+                    'updated_at = ? WHERE id = ?',
+                    (json.dumps(fields), status, risk_score, reference.version, time.time(), document_id))
+                if status != document['status']:
+                    change = {
+                        'document_id': document_id,
+                        'previous_status': document['status'],
+                        'status': status,
+                        'risk_score': risk_score,
+                        'reference_data_version': reference.version,
+                        'changed_at': time.time()
+                    }
+                    self._connection.execute(
+                        'INSERT INTO status_changes (document_id, previous_status, status, risk_score, '
+                        'reference_data_version, changed_at) VALUES (?, ?, ?, ?, ?, ?)', tuple(change.values()))
+                    changes.append(change)
+        return changes
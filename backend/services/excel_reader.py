@@ -0,0 +1,150 @@
+import io
+import os
+from collections import namedtuple
+from datetime import date, datetime, time
+from openpyxl import load_workbook
+from utils.metrics import log
+
+# Filled rows read from each sheet when a workbook is read as one document.
+# Bounds the time, the extracted text and so memory for very large
+# blotters, while every sheet is still visited; a workbook cut short is
+# reported as truncated. Bundles stream every row instead.
+DEFAULT_EXCEL_MAX_ROWS = int(os.environ.get('EXCEL_MAX_ROWS', 10000))
+
+# A row with at least this many filled cells is a table row rather than a
+# label and its value
+TABLE_MIN_CELLS = 3
+
+# The text of a workbook and the titles of the sheets cut short at max_rows
+WorkbookText = namedtuple('WorkbookText', ['text', 'truncated_sheets'])
+
+
+class WorkbookReader:
+    """
+    Streams the sheets of an Excel workbook as label and value pairs
+
+    The workbook is opened read-only, so openpyxl parses rows from the zip
+    as they are iterated and never holds a whole sheet. Up to max_rows
+    filled rows of every sheet are read, in workbook order:
+
+    - a row holding a label and a value, in any two columns, gives that
+      pair, so that term sheets laid out as a two-column form read as
+      'Label: value' lines
+    - the first row of three or more text cells is a table header, and
+      each later row of three or more cells gives one pair per cell,
+      labelled by its column's header, as in a trade blotter
+    - any other filled cell is passed on unlabelled
+    """
+
+    def __init__(self, max_rows=DEFAULT_EXCEL_MAX_ROWS):
+        self.max_rows = max_rows
+
+    def iter_pairs(self, source, truncated_sheets=None, max_rows=None):
+        """
+        Yield (sheet, label, value) for every entry of a workbook, given a
+        path or a binary stream; label is None for unlabelled cells and
+        values are formatted as text
+
+        max_rows overrides the reader's limit (0 reads every row). The title
+        of each sheet cut short is appended to the list truncated_sheets.
+        """
+        max_rows = self.max_rows if max_rows is None else max_rows
+        workbook = load_workbook(source, read_only=True, data_only=True)
+        try:
+            for sheet in workbook.worksheets:
+                header = None
+                rows = 0
+                for row in sheet.iter_rows():
+                    filled = []
+                    for column, cell in enumerate(row):
+                        if cell.value is not None:
+                            value = format_cell(cell)
+                            if value:
+                                filled.append((column, value))
+                    if not filled:
+                        continue
+                    rows += 1
+                    if max_rows and rows > max_rows:
+                        log(f"Sheet '{sheet.title}' has more than {max_rows} rows; the rest is not extracted")
+                        if truncated_sheets is not None:
+                            truncated_sheets.append(sheet.title)
+                        break
+
+                    if len(filled) < TABLE_MIN_CELLS:
+                        if len(filled) == 2:
+                            yield sheet.title, filled[0][1].rstrip(':').strip(), filled[1][1]
+                        else:
+                            yield sheet.title, None, filled[0][1]
+                    elif header is None and all(isinstance(row[column].value, str) for column, _ in filled):
+                        header = dict(filled)
+                    else:
+                        for column, value in filled:
+                            yield sheet.title, header.get(column) if header else None, value
+                        # Separates the records of a table
+                        yield sheet.title, None, None
+        finally:
+            workbook.close()
+
+    def iter_lines(self, source, truncated_sheets=None, max_rows=None):
+        """
+        Yield the text lines of a workbook: 'label: value' for labelled
+        entries, the value alone otherwise, and a '[sheet]' line before
+        each sheet; truncated_sheets and max_rows are as in iter_pairs
+        """
+        current_sheet = None
+        for sheet, label, value in self.iter_pairs(source, truncated_sheets, max_rows):
+            if sheet != current_sheet:
+                if current_sheet is not None:
+                    yield ''
+                yield f"[{sheet}]"
+                current_sheet = sheet
+            if value is None:
+                yield ''
+            elif label:
+                yield f"{label}: {value}"
+            else:
+                yield value
+
+    def read(self, source):
+        """
+        Return the WorkbookText of a workbook, one line per entry
+        """
+        text = io.StringIO()
+        truncated_sheets = []
+        for line in self.iter_lines(source, truncated_sheets):
+            text.write(line)
+            text.write('\n')
+        return WorkbookText(text.getvalue(), truncated_sheets)
+
+    def read_text(self, source):
+        """
+        Return the text of a workbook, one line per entry
+        """
+        return self.read(source).text
+
+
+def format_cell(cell):
+    """
+    Format a cell value as the text a reader of the sheet sees: dates in
+    ISO format, percentages with a percent sign and whole numbers without
+    a decimal point
+    """
+    value = cell.value
+    if isinstance(value, datetime):
+        return value.date().isoformat() if value.time() == time() else value.isoformat(sep=' ')
+    if isinstance(value, (date, time)):
+        return value.isoformat()
+    if isinstance(value, bool):
+        return str(value).upper()
+    if isinstance(value, (int, float)):
+        if '%' in (cell.number_format or ''):
+            value = round(value * 100, 10)
+            return f"{_format_number(value)}%"
+        return _format_number(value)
+    return str(value).strip()
+
+
+def _format_number(value):
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return str(value)
@@ -0,0 +1,221 @@
+import hashlib
+import os
+import threading
+import uuid
+
+# Location and size bound of the shared extraction cache. A size of 0
+# disables caching.
+DEFAULT_CACHE_DIR = os.environ.get('EXTRACTION_CACHE_DIR', 'cache/extractions')
+DEFAULT_CACHE_MAX_BYTES = int(os.environ.get('EXTRACTION_CACHE_MAX_MB', 512)) * 1024 * 1024
+
+# Binary data stored with an entry's text, such as the token table of an
+# OCR'd document, lives in a sibling file with this suffix
+BYTES_SUFFIX = '.tokens'
+
+# Eviction trims the cache to this fraction of its limit so that it does
+# not run again on the very next write
+EVICTION_TARGET_RATIO = 0.9
+
+_default_cache = None
+_default_cache_lock = threading.Lock()
+
+
+def get_extraction_cache():
+    """
+    Return the process-wide extraction cache, or None if caching is disabled
+    """
+    global _default_cache
+    if DEFAULT_CACHE_MAX_BYTES <= 0:
+        return None
+    with _default_cache_lock:
+        if _default_cache is None:
+            _default_cache = ExtractionCache(DEFAULT_CACHE_DIR, DEFAULT_CACHE_MAX_BYTES)
+        return _default_cache
+
+
+class ExtractionCache:
+    """
+    Content-addressed on-disk cache of extracted document text, and of
+    binary data stored with it
+
+    Entries are keyed on the hash of the uploaded bytes combined with the
+    extractor settings, so the same document uploaded under any name hits
+    the same entry while a change in OCR settings misses. Recency is tracked
+    through file modification times, which lets several worker processes
+    share one cache directory, and the least recently used entries are
+    evicted once the directory grows beyond max_bytes.
+    """
+
+    def __init__(self, cache_dir, max_bytes):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.writes = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+
+        os.makedirs(cache_dir, exist_ok=True)
+        self._total_bytes = sum(size for _, _, size in self._scan())
+
+    def make_key(self, file_hash, settings):
+        """
+        Build the cache key for a document hash and extractor settings string
+        """
+        return hashlib.sha256(f"{file_hash}:{settings}".encode('utf-8')).hexdigest()
+
+    def get(self, key):
+        """
+        Return the cached text for a key, or None on a miss
+        """
+        path = self._entry_path(key)
+        try:
+            with open(path, 'r', encoding='utf-8') as file:
+                text = file.read()
+            # Mark the entry as recently used
+            os.utime(path)
+        except OSError:
+            with self._lock:
+                self.misses += 1
+            return None
+
+        with self._lock:
+            self.hits += 1
+        return text
+
+    def get_bytes(self, key):
+        """
+        Return the binary data stored with a key's text, or None
+
+        Not counted as a hit or miss, since it is only looked up after the
+        text was found.
+        """
+        try:
+            with open(self._entry_path(key) + BYTES_SUFFIX, 'rb') as file:
+                return file.read()
+        except OSError:
+            return None
+
+    def put(self, key, text):
+        """
+        Store the extracted text for a key
+        """
+        self._write(self._entry_path(key), text.encode('utf-8'), new_entry=True)
+
+    def put_bytes(self, key, data):
+        """
+        Store binary data with a key's text; evicted together with it
+        """
+        self._write(self._entry_path(key) + BYTES_SUFFIX, data, new_entry=False)
+
+    def _write(self, path, data, new_entry):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        # Write to a private temporary file and rename it into place so that
+        # concurrent readers never see a partially written entry
+        temp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        with open(temp_path, 'wb') as file:
+            file.write(data)
+        # A rewritten entry replaces the bytes of the old one rather than
+        # adding to them
+        try:
+            replaced_bytes = os.path.getsize(path)
+        except OSError:
+            replaced_bytes = 0
+        os.replace(temp_path, path)
+
+        with self._lock:
+            if new_entry:
+                self.writes += 1
+            self._total_bytes += len(data) - replaced_bytes
+            needs_eviction = self._total_bytes > self.max_bytes
+
+        if needs_eviction:
+            self._evict()
+
+    def stats(self):
+        """
+        Return hit/miss counters and the current cache size
+        """
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': self.hits / lookups if lookups else 0.0,
+                'writes': self.writes,
+                'evictions': self.evictions,
+                'size_bytes': self._total_bytes,
+                'max_bytes': self.max_bytes
+            }
+
+    def _entry_path(self, key):
+        """
+        Return the file path of a cache entry, fanned out by key prefix
+        """
+        return os.path.join(self.cache_dir, key[:2], key + '.txt')
+
+    def _scan(self):
+        """
+        Yield (mtime, path, size) for every cache entry on disk, its size
+        including the binary data stored with it
+
+        Binary data whose text is gone, left behind when an entry was
+        evicted between its two writes, is yielded as an entry of its own so
+        that it is evicted too.
+        """
+        for root, _, filenames in os.walk(self.cache_dir):
+            filenames = set(filenames)
+            for filename in filenames:
+                if filename.endswith('.txt' + BYTES_SUFFIX) and filename[:-len(BYTES_SUFFIX)] not in filenames:
+                    path = os.path.join(root, filename[:-len(BYTES_SUFFIX)])
+                    try:
+                        stat = os.stat(path + BYTES_SUFFIX)
+                    except OSError:
+                        continue
+                    yield stat.st_mtime, path, stat.st_size
+                    continue
+                if not filename.endswith('.txt'):
+                    continue
+                path = os.path.join(root, filename)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                size = stat.st_size
+                if filename + BYTES_SUFFIX in filenames:
+                    try:
+                        size += os.path.getsize(path + BYTES_SUFFIX)
+                    except OSError:
+                        pass
+                yield stat.st_mtime, path, size
+
+    def _evict(self):
+        """
+        Delete least recently used entries until the cache is under its target size
+        """
+        # Rescan rather than trusting the running total, since other worker
+        # processes may have written or evicted entries in the meantime
+        entries = sorted(self._scan())
+        total_bytes = sum(size for _, _, size in entries)
+        target_bytes = self.max_bytes * EVICTION_TARGET_RATIO
+        evicted = 0
+
+        for _, path, size in entries:
+            if total_bytes <= target_bytes:
+                break
+            removed = False
+            for entry_path in (path, path + BYTES_SUFFIX):
+                try:
+                    os.remove(entry_path)
+                    removed = True
+                except OSError:
+                    pass
+            if not removed:
+                continue
+            total_bytes -= size
+            evicted += 1
+
+        with self._lock:
+            self.evictions += evicted
+            self._total_bytes = total_bytes
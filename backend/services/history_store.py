@@ -0,0 +1,234 @@
+import atexit
+import base64
+import json
+import os
+import queue
+import threading
+import time
+import traceback
+from services.rule_engine import validation_status
+from utils.db import connect_sqlite
+from utils.metrics import log
+
+# SQLite file of the validation history, shared by all worker processes
+DEFAULT_HISTORY_DB = os.environ.get('HISTORY_DB', 'data/history.db')
+
+# Validations are written by a background thread in batches of up to this
+# many rows, at least every HISTORY_FLUSH_SECONDS
+DEFAULT_HISTORY_BATCH_SIZE = int(os.environ.get('HISTORY_BATCH_SIZE', 500))
+DEFAULT_HISTORY_FLUSH_SECONDS = float(os.environ.get('HISTORY_FLUSH_SECONDS', 0.5))
+
+# Rows waiting to be written; record() drops rows beyond this rather than
+# slowing down validations if the disk cannot keep up
+HISTORY_QUEUE_SIZE = 50000
+
+# Filters accepted by HistoryStore.query, each backed by an index that ends
+# in the sort order (created_at, id)
+HISTORY_FILTERS = ('status', 'counterparty', 'issuer', 'document_hash')
+
+_default_store = None
+_default_store_lock = threading.Lock()
+
+
+def get_history_store():
+    """
+    Return the process-wide history store, creating it on first use
+    """
+    global _default_store
+    with _default_store_lock:
+        if _default_store is None:
+            _default_store = HistoryStore(DEFAULT_HISTORY_DB)
+            atexit.register(_default_store.close)
+        return _default_store
+
+
+def encode_cursor(created_at, row_id):
+    """
+    Encode the sort key of the last row of a page as an opaque cursor
+    """
+    return base64.urlsafe_b64encode(json.dumps([created_at, row_id]).encode('utf-8')).decode('ascii')
+
+
+def decode_cursor(cursor):
+    """
+    Decode a cursor from encode_cursor, raising ValueError if it is malformed
+    """
+    try:
+        created_at, row_id = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+        return float(created_at), int(row_id)
+    except Exception:
+        raise ValueError('Invalid cursor') from None
+
+
+class HistoryStore:
+    """
+    Append-only history of validations in SQLite
+
+    record() only queues the row; a writer thread inserts queued rows in
+    batches, one transaction per batch, so validations never wait on disk.
+    Pages are read newest first with keyset pagination on (created_at, id):
+    each page is a range scan of an index starting where the previous page
+    ended, so page cost does not grow with the table or the page number.
+    """
+
+    def __init__(self, db_path, batch_size=DEFAULT_HISTORY_BATCH_SIZE, flush_seconds=DEFAULT_HISTORY_FLUSH_SECONDS):
+        self.batch_size = batch_size
+        self.flush_seconds = flush_seconds
+        self.dropped = 0
+        self._write_connection = connect_sqlite(db_path)
+        self._read_connection = connect_sqlite(db_path)
+        self._read_lock = threading.Lock()
+        with self._write_connection:
+            self._write_connection.executescript('''
+                CREATE TABLE IF NOT EXISTS validations (
+                    id INTEGER PRIMARY KEY,
+                    created_at REAL NOT NULL,
+                    document_hash TEXT,
+                    filename TEXT,
+                    status TEXT NOT NULL,
+                    risk_score REAL NOT NULL,
+                    counterparty TEXT,
+                    issuer TEXT,
+                    reference_data_version TEXT,
+                    fields TEXT NOT NULL,
+                    issues TEXT NOT NULL,
+                    timings TEXT
+                );
+                CREATE INDEX IF NOT EXISTS idx_validations_created ON validations (created_at, id);
+                CREATE INDEX IF NOT EXISTS idx_validations_status ON validations (status, created_at, id);
+                CREATE INDEX IF NOT EXISTS idx_validations_counterparty ON validations (counterparty, created_at, id);
+                CREATE INDEX IF NOT EXISTS idx_validations_issuer ON validations (issuer, created_at, id);
+                CREATE INDEX IF NOT EXISTS idx_validations_document ON validations (document_hash, created_at, id);
+            ''')
+
+        self._queue = queue.Queue(maxsize=HISTORY_QUEUE_SIZE)
+        self._closed = threading.Event()
+        self._writer = threading.Thread(target=self._write_batches, daemon=True, name='sheetwise-history')
+        self._writer.start()
+
+    def record(self, document_hash, filename, fields, validation_results, timings=None):
+        """
+        Queue a validation for writing
+        """
+        row = (
+            time.time(),
+            document_hash,
+            filename,
+            validation_status(validation_results['is_valid'], validation_results['issues']),
+            validation_results['risk_score'],
+            fields.get('counterparty'),
+            fields.get('issuer'),
+            validation_results.get('reference_data_version'),
+            json.dumps(fields),
+            json.dumps(validation_results['issues']),
+            json.dumps(timings) if timings is not None else None
+        )
+        try:
+            self._queue.put_nowait(row)
+        except queue.Full:
+            self.dropped += 1
+            if self.dropped % 1000 == 1:
+                log(f"History queue is full; dropped a validation of {filename} ({self.dropped} dropped so far)")
+
+    def flush(self, timeout=None):
+        """
+        Wait until every queued row has been written
+        """
+        if timeout is None:
+            self._queue.join()
+        else:
+            self._join_with_timeout(timeout)
+
+    def close(self):
+        """
+        Write the remaining rows and stop the writer thread
+        """
+        if not self._closed.is_set():
+            self.flush(timeout=5)
+            self._closed.set()
+            self._writer.join(timeout=5)
+
+    def query(self, limit=50, cursor=None, since=None, until=None, **filters):
+        """
+        Return (rows, next_cursor) of the validations matching the filters,
+        newest first
+
+        filters may hold any of HISTORY_FILTERS. since and until bound the
+        timestamp (epoch seconds). next_cursor is None on the last page.
+        """
+        conditions = []
+        params = []
+        for name in HISTORY_FILTERS:
+            value = filters.pop(name, None)
+            if value is not None:
+                conditions.append(f'{name} = ?')
+                params.append(value)
+        if filters:
+            raise ValueError(f"Unknown history filter: {', '.join(sorted(filters))}")
+        if since is not None:
+            conditions.append('created_at >= ?')
+            params.append(since)
+        if until is not None:
+            conditions.append('created_at < ?')
+            params.append(until)
+        if cursor is not None:
+            created_at, row_id = decode_cursor(cursor)
+            conditions.append('(created_at, id) < (?, ?)')
+            params.extend([created_at, row_id])
+
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ''
+        # One extra row tells whether there is a next page
+        sql = f'SELECT * FROM validations {where} ORDER BY created_at DESC, id DESC LIMIT ?'
+        with self._read_lock:
+            rows = self._read_connection.execute(sql, (*params, limit + 1)).fetchall()
+
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = encode_cursor(rows[-1]['created_at'], rows[-1]['id'])
+        return [self._deserialize(row) for row in rows], next_cursor
+
+    def _deserialize(self, row):
+        entry = dict(row)
+        entry['fields'] = json.loads(entry['fields'])
+        entry['issues'] = json.loads(entry['issues'])
+        entry['timings'] = json.loads(entry['timings']) if entry['timings'] is not None else None
+        return entry
+
+    def _join_with_timeout(self, timeout):
+        deadline = time.monotonic() + timeout
+        while self._queue.unfinished_tasks and time.monotonic() < deadline:
+            time.sleep(0.01)
+
+    def _write_batches(self):
+        """
+        Writer thread: insert queued rows in batches
+        """
+        while not self._closed.is_set():
+            try:
+                batch = [self._queue.get(timeout=self.flush_seconds)]
+            except queue.Empty:
+                continue
+            # Collect whatever else arrives within the flush interval
+            deadline = time.monotonic() + self.flush_seconds
+            while len(batch) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+
+            try:
+                with self._write_connection:
+                    self._write_connection.executemany(
+                        'INSERT INTO validations (created_at, document_hash, filename, status, risk_score, '
+                        'counterparty, issuer, reference_data_version, fields, issues, timings) '
+                        'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)', batch)
+            except Exception as e:
+                log(f"Error writing {len(batch)} validations to history: {str(e)}")
+                log(traceback.format_exc())
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
@@ -0,0 +1,273 @@
+import os
+import numpy as np
+from PIL import Image
+
+# Set OCR_PREPROCESS=false to send page images to Tesseract unchanged
+DEFAULT_OCR_PREPROCESS = os.environ.get('OCR_PREPROCESS', 'true').lower() not in ('0', 'false', 'no')
+
+# Page images above OCR_TARGET_DPI are downscaled to it and those below
+# OCR_MIN_DPI upscaled to it. Tesseract is most accurate from about 200 dpi
+# on, and gains little but time above 300.
+DEFAULT_OCR_TARGET_DPI = int(os.environ.get('OCR_TARGET_DPI', 300))
+DEFAULT_OCR_MIN_DPI = int(os.environ.get('OCR_MIN_DPI', 200))
+
+# Largest skew, in degrees either way, that is detected and corrected
+DEFAULT_OCR_DESKEW_MAX_ANGLE = float(os.environ.get('OCR_DESKEW_MAX_ANGLE', 5))
+
+# A page with less than this share of ink pixels after thresholding is
+# blank (speckle and scanner noise only) and is not OCR'd
+DEFAULT_OCR_BLANK_INK_RATIO = float(os.environ.get('OCR_BLANK_INK_RATIO', 0.002))
+
+# Adaptive threshold: a pixel is ink when it is this much darker than the
+# mean of the surrounding window, a square of THRESHOLD_WINDOW_INCHES
+THRESHOLD_WINDOW_INCHES = 0.125
+THRESHOLD_OFFSET = 0.15
+
+# Page widths, in inches, for which an image's dpi metadata is believed;
+# otherwise the dpi is estimated from the width of a letter-size page
+PLAUSIBLE_PAGE_WIDTH_INCHES = (3.5, 17)
+ASSUMED_PAGE_WIDTH_INCHES = 8.5
+
+# Images are never scaled above this many pixels
+MAX_PIXELS = 50 * 1000 * 1000
+
+# Rows or columns at the edge of the page that are mostly dark are scanner
+# borders or punched-hole shadows and are trimmed
+BORDER_DARK_RATIO = 0.5
+
+# Rows and columns with fewer ink pixels than this share are treated as
+# empty when cropping to the content, so isolated specks do not count
+CONTENT_INK_RATIO = 0.005
+
+# Margin, in inches, left around the content when cropping
+CROP_MARGIN_INCHES = 0.1
+
+# Ink pixels sampled when estimating the skew angle
+DESKEW_SAMPLE_SIZE = 20000
+
+
+class ImagePreprocessor:
+    """
+    Prepares scanned and photographed page images for Tesseract
+
+    Every page is converted to grayscale, scaled to between min_dpi and
+    target_dpi, stripped of scanner borders, binarized with a local
+    (adaptive) threshold, cleared of isolated specks, cropped to its content
+    and deskewed. Pages that hold no text are reported as blank so that OCR
+    can skip them. All steps after scaling operate on NumPy arrays of the
+    whole page.
+
+    Instances only hold settings, so they can be sent to OCR pool workers.
+    """
+
+    def __init__(self, target_dpi=DEFAULT_OCR_TARGET_DPI, min_dpi=DEFAULT_OCR_MIN_DPI,
+                 deskew_max_angle=DEFAULT_OCR_DESKEW_MAX_ANGLE, blank_ink_ratio=DEFAULT_OCR_BLANK_INK_RATIO):
+        self.target_dpi = target_dpi
+        self.min_dpi = min(min_dpi, target_dpi)
+        self.deskew_max_angle = deskew_max_angle
+        self.blank_ink_ratio = blank_ink_ratio
+
+    def fingerprint(self):
+        """
+        Describe every setting that affects the preprocessed image, for
+        extraction cache keys
+        """
+        return (f"dpi={self.min_dpi}-{self.target_dpi}|deskew={self.deskew_max_angle}"
+                f"|blank={self.blank_ink_ratio}|threshold={THRESHOLD_WINDOW_INCHES}/{THRESHOLD_OFFSET}")
+
+    def process(self, image, dpi=None):
+        """
+        Preprocess one page image rendered or scanned at dpi (read from the
+        image, or estimated, when None)
+
+        Returns (image, details): the binarized page as a grayscale PIL
+        image, or None for a blank page, and a dict with the dpi of the
+        result, the scale applied, the skew corrected in degrees and the
+        share of ink pixels.
+        """
+        gray = _to_grayscale(image)
+        source_dpi = dpi or _image_dpi(gray)
+        scale = self._scale(source_dpi, gray.size)
+        if scale != 1.0:
+            size = (max(1, round(gray.width * scale)), max(1, round(gray.height * scale)))
+            # Downscales are mostly done by the much cheaper box reduction
+            # (reducing_gap), which averages pixels just as well for OCR
+            gray = gray.resize(size, Image.LANCZOS if scale < 1 else Image.BICUBIC, reducing_gap=1.0)
+        out_dpi = round(source_dpi * scale)
+
+        page = trim_borders(np.asarray(gray))
+        if page.size:
+            ink = remove_specks(adaptive_threshold(page, _odd(THRESHOLD_WINDOW_INCHES * out_dpi)))
+        else:
+            ink = np.zeros((0, 0), dtype=bool)
+        ink_ratio = float(ink.mean()) if ink.size else 0.0
+        details = {'dpi': out_dpi, 'scale': round(scale, 4), 'skew_degrees': 0.0,
+                   'ink_ratio': round(ink_ratio, 5), 'blank': ink_ratio < self.blank_ink_ratio}
+        if details['blank']:
+            return None, details
+
+        margin = round(CROP_MARGIN_INCHES * out_dpi)
+        ink = crop_to_content(ink, margin)
+        if self.deskew_max_angle > 0:
+            angle = estimate_skew(ink, self.deskew_max_angle)
+            if abs(angle) >= 0.1:
+                ink = crop_to_content(_rotate(ink, angle), margin)
+                details['skew_degrees'] = round(angle, 2)
+
+        page = Image.fromarray(np.where(ink, 0, 255).astype(np.uint8), mode='L')
+        page.info['dpi'] = (out_dpi, out_dpi)
+        return page, details
+
+    def _scale(self, dpi, size):
+        if dpi > self.target_dpi:
+            scale = self.target_dpi / dpi
+        elif dpi < self.min_dpi:
+            scale = self.min_dpi / dpi
+        else:
+            return 1.0
+        # Not worth resampling for a few percent
+        if abs(scale - 1) < 0.1:
+            return 1.0
+        return min(scale, (MAX_PIXELS / max(1, size[0] * size[1])) ** 0.5)
+
+
+def _to_grayscale(image):
+    if image.mode in ('RGBA', 'LA') or (image.mode == 'P' and 'transparency' in image.info):
+        # Transparent areas are paper, not ink
+        background = Image.new('RGBA', image.size, (255, 255, 255, 255))
+        image = Image.alpha_composite(background, image.convert('RGBA'))
+    return image.convert('L')
+
+
+def _image_dpi(image):
+    """
+    Return the horizontal dpi of an image from its metadata when that gives
+    a plausible page width, else estimate it from a letter-size page width
+    """
+    dpi = image.info.get('dpi')
+    if dpi:
+        dpi = float(dpi[0] if isinstance(dpi, tuple) else dpi)
+        low, high = PLAUSIBLE_PAGE_WIDTH_INCHES
+        if dpi > 0 and low <= image.width / dpi <= high:
+            return dpi
+    return max(1.0, image.width / ASSUMED_PAGE_WIDTH_INCHES)
+
+
+def _odd(value):
+    value = max(3, int(value))
+    return value if value % 2 else value + 1
+
+
+def adaptive_threshold(gray, window, offset=THRESHOLD_OFFSET):
+    """
+    Return a boolean ink mask of a grayscale array: pixels darker than the
+    mean of their window x window neighbourhood by more than offset
+
+    Window sums are separable running sums over the edge-padded page, so
+    the cost does not depend on the window size. Uneven lighting and
+    shadows, which defeat a single global threshold, are absorbed by the
+    local mean.
+    """
+    radius = window // 2
+    padded = np.pad(gray, radius + 1, mode='edge').astype(np.float32)
+    # float32 running sums round by a few units on wide pages, nothing
+    # against window sums in the hundreds of thousands
+    columns = np.cumsum(padded, axis=0, dtype=np.float32)
+    columns = columns[window + 1:] - columns[1:-window]
+    sums = np.cumsum(columns, axis=1, dtype=np.float32)
+    sums = sums[:, window + 1:] - sums[:, 1:-window]
+    # gray < mean * (1 - offset), without dividing
+    return gray * np.float32(window * window) < sums * np.float32(1 - offset)
+
+
+def remove_specks(ink):
+    """
+    Clear the ink pixels of a mask that have no ink among their eight
+    neighbours: scanner noise, which would otherwise count as content
+    """
+    height, width = ink.shape
+    padded = np.pad(ink, 1).view(np.uint8)
+    neighbours = sum(padded[dy:dy + height, dx:dx + width] for dy in range(3) for dx in range(3))
+    # The sum includes the pixel itself
+    return ink & (neighbours > 1)
+
+
+def trim_borders(gray):
+    """
+    Drop the rows and columns at each edge of a grayscale array that are
+    mostly dark, such as the frame around a scanned page
+
+    Done before thresholding, which would turn the inside of a wide frame
+    white and leave only its edge as a line of ink.
+    """
+    dark = gray < 128
+    top, bottom = _trim_range(dark.mean(axis=1))
+    left, right = _trim_range(dark.mean(axis=0))
+    return gray[top:bottom, left:right]
+
+
+def _trim_range(ratios):
+    dark = ratios > BORDER_DARK_RATIO
+    start = 0
+    while start < len(dark) and dark[start]:
+        start += 1
+    end = len(dark)
+    while end > start and dark[end - 1]:
+        end -= 1
+    return start, end
+
+
+def crop_to_content(ink, margin):
+    """
+    Crop an ink mask to the rows and columns holding text, plus margin
+    """
+    rows = np.flatnonzero(ink.sum(axis=1) >= max(1, CONTENT_INK_RATIO * ink.shape[1]))
+    cols = np.flatnonzero(ink.sum(axis=0) >= max(1, CONTENT_INK_RATIO * ink.shape[0]))
+    if not len(rows) or not len(cols):
+        return ink
+    top, bottom = max(0, rows[0] - margin), min(ink.shape[0], rows[-1] + margin + 1)
+    left, right = max(0, cols[0] - margin), min(ink.shape[1], cols[-1] + margin + 1)
+    return ink[top:bottom, left:right]
+
+
+def estimate_skew(ink, max_angle, coarse_step=0.5, fine_step=0.1):
+    """
+    Return the angle, in degrees, by which the text lines of an ink mask
+    slope down to the right
+
+    Sampled ink pixels are projected onto the vertical axis at each
+    candidate angle; at the true angle the text lines fall into few rows,
+    so the sum of squared row counts peaks. All candidate angles are
+    scored with a single bincount.
+    """
+    ys, xs = np.nonzero(ink)
+    if len(ys) < 100:
+        return 0.0
+    if len(ys) > DESKEW_SAMPLE_SIZE:
+        picks = np.linspace(0, len(ys) - 1, DESKEW_SAMPLE_SIZE).astype(np.int64)
+        ys, xs = ys[picks], xs[picks]
+
+    best = _best_angle(ys, xs, np.arange(-max_angle, max_angle + coarse_step / 2, coarse_step))
+    return _best_angle(ys, xs, np.arange(best - coarse_step, best + coarse_step + fine_step / 2, fine_step))
+
+
+def _best_angle(ys, xs, angles):
+    slopes = np.tan(np.radians(angles))
+    projected = np.rint(ys[None, :] - xs[None, :] * slopes[:, None]).astype(np.int64)
+    projected -= projected.min()
+    span = int(projected.max()) + 1
+    rows = projected + (np.arange(len(angles)) * span)[:, None]
+    counts = np.bincount(rows.ravel(), minlength=span * len(angles)).reshape(len(angles), span)
+    scores = (counts.astype(np.float64) ** 2).sum(axis=1)
+    return float(angles[int(np.argmax(scores))])
+
+
+def _rotate(ink, angle):
+    """
+    Rotate an ink mask so that lines sloping down to the right by angle
+    degrees become horizontal
+    """
+    image = Image.fromarray(np.where(ink, 0, 255).astype(np.uint8), mode='L')
+    # PIL rotates counterclockwise, which lifts the right-hand side
+    rotated = image.rotate(angle, resample=Image.NEAREST, fillcolor=255, expand=True)
+    return np.asarray(rotated) < 128
@@ -0,0 +1,343 @@
+import json
+import os
+import threading
+import time
+import traceback
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from utils.db import connect_sqlite
+from utils.metrics import log, current_request_id, request_trace, get_metrics_registry, JOB_SECONDS
+
+# Job queue configuration. JOB_QUEUE_BACKEND is 'memory' (jobs are visible
+# to the worker process that accepted them) or 'sqlite' (job status is
+# shared by every worker process through JOB_QUEUE_DB).
+DEFAULT_JOB_QUEUE_BACKEND = os.environ.get('JOB_QUEUE_BACKEND', 'memory')
+DEFAULT_JOB_QUEUE_DB = os.environ.get('JOB_QUEUE_DB', 'data/jobs.db')
+DEFAULT_JOB_WORKERS = int(os.environ.get('JOB_WORKERS', 2))
+DEFAULT_JOB_QUEUE_MAX_PENDING = int(os.environ.get('JOB_QUEUE_MAX_PENDING', 100))
+
+# Finished jobs are kept for polling this long before being pruned
+JOB_RETENTION_SECONDS = int(os.environ.get('JOB_RETENTION_SECONDS', 24 * 60 * 60))
+
+# A queued or running job whose queue has not renewed its lease for this
+# long, because its process crashed or was restarted, is marked failed
+JOB_LEASE_SECONDS = int(os.environ.get('JOB_LEASE_SECONDS', 60))
+
+ABANDONED_JOB_ERROR = 'The worker running this job stopped before it finished; submit the document again'
+
+JOB_QUEUED = 'queued'
+JOB_RUNNING = 'running'
+JOB_SUCCEEDED = 'succeeded'
+JOB_FAILED = 'failed'
+
+_default_queue = None
+_default_queue_lock = threading.Lock()
+
+
+def get_job_queue():
+    """
+    Return the process-wide job queue, creating it on first use
+    """
+    global _default_queue
+    with _default_queue_lock:
+        if _default_queue is None:
+            if DEFAULT_JOB_QUEUE_BACKEND == 'sqlite':
+                store = SQLiteJobStore(DEFAULT_JOB_QUEUE_DB)
+            else:
+                store = MemoryJobStore()
+            _default_queue = JobQueue(store, DEFAULT_JOB_WORKERS, DEFAULT_JOB_QUEUE_MAX_PENDING)
+        return _default_queue
+
+
+class QueueFullError(Exception):
+    """
+    Raised when a job is submitted while the queue is at capacity
+    """
+
+
+class MemoryJobStore:
+    """
+    Job records held in a dictionary of the current process
+    """
+
+    def __init__(self):
+        self._jobs = {}
+        self._lock = threading.Lock()
+
+    def create(self, job_id, owner):
+        now = time.time()
+        with self._lock:
+            self._jobs[job_id] = {
+                'id': job_id,
+                'status': JOB_QUEUED,
+                'pages_done': 0,
+                'pages_total': None,
+                'result': None,
+                'error': None,
+                'created_at': now,
+                'updated_at': now,
+                'owner': owner,
+                'heartbeat_at': now
+            }
+
+    def update(self, job_id, **fields):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is not None:
+                job.update(fields, updated_at=time.time())
+
+    def get(self, job_id):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return dict(job) if job is not None else None
+
+    def prune(self, older_than):
+        with self._lock:
+            expired = [job_id for job_id, job in self._jobs.items()
+                       if job['status'] in (JOB_SUCCEEDED, JOB_FAILED) and job['updated_at'] < older_than]
+            for job_id in expired:
+                del self._jobs[job_id]
+
+    def heartbeat(self, owner):
+        now = time.time()
+        with self._lock:
+            for job in self._jobs.values():
+                if job['owner'] == owner and job['status'] in (JOB_QUEUED, JOB_RUNNING):
+                    job['heartbeat_at'] = now
+
+    def fail_abandoned(self, older_than, error, job_id=None):
+        now = time.time()
+        failed = 0
+        with self._lock:
+            for job in self._jobs.values():
+                if ((job_id is None or job['id'] == job_id) and job['status'] in (JOB_QUEUED, JOB_RUNNING)
+                        and job['heartbeat_at'] < older_than):
+                    job.update(status=JOB_FAILED, error=error, updated_at=now)
+                    failed += 1
+        return failed
+
+
+class SQLiteJobStore:
+    """
+    Job records in a SQLite database shared by all worker processes, so a
+    status poll can be answered by any worker
+    """
+
+    def __init__(self, db_path):
+        self._connection = connect_sqlite(db_path)
+        self._lock = threading.Lock()
+        with self._lock, self._connection:
+            self._connection.execute('''
+                CREATE TABLE IF NOT EXISTS jobs (
+                    id TEXT PRIMARY KEY,
+                    status TEXT NOT NULL,
+                    pages_done INTEGER NOT NULL DEFAULT 0,
+                    pages_total INTEGER,
+                    result TEXT,
+                    error TEXT,
+                    created_at REAL NOT NULL,
+                    updated_at REAL NOT NULL,
+                    owner TEXT,
+                    heartbeat_at REAL
+                )
+            ''')
+            # Databases created before jobs had leases
+            columns = {row['name'] for row in self._connection.execute('PRAGMA table_info(jobs)')}
+            for column, column_type in (('owner', 'TEXT'), ('heartbeat_at', 'REAL')):
+                if column not in columns:
+                    self._connection.execute(f'ALTER TABLE jobs ADD COLUMN {column} {column_type}')
+            self._connection.execute(
+                'CREATE INDEX IF NOT EXISTS idx_jobs_status_updated ON jobs (status, updated_at)')
+
+    def create(self, job_id, owner):
+        now = time.time()
+        with self._lock, self._connection:
+            self._connection.execute(
+                'INSERT INTO jobs (id, status, created_at, updated_at, owner, heartbeat_at) VALUES (?, ?, ?, ?, ?, ?)',
+                (job_id, JOB_QUEUED, now, now, owner, now))
+
+    def update(self, job_id, **fields):
+        if 'result' in fields:
+            fields['result'] = json.dumps(fields['result'])
+        fields['updated_at'] = time.time()
+        assignments = ', '.join(f'{column} = ?' for column in fields)
+        with self._lock, self._connection:
+            self._connection.execute(f'UPDATE jobs SET {assignments} WHERE id = ?',
+                                     (*fields.values(), job_id))
+
+    def get(self, job_id):
+        with self._lock:
+            row = self._connection.execute('SELECT * FROM jobs WHERE id = ?', (job_id,)).fetchone()
+        if row is None:
+            return None
+        job = dict(row)
+        if job['result'] is not None:
+            job['result'] = json.loads(job['result'])
+        return job
+
+    def prune(self, older_than):
+        with self._lock, self._connection:
+            self._connection.execute(
+                'DELETE FROM jobs WHERE status IN (?, ?) AND updated_at < ?',
+                (JOB_SUCCEEDED, JOB_FAILED, older_than))
+
+    def heartbeat(self, owner):
+        with self._lock, self._connection:
+            self._connection.execute(
+                'UPDATE jobs SET heartbeat_at = ? WHERE owner = ? AND status IN (?, ?)',
+                (time.time(), owner, JOB_QUEUED, JOB_RUNNING))
+
+    def fail_abandoned(self, older_than, error, job_id=None):
+        # Rows without a lease were written before leases existed
+        query = ('UPDATE jobs SET status = ?, error = ?, updated_at = ? '
+                 'WHERE status IN (?, ?) AND (heartbeat_at IS NULL OR heartbeat_at < ?)')
+        parameters = [JOB_FAILED, error, time.time(), JOB_QUEUED, JOB_RUNNING, older_than]
+        if job_id is not None:
+            query += ' AND id = ?'
+            parameters.append(job_id)
+        with self._lock, self._connection:
+            return self._connection.execute(query, parameters).rowcount
+
+
+class JobQueue:
+    """
+    Bounded pool of local worker threads running validation jobs
+
+    The heavy lifting inside a job (Tesseract, pdftoppm, the OCR process
+    pool) happens outside the GIL, so threads are enough to keep several
+    documents in flight without blocking HTTP workers.
+
+    Jobs only run in the process that accepted them. While it has jobs
+    queued or running, the queue renews their lease in the store every
+    quarter of lease_seconds. Jobs whose lease ran out were lost with their
+    process, and are marked failed when a queue starts, when a job is
+    submitted and when one of them is polled, so clients do not poll them
+    forever.
+    """
+
+    def __init__(self, store, max_workers=DEFAULT_JOB_WORKERS, max_pending=DEFAULT_JOB_QUEUE_MAX_PENDING,
+                 lease_seconds=JOB_LEASE_SECONDS):
+        self.store = store
+        self.max_pending = max_pending
+        self.lease_seconds = lease_seconds
+        # Identifies the jobs of this queue in a store shared with other processes
+        self.owner = uuid.uuid4().hex
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='sheetwise-job')
+        self._pending = 0
+        self._lock = threading.Lock()
+        self._heartbeat = None
+        self._fail_abandoned()
+
+    def submit(self, func, *args, **kwargs):
+        """
+        Queue func(*args, progress_callback=..., **kwargs) and return the job id
+
+        The job's result must be JSON serializable. Raises QueueFullError
+        when max_pending jobs are already queued or running.
+        """
+        with self._lock:
+            if self._pending >= self.max_pending:
+                raise QueueFullError(f"Job queue is full ({self.max_pending} jobs pending)")
+            self._pending += 1
+
+        job_id = uuid.uuid4().hex
+        try:
+            self.store.create(job_id, self.owner)
+            self._start_heartbeat()
+            # The job logs and records its stage timings under the id of
+            # the request that queued it
+            self._executor.submit(self._run, job_id, func, args, kwargs, current_request_id())
+        except Exception:
+            with self._lock:
+                self._pending -= 1
+            raise
+
+        self._fail_abandoned()
+        self.store.prune(time.time() - JOB_RETENTION_SECONDS)
+        return job_id
+
+    def get(self, job_id):
+        """
+        Return the job record, or None if the job is unknown or was pruned
+        """
+        job = self.store.get(job_id)
+        if (job is not None and job['status'] in (JOB_QUEUED, JOB_RUNNING)
+                and (job['heartbeat_at'] or 0) < time.time() - self.lease_seconds):
+            self._fail_abandoned(job_id)
+            job = self.store.get(job_id)
+        return job
+
+    def pending_count(self):
+        """
+        Return the number of jobs queued or running in this process
+        """
+        with self._lock:
+            return self._pending
+
+    def _fail_abandoned(self, job_id=None):
+        """
+        Mark failed the queued and running jobs, or the given one, whose
+        lease ran out
+        """
+        failed = self.store.fail_abandoned(time.time() - self.lease_seconds, ABANDONED_JOB_ERROR, job_id)
+        if failed and job_id is None:
+            log(f"Marked {failed} abandoned jobs as failed")
+
+    def _start_heartbeat(self):
+        with self._lock:
+            if self._heartbeat is None:
+                self._heartbeat = threading.Thread(target=self._renew_leases, daemon=True,
+                                                   name='sheetwise-job-heartbeat')
+                self._heartbeat.start()
+
+    def _renew_leases(self):
+        while True:
+            time.sleep(self.lease_seconds / 4)
+            if not self.pending_count():
+                continue
+            try:
+                self.store.heartbeat(self.owner)
+            except Exception as e:
+                log(f"Error renewing job leases: {str(e)}")
+
+    def _run(self, job_id, func, args, kwargs, request_id=None):
+        """
+        Execute a job on a worker thread and record its outcome
+        """
+        def report_progress(pages_done, pages_total):
+            self.store.update(job_id, pages_done=pages_done, pages_total=pages_total)
+
+        started = time.perf_counter()
+        status = JOB_FAILED
+        with request_trace(request_id):
+            try:
+                self.store.update(job_id, status=JOB_RUNNING)
+                result = func(*args, progress_callback=report_progress, **kwargs)
+                self.store.update(job_id, status=JOB_SUCCEEDED, result=result)
+                status = JOB_SUCCEEDED
+            except Exception as e:
+                log(f"Error in job {job_id}: {str(e)}")
+                log(traceback.format_exc())
+                self.store.update(job_id, status=JOB_FAILED, error=str(e))
+            finally:
+                get_metrics_registry().observe(JOB_SECONDS, (status,), time.perf_counter() - started)
+                with self._lock:
+                    self._pending -= 1
+
+
+def serialize_job(job):
+    """
+    Convert a job record into the public status payload
+    """
+    return {
+        'job_id': job['id'],
+        'status': job['status'],
+        'progress': {
+            'pages_done': job['pages_done'],
+            'pages_total': job['pages_total']
+        },
+        'result': job['result'],
+        'error': job['error'],
+        'created_at': job['created_at'],
+        'updated_at': job['updated_at']
+    }
@@ -2,12 +2,25 @@ import re
 import json
 import os
 from datetime import datetime
+from services.field_extractor import DEFAULT_FIELD_EXTRACTOR
+from services.segmentation import DEFAULT_SEGMENTER, TermSheetSegmenter
+from utils.metrics import log
 
 class NLPService:
     """
     Service for performing NLP analysis on term sheet text
     """
     
+    def __init__(self, field_extractor=None, segmenter=None):
+        """
+        Initialize the NLP service with a compiled field extractor, and a
+        segmenter splitting bundled documents that uses it
+        """
+        self.field_extractor = field_extractor or DEFAULT_FIELD_EXTRACTOR
+        if segmenter is None:
+            segmenter = DEFAULT_SEGMENTER if field_extractor is None else TermSheetSegmenter(field_extractor)
+        self.segmenter = segmenter
+    
     def analyze_text(self, text):
         """
         Analyze the extracted text from term sheets
@@ -17,71 +30,62 @@ class NLPService:
             # For demonstration purposes, we'll use regex pattern matching
             # In a real implementation, use a proper NLP model like Azure OpenAI
             
-            # Extract key information using regex patterns
-            term_sheet_data = {}
-            
-            # Trade and settlement dates
-            trade_date_match = re.search(r'Trade Date:\s*(\d{4}-\d{2}-\d{2})', text)
-            if trade_date_match:
-                term_sheet_data['trade_date'] = trade_date_match.group(1)
-            
-            settlement_date_match = re.search(r'Settlement Date:\s*(\d{4}-\d{2}-\d{2})', text)
-            if settlement_date_match:
-                term_sheet_data['settlement_date'] = settlement_date_match.group(1)
-            
-            # Counterparties
-            issuer_match = re.search(r'Issuer:\s*([^\n]+)', text)
-            if issuer_match:
-                term_sheet_data['issuer'] = issuer_match.group(1).strip()
-            
-            counterparty_match = re.search(r'Counterparty:\s*([^\n]+)', text)
-            if counterparty_match:
-                term_sheet_data['counterparty'] = counterparty_match.group(1).strip()
-            
-            # Product details
-            product_match = re.search(r'Product:\s*([^\n]+)', text)
-            if product_match:
-                term_sheet_data['product'] = product_match.group(1).strip()
-            
-            principal_match = re.search(r'Principal Amount:\s*([^\n]+)', text)
-            if principal_match:
-                principal_text = principal_match.group(1).strip()
-                # Extract currency and amount
-                currency_amount_match = re.search(r'([A-Z]{3})\s*([\d,]+(?:\.\d+)?)', principal_text)
-                if currency_amount_match:
-                    term_sheet_data['currency'] = currency_amount_match.group(1)
-                    # Remove commas and convert to float
-                    amount_str = currency_amount_match.group(2).replace(',', '')
-                    term_sheet_data['principal_amount'] = float(amount_str)
-            
-            maturity_date_match = re.search(r'Maturity Date:\s*(\d{4}-\d{2}-\d{2})', text)
-            if maturity_date_match:
-                term_sheet_data['maturity_date'] = maturity_date_match.group(1)
-            
-            coupon_rate_match = re.search(r'Coupon Rate:\s*([\d.]+)%', text)
-            if coupon_rate_match:
-                term_sheet_data['coupon_rate'] = float(coupon_rate_match.group(1))
-            
-            coupon_frequency_match = re.search(r'Coupon Payment Frequency:\s*([^\n]+)', text)
-            if coupon_frequency_match:
-                term_sheet_data['coupon_frequency'] = coupon_frequency_match.group(1).strip()
-            
-            # Legal terms
-            governing_law_match = re.search(r'Governing Law:\s*([^\n]+)', text)
-            if governing_law_match:
-                term_sheet_data['governing_law'] = governing_law_match.group(1).strip()
-            
-            # Risk disclosure
-            risk_disclosure_match = re.search(r'Risk Disclosure:\s*([^\n]+)', text)
-            if risk_disclosure_match:
-                term_sheet_data['risk_disclosure'] = risk_disclosure_match.group(1).strip()
+            # Extract key information in one pass over the lines starting with a field label
+            term_sheet_data = self.field_extractor.extract(text)
             
             return term_sheet_data
         except Exception as e:
-            print(f"Error in NLP analysis: {str(e)}")
+            log(f"Error in NLP analysis: {str(e)}")
             # Return mock data for prototype purposes
             return self._get_mock_nlp_analysis()
     
+    def analyze_with_evidence(self, text, tokens=None):
+        """
+        Analyze text like analyze_text, and also return the evidence for
+        each extracted field (see field_evidence), given the TokenTable of
+        the text's OCR'd words
+        """
+        try:
+            fields, spans = self.field_extractor.extract_spans(text)
+            return fields, self.field_evidence(spans, tokens)
+        except Exception as e:
+            log(f"Error in NLP analysis: {str(e)}")
+            return self._get_mock_nlp_analysis(), {}
+    
+    def field_evidence(self, spans, tokens=None, offset=0):
+        """
+        Describe where each field's value was read: its span in the text and,
+        when that part of the text was OCR'd, the lowest word confidence in
+        it and its page and bounding box; otherwise these are None
+
+        spans are relative to the text at offset in the document that
+        tokens cover.
+        """
+        evidence = {}
+        for field, (start, end) in spans.items():
+            found = tokens.evidence(offset + start, offset + end) if tokens is not None else None
+            evidence[field] = {
+                'span': [offset + start, offset + end],
+                'confidence': found['confidence'] if found else None,
+                'page': found['page'] if found else None,
+                'bbox': found['bbox'] if found else None
+            }
+        return evidence
+    
+    def split_term_sheets(self, text):
+        """
+        Yield a TermSheetSegment, with its extracted fields, for each term
+        sheet in the text of a bundled document (see services/segmentation.py)
+        """
+        return self.segmenter.split(text)
+    
+    def split_term_sheet_lines(self, lines):
+        """
+        Yield a TermSheetSegment for each term sheet in an iterable of the
+        lines of a bundled document, consuming it as segments are yielded
+        """
+        return self.segmenter.iter_segments(lines)
+    
     def _get_mock_nlp_analysis(self):
         """
         Return mock NLP analysis for prototype purposes
@@ -1,101 +1,587 @@
+import io
 import os
+import subprocess
+import tempfile
+import threading
+import time
+from collections import deque, namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 import pytesseract
-from pdf2image import convert_from_path
+from pdf2image import convert_from_path, pdfinfo_from_path
 from PIL import Image
 import docx2txt
-import pandas as pd
 import mimetypes
+from services.excel_reader import WorkbookReader
+from services.extraction_cache import get_extraction_cache
+from services.image_preprocessing import ImagePreprocessor, DEFAULT_OCR_PREPROCESS
+from services.resource_governor import (OCRBudget, get_ocr_governor, DEFAULT_OCR_MAX_PAGES,
+                                        DEFAULT_OCR_MAX_CPU_SECONDS)
+from services.token_table import TokenTable, tesseract_tokens
+from utils.file_handler import file_sha256, SpooledUpload
+from utils.metrics import log, record_stage, set_document, timed_stage
+
+# Bump whenever a change to the extraction code alters its output, so that
+# cached extractions from older versions are no longer served
+EXTRACTOR_VERSION = 4
+
+# Number of worker processes used to OCR the pages of a PDF in parallel.
+# Set OCR_WORKERS=1 to OCR pages serially in the calling process.
+DEFAULT_OCR_WORKERS = int(os.environ.get('OCR_WORKERS', os.cpu_count() or 1))
+
+# Resolution used when rasterizing PDF pages (pdf2image default)
+DEFAULT_PDF_DPI = 200
+
+# Number of pages rasterized per pdftoppm call when OCRing serially. Only
+# one window of page images exists at a time, which bounds peak memory
+# regardless of document length.
+DEFAULT_PAGE_WINDOW = int(os.environ.get('OCR_PAGE_WINDOW', 4))
+
+# A PDF page whose embedded text layer has fewer alphanumeric characters
+# than this (blank, scanned or signature pages) is OCR'd instead
+DEFAULT_MIN_TEXT_LAYER_CHARS = int(os.environ.get('PDF_MIN_TEXT_LAYER_CHARS', 32))
+
+# Upper bound for a single pdftotext run
+PDFTOTEXT_TIMEOUT_SECONDS = 120
+
+# The text of a document, the TokenTable of its OCR'd words, or None when
+# no part of it was OCR'd, and, when an OCR budget ran out before every page
+# was read or a workbook sheet was cut short, a description of what was
+# left out (see OCRService.extract)
+Extraction = namedtuple('Extraction', ['text', 'tokens', 'truncated'], defaults=(None,))
+
+# Process pools are expensive to start, so they are shared by every
+# OCRService instance in the process and keyed by pool size
+_page_pools = {}
+_page_pools_lock = threading.Lock()
+
+
+def _get_page_pool(max_workers):
+    """
+    Return the shared process pool with the given number of workers
+    """
+    with _page_pools_lock:
+        pool = _page_pools.get(max_workers)
+        if pool is None:
+            pool = ProcessPoolExecutor(max_workers=max_workers)
+            _page_pools[max_workers] = pool
+        return pool
+
+
+def _discard_page_pool(max_workers):
+    """
+    Drop a pool whose worker died so the next call starts a fresh one
+    """
+    with _page_pools_lock:
+        pool = _page_pools.pop(max_workers, None)
+    if pool is not None:
+        pool.shutdown(wait=False)
+
+
+def _ocr_image(image, dpi=None, preprocessor=None, page=1):
+    """
+    OCR one page image, preprocessed first unless preprocessor is None
+
+    Returns the text, the TokenTable of its words (numbered as page), the
+    preprocessing and OCR times, and whether the page was blank, in which
+    case it is not OCR'd, its text is empty and it has no tokens.
+    """
+    started = time.perf_counter()
+    config = ''
+    if preprocessor is not None:
+        image, details = preprocessor.process(image, dpi)
+        if image is None:
+            return {'text': '', 'tokens': None, 'blank': True,
+                    'preprocess_seconds': time.perf_counter() - started, 'ocr_seconds': 0.0}
+        # Tesseract cannot read the resolution of an in-memory image
+        config = f"--dpi {details['dpi']}"
+    preprocessed = time.perf_counter()
+    # Word-level output keeps the boxes and confidences that
+    # image_to_string throws away; the text is rebuilt from the words
+    data = pytesseract.image_to_data(image, config=config, output_type=pytesseract.Output.DICT)
+    text, tokens = tesseract_tokens(data, page)
+    return {'text': text, 'tokens': tokens, 'blank': False, 'preprocess_seconds': preprocessed - started,
+            'ocr_seconds': time.perf_counter() - preprocessed}
+
+
+def _ocr_pdf_page(file_path, page_number, dpi, preprocessor=None):
+    """
+    Rasterize and OCR a single PDF page.
+
+    Runs in a pool worker, so only the path and page number cross the
+    process boundary and each worker holds at most one page image.
+    """
+    started = time.perf_counter()
+    images = convert_from_path(file_path, dpi=dpi, first_page=page_number, last_page=page_number)
+    rasterized = time.perf_counter()
+    page = {'page': page_number, 'text': '', 'tokens': None, 'source': 'ocr', 'blank': True,
+            'rasterize_seconds': rasterized - started, 'preprocess_seconds': 0.0, 'ocr_seconds': 0.0}
+    for image in images:
+        result = _ocr_image(image, dpi, preprocessor, page_number)
+        page['tokens'] = TokenTable.concatenate([(0, page['tokens']), (len(page['text']), result['tokens'])])
+        page['text'] += result['text']
+        page['blank'] = page['blank'] and result['blank']
+        page['preprocess_seconds'] += result['preprocess_seconds']
+        page['ocr_seconds'] += result['ocr_seconds']
+    return page
+
+
+def _page_runs(page_numbers, max_length):
+    """
+    Group ascending page numbers into (first, last) runs of consecutive
+    pages, each at most max_length pages long
+    """
+    first = last = None
+    for page_number in page_numbers:
+        if first is not None and page_number == last + 1 and page_number - first < max_length:
+            last = page_number
+            continue
+        if first is not None:
+            yield first, last
+        first = last = page_number
+    if first is not None:
+        yield first, last
+
 
 class OCRService:
     """
     Service for extracting text from various document formats
     """
     
-    def extract_text(self, file_path):
+    def __init__(self, max_workers=None, dpi=DEFAULT_PDF_DPI, page_window=None,
+                 use_text_layer=True, min_text_layer_chars=DEFAULT_MIN_TEXT_LAYER_CHARS,
+                 cache=None, use_cache=True, preprocessor=None, preprocess=DEFAULT_OCR_PREPROCESS,
+                 workbook_reader=None, governor=None, max_pages=DEFAULT_OCR_MAX_PAGES,
+                 max_cpu_seconds=DEFAULT_OCR_MAX_CPU_SECONDS):
+        """
+        Initialize the OCR service
+
+        max_workers is the number of processes used for page-level PDF OCR
+        and page_window the number of pages rasterized at a time when OCRing
+        serially. With use_text_layer, PDF pages that carry an embedded text
+        layer of at least min_text_layer_chars characters skip OCR.
+        Extracted text is stored in cache, or in the process-wide extraction
+        cache when none is given, unless use_cache is False.
+        Page images are cleaned up by preprocessor (see
+        services/image_preprocessing.py), or a default one, before OCR
+        unless preprocess is False. Excel workbooks are read by
+        workbook_reader (see services/excel_reader.py), or a default one.
+        Every page OCR'd takes a slot of governor, or of the process-wide
+        one (see services/resource_governor.py), and each extraction OCRs
+        at most max_pages pages and max_cpu_seconds of page work; 0 lifts
+        either limit.
+        """
+        self.max_workers = max(1, max_workers or DEFAULT_OCR_WORKERS)
+        self.dpi = dpi
+        self.page_window = max(1, page_window or DEFAULT_PAGE_WINDOW)
+        self.use_text_layer = use_text_layer
+        self.min_text_layer_chars = min_text_layer_chars
+        self.cache = (cache or get_extraction_cache()) if use_cache else None
+        self.preprocessor = (preprocessor or ImagePreprocessor()) if preprocess else None
+        self.workbook_reader = workbook_reader or WorkbookReader()
+        self.governor = governor or get_ocr_governor()
+        self.max_pages = max_pages
+        self.max_cpu_seconds = max_cpu_seconds
+    
+    def settings_fingerprint(self):
+        """
+        Describe every setting that affects extracted text, for cache keys
+        """
+        preprocessing = self.preprocessor.fingerprint() if self.preprocessor is not None else 'off'
+        return (f"v{EXTRACTOR_VERSION}|dpi={self.dpi}|text_layer={self.use_text_layer}"
+                f"|min_text_layer_chars={self.min_text_layer_chars}|preprocess={preprocessing}"
+                f"|excel_max_rows={self.workbook_reader.max_rows}")
+    
+    def extract_text(self, source, progress_callback=None):
         """
         Extract text from various file formats
+
+        source is a file path or a SpooledUpload; uploads are read from
+        their buffer and only PDFs, which poppler reads by path, are briefly
+        written to a temporary file.
+        Repeat uploads of the same bytes are served from the extraction cache.
+        progress_callback, if given, is called as progress_callback(pages_done,
+        pages_total) as PDF pages are extracted, and once with (1, 1) for
+        single-page formats and cache hits.
+        """
+        return self.extract(source, progress_callback).text
+    
+    def extract(self, source, progress_callback=None):
         """
-        file_extension = os.path.splitext(file_path)[1].lower()
+        Extract text like extract_text, and return an Extraction of the text
+        and the TokenTable of its OCR'd words (None for documents that were
+        not OCR'd), which is cached alongside the text
+
+        OCR runs in the priority lane of the calling request (see
+        resource_governor.ocr_lane) under a fresh OCRBudget. When the budget
+        runs out, the remaining pages that need OCR are left out and the
+        Extraction's truncated is {'reason': 'page_budget' or 'cpu_budget',
+        'pages_total', 'pages_skipped'}. A workbook with a sheet longer than
+        the workbook reader's max_rows is truncated with {'reason':
+        'row_limit', 'max_rows', 'sheets_truncated'}. Truncated extractions
+        are not cached.
+        """
+        if isinstance(source, SpooledUpload):
+            file_extension = source.extension
+        else:
+            file_extension = os.path.splitext(source)[1].lower()
+        budget = OCRBudget(self.max_pages, self.max_cpu_seconds)
         
-        # Determine file type
+        if self.cache is None:
+            return self._extract_uncached(source, file_extension, progress_callback, budget)
+        
+        sha256 = source.sha256 if isinstance(source, SpooledUpload) else file_sha256(source)
+        key = self.cache.make_key(sha256, f"{file_extension}|{self.settings_fingerprint()}")
+        text = self.cache.get(key)
+        if text is not None:
+            if progress_callback:
+                progress_callback(1, 1)
+            data = self.cache.get_bytes(key)
+            return Extraction(text, TokenTable.from_bytes(data) if data is not None else None)
+        
+        extraction = self._extract_uncached(source, file_extension, progress_callback, budget)
+        # Never cache the mock text returned when an extractor fails, nor a
+        # partial text that a later request with budget to spare would complete
+        if extraction.text != self._get_mock_term_sheet_text() and extraction.truncated is None:
+            # Tokens first, so that a cached text always has its tokens
+            if extraction.tokens is not None:
+                self.cache.put_bytes(key, extraction.tokens.to_bytes())
+            self.cache.put(key, extraction.text)
+        return extraction
+    
+    def _extract_uncached(self, source, file_extension, progress_callback=None, budget=None):
+        """
+        Extract text, and tokens for OCR'd documents, by dispatching on the
+        file extension
+        """
         if file_extension == '.pdf':
-            return self._extract_from_pdf(file_path)
-        elif file_extension == '.docx':
-            return self._extract_from_docx(file_path)
+            if isinstance(source, SpooledUpload):
+                with source.as_file() as file_path:
+                    return self._extract_from_pdf(file_path, progress_callback, budget)
+            return self._extract_from_pdf(source, progress_callback, budget)
+        
+        # The other extractors read a path or a binary stream alike
+        if isinstance(source, SpooledUpload):
+            source = source.open()
+        
+        # Determine file type
+        if file_extension == '.docx':
+            extraction = Extraction(self._extract_from_docx(source), None)
         elif file_extension == '.xlsx':
-            return self._extract_from_excel(file_path)
+            extraction = self._extract_from_excel(source)
         elif file_extension in ['.png', '.jpg', '.jpeg']:
-            return self._extract_from_image(file_path)
+            extraction = self._extract_from_image(source, budget)
         elif file_extension == '.txt':
-            return self._extract_from_text(file_path)
+            extraction = Extraction(self._extract_from_text(source), None)
         else:
             raise ValueError(f"Unsupported file format: {file_extension}")
+        
+        if progress_callback:
+            progress_callback(1, 1)
+        return extraction
     
-    def _extract_from_pdf(self, file_path):
+    def _extract_from_pdf(self, file_path, progress_callback=None, budget=None):
         """
-        Extract text from PDF files
+        Extract the text of PDF files, and the tokens of their OCR'd pages
         """
         # For production, we would use Azure Document Intelligence or similar
         # For this prototype, we're using pytesseract with pdf2image
-        text = ""
-        
         try:
-            # Convert PDF to images
-            images = convert_from_path(file_path)
+            budget = budget or OCRBudget(self.max_pages, self.max_cpu_seconds)
+            started = time.perf_counter()
+            pages = self.extract_pdf_pages(file_path, progress_callback, budget)
+            elapsed = time.perf_counter() - started
             
-            # Extract text from each image
-            for image in images:
-                text += pytesseract.image_to_string(image) + "\n"
-                
-            return text
+            ocr_count = sum(1 for page in pages if page['source'] == 'ocr')
+            blank_count = sum(1 for page in pages if page['blank'])
+            skipped_count = sum(1 for page in pages if page['source'] == 'skipped')
+            log(f"Extracted {len(pages)} PDF pages in {elapsed:.2f}s "
+                f"({len(pages) - ocr_count - skipped_count} from text layer, {ocr_count} OCR'd, "
+                f"{blank_count} blank, {skipped_count} skipped)")
+            truncated = None
+            if skipped_count:
+                truncated = {'reason': budget.exhausted, 'pages_total': len(pages), 'pages_skipped': skipped_count}
+                log(f"OCR {budget.exhausted.replace('_', ' ')} ran out after {budget.pages} pages "
+                    f"and {budget.cpu_seconds:.1f}s; {skipped_count} pages skipped")
+            for page in pages:
+                if page['source'] == 'ocr':
+                    log(f"  page {page['page']}: rasterize {page['rasterize_seconds']:.2f}s, "
+                        f"preprocess {page['preprocess_seconds']:.2f}s, ocr {page['ocr_seconds']:.2f}s")
+            
+            parts = []
+            offset = 0
+            for page in pages:
+                parts.append((offset, page['tokens']))
+                offset += len(page['text']) + 1
+            return Extraction("".join(page['text'] + "\n" for page in pages), TokenTable.concatenate(parts),
+                              truncated)
         except Exception as e:
             # Fallback to a mock response for prototype purposes
-            print(f"Error in PDF extraction: {str(e)}")
-            return self._get_mock_term_sheet_text()
+            log(f"Error in PDF extraction: {str(e)}")
+            return Extraction(self._get_mock_term_sheet_text(), None)
+    
+    def extract_pdf_pages(self, file_path, progress_callback=None, budget=None):
+        """
+        Extract every page of a PDF and return per-page results in page order
+
+        Each result holds the page number, its text, the TokenTable of its
+        words (None unless OCR'd), its source ('text_layer', 'ocr', or
+        'skipped' when the OCR budget ran out before it), whether it was
+        found blank and skipped, and the rasterization, preprocessing and
+        OCR timings for that page.
+        """
+        return list(self.iter_pdf_pages(file_path, progress_callback, budget))
+    
+    def iter_pdf_pages(self, file_path, progress_callback=None, budget=None):
+        """
+        Yield per-page extraction results for a PDF in page order
+
+        Pages with a usable embedded text layer are taken from it directly;
+        only the remaining pages are rasterized and OCR'd, as far as budget
+        (an OCRBudget, or a fresh one) allows, and the rest are yielded
+        empty. progress_callback is called with (pages_done, pages_total)
+        as each page completes.
+        """
+        budget = budget or OCRBudget(self.max_pages, self.max_cpu_seconds)
+        page_count = pdfinfo_from_path(file_path)['Pages']
+        set_document(pages=page_count)
+        
+        text_layer = None
+        if self.use_text_layer:
+            with timed_stage('pdf_text_layer'):
+                text_layer = self._extract_pdf_text_layer(file_path, page_count)
+        if text_layer is None:
+            text_layer = [''] * page_count
+        
+        usable = [self._has_usable_text(page_text) for page_text in text_layer]
+        ocr_pages = [page_number for page_number in range(1, page_count + 1)
+                     if not usable[page_number - 1]]
+        ocr_results = self._iter_ocr_pages(file_path, ocr_pages, budget)
+        
+        for page_number in range(1, page_count + 1):
+            if usable[page_number - 1]:
+                page = {
+                    'page': page_number,
+                    'text': text_layer[page_number - 1],
+                    'tokens': None,
+                    'source': 'text_layer',
+                    'blank': False,
+                    'rasterize_seconds': 0.0,
+                    'preprocess_seconds': 0.0,
+                    'ocr_seconds': 0.0
+                }
+            else:
+                page = next(ocr_results, None)
+                if page is None:
+                    # Out of OCR budget; text layer pages after this one
+                    # are still read
+                    page = {'page': page_number, 'text': '', 'tokens': None, 'source': 'skipped', 'blank': False,
+                            'rasterize_seconds': 0.0, 'preprocess_seconds': 0.0, 'ocr_seconds': 0.0}
+                else:
+                    record_stage('pdf_rasterize_page', page['rasterize_seconds'])
+                    record_stage('preprocess_page', page['preprocess_seconds'])
+                    if not page['blank']:
+                        record_stage('ocr_page', page['ocr_seconds'])
+            
+            if progress_callback:
+                progress_callback(page_number, page_count)
+            yield page
+    
+    def _extract_pdf_text_layer(self, file_path, page_count):
+        """
+        Return the embedded text of each PDF page using poppler's pdftotext
+
+        Returns None when pdftotext is unavailable or fails, in which case
+        every page is OCR'd.
+        """
+        # Text comes out in reading order rather than with -layout, which
+        # sets columns side by side on one line and so runs a label's value
+        # into the text of the next column
+        try:
+            result = subprocess.run(
+                ['pdftotext', '-enc', 'UTF-8', file_path, '-'],
+                capture_output=True, check=True, timeout=PDFTOTEXT_TIMEOUT_SECONDS
+            )
+        except (OSError, subprocess.SubprocessError) as e:
+            log(f"Text layer extraction unavailable, falling back to OCR: {str(e)}")
+            return None
+        
+        # pdftotext terminates every page with a form feed
+        pages = result.stdout.decode('utf-8', errors='replace').split('\f')
+        pages = pages[:page_count]
+        return pages + [''] * (page_count - len(pages))
     
-    def _extract_from_docx(self, file_path):
+    def _has_usable_text(self, text):
         """
-        Extract text from Word documents
+        Check whether a page's text layer holds enough text to skip OCR
+        """
+        return sum(1 for char in text if char.isalnum()) >= self.min_text_layer_chars
+    
+    def _iter_ocr_pages(self, file_path, page_numbers, budget):
         """
+        Yield OCR results for the given ascending page numbers in order,
+        stopping early when budget runs out
+
+        Pages are spread over the shared process pool when more than one
+        worker is configured, in which case each worker holds a single page
+        image. Otherwise pages are rasterized in windows of page_window pages
+        and each page image is released as soon as it has been OCR'd.
+        """
+        if self.max_workers == 1 or len(page_numbers) <= 1:
+            yield from self._iter_pdf_pages_serial(file_path, page_numbers, budget)
+            return
+        
+        pool = _get_page_pool(self.max_workers)
+        # Pages are submitted one at a time as governor slots free up, at
+        # most max_workers of them ahead of the consumer; each slot is
+        # released as soon as its page is done, whether or not it has been
+        # consumed
+        pending = deque()
         try:
-            text = docx2txt.process(file_path)
+            for page_number in page_numbers:
+                if len(pending) >= self.max_workers:
+                    yield self._finish_page(pending.popleft(), budget)
+                if not budget.admit_page():
+                    break
+                self.governor.acquire(budget.lane)
+                try:
+                    future = pool.submit(_ocr_pdf_page, file_path, page_number, self.dpi, self.preprocessor)
+                except BaseException:
+                    self.governor.release()
+                    raise
+                future.add_done_callback(lambda _: self.governor.release())
+                pending.append(future)
+            while pending:
+                yield self._finish_page(pending.popleft(), budget)
+        except BrokenProcessPool:
+            _discard_page_pool(self.max_workers)
+            raise
+        finally:
+            for future in pending:
+                future.cancel()
+    
+    def _finish_page(self, future, budget):
+        page = future.result()
+        budget.charge(page['rasterize_seconds'] + page['preprocess_seconds'] + page['ocr_seconds'])
+        return page
+    
+    def _iter_pdf_pages_serial(self, file_path, page_numbers, budget):
+        """
+        OCR PDF pages in the calling process, one page window at a time
+
+        pdftoppm writes the window's pages to a temporary folder and they
+        are loaded, OCR'd and deleted one by one, so at most one decoded
+        page is held in memory. A window only takes the pages budget admits.
+        """
+        with tempfile.TemporaryDirectory(prefix='sheetwise-pdf-') as output_folder:
+            for first_page, last_page in _page_runs(page_numbers, self.page_window):
+                admitted = 0
+                while first_page + admitted <= last_page and budget.admit_page():
+                    admitted += 1
+                if not admitted:
+                    return
+                
+                started = time.perf_counter()
+                with self.governor.slot(budget.lane):
+                    image_paths = convert_from_path(file_path, dpi=self.dpi,
+                                                    first_page=first_page, last_page=first_page + admitted - 1,
+                                                    output_folder=output_folder, paths_only=True)
+                rasterize_seconds = (time.perf_counter() - started) / max(1, len(image_paths))
+                
+                for page_number, image_path in enumerate(image_paths, start=first_page):
+                    with self.governor.slot(budget.lane), Image.open(image_path) as image:
+                        result = _ocr_image(image, self.dpi, self.preprocessor, page_number)
+                    os.remove(image_path)
+                    budget.charge(rasterize_seconds + result['preprocess_seconds'] + result['ocr_seconds'])
+                    
+                    yield {
+                        'page': page_number,
+                        'source': 'ocr',
+                        'rasterize_seconds': rasterize_seconds,
+                        **result
+                    }
+                if first_page + admitted <= last_page:
+                    return
+    
+    def _extract_from_docx(self, source):
+        """
+        Extract text from Word documents, given a path or a binary stream
+        """
+        try:
+            text = docx2txt.process(source)
             return text
         except Exception as e:
-            print(f"Error in DOCX extraction: {str(e)}")
+            log(f"Error in DOCX extraction: {str(e)}")
             return self._get_mock_term_sheet_text()
     
-    def _extract_from_excel(self, file_path):
+    def _extract_from_excel(self, source):
         """
-        Extract text from Excel files
+        Extract the text of Excel files, given a path or a binary stream
+
+        Every sheet is streamed row by row into 'Label: value' lines, which
+        field extraction reads like those of any other document.
         """
         try:
-            df = pd.read_excel(file_path)
-            return df.to_string()
+            workbook = self.workbook_reader.read(source)
         except Exception as e:
-            print(f"Error in Excel extraction: {str(e)}")
-            return self._get_mock_term_sheet_text()
+            log(f"Error in Excel extraction: {str(e)}")
+            return Extraction(self._get_mock_term_sheet_text(), None)
+        truncated = None
+        if workbook.truncated_sheets:
+            truncated = {'reason': 'row_limit', 'max_rows': self.workbook_reader.max_rows,
+                         'sheets_truncated': workbook.truncated_sheets}
+        return Extraction(workbook.text, None, truncated)
+    
+    def iter_excel_lines(self, source):
+        """
+        Yield the text lines of an Excel workbook, given a path or a
+        SpooledUpload, as they are read; every row of every sheet is read,
+        so consumers that only hold a few lines at a time see all of it
+        """
+        if isinstance(source, SpooledUpload):
+            source = source.open()
+        return self.workbook_reader.iter_lines(source, max_rows=0)
     
-    def _extract_from_image(self, file_path):
+    def _extract_from_image(self, source, budget=None):
         """
-        Extract text from image files
+        Extract the text and tokens of image files, given a path or a
+        binary stream
         """
         try:
-            image = Image.open(file_path)
-            text = pytesseract.image_to_string(image)
-            return text
+            set_document(pages=1)
+            budget = budget or OCRBudget(self.max_pages, self.max_cpu_seconds)
+            # A single page always fits a fresh budget
+            budget.admit_page()
+            image = Image.open(source)
+            with self.governor.slot(budget.lane):
+                # Scanners and cameras write their resolution into the file
+                result = _ocr_image(image, None, self.preprocessor)
+            budget.charge(result['preprocess_seconds'] + result['ocr_seconds'])
+            record_stage('preprocess_page', result['preprocess_seconds'])
+            if not result['blank']:
+                record_stage('ocr_page', result['ocr_seconds'])
+            return Extraction(result['text'], result['tokens'])
         except Exception as e:
-            print(f"Error in image extraction: {str(e)}")
-            return self._get_mock_term_sheet_text()
+            log(f"Error in image extraction: {str(e)}")
+            return Extraction(self._get_mock_term_sheet_text(), None)
     
-    def _extract_from_text(self, file_path):
+    def _extract_from_text(self, source):
         """
-        Extract text from text files
+        Extract text from text files, given a path or a binary stream
         """
         try:
-            with open(file_path, 'r', encoding='utf-8') as file:
+            if hasattr(source, 'read'):
+                # Decoded as open() in text mode would, newlines included;
+                # detach() leaves the stream open for its owner
+                reader = io.TextIOWrapper(source, encoding='utf-8')
+                try:
+                    return reader.read()
+                finally:
+                    reader.detach()
+            with open(source, 'r', encoding='utf-8') as file:
                 return file.read()
         except Exception as e:
-            print(f"Error in text file extraction: {str(e)}")
+            log(f"Error in text file extraction: {str(e)}")
             return self._get_mock_term_sheet_text()
     
     def _get_mock_term_sheet_text(self):
@@ -0,0 +1,344 @@
+import os
+import shutil
+import threading
+import time
+import traceback
+import pytesseract
+from services.ocr_service import OCRService, Extraction
+from services.nlp_service import NLPService
+from services.validation_service import ValidationService
+from services.history_store import get_history_store
+from services.dedup_index import get_dedup_index, simhash
+from utils.file_handler import file_sha256, SpooledUpload
+from utils.metrics import log, record_stage, set_document
+
+_default_pipeline = None
+_default_pipeline_lock = threading.Lock()
+
+
+def get_pipeline():
+    """
+    Return the process-wide term sheet pipeline, building and warming it on
+    first use
+    """
+    global _default_pipeline
+    with _default_pipeline_lock:
+        if _default_pipeline is None:
+            _default_pipeline = TermSheetPipeline()
+        return _default_pipeline
+
+
+def init_pipeline(**services):
+    """
+    Build the process-wide pipeline with the given services instead of the
+    defaults, for worker processes that set it up before first use
+    """
+    global _default_pipeline
+    with _default_pipeline_lock:
+        _default_pipeline = TermSheetPipeline(**services)
+        return _default_pipeline
+
+
+class TermSheetPipeline:
+    """
+    OCR, field extraction and validation of term sheet files
+
+    Built once per worker process and shared by both blueprints, so no
+    request pays for constructing services, compiling rules or probing the
+    OCR binaries. Every processed file is recorded in the validation
+    history, and in the duplicate index unless use_dedup is False.
+    """
+
+    def __init__(self, ocr_service=None, nlp_service=None, validation_service=None, dedup_index=None,
+                 use_dedup=True, warm=True):
+        self.ocr_service = ocr_service or OCRService()
+        self.nlp_service = nlp_service or NLPService()
+        self.validation_service = validation_service or ValidationService()
+        self.dedup_index = (dedup_index or get_dedup_index()) if use_dedup else None
+        self._mock_text = self.ocr_service._get_mock_term_sheet_text()
+        self.tesseract_version = None
+        self.poppler_available = None
+        self.warm_seconds = None
+        if warm:
+            self.warm()
+
+    def warm(self):
+        """
+        Do the one-off work of the first request ahead of time: compile the
+        current reference data rules, exercise the field extractor and
+        look up the Tesseract and poppler binaries once
+        """
+        started = time.perf_counter()
+        self.validation_service.reference_store.current().rule_engine
+        self.nlp_service.analyze_text(self._mock_text)
+        get_history_store()
+
+        try:
+            # pytesseract remembers the version, so later OCR calls skip the probe
+            self.tesseract_version = str(pytesseract.get_tesseract_version())
+        except Exception as e:
+            log(f"Tesseract is not available, images and scanned pages cannot be OCR'd: {str(e)}")
+        self.poppler_available = shutil.which('pdftoppm') is not None and shutil.which('pdfinfo') is not None
+        if not self.poppler_available:
+            log("Poppler is not available, PDFs cannot be rasterized")
+
+        self.warm_seconds = time.perf_counter() - started
+        log(f"Term sheet pipeline warmed in {self.warm_seconds * 1000:.1f}ms")
+
+    def describe(self):
+        """
+        Return a JSON-serializable summary of the pipeline settings
+        """
+        return {
+            'ocr_workers': self.ocr_service.max_workers,
+            'ocr_settings': self.ocr_service.settings_fingerprint(),
+            'ocr_preprocessing': self.ocr_service.preprocessor is not None,
+            'extraction_cache': self.ocr_service.cache is not None,
+            'dedup_index': self.dedup_index is not None,
+            'ocr_max_concurrency': self.ocr_service.governor.max_concurrency,
+            'ocr_max_pages': self.ocr_service.max_pages,
+            'ocr_max_cpu_seconds': self.ocr_service.max_cpu_seconds,
+            'tesseract_version': self.tesseract_version,
+            'poppler_available': self.poppler_available,
+            'warm_ms': round(self.warm_seconds * 1000, 3) if self.warm_seconds is not None else None,
+            'reference_data_version': self.validation_service.reference_store.current().version
+        }
+
+    def is_mock_text(self, text):
+        """
+        Return whether text is the mock term sheet an extractor falls back to
+        """
+        return text == self._mock_text
+
+    def process(self, source, filename, progress_callback=None, validation_service=None,
+                fallback_on_error=False, reuse_duplicates=False):
+        """
+        Extract, analyze and validate a term sheet, given as a file path or
+        a SpooledUpload
+
+        Returns a dict with the document_id (None when extraction fell back
+        to the mock text), the document_hash, the extracted term_sheet_data
+        with its field_evidence (OCR confidence and position of each field),
+        the validation_results, the duplicates found (see _duplicates), what
+        was left out when the OCR budget or the workbook row limit ran out
+        (truncated, see OCRService.extract; None otherwise) and the time
+        spent in each stage, which is also recorded for /metrics.
+        validation_service overrides the pipeline's own for the validation
+        step. With fallback_on_error, an OCR or NLP failure falls back to
+        the mock text or analysis instead of raising. With
+        reuse_duplicates, a resubmission of an indexed document, or a near
+        duplicate of one, gets the stored result of that document instead
+        of being validated again, as long as the reference data has not
+        changed since; exact resubmissions are not even extracted.
+        Truncated documents are not indexed, so a later full extraction is.
+        """
+        validation_service = validation_service or self.validation_service
+        set_document(file_type=source.extension if isinstance(source, SpooledUpload)
+                     else os.path.splitext(source)[1].lower())
+        started = time.perf_counter()
+        document_hash = source.sha256 if isinstance(source, SpooledUpload) else file_sha256(source)
+
+        prior = self.dedup_index.get(document_hash) if self.dedup_index is not None else None
+        if reuse_duplicates and prior is not None and self._reusable(prior, validation_service):
+            self.dedup_index.record_resubmission(document_hash)
+            return self._reuse(prior, 'exact', 0, document_hash, filename, started, started)
+
+        try:
+            extraction = self.ocr_service.extract(source, progress_callback)
+        except Exception as e:
+            if not fallback_on_error:
+                raise
+            log(f"Error in OCR extraction: {str(e)}")
+            log(traceback.format_exc())
+            extraction = Extraction(self._mock_text, None)
+        extracted = time.perf_counter()
+
+        try:
+            term_sheet_data, field_evidence = self.nlp_service.analyze_with_evidence(extraction.text,
+                                                                                     extraction.tokens)
+        except Exception as e:
+            if not fallback_on_error:
+                raise
+            log(f"Error in NLP analysis: {str(e)}")
+            log(traceback.format_exc())
+            term_sheet_data, field_evidence = self.nlp_service._get_mock_nlp_analysis(), {}
+        analyzed = time.perf_counter()
+
+        # Store and index the document unless it came from the mock text
+        document_id = None if self.is_mock_text(extraction.text) else document_hash
+        match = None
+        if self.dedup_index is not None and document_id is not None:
+            fingerprint = simhash(extraction.text)
+            if prior is not None:
+                match = (prior, 'exact', 0)
+            else:
+                near = self.dedup_index.find_near_duplicate(fingerprint, term_sheet_data)
+                if near is not None:
+                    match = (near[0], 'near', near[1])
+            if reuse_duplicates and match is not None and self._reusable(match[0], validation_service):
+                self.dedup_index.add(document_hash, filename, fingerprint, term_sheet_data, match[0]['result'],
+                                     match[0]['cluster_id'])
+                record_stage('extract', extracted - started)
+                record_stage('analyze', analyzed - extracted)
+                return self._reuse(match[0], match[1], match[2], document_hash, filename, started, analyzed, {
+                    'extract_ms': round((extracted - started) * 1000, 3),
+                    'analyze_ms': round((analyzed - extracted) * 1000, 3)
+                })
+        deduped = time.perf_counter()
+
+        validation_results = validation_service.validate_term_sheet(term_sheet_data, document_id, filename,
+                                                                    field_evidence)
+        validated = time.perf_counter()
+
+        duplicates = None
+        if self.dedup_index is not None and document_id is not None and extraction.truncated is None:
+            cluster_id = self.dedup_index.add(
+                document_hash, filename, fingerprint, term_sheet_data,
+                {'document_id': document_id, 'term_sheet_data': term_sheet_data, 'field_evidence': field_evidence,
+                 'validation_results': validation_results},
+                match[0]['cluster_id'] if match is not None else None)
+            duplicates = self._duplicates(cluster_id, match, reused=False)
+
+        record_stage('extract', extracted - started)
+        record_stage('analyze', analyzed - extracted)
+        record_stage('dedup', deduped - analyzed)
+        record_stage('validate', validated - deduped)
+        timings = {
+            'extract_ms': round((extracted - started) * 1000, 3),
+            'analyze_ms': round((analyzed - extracted) * 1000, 3),
+            'dedup_ms': round((deduped - analyzed) * 1000, 3),
+            'validate_ms': round((validated - deduped) * 1000, 3),
+            'total_ms': round((validated - started) * 1000, 3)
+        }
+        get_history_store().record(document_hash, filename, term_sheet_data, validation_results, timings)
+
+        return {
+            'document_id': document_id,
+            'document_hash': document_hash,
+            'term_sheet_data': term_sheet_data,
+            'field_evidence': field_evidence,
+            'validation_results': validation_results,
+            'duplicates': duplicates,
+            'truncated': extraction.truncated,
+            'timings': timings
+        }
+
+    def _reusable(self, document, validation_service):
+        """
+        Return whether an indexed document's stored result still holds: it
+        was validated against the current reference data
+        """
+        version = document['result']['validation_results'].get('reference_data_version')
+        return version == validation_service.reference_store.current().version
+
+    def _duplicates(self, cluster_id, match, reused):
+        """
+        Describe the duplicates of a document: its cluster, its size and,
+        if the document matched an indexed one, the kind of match ('exact'
+        or 'near'), that document, the Hamming distance of their
+        fingerprints and whether its result was reused
+        """
+        document, kind, distance = match if match is not None else (None, None, None)
+        return {
+            'cluster_id': cluster_id,
+            'cluster_size': self.dedup_index.cluster_size(cluster_id),
+            'match': kind,
+            'duplicate_of': document['document_hash'] if document is not None else None,
+            'distance': distance,
+            'reused': reused
+        }
+
+    def _reuse(self, document, kind, distance, document_hash, filename, started, dedup_started, timings=None):
+        """
+        Build the result of a document from the stored result of a
+        duplicate of it, and record it in the history
+
+        timings holds those of the stages run before the duplicate was
+        found, the dedup stage having started at dedup_started.
+        """
+        result = document['result']
+        finished = time.perf_counter()
+        record_stage('dedup', finished - dedup_started)
+        timings = dict(timings or {},
+                       dedup_ms=round((finished - dedup_started) * 1000, 3),
+                       total_ms=round((finished - started) * 1000, 3))
+        get_history_store().record(document_hash, filename, result['term_sheet_data'], result['validation_results'],
+                                   timings)
+
+        return {
+            'document_id': result['document_id'],
+            'document_hash': document_hash,
+            'term_sheet_data': result['term_sheet_data'],
+            'field_evidence': result['field_evidence'],
+            'validation_results': result['validation_results'],
+            'duplicates': self._duplicates(document['cluster_id'], (document, kind, distance), reused=True),
+            'truncated': None,
+            'timings': timings
+        }
+
+    def process_bundle(self, source, filename, validation_service=None):
+        """
+        Extract a document holding any number of term sheets, such as a
+        bundled PDF or a trade blotter, given as a file path or a
+        SpooledUpload
+
+        Returns (document_hash, truncated, term_sheets): truncated is as in
+        process(), and term_sheets is a generator that splits the text and
+        analyzes and validates one term sheet at a time, yielding a dict for
+        each like process() returns, plus its index and start_line. Each
+        term sheet is stored under the document_id '<document_hash>:<index>'
+        and recorded in the history.
+
+        Excel workbooks are read as term_sheets is consumed, every row of
+        them, so source must stay open until then; other documents are
+        extracted before this returns, so source may be closed afterwards.
+        """
+        extension = source.extension if isinstance(source, SpooledUpload) else os.path.splitext(source)[1].lower()
+        set_document(file_type=extension)
+        document_hash = source.sha256 if isinstance(source, SpooledUpload) else file_sha256(source)
+        validation_service = validation_service or self.validation_service
+        if extension == '.xlsx':
+            # Segmentation holds a term sheet or two at a time, so a blotter
+            # of any length is read without building its text
+            segments = self.nlp_service.split_term_sheet_lines(self.ocr_service.iter_excel_lines(source))
+            return document_hash, None, self._iter_bundle(segments, None, False, document_hash, filename,
+                                                          validation_service)
+
+        started = time.perf_counter()
+        extraction = self.ocr_service.extract(source)
+        record_stage('extract', time.perf_counter() - started)
+        segments = self.nlp_service.split_term_sheets(extraction.text)
+        return document_hash, extraction.truncated, self._iter_bundle(
+            segments, extraction.tokens, self.is_mock_text(extraction.text), document_hash, filename,
+            validation_service)
+
+    def _iter_bundle(self, segments, tokens, mock, document_hash, filename, validation_service):
+        started = time.perf_counter()
+        for segment in segments:
+            field_evidence = self.nlp_service.field_evidence(segment.spans, tokens, segment.offset)
+            analyzed = time.perf_counter()
+            document_id = None if mock else f"{document_hash}:{segment.index}"
+            validation_results = validation_service.validate_term_sheet(segment.fields, document_id, filename,
+                                                                        field_evidence)
+            validated = time.perf_counter()
+
+            record_stage('analyze', analyzed - started)
+            record_stage('validate', validated - analyzed)
+            timings = {
+                'analyze_ms': round((analyzed - started) * 1000, 3),
+                'validate_ms': round((validated - analyzed) * 1000, 3)
+            }
+            get_history_store().record(document_hash, filename, segment.fields, validation_results, timings)
+
+            yield {
+                'index': segment.index,
+                'start_line': segment.start_line,
+                'document_id': document_id,
+                'document_hash': document_hash,
+                'term_sheet_data': segment.fields,
+                'field_evidence': field_evidence,
+                'validation_results': validation_results,
+                'timings': timings
+            }
+            # Time spent by the consumer is not this term sheet's
+            started = time.perf_counter()
@@ -0,0 +1,356 @@
+import csv
+import hashlib
+import json
+import mmap
+import os
+import queue
+import sys
+import threading
+import time
+import traceback
+from functools import cached_property
+from services.reference_index import ReferenceIndex, build_index_section
+from services.rule_engine import RuleEngine
+from utils.metrics import log
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - Windows
+    fcntl = None
+
+_BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Versioned reference data: a JSON document of approved lists and rule
+# settings. A list is either inline or read from a CSV file next to it.
+DEFAULT_REFERENCE_DATA_PATH = os.environ.get(
+    'REFERENCE_DATA_PATH', os.path.join(_BACKEND_DIR, 'reference_data', 'reference_data.json'))
+
+# Compiled snapshots are written here and memory-mapped read-only, so every
+# worker process on the host shares one copy through the page cache
+DEFAULT_REFERENCE_SNAPSHOT_DIR = os.environ.get('REFERENCE_SNAPSHOT_DIR', 'cache/reference')
+
+# How often the source files are checked for changes
+DEFAULT_REFERENCE_RELOAD_SECONDS = float(os.environ.get('REFERENCE_RELOAD_SECONDS', 5))
+
+# Older snapshot files are deleted once this many newer ones exist; workers
+# still mapping a deleted file keep reading it until they swap
+SNAPSHOTS_KEPT = 3
+
+SNAPSHOT_MAGIC = b'SWREFSN1'
+SNAPSHOT_FORMAT_VERSION = 1
+
+_default_store = None
+_default_store_lock = threading.Lock()
+
+
+def get_reference_store():
+    """
+    Return the process-wide reference data store, creating it on first use
+    """
+    global _default_store
+    with _default_store_lock:
+        if _default_store is None:
+            _default_store = ReferenceDataStore()
+        return _default_store
+
+
+def _align(offset, boundary=8):
+    return offset + (-offset % boundary)
+
+
+def load_reference_source(source_path):
+    """
+    Read the reference data document and the CSV files it refers to
+
+    Returns the document with every list resolved to a list of names, the
+    SHA-256 of all the source bytes, and the paths that were read.
+    """
+    base_dir = os.path.dirname(os.path.abspath(source_path))
+    digest = hashlib.sha256()
+    with open(source_path, 'rb') as f:
+        raw = f.read()
+    digest.update(raw)
+    document = json.loads(raw)
+    paths = [source_path]
+
+    if not isinstance(document.get('lists'), dict) or not isinstance(document.get('rules'), dict):
+        raise ValueError(f"Reference data {source_path} must define 'lists' and 'rules'")
+
+    lists = {}
+    for list_name, entry in sorted(document['lists'].items()):
+        if isinstance(entry, list):
+            lists[list_name] = [str(name).strip() for name in entry if str(name).strip()]
+            continue
+        csv_path = os.path.join(base_dir, entry['file'])
+        with open(csv_path, 'rb') as f:
+            csv_raw = f.read()
+        digest.update(list_name.encode('utf-8') + b'\0' + csv_raw)
+        paths.append(csv_path)
+        column = entry.get('column', 'name')
+        reader = csv.DictReader(csv_raw.decode('utf-8-sig').splitlines())
+        if column not in (reader.fieldnames or []):
+            raise ValueError(f"Reference list '{list_name}': {entry['file']} has no '{column}' column")
+        lists[list_name] = [row[column].strip() for row in reader if row[column] and row[column].strip()]
+
+    document['lists'] = lists
+    return document, digest.hexdigest(), paths
+
+
+def write_snapshot(document, source_sha256, snapshot_path):
+    """
+    Compile a resolved reference data document into a snapshot file
+
+    The file is the magic bytes, the length of a JSON header, the header
+    (version, rules and the position of each list) and one index section
+    per list, 8-byte aligned. It is written to a temporary file and renamed
+    into place so readers never see a partial snapshot.
+    """
+    sections = {name: build_index_section(names) for name, names in document['lists'].items()}
+    offsets = {}
+    position = 0
+    for name, section in sections.items():
+        offsets[name] = [position, len(section)]
+        position = _align(position + len(section))
+
+    header = json.dumps({
+        'format': SNAPSHOT_FORMAT_VERSION,
+        'byteorder': sys.byteorder,
+        'version': str(document.get('version', 'unversioned')),
+        'source_sha256': source_sha256,
+        'built_at': time.time(),
+        'rules': document['rules'],
+        'lists': offsets
+    }).encode('utf-8')
+    prefix = SNAPSHOT_MAGIC + len(header).to_bytes(4, 'little') + header
+    data_start = _align(len(prefix))
+
+    tmp_path = f"{snapshot_path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(prefix + b'\0' * (data_start - len(prefix)))
+        for name, section in sections.items():
+            f.write(section)
+            f.write(b'\0' * (_align(len(section)) - len(section)))
+    os.replace(tmp_path, snapshot_path)
+
+
+class ReferenceSnapshot:
+    """
+    Immutable view of one version of the reference data
+
+    The approved-list indexes read directly from the memory-mapped snapshot
+    file. A snapshot stays valid for as long as it is referenced, even after
+    a newer one has been swapped in or its file has been deleted.
+    """
+
+    def __init__(self, snapshot_path):
+        with open(snapshot_path, 'rb') as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        if self._mmap[:len(SNAPSHOT_MAGIC)] != SNAPSHOT_MAGIC:
+            raise ValueError(f"{snapshot_path} is not a reference data snapshot")
+        header_start = len(SNAPSHOT_MAGIC) + 4
+        header_length = int.from_bytes(self._mmap[len(SNAPSHOT_MAGIC):header_start], 'little')
+        header = json.loads(self._mmap[header_start:header_start + header_length])
+        if header.get('format') != SNAPSHOT_FORMAT_VERSION or header.get('byteorder') != sys.byteorder:
+            raise ValueError(f"{snapshot_path} was written by an incompatible build")
+
+        data_start = _align(header_start + header_length)
+        buffer = memoryview(self._mmap)
+        self.path = snapshot_path
+        self.declared_version = header['version']
+        self.source_sha256 = header['source_sha256']
+        self.version = f"{header['version']}+{header['source_sha256'][:12]}"
+        self.built_at = header['built_at']
+        self.rules = header['rules']
+        self.lists = {
+            name: ReferenceIndex.from_buffer(buffer[data_start + offset:data_start + offset + length])
+            for name, (offset, length) in header['lists'].items()
+        }
+
+    @cached_property
+    def rule_engine(self):
+        """
+        The validation rules of this snapshot, compiled on first use
+        """
+        return RuleEngine(self.rules, self.lists)
+
+    def index(self, list_name):
+        """
+        Return the ReferenceIndex of an approved list
+        """
+        try:
+            return self.lists[list_name]
+        except KeyError:
+            raise KeyError(f"Reference data has no list named '{list_name}'") from None
+
+    def severity(self, rule_id):
+        """
+        Return the configured severity of a rule
+        """
+        return self.rules[rule_id]['severity']
+
+    def describe(self):
+        """
+        Return a JSON-serializable summary of the snapshot
+        """
+        return {
+            'version': self.version,
+            'built_at': self.built_at,
+            'lists': {name: len(index) for name, index in self.lists.items()},
+            'rules': sorted(self.rules)
+        }
+
+
+class ReferenceDataStore:
+    """
+    Serves the current reference data snapshot and hot-reloads it
+
+    At most every reload_seconds, current() checks the modification time
+    and size of the source files. When they changed and the content hash
+    differs, a new snapshot is compiled (or reused, if another worker
+    already compiled the same content) and swapped in with a single
+    assignment. A validation that already took a snapshot keeps using it,
+    so every result is computed against exactly one version.
+    """
+
+    def __init__(self, source_path=DEFAULT_REFERENCE_DATA_PATH, snapshot_dir=DEFAULT_REFERENCE_SNAPSHOT_DIR,
+                 reload_seconds=DEFAULT_REFERENCE_RELOAD_SECONDS):
+        self.source_path = source_path
+        self.snapshot_dir = snapshot_dir
+        self.reload_seconds = reload_seconds
+        self._snapshot = None
+        self._source_paths = []
+        self._source_stats = None
+        self._next_check = 0.0
+        self._reload_lock = threading.Lock()
+        self._listeners = []
+        # Swaps waiting to be passed to the listeners, oldest first
+        self._notifications = queue.Queue()
+        self._notifier = None
+        os.makedirs(snapshot_dir, exist_ok=True)
+        self.reload()
+
+    def current(self):
+        """
+        Return the current ReferenceSnapshot, reloading it first if the
+        source files changed
+        """
+        if time.monotonic() >= self._next_check and self._reload_lock.acquire(blocking=False):
+            # Other threads keep serving the current snapshot meanwhile
+            try:
+                self._next_check = time.monotonic() + self.reload_seconds
+                stats = self._stat_sources()
+                if stats != self._source_stats:
+                    # Recorded first so a broken file is retried only after
+                    # its next change
+                    self._source_stats = stats
+                    self._reload_locked()
+            except Exception as e:
+                log(f"Error reloading reference data, keeping version {self._snapshot.version}: {str(e)}")
+                log(traceback.format_exc())
+            finally:
+                self._reload_lock.release()
+        return self._snapshot
+
+    def reload(self):
+        """
+        Load the source files now and swap in their snapshot
+
+        Raises if the source files are invalid.
+        """
+        with self._reload_lock:
+            self._reload_locked()
+        return self._snapshot
+
+    def add_listener(self, callback):
+        """
+        Call callback(previous_snapshot, snapshot) after each swap
+
+        Listeners run on a background thread, one swap at a time and in
+        order, so a slow one such as re-validating stored documents holds
+        neither the reload lock nor the request that noticed the change.
+        """
+        with self._reload_lock:
+            self._listeners.append(callback)
+            if self._notifier is None:
+                self._notifier = threading.Thread(target=self._notify_listeners, daemon=True,
+                                                  name='sheetwise-reference-listeners')
+                self._notifier.start()
+
+    def _notify_listeners(self):
+        while True:
+            previous, snapshot = self._notifications.get()
+            for callback in list(self._listeners):
+                try:
+                    callback(previous, snapshot)
+                except Exception as e:
+                    log(f"Error in reference data listener: {str(e)}")
+                    log(traceback.format_exc())
+
+    def _stat_sources(self):
+        stats = []
+        for path in [self.source_path] + self._source_paths:
+            try:
+                stat = os.stat(path)
+                stats.append((path, stat.st_mtime_ns, stat.st_size))
+            except OSError:
+                stats.append((path, None, None))
+        return stats
+
+    def _reload_locked(self):
+        document, source_sha256, paths = load_reference_source(self.source_path)
+        previous = self._snapshot
+        if previous is not None and previous.source_sha256 == source_sha256:
+            self._source_paths = paths[1:]
+            self._source_stats = self._stat_sources()
+            return
+
+        snapshot = self._open_or_build(document, source_sha256)
+        # Compile the rules before the swap so a bad rule keeps the
+        # previous version in use
+        snapshot.rule_engine
+        self._source_paths = paths[1:]
+        self._snapshot = snapshot
+        self._source_stats = self._stat_sources()
+        self._next_check = time.monotonic() + self.reload_seconds
+        log(f"Reference data version {snapshot.version} loaded from {snapshot.path}")
+        if self._listeners:
+            self._notifications.put((previous, snapshot))
+
+    def _open_or_build(self, document, source_sha256):
+        """
+        Map the snapshot of source_sha256, compiling it first if needed
+
+        A lock file keeps concurrent workers from compiling the same
+        snapshot; the others wait and then map the finished file.
+        """
+        snapshot_path = os.path.join(self.snapshot_dir, f"reference-{source_sha256[:32]}.snap")
+        with open(os.path.join(self.snapshot_dir, '.build.lock'), 'w') as lock_file:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                try:
+                    return ReferenceSnapshot(snapshot_path)
+                except (OSError, ValueError):
+                    pass
+                started = time.perf_counter()
+                write_snapshot(document, source_sha256, snapshot_path)
+                log(f"Compiled reference data snapshot in {time.perf_counter() - started:.2f}s")
+                self._prune_snapshots(snapshot_path)
+                return ReferenceSnapshot(snapshot_path)
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _prune_snapshots(self, keep_path):
+        snapshots = []
+        for entry in os.scandir(self.snapshot_dir):
+            if entry.name.startswith('reference-') and entry.name.endswith('.snap'):
+                snapshots.append((entry.stat().st_mtime, entry.path))
+        snapshots.sort(reverse=True)
+        for _, path in snapshots[SNAPSHOTS_KEPT:]:
+            if os.path.abspath(path) != os.path.abspath(keep_path):
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
@@ -0,0 +1,369 @@
+import re
+import unicodedata
+from array import array
+from bisect import bisect_left
+from collections import Counter, namedtuple
+
+# Result of a reference lookup: the canonical approved name, a confidence
+# between 0 and 1, and whether the normalized names matched exactly
+ReferenceMatch = namedtuple('ReferenceMatch', ['name', 'confidence', 'exact'])
+
+# Fuzzy matches must be at least this similar (1 - edits / length)
+DEFAULT_MIN_CONFIDENCE = 0.85
+
+# Upper bound on the edit distance of a fuzzy match, whatever the length
+DEFAULT_MAX_DISTANCE = 2
+
+# Length of the character n-grams indexed for fuzzy matching
+NGRAM_SIZE = 3
+
+# Posting entries scanned per fuzzy lookup before the most common n-grams
+# of the query are left out of the candidate count
+CANDIDATE_BUDGET = 3000
+
+_NON_ALPHANUMERIC = re.compile(r'[\W_]+', re.UNICODE)
+
+
+def normalize_name(name):
+    """
+    Normalize a name for comparison: case-folded, accents and punctuation
+    removed, whitespace collapsed
+    """
+    name = unicodedata.normalize('NFKD', name)
+    name = ''.join(char for char in name if not unicodedata.combining(char))
+    return _NON_ALPHANUMERIC.sub(' ', name.casefold()).strip()
+
+
+def _ngrams(key):
+    """
+    Return the n-grams of a normalized name, padded so that the start and
+    end of the name form n-grams of their own
+    """
+    padded = f"\x02{key}\x03"
+    return [padded[i:i + NGRAM_SIZE] for i in range(len(padded) - NGRAM_SIZE + 1)]
+
+
+def bounded_edit_distance(a, b, max_distance):
+    """
+    Return the Levenshtein distance between a and b, or max_distance + 1 if
+    it is larger than max_distance
+
+    Only a diagonal band of width 2 * max_distance + 1 is computed.
+    """
+    if abs(len(a) - len(b)) > max_distance:
+        return max_distance + 1
+
+    too_far = max_distance + 1
+    previous = list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        low = max(1, i - max_distance)
+        high = min(len(b), i + max_distance)
+        current = [too_far] * (len(b) + 1)
+        current[0] = i
+        row_minimum = current[0] if low == 1 else too_far
+        char = a[i - 1]
+        for j in range(low, high + 1):
+            cost = 0 if char == b[j - 1] else 1
+            value = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + cost)
+            current[j] = value
+            if value < row_minimum:
+                row_minimum = value
+        if row_minimum > max_distance:
+            return too_far
+        previous = current
+
+    return min(previous[len(b)], too_far)
+
+
+def _offsets(chunks):
+    """
+    Return the cumulative byte offsets of a list of byte strings
+    """
+    offsets = array('I', [0])
+    total = 0
+    for chunk in chunks:
+        total += len(chunk)
+        offsets.append(total)
+    return offsets
+
+
+def _padded(data):
+    """
+    Pad bytes with zeros to a multiple of 4 so the next array stays aligned
+    """
+    return data + b'\0' * (-len(data) % 4)
+
+
+def build_index_section(names):
+    """
+    Serialize the index of a list of names into its flat binary layout
+
+    The layout is a header of eight uint32 counts followed by uint32 arrays
+    and UTF-8 blobs, all 4-byte aligned and in native byte order:
+
+        count, gram_count, longest, key_bytes, name_bytes, gram_bytes, postings, 0
+        key_offsets[count + 1]        normalized names, numbered by (length, name)
+        name_offsets[count + 1]       canonical names, same numbering
+        length_starts[longest + 2]    first id of each name length
+        exact_order[count]            ids sorted by normalized UTF-8 bytes
+        gram_offsets[gram_count + 1]
+        posting_offsets[gram_count + 1]
+        postings[postings]            ids containing each trigram, ascending
+        key blob, name blob, gram blob
+    """
+    entries = {}
+    for name in names:
+        key = normalize_name(name)
+        if key and key not in entries:
+            entries[key] = name
+
+    ordered = sorted(entries, key=lambda key: (len(key), key))
+    key_bytes = [key.encode('utf-8') for key in ordered]
+    name_bytes = [entries[key].encode('utf-8') for key in ordered]
+
+    longest = len(ordered[-1]) if ordered else 0
+    length_starts = array('I', [0] * (longest + 2))
+    position = 0
+    for length in range(longest + 2):
+        while position < len(ordered) and len(ordered[position]) < length:
+            position += 1
+        length_starts[length] = position
+
+    exact_order = array('I', sorted(range(len(ordered)), key=key_bytes.__getitem__))
+
+    postings = {}
+    for index, key in enumerate(ordered):
+        for gram in set(_ngrams(key)):
+            posting = postings.get(gram)
+            if posting is None:
+                posting = postings[gram] = array('I')
+            posting.append(index)
+    grams = sorted(postings)
+    gram_bytes = [gram.encode('utf-8') for gram in grams]
+    posting_offsets = array('I', [0])
+    for gram in grams:
+        posting_offsets.append(posting_offsets[-1] + len(postings[gram]))
+
+    key_blob = b''.join(key_bytes)
+    name_blob = b''.join(name_bytes)
+    gram_blob = b''.join(gram_bytes)
+    header = array('I', [len(ordered), len(grams), longest, len(key_blob), len(name_blob),
+                         len(gram_blob), posting_offsets[-1], 0])
+
+    parts = [header, _offsets(key_bytes), _offsets(name_bytes), length_starts, exact_order,
+             _offsets(gram_bytes), posting_offsets]
+    parts.extend(postings[gram] for gram in grams)
+    return b''.join([part.tobytes() for part in parts] +
+                    [_padded(key_blob), _padded(name_blob), _padded(gram_blob)])
+
+
+class ReferenceIndex:
+    """
+    Index of approved reference names for exact and fuzzy lookups
+
+    The index lives in one flat buffer (see build_index_section), either
+    built in memory or memory-mapped from a reference data snapshot, so
+    large lists are shared between worker processes instead of copied.
+
+    Exact lookups binary-search the normalized names. Fuzzy lookups use an
+    inverted index of character trigrams: an edit changes at most
+    NGRAM_SIZE trigrams, so any name within k edits of the query shares all
+    but k * NGRAM_SIZE of the query's trigrams. Names are numbered in order
+    of length, which turns the length filter into an id range that is cut
+    out of each sorted posting list by binary search. Candidates are
+    verified with a banded edit distance in order of shared trigrams,
+    stopping once the trigrams a candidate lacks prove it cannot beat the
+    best match.
+    """
+
+    def __init__(self, names, min_confidence=DEFAULT_MIN_CONFIDENCE, max_distance=DEFAULT_MAX_DISTANCE):
+        self.min_confidence = min_confidence
+        self.max_distance = max_distance
+        self._attach(memoryview(build_index_section(names)))
+
+    @classmethod
+    def from_buffer(cls, buffer, min_confidence=DEFAULT_MIN_CONFIDENCE, max_distance=DEFAULT_MAX_DISTANCE):
+        """
+        Wrap a buffer produced by build_index_section without copying it
+        """
+        index = cls.__new__(cls)
+        index.min_confidence = min_confidence
+        index.max_distance = max_distance
+        index._attach(memoryview(buffer))
+        return index
+
+    def _attach(self, buffer):
+        """
+        Slice the typed arrays and blobs of the layout out of buffer
+        """
+        position = 0
+
+        def take_array(count):
+            nonlocal position
+            view = buffer[position:position + count * 4].cast('I')
+            position += count * 4
+            return view
+
+        def take_blob(size):
+            nonlocal position
+            view = buffer[position:position + size]
+            position += size + (-size % 4)
+            return view
+
+        count, gram_count, longest, key_size, name_size, gram_size, posting_count, _ = take_array(8)
+        self._count = count
+        self._key_offsets = take_array(count + 1)
+        self._name_offsets = take_array(count + 1)
+        self._length_starts = take_array(longest + 2)
+        self._exact_order = take_array(count)
+        gram_offsets = take_array(gram_count + 1)
+        self._posting_offsets = take_array(gram_count + 1)
+        self._postings = take_array(posting_count)
+        self._key_blob = take_blob(key_size)
+        self._name_blob = take_blob(name_size)
+        gram_blob = take_blob(gram_size)
+
+        # The trigram table is small next to the postings, so it is decoded
+        # into a dict for constant-time lookups
+        self._gram_ids = {
+            str(gram_blob[gram_offsets[gram_id]:gram_offsets[gram_id + 1]], 'utf-8'): gram_id
+            for gram_id in range(gram_count)
+        }
+
+    def __len__(self):
+        return self._count
+
+    def __contains__(self, name):
+        return self._find_exact(normalize_name(name)) is not None
+
+    def names(self):
+        """
+        Yield every canonical name in the index
+        """
+        for index in range(self._count):
+            yield self._name(index)
+
+    def items(self):
+        """
+        Yield (normalized name, canonical name) for every name in the index
+        """
+        for index in range(self._count):
+            yield self._key(index), self._name(index)
+
+    def _key(self, index):
+        return str(self._key_blob[self._key_offsets[index]:self._key_offsets[index + 1]], 'utf-8')
+
+    def _name(self, index):
+        return str(self._name_blob[self._name_offsets[index]:self._name_offsets[index + 1]], 'utf-8')
+
+    def _find_exact(self, key):
+        """
+        Binary-search the normalized names and return the id of key, or None
+        """
+        target = key.encode('utf-8')
+        low, high = 0, self._count
+        while low < high:
+            middle = (low + high) // 2
+            index = self._exact_order[middle]
+            if bytes(self._key_blob[self._key_offsets[index]:self._key_offsets[index + 1]]) < target:
+                low = middle + 1
+            else:
+                high = middle
+        if low < self._count:
+            index = self._exact_order[low]
+            if self._key(index) == key:
+                return index
+        return None
+
+    def match(self, name):
+        """
+        Return the best ReferenceMatch for name, or None if no approved name
+        is close enough
+        """
+        key = normalize_name(name)
+        index = self._find_exact(key)
+        if index is not None:
+            return ReferenceMatch(self._name(index), 1.0, True)
+
+        max_distance = min(self.max_distance, int(len(key) * (1 - self.min_confidence)))
+        if max_distance < 1:
+            return None
+
+        best = None
+        best_distance = max_distance
+        probes, candidates = self._candidates(key, max_distance)
+        for candidate, count in candidates:
+            # Every edit removes at most NGRAM_SIZE trigrams, so a candidate
+            # missing more trigrams than that cannot be closer than the best
+            if best is not None and (probes - count + NGRAM_SIZE - 1) // NGRAM_SIZE > best_distance:
+                break
+            candidate_key = self._key(candidate)
+            distance = bounded_edit_distance(key, candidate_key, best_distance)
+            if distance > best_distance:
+                continue
+            confidence = 1 - distance / max(len(key), len(candidate_key))
+            if best is None or confidence > best.confidence:
+                best = ReferenceMatch(self._name(candidate), confidence, False)
+                best_distance = distance
+
+        if best is None or best.confidence < self.min_confidence:
+            return None
+        return best
+
+    def _candidates(self, key, max_distance):
+        """
+        Find names whose length and shared trigrams allow them to be within
+        max_distance edits of key
+
+        Returns the number of query trigrams probed and a list of
+        (id, shared trigram count) pairs, most shared first.
+        """
+        lowest_id = self._length_start(len(key) - max_distance)
+        end_id = self._length_start(len(key) + max_distance + 1)
+        if lowest_id >= end_id:
+            return 0, []
+
+        # Slice every trigram's posting list down to the length window
+        slices = []
+        for gram in _ngrams(key):
+            gram_id = self._gram_ids.get(gram)
+            if gram_id is None:
+                slices.append(None)
+                continue
+            first = self._posting_offsets[gram_id]
+            last = self._posting_offsets[gram_id + 1]
+            start = bisect_left(self._postings, lowest_id, first, last)
+            stop = bisect_left(self._postings, end_id, start, last)
+            slices.append((start, stop))
+
+        # Count over the rarest trigrams first; leaving out the most common
+        # ones keeps lookups fast while the threshold still holds
+        slices.sort(key=lambda item: 0 if item is None else item[1] - item[0])
+        minimum_probes = max_distance * NGRAM_SIZE + 1
+        counts = Counter()
+        probes = 0
+        scanned = 0
+        for item in slices:
+            size = 0 if item is None else item[1] - item[0]
+            if probes >= minimum_probes and scanned + size > CANDIDATE_BUDGET:
+                break
+            if item is not None:
+                start, stop = item
+                counts.update(self._postings[start:stop])
+            probes += 1
+            scanned += size
+
+        threshold = probes - max_distance * NGRAM_SIZE
+        candidates = [(candidate, count) for candidate, count in counts.items() if count >= threshold]
+        candidates.sort(key=lambda item: item[1], reverse=True)
+        return probes, candidates
+
+    def _length_start(self, length):
+        """
+        Return the id of the first name at least length characters long
+        """
+        if length <= 0:
+            return 0
+        if length >= len(self._length_starts):
+            return self._count
+        return self._length_starts[length]
@@ -0,0 +1,273 @@
+import contextvars
+import heapq
+import itertools
+import os
+import threading
+import time
+from contextlib import contextmanager
+from utils.metrics import get_metrics_registry, STAGE_BUCKETS
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - Windows
+    fcntl = None
+
+# Tesseract runs (with their page's rasterization and preprocessing) allowed
+# at once, whichever requests they belong to
+DEFAULT_OCR_MAX_CONCURRENCY = int(os.environ.get('OCR_MAX_CONCURRENCY', os.cpu_count() or 1))
+
+# Lock files, one per slot, shared by the worker processes of a host, so
+# that OCR_MAX_CONCURRENCY caps the machine rather than each process. Empty
+# caps each process separately.
+DEFAULT_OCR_SLOT_DIR = os.environ.get('OCR_SLOT_DIR', 'cache/ocr-slots')
+
+# Seconds between attempts to take a slot held by another process
+SLOT_POLL_SECONDS = 0.05
+
+# Budgets of one extraction: pages OCR'd and the CPU time spent on them.
+# An extraction that runs out returns the pages done so far, marked as
+# truncated. 0 disables a budget.
+DEFAULT_OCR_MAX_PAGES = int(os.environ.get('OCR_MAX_PAGES', 200))
+DEFAULT_OCR_MAX_CPU_SECONDS = float(os.environ.get('OCR_MAX_CPU_SECONDS', 600))
+
+# Tesseract otherwise spreads each run over up to four OpenMP threads,
+# which oversubscribes the cores the concurrency cap is sized to
+os.environ.setdefault('OMP_THREAD_LIMIT', '1')
+
+# Priority lanes, highest first. Interactive uploads, whose client waits
+# for the response, are served before batch work: queued jobs, batch
+# uploads and background extraction.
+LANE_INTERACTIVE = 'interactive'
+LANE_BATCH = 'batch'
+LANES = (LANE_INTERACTIVE, LANE_BATCH)
+
+_lane = contextvars.ContextVar('sheetwise_ocr_lane', default=LANE_BATCH)
+
+_registry = get_metrics_registry()
+OCR_THROTTLED = _registry.counter(
+    'sheetwise_ocr_throttled_total',
+    "OCR pages that waited for a Tesseract slot ('queued') and extractions truncated by a budget, by lane",
+    ('lane', 'reason'))
+OCR_WAIT_SECONDS = _registry.histogram(
+    'sheetwise_ocr_wait_seconds', 'Time OCR pages waited for a Tesseract slot, by lane', ('lane',), STAGE_BUCKETS)
+
+_default_governor = None
+_default_governor_lock = threading.Lock()
+
+
+def get_ocr_governor():
+    """
+    Return the process-wide OCR governor, creating it on first use
+    """
+    global _default_governor
+    with _default_governor_lock:
+        if _default_governor is None:
+            _default_governor = OCRGovernor(DEFAULT_OCR_MAX_CONCURRENCY, DEFAULT_OCR_SLOT_DIR or None)
+            _default_governor.register_metrics()
+        return _default_governor
+
+
+@contextmanager
+def ocr_lane(lane):
+    """
+    Run the body of a with statement in the given priority lane
+    """
+    token = _lane.set(lane)
+    try:
+        yield
+    finally:
+        _lane.reset(token)
+
+
+def current_ocr_lane():
+    """
+    Return the priority lane of the current request: batch unless set
+    with ocr_lane()
+    """
+    return _lane.get()
+
+
+class OCRGovernor:
+    """
+    Caps the Tesseract runs of a process and shares them out by priority
+
+    A run takes a slot for its duration. When every slot is taken, runs
+    wait in order of lane, then arrival, and each freed slot goes straight
+    to the first waiter: an interactive upload waits for at most one page
+    of any batch job to finish, however many pages that job has left, and
+    documents in the same lane take turns page by page.
+
+    With a slot_dir, a run also takes one of the slots shared there by the
+    processes of the host. Lanes order the runs of a process; between
+    processes, a slot goes to the first to find it free.
+    """
+
+    def __init__(self, max_concurrency=DEFAULT_OCR_MAX_CONCURRENCY, slot_dir=None):
+        self.max_concurrency = max(1, max_concurrency)
+        self.slot_dir = slot_dir
+        self._host_slots = _HostSlots(slot_dir, self.max_concurrency) if slot_dir and fcntl is not None else None
+        self._in_use = 0
+        # Heap of (lane priority, arrival, event, lane)
+        self._waiting = []
+        self._waiting_by_lane = dict.fromkeys(LANES, 0)
+        self._arrivals = itertools.count()
+        self._lock = threading.Lock()
+
+    def acquire(self, lane=None):
+        """
+        Take a slot, waiting for one if needed, and return the seconds waited
+        """
+        lane = lane or current_ocr_lane()
+        started = time.perf_counter()
+        with self._lock:
+            if self._in_use < self.max_concurrency and not self._waiting:
+                self._in_use += 1
+                event = None
+            else:
+                event = threading.Event()
+                heapq.heappush(self._waiting, (LANES.index(lane), next(self._arrivals), event, lane))
+                self._waiting_by_lane[lane] += 1
+        if event is not None:
+            event.wait()
+
+        queued = event is not None
+        if self._host_slots is not None:
+            try:
+                queued = not self._host_slots.acquire() or queued
+            except BaseException:
+                self._release_local()
+                raise
+        if not queued:
+            return 0.0
+        waited = time.perf_counter() - started
+        _registry.observe_many([(OCR_THROTTLED, (lane, 'queued'), 1), (OCR_WAIT_SECONDS, (lane,), waited)])
+        return waited
+
+    def release(self):
+        """
+        Give a slot back, handing it to the first waiter if there is one
+        """
+        if self._host_slots is not None:
+            self._host_slots.release()
+        self._release_local()
+
+    def _release_local(self):
+        with self._lock:
+            if self._waiting:
+                _, _, event, lane = heapq.heappop(self._waiting)
+                self._waiting_by_lane[lane] -= 1
+                event.set()
+            else:
+                self._in_use -= 1
+
+    @contextmanager
+    def slot(self, lane=None):
+        """
+        Hold a slot for the body of a with statement
+        """
+        self.acquire(lane)
+        try:
+            yield
+        finally:
+            self.release()
+
+    def state(self):
+        """
+        Return the slots in use and the number of runs waiting in each lane
+        """
+        with self._lock:
+            return {'slots': self.max_concurrency, 'in_use': self._in_use, 'waiting': dict(self._waiting_by_lane)}
+
+    def register_metrics(self):
+        """
+        Expose the queue depth and slots in use of this governor as gauges
+        """
+        _registry.gauge('sheetwise_ocr_queue_depth', 'OCR pages waiting for a Tesseract slot, by lane', ('lane',),
+                        lambda: {(lane,): waiting for lane, waiting in self.state()['waiting'].items()})
+        _registry.gauge('sheetwise_ocr_slots_in_use', 'Tesseract slots in use', (),
+                        lambda: {(): self.state()['in_use']})
+
+
+class _HostSlots:
+    """
+    Slots shared by processes: lock files in a directory, each locked with
+    flock while a run holds it. The lock goes with the file, so a worker
+    that exits or is killed mid-run frees its slots.
+    """
+
+    def __init__(self, slot_dir, count, poll_seconds=SLOT_POLL_SECONDS):
+        os.makedirs(slot_dir, exist_ok=True)
+        self.paths = [os.path.join(slot_dir, f'slot-{number}.lock') for number in range(count)]
+        self.poll_seconds = poll_seconds
+        # Files of the slots this process holds. They are interchangeable,
+        # so a release, which may run on another thread, frees any of them.
+        self._held = []
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """
+        Take a free slot, polling until there is one, and return whether one
+        was free at once
+        """
+        first_attempt = True
+        while True:
+            for path in self.paths:
+                slot_file = open(path, 'a')
+                try:
+                    fcntl.flock(slot_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    slot_file.close()
+                    continue
+                with self._lock:
+                    self._held.append(slot_file)
+                return first_attempt
+            first_attempt = False
+            time.sleep(self.poll_seconds)
+
+    def release(self):
+        with self._lock:
+            slot_file = self._held.pop()
+        fcntl.flock(slot_file, fcntl.LOCK_UN)
+        slot_file.close()
+
+
+class OCRBudget:
+    """
+    Page and CPU time allowance of one extraction, in a priority lane
+
+    Pages are counted when admitted, before they are OCR'd. CPU time is
+    counted as each page finishes: the time spent rasterizing,
+    preprocessing and OCRing it, which runs on a single core while it holds
+    a slot. Pages already running when the CPU budget runs out are kept.
+    """
+
+    def __init__(self, max_pages=DEFAULT_OCR_MAX_PAGES, max_cpu_seconds=DEFAULT_OCR_MAX_CPU_SECONDS, lane=None):
+        self.max_pages = max_pages
+        self.max_cpu_seconds = max_cpu_seconds
+        self.lane = lane or current_ocr_lane()
+        self.pages = 0
+        self.cpu_seconds = 0.0
+        # The budget that ran out ('page_budget' or 'cpu_budget'), if any
+        self.exhausted = None
+
+    def admit_page(self):
+        """
+        Return whether another page may be OCR'd, counting it if so
+        """
+        if self.exhausted is None:
+            if self.max_pages and self.pages >= self.max_pages:
+                self.exhausted = 'page_budget'
+            elif self.max_cpu_seconds and self.cpu_seconds >= self.max_cpu_seconds:
+                self.exhausted = 'cpu_budget'
+            if self.exhausted is not None:
+                _registry.observe(OCR_THROTTLED, (self.lane, self.exhausted))
+                return False
+            self.pages += 1
+            return True
+        return False
+
+    def charge(self, seconds):
+        """
+        Count the CPU time a finished page took
+        """
+        self.cpu_seconds += seconds
@@ -0,0 +1,350 @@
+import re
+import threading
+import time
+from datetime import datetime
+from functools import lru_cache
+from services.reference_index import normalize_name
+from utils.metrics import record_rule_timings
+
+# Weight of each issue severity in the risk score
+SEVERITY_WEIGHTS = {'HIGH': 0.5, 'MEDIUM': 0.3, 'LOW': 0.1}
+
+_ISO_DATE = re.compile(r'(\d{4})-(\d{2})-(\d{2})')
+
+# Distinct values whose approved-list lookup is remembered per rule; term
+# sheets reuse the same few counterparties, issuers and products
+MATCH_CACHE_SIZE = 8192
+
+# Returned by parse_date for values that are not valid dates
+INVALID_DATE = object()
+
+
+@lru_cache(maxsize=4096)
+def parse_date(value):
+    """
+    Parse a 'YYYY-MM-DD' date exactly as datetime.strptime(value, '%Y-%m-%d')
+    does, returning INVALID_DATE instead of raising
+
+    Zero-padded dates, which is all the field extractor produces, are read
+    without strptime. Results are cached because the same dates recur across
+    term sheets and across rules.
+    """
+    match = _ISO_DATE.fullmatch(value)
+    try:
+        if match:
+            return datetime(int(match.group(1)), int(match.group(2)), int(match.group(3)))
+        return datetime.strptime(value, '%Y-%m-%d')
+    except ValueError:
+        return INVALID_DATE
+
+
+def validation_status(is_valid, issues):
+    """
+    Summarize a validation as 'invalid' (any HIGH issue), 'warning' (other
+    issues) or 'valid'
+    """
+    return 'invalid' if not is_valid else 'warning' if issues else 'valid'
+
+
+class RuleContext:
+    """
+    The term sheet being evaluated, with parsed field values shared by
+    every rule that reads them
+    """
+
+    __slots__ = ('data', 'now', '_dates')
+
+    def __init__(self, data, now):
+        self.data = data
+        self.now = now
+        self._dates = {}
+
+    def date(self, field):
+        parsed = self._dates.get(field)
+        if parsed is None:
+            parsed = self._dates[field] = parse_date(self.data[field])
+        return parsed
+
+
+def _compile_condition(condition):
+    """
+    Compile a rule's 'when' clause into a predicate over a RuleContext
+
+    {"field": "product", "in": [...]} applies the rule only to term sheets
+    whose field is one of the values; "not_in" excludes them instead.
+    Values are compared after normalize_name.
+    """
+    if condition is None:
+        return None
+    field = condition['field']
+    if 'in' in condition:
+        values = frozenset(normalize_name(value) for value in condition['in'])
+        expected = True
+    else:
+        values = frozenset(normalize_name(value) for value in condition['not_in'])
+        expected = False
+
+    def applies(context):
+        value = context.data.get(field)
+        return isinstance(value, str) and (normalize_name(value) in values) == expected
+    return applies
+
+
+def _required(rule, severity, lists):
+    field = rule['field']
+    missing_message = rule['missing_message']
+    allow_empty = rule.get('allow_empty', True)
+
+    def check(context, issues):
+        if field not in context.data or (not allow_empty and not context.data[field]):
+            issues.append((missing_message, severity))
+    return check
+
+
+def _approved_list(rule, severity, lists):
+    field = rule['field']
+    # Safe to memoize: the index belongs to an immutable snapshot
+    match_name = lru_cache(maxsize=MATCH_CACHE_SIZE)(lists[rule['list']].match)
+    label = rule['label']
+    missing_message = rule['missing_message']
+
+    def check(context, issues):
+        if field not in context.data:
+            issues.append((missing_message, severity))
+            return
+        value = context.data[field]
+        match = match_name(value)
+        if match is None:
+            issues.append((f"{label} '{value}' is not on the approved list", severity))
+        elif not match.exact:
+            # Close to an approved name, which may be OCR noise or a
+            # different entity: fails like any other unapproved name, with
+            # the closest approved one suggested for the reviewer
+            issues.append((f"{label} '{value}' is not on the approved list; closest approved name is "
+                           f"'{match.name}' (match confidence {match.confidence:.0%})", severity))
+    return check
+
+
+def _range(rule, severity, lists):
+    field = rule['field']
+    minimum = rule.get('min')
+    maximum = rule.get('max')
+    missing_message = rule['missing_message']
+    message = rule['message']
+
+    def check(context, issues):
+        if field not in context.data:
+            issues.append((missing_message, severity))
+            return
+        value = context.data[field]
+        if (minimum is not None and value < minimum) or (maximum is not None and value > maximum):
+            issues.append((message.format(value=value), severity))
+    return check
+
+
+def _date(rule, severity, lists):
+    field = rule['field']
+    must_be = rule['must_be']
+    if must_be not in ('future', 'not_future'):
+        raise ValueError(f"Unknown date condition '{must_be}'")
+    missing_message = rule['missing_message']
+    message = rule['message']
+    invalid_message = rule['invalid_message']
+
+    def check(context, issues):
+        if field not in context.data:
+            issues.append((missing_message, severity))
+            return
+        parsed = context.date(field)
+        if parsed is INVALID_DATE:
+            issues.append((invalid_message.format(value=context.data[field]), severity))
+        elif (parsed <= context.now) if must_be == 'future' else (parsed > context.now):
+            issues.append((message.format(value=context.data[field]), severity))
+    return check
+
+
+def _date_order(rule, severity, lists):
+    earlier = rule['earlier']
+    later = rule['later']
+    message = rule['message']
+    invalid_message = rule['invalid_message']
+
+    def check(context, issues):
+        # Only checked when both dates are present
+        if later not in context.data or earlier not in context.data:
+            return
+        later_date = context.date(later)
+        earlier_date = context.date(earlier)
+        if later_date is INVALID_DATE or earlier_date is INVALID_DATE:
+            issues.append((invalid_message, severity))
+        elif later_date < earlier_date:
+            issues.append((message.format(earlier=context.data[earlier], later=context.data[later]), severity))
+    return check
+
+
+def rule_dependencies(rule):
+    """
+    Return the fields and the approved lists a rule configuration reads
+    """
+    fields = {rule[key] for key in ('field', 'earlier', 'later') if key in rule}
+    if rule.get('when'):
+        fields.add(rule['when']['field'])
+    lists = {rule['list']} if 'list' in rule else set()
+    return frozenset(fields), frozenset(lists)
+
+
+# Rule types available to the reference data, by their 'type' setting
+RULE_TYPES = {
+    'required': _required,
+    'approved_list': _approved_list,
+    'range': _range,
+    'date': _date,
+    'date_order': _date_order,
+}
+
+
+class RuleEngine:
+    """
+    Validation rules compiled from their declarative configuration
+
+    Each rule is compiled once into a closure with its settings and list
+    index bound, so evaluating a term sheet is a single pass over the plan
+    with no configuration lookups. Dates are parsed at most once per term
+    sheet however many rules read them, and a rule whose 'when' clause does
+    not apply is skipped before any of its checks run.
+
+    Time spent in each rule is accumulated for timing_stats() and, during
+    a request, reported to the rule timing histogram.
+
+    dependencies maps each rule to the fields and lists it reads, so that
+    a change to either re-runs only the rules concerned.
+    """
+
+    def __init__(self, rules, lists, timing=True):
+        self.rules = rules
+        self.timing = timing
+        self._plan = []
+        self.dependencies = {}
+        for rule_id, rule in rules.items():
+            try:
+                compile_rule = RULE_TYPES[rule['type']]
+            except KeyError:
+                raise ValueError(f"Rule '{rule_id}' has unknown type '{rule.get('type')}'") from None
+            check = compile_rule(rule, rule['severity'], lists)
+            self._plan.append((rule_id, _compile_condition(rule.get('when')), check))
+            self.dependencies[rule_id] = rule_dependencies(rule)
+        self._rule_ids = tuple(rule_id for rule_id, _, _ in self._plan)
+
+        self._calls = 0
+        self._seconds = [0.0] * len(self._plan)
+        self._timing_lock = threading.Lock()
+
+    def evaluate(self, data, now=None):
+        """
+        Run every rule on one term sheet and return its issues, in rule order
+        """
+        context = RuleContext(data, now or datetime.now())
+        raw_issues = []
+        issues = []
+
+        if not self.timing:
+            for rule_id, applies, check in self._plan:
+                if applies is None or applies(context):
+                    check(context, raw_issues)
+                    for description, severity in raw_issues:
+                        issues.append({'rule_id': rule_id, 'description': description, 'severity': severity})
+                    raw_issues.clear()
+            return issues
+
+        perf_counter = time.perf_counter
+        elapsed = []
+        for rule_id, applies, check in self._plan:
+            started = perf_counter()
+            if applies is None or applies(context):
+                check(context, raw_issues)
+            elapsed.append(perf_counter() - started)
+            for description, severity in raw_issues:
+                issues.append({'rule_id': rule_id, 'description': description, 'severity': severity})
+            raw_issues.clear()
+
+        record_rule_timings(self._rule_ids, elapsed)
+        with self._timing_lock:
+            self._calls += 1
+            seconds = self._seconds
+            for position, value in enumerate(elapsed):
+                seconds[position] += value
+        return issues
+
+    def evaluate_rules(self, data, rule_ids, now=None):
+        """
+        Run only the given rules on one term sheet and return a dict of
+        each rule's issues, in rule order
+        """
+        context = RuleContext(data, now or datetime.now())
+        results = {}
+        raw_issues = []
+        for rule_id, applies, check in self._plan:
+            if rule_id not in rule_ids:
+                continue
+            if applies is None or applies(context):
+                check(context, raw_issues)
+            results[rule_id] = [{'rule_id': rule_id, 'description': description, 'severity': severity}
+                                for description, severity in raw_issues]
+            raw_issues.clear()
+        return results
+
+    def applies(self, rule_id, data):
+        """
+        Return whether a rule's 'when' clause selects this term sheet
+        """
+        for plan_rule_id, applies, _ in self._plan:
+            if plan_rule_id == rule_id:
+                return applies is None or applies(RuleContext(data, None))
+        raise KeyError(rule_id)
+
+    def evaluate_many(self, records, now=None):
+        """
+        Evaluate an iterable of term sheets against the same clock and
+        yield (issues, risk_score, is_valid) for each
+        """
+        now = now or datetime.now()
+        for data in records:
+            issues = self.evaluate(data, now)
+            yield (issues,) + self.score(issues)
+
+    def score(self, issues):
+        """
+        Return the (risk_score, is_valid) of a term sheet's issues
+
+        The risk score weights issues by severity and is relative to every
+        rule failing with HIGH severity; any HIGH issue makes the term sheet
+        invalid.
+        """
+        if not issues:
+            return 0.0, True
+        counts = {'HIGH': 0, 'MEDIUM': 0, 'LOW': 0}
+        for issue in issues:
+            if issue['severity'] in counts:
+                counts[issue['severity']] += 1
+        weighted_score = sum(SEVERITY_WEIGHTS[severity] * count for severity, count in counts.items())
+        max_possible_score = len(self.rules) * SEVERITY_WEIGHTS['HIGH']
+        return min(1.0, weighted_score / max_possible_score), counts['HIGH'] == 0
+
+    def timing_stats(self):
+        """
+        Return the number of term sheets evaluated and the time spent in
+        each rule, in rule order
+        """
+        with self._timing_lock:
+            calls = self._calls
+            seconds = list(self._seconds)
+        return {
+            'evaluations': calls,
+            'rules': [
+                {
+                    'rule_id': rule_id,
+                    'total_ms': round(total * 1000, 3),
+                    'mean_us': round(total / calls * 1e6, 3) if calls else None
+                } for (rule_id, _, _), total in zip(self._plan, seconds)
+            ]
+        }
@@ -0,0 +1,137 @@
+import re
+from collections import namedtuple
+from services.field_extractor import DEFAULT_FIELD_EXTRACTOR, FIELD_SPECS
+
+# A line matching this (case-insensitively) is the heading of a new term sheet
+DEFAULT_HEADING_PATTERN = r'\s*(?:indicative\s+|final\s+)?term\s+sheet\b'
+
+# A segment with fewer distinct field labels than this is not a term sheet
+# of its own, such as a clause quoting "Issuer:" again, and is kept with
+# the term sheet before it
+MIN_SEGMENT_FIELDS = 2
+
+# One term sheet found in a document: its position among them, the line
+# it starts on (counted from 0) and its offset in the document text, its
+# text, its extracted fields and their spans in its text (see
+# FieldExtractor.extract_spans)
+TermSheetSegment = namedtuple('TermSheetSegment', ['index', 'start_line', 'offset', 'text', 'fields', 'spans'])
+
+
+def iter_lines(text):
+    """
+    Yield the lines of text one at a time, without building a list of them
+    """
+    start = 0
+    while True:
+        end = text.find('\n', start)
+        if end == -1:
+            if start < len(text):
+                yield text[start:]
+            return
+        yield text[start:end]
+        start = end + 1
+
+
+class TermSheetSegmenter:
+    """
+    Splits the text of a bundled document into one segment per term sheet
+
+    Lines are read once, in order. A new term sheet starts at a heading
+    line ('TERM SHEET') or at a field label, at the start of a line, that
+    the current term sheet already has: a second 'Trade Date:' means the
+    next trade, which is how blotter rows and bundled PDFs read after
+    extraction. Synonyms count as the same field. Only the current segment
+    and the one before it are held, so memory does not grow with the number
+    of term sheets.
+    """
+
+    def __init__(self, field_extractor=None, specs=FIELD_SPECS, heading_pattern=DEFAULT_HEADING_PATTERN,
+                 min_fields=MIN_SEGMENT_FIELDS):
+        self.field_extractor = field_extractor or DEFAULT_FIELD_EXTRACTOR
+        self.min_fields = min_fields
+        self._heading = re.compile(heading_pattern, re.IGNORECASE)
+
+        self._field_by_label = {}
+        for spec in specs:
+            for label in spec.labels:
+                self._field_by_label[label] = spec.name
+        # Longest first, so that 'Notional Amount' is not read as 'Notional'
+        labels = sorted(self._field_by_label, key=len, reverse=True)
+        self._label = re.compile(r'\s*(' + '|'.join(re.escape(label) for label in labels) + r'):')
+
+    def iter_segments(self, lines):
+        """
+        Yield a TermSheetSegment for each term sheet in an iterable of lines
+
+        Text before the first term sheet belongs to it. Lines after the
+        last blank line that follows a term sheet's last field, such as a
+        blotter row's trade id, go with the next term sheet. A document
+        without any boundary yields a single segment holding all of it.
+        """
+        index = 0
+        # The segment before the current one, held until the current one
+        # shows whether it is large enough to stand alone
+        pending = None
+        # [start_line, offset, lines, fields seen]
+        current = [0, 0, [], set()]
+        offset = 0
+        # Position in the current lines after the last blank line that
+        # follows its last field, where a new term sheet would begin
+        split_at = None
+        for line_number, line in enumerate(lines):
+            match = self._label.match(line)
+            field = self._field_by_label[match.group(1)] if match else None
+            seen = current[3]
+            if (field is not None and field in seen) or (seen and self._heading.match(line)):
+                if pending is None and len(seen) < self.min_fields:
+                    # A cover page or preamble, kept with the first term sheet
+                    current[3] = set()
+                else:
+                    carried = []
+                    if split_at is not None:
+                        carried = current[2][split_at:]
+                        del current[2][split_at:]
+                    if pending is not None and len(seen) < self.min_fields:
+                        pending[2].extend(current[2])
+                        pending[3].update(seen)
+                    else:
+                        if pending is not None:
+                            yield self._segment(index, pending)
+                            index += 1
+                        pending = current
+                    carried_length = sum(len(carried_line) + 1 for carried_line in carried)
+                    current = [line_number - len(carried), offset - carried_length, carried, set()]
+                split_at = None
+
+            current[2].append(line)
+            offset += len(line) + 1
+            if field is not None:
+                current[3].add(field)
+                split_at = None
+            elif not line.strip() and current[3]:
+                split_at = len(current[2])
+
+        if pending is not None and len(current[3]) < self.min_fields:
+            pending[2].extend(current[2])
+            pending[3].update(current[3])
+            current = None
+        if pending is not None:
+            yield self._segment(index, pending)
+            index += 1
+        if current is not None and (current[2] or index == 0):
+            yield self._segment(index, current)
+
+    def split(self, text):
+        """
+        Yield a TermSheetSegment for each term sheet in text
+        """
+        return self.iter_segments(iter_lines(text))
+
+    def _segment(self, index, segment):
+        start_line, offset, lines, _ = segment
+        text = '\n'.join(lines)
+        fields, spans = self.field_extractor.extract_spans(text)
+        return TermSheetSegment(index, start_line, offset, text, fields, spans)
+
+
+DEFAULT_SEGMENTER = TermSheetSegmenter()
@@ -0,0 +1,127 @@
+import numpy as np
+
+# One row per OCR'd word. A token's text is the span [start, end) of the
+# extracted document text, so no strings are stored; the box is in pixels
+# of the page image Tesseract read, after preprocessing, and the confidence
+# is Tesseract's, 0-100.
+TOKEN_DTYPE = np.dtype([
+    ('start', '<i4'), ('end', '<i4'), ('page', '<i2'),
+    ('left', '<i4'), ('top', '<i4'), ('width', '<i4'), ('height', '<i4'),
+    ('confidence', 'i1')
+])
+
+# Header of serialized token tables; bump the digit when TOKEN_DTYPE changes
+TOKEN_TABLE_MAGIC = b'SWTOK1\n'
+
+
+class TokenTable:
+    """
+    Word boxes and confidences of the OCR'd parts of a document's text
+
+    Backed by a single NumPy structured array in text order, so a table
+    costs 27 bytes per word, serializes to its raw buffer and is sliced by
+    text offset with a binary search.
+    """
+
+    def __init__(self, tokens=None):
+        self.tokens = tokens if tokens is not None else np.zeros(0, dtype=TOKEN_DTYPE)
+
+    def __len__(self):
+        return len(self.tokens)
+
+    @classmethod
+    def concatenate(cls, parts):
+        """
+        Build one table from (text_offset, table) pairs in text order, for
+        documents assembled from the text of several pages
+        """
+        arrays = []
+        for offset, table in parts:
+            if table is None or not len(table):
+                continue
+            tokens = table.tokens.copy()
+            tokens['start'] += offset
+            tokens['end'] += offset
+            arrays.append(tokens)
+        if not arrays:
+            return None
+        return cls(np.concatenate(arrays))
+
+    def span(self, start, end):
+        """
+        Return the tokens overlapping the text span [start, end)
+        """
+        first = np.searchsorted(self.tokens['end'], start, side='right')
+        last = np.searchsorted(self.tokens['start'], end, side='left')
+        return self.tokens[first:last]
+
+    def evidence(self, start, end):
+        """
+        Describe the OCR evidence for the text span [start, end): the lowest
+        word confidence in it, and the page and bounding box (left, top,
+        right, bottom) of its words on the first page they are on
+
+        Returns None when the span was not OCR'd.
+        """
+        tokens = self.span(start, end)
+        if not len(tokens):
+            return None
+        on_page = tokens[tokens['page'] == tokens['page'][0]]
+        return {
+            'confidence': int(tokens['confidence'].min()),
+            'page': int(tokens['page'][0]),
+            'bbox': [int(on_page['left'].min()), int(on_page['top'].min()),
+                     int((on_page['left'] + on_page['width']).max()),
+                     int((on_page['top'] + on_page['height']).max())]
+        }
+
+    def to_bytes(self):
+        return TOKEN_TABLE_MAGIC + self.tokens.tobytes()
+
+    @classmethod
+    def from_bytes(cls, data):
+        """
+        Load a table serialized by to_bytes, or return None if data is not one
+        """
+        if not data.startswith(TOKEN_TABLE_MAGIC):
+            return None
+        return cls(np.frombuffer(data, dtype=TOKEN_DTYPE, offset=len(TOKEN_TABLE_MAGIC)).copy())
+
+
+def tesseract_tokens(data, page):
+    """
+    Build the text and token table of a page from Tesseract's word-level
+    output (pytesseract.image_to_data with Output.DICT)
+
+    Words are joined with spaces, lines with newlines and paragraphs and
+    blocks with a blank line, as Tesseract's own text output does.
+    """
+    pieces = []
+    length = 0
+    rows = []
+    previous_line = None
+    for position, word in enumerate(data['text']):
+        word = word.strip() if word else ''
+        if int(data['level'][position]) != 5 or not word:
+            continue
+        line = (data['block_num'][position], data['par_num'][position], data['line_num'][position])
+        if previous_line is not None:
+            if line[:2] != previous_line[:2]:
+                separator = '\n\n'
+            elif line != previous_line:
+                separator = '\n'
+            else:
+                separator = ' '
+            pieces.append(separator)
+            length += len(separator)
+        previous_line = line
+
+        pieces.append(word)
+        confidence = max(0, min(100, round(float(data['conf'][position]))))
+        rows.append((length, length + len(word), page, data['left'][position], data['top'][position],
+                     data['width'][position], data['height'][position], confidence))
+        length += len(word)
+
+    if pieces:
+        pieces.append('\n')
+    return ''.join(pieces), TokenTable(np.array(rows, dtype=TOKEN_DTYPE))
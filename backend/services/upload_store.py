@@ -0,0 +1,309 @@
+import json
+import os
+import re
+import shutil
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from utils.file_handler import file_sha256
+from utils.metrics import log, current_request_id, request_trace
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - Windows
+    fcntl = None
+
+# Chunked uploads in progress, one directory each, shared by every worker
+# process so that consecutive chunks may land on different workers
+DEFAULT_CHUNKED_UPLOAD_DIR = os.environ.get('CHUNKED_UPLOAD_DIR', 'uploads/chunked')
+
+# Largest file accepted through a chunked upload, and largest single chunk.
+# Chunks must stay below the app's MAX_CONTENT_LENGTH.
+DEFAULT_CHUNKED_UPLOAD_MAX_BYTES = int(os.environ.get('CHUNKED_UPLOAD_MAX_MB', 500)) * 1024 * 1024
+DEFAULT_CHUNK_MAX_BYTES = int(os.environ.get('CHUNKED_UPLOAD_CHUNK_MAX_MB', 8)) * 1024 * 1024
+
+# Uploads not finalized within this many seconds are deleted
+DEFAULT_CHUNKED_UPLOAD_EXPIRY_SECONDS = int(os.environ.get('CHUNKED_UPLOAD_EXPIRY_SECONDS', 24 * 60 * 60))
+
+# Threads extracting text from uploads whose last chunk has arrived, ahead
+# of their finalize request
+UPLOAD_PREFETCH_WORKERS = int(os.environ.get('UPLOAD_PREFETCH_WORKERS', 1))
+
+# Request bodies are copied to disk in pieces of this size, so memory use
+# per chunk request is bounded regardless of the chunk size
+COPY_BUFFER_BYTES = 1024 * 1024
+
+_UPLOAD_ID = re.compile(r'[0-9a-f]{32}')
+
+_default_store = None
+_default_store_lock = threading.Lock()
+
+
+def get_upload_store():
+    """
+    Return the process-wide chunked upload store, creating it on first use
+    """
+    global _default_store
+    with _default_store_lock:
+        if _default_store is None:
+            _default_store = ChunkedUploadStore()
+        return _default_store
+
+
+class UploadNotFoundError(Exception):
+    """
+    Raised for an unknown, expired or already finalized upload id
+    """
+
+
+class UploadOffsetError(Exception):
+    """
+    Raised when a chunk does not start where the upload currently ends
+
+    offset is where the next chunk must start.
+    """
+
+    def __init__(self, message, offset):
+        super().__init__(message)
+        self.offset = offset
+
+
+class UploadSizeError(Exception):
+    """
+    Raised when an upload or a chunk exceeds its size limit
+    """
+
+
+class ChunkedUploadStore:
+    """
+    Resumable uploads assembled on disk from sequential chunks
+
+    Each upload is a directory holding its metadata and the bytes received
+    so far. The current offset is the size of the data file, so a chunk cut
+    off mid-way is resumed from whatever reached the disk. Chunk bodies are
+    streamed to the file in COPY_BUFFER_BYTES pieces.
+
+    As soon as the last byte arrives, the text of the file is extracted in
+    the background into the extraction cache, so OCR is usually under way,
+    or finished, by the time the client has sent its finalize request.
+    """
+
+    def __init__(self, upload_dir=DEFAULT_CHUNKED_UPLOAD_DIR, max_upload_bytes=DEFAULT_CHUNKED_UPLOAD_MAX_BYTES,
+                 chunk_max_bytes=DEFAULT_CHUNK_MAX_BYTES, expiry_seconds=DEFAULT_CHUNKED_UPLOAD_EXPIRY_SECONDS):
+        self.upload_dir = upload_dir
+        self.max_upload_bytes = max_upload_bytes
+        self.chunk_max_bytes = chunk_max_bytes
+        self.expiry_seconds = expiry_seconds
+        self._prefetch_pool = ThreadPoolExecutor(max_workers=UPLOAD_PREFETCH_WORKERS,
+                                                 thread_name_prefix='sheetwise-prefetch')
+        self._prefetches = {}
+        self._prefetches_lock = threading.Lock()
+        os.makedirs(upload_dir, exist_ok=True)
+
+    def create(self, filename, size, sha256=None):
+        """
+        Start an upload of size bytes and return its status
+
+        sha256, if given now, is checked before the background extraction
+        starts; it may instead be given only when finalizing.
+        """
+        if size < 0 or size > self.max_upload_bytes:
+            raise UploadSizeError(f"Upload size must be between 0 and {self.max_upload_bytes} bytes")
+
+        self.prune()
+        upload_id = uuid.uuid4().hex
+        upload_path = os.path.join(self.upload_dir, upload_id)
+        os.makedirs(upload_path)
+        metadata = {
+            'filename': filename,
+            'size': size,
+            'sha256': sha256.lower() if sha256 else None,
+            'created_at': time.time()
+        }
+        with open(os.path.join(upload_path, 'metadata.json'), 'w') as f:
+            json.dump(metadata, f)
+        open(self._data_path(upload_id), 'wb').close()
+        return self.status(upload_id)
+
+    def status(self, upload_id):
+        """
+        Return the filename, size and received offset of an upload
+        """
+        metadata = self._metadata(upload_id)
+        offset = os.path.getsize(self._data_path(upload_id))
+        return {
+            'upload_id': upload_id,
+            'filename': metadata['filename'],
+            'size': metadata['size'],
+            'offset': offset,
+            'complete': offset == metadata['size'],
+            'chunk_max_bytes': self.chunk_max_bytes
+        }
+
+    def write_chunk(self, upload_id, offset, stream, prefetch=None):
+        """
+        Append the bytes of stream at offset and return the upload status
+
+        Raises UploadOffsetError unless offset is the current end of the
+        upload, and UploadSizeError if the chunk is too large or would run
+        past the declared size. prefetch(path), if given, is run in the
+        background on the data file once the upload has all its bytes.
+        """
+        metadata = self._metadata(upload_id)
+        with self._locked(upload_id):
+            data_path = self._data_path(upload_id)
+            current = os.path.getsize(data_path)
+            if offset != current:
+                raise UploadOffsetError(f"Chunk starts at {offset} but the upload has {current} bytes", current)
+
+            limit = min(self.chunk_max_bytes, metadata['size'] - current)
+            written = 0
+            with open(data_path, 'ab') as f:
+                for piece in iter(lambda: stream.read(COPY_BUFFER_BYTES), b''):
+                    written += len(piece)
+                    if written > limit:
+                        # Drop the whole chunk so the offset stays where it was
+                        f.truncate(current)
+                        raise UploadSizeError(f"Chunk exceeds {limit} bytes "
+                                              f"(chunk limit or remaining size of the upload)")
+                    f.write(piece)
+
+        status = self.status(upload_id)
+        if status['complete'] and prefetch is not None:
+            self._start_prefetch(upload_id, metadata, prefetch)
+        return status
+
+    def finalize(self, upload_id, sha256):
+        """
+        Check a complete upload against its SHA-256 and hand it over
+
+        Returns (path, filename, prefetch) where path is the assembled file,
+        now owned by the caller, and prefetch is the Future of its
+        background extraction in this process, or None. The upload id is no
+        longer valid afterwards. Raises ValueError if the upload is
+        incomplete or the checksum does not match; a mismatched upload is
+        discarded.
+        """
+        metadata = self._metadata(upload_id)
+        expected = (sha256 or metadata['sha256'] or '').lower()
+        if not expected:
+            raise ValueError('A sha256 checksum is required to finalize an upload')
+
+        with self._locked(upload_id):
+            status = self.status(upload_id)
+            if not status['complete']:
+                raise ValueError(f"Upload is incomplete: {status['offset']} of {status['size']} bytes received")
+
+            if file_sha256(self._data_path(upload_id)) != expected:
+                self.discard(upload_id)
+                raise ValueError('Checksum mismatch; the upload was discarded')
+
+            # Move the file out before the directory goes, so a concurrent
+            # finalize of the same id finds nothing
+            extension = os.path.splitext(metadata['filename'])[1].lower()
+            path = os.path.join(self.upload_dir, f"{upload_id}{extension}")
+            os.replace(self._data_path(upload_id), path)
+        shutil.rmtree(os.path.join(self.upload_dir, upload_id), ignore_errors=True)
+
+        with self._prefetches_lock:
+            prefetch = self._prefetches.pop(upload_id, None)
+        return path, metadata['filename'], prefetch
+
+    def discard(self, upload_id):
+        """
+        Delete an upload and everything received for it
+        """
+        with self._prefetches_lock:
+            self._prefetches.pop(upload_id, None)
+        shutil.rmtree(os.path.join(self.upload_dir, upload_id), ignore_errors=True)
+
+    def prune(self):
+        """
+        Delete uploads that were not finalized in time
+        """
+        expired_before = time.time() - self.expiry_seconds
+        for entry in os.scandir(self.upload_dir):
+            # Upload directories, and finalized files left behind by a crash
+            if not _UPLOAD_ID.match(entry.name):
+                continue
+            try:
+                if entry.is_dir():
+                    if os.stat(os.path.join(entry.path, 'data')).st_mtime < expired_before:
+                        log(f"Discarding expired chunked upload {entry.name}")
+                        self.discard(entry.name)
+                elif entry.stat().st_mtime < expired_before:
+                    os.remove(entry.path)
+            except OSError:
+                pass
+
+    def _start_prefetch(self, upload_id, metadata, extract):
+        with self._prefetches_lock:
+            if upload_id in self._prefetches:
+                return
+            # Extract from a hard link, which stays readable when finalize
+            # moves the data file or a failed upload is discarded
+            extension = os.path.splitext(metadata['filename'])[1].lower()
+            prefetch_path = os.path.join(self.upload_dir, f"{upload_id}.prefetch{extension}")
+            try:
+                os.link(self._data_path(upload_id), prefetch_path)
+            except OSError:
+                # Already finalized by a concurrent request
+                return
+            self._prefetches[upload_id] = self._prefetch_pool.submit(
+                self._prefetch, extract, prefetch_path, metadata['sha256'], current_request_id())
+
+    def _prefetch(self, extract, path, expected_sha256, request_id=None):
+        # Logged under the id of the request that completed the upload
+        with request_trace(request_id):
+            try:
+                # Not worth extracting bytes that finalize will reject
+                if expected_sha256 is None or file_sha256(path) == expected_sha256:
+                    extract(path)
+            except Exception as e:
+                log(f"Error extracting {path} ahead of finalize: {str(e)}")
+            finally:
+                os.remove(path)
+
+    def _metadata(self, upload_id):
+        if not _UPLOAD_ID.fullmatch(upload_id or ''):
+            raise UploadNotFoundError(f"Unknown upload {upload_id}")
+        try:
+            with open(os.path.join(self.upload_dir, upload_id, 'metadata.json')) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            raise UploadNotFoundError(f"Unknown upload {upload_id}") from None
+
+    def _data_path(self, upload_id):
+        return os.path.join(self.upload_dir, upload_id, 'data')
+
+    def _locked(self, upload_id):
+        """
+        Return a context manager holding an exclusive lock on an upload
+        across worker processes
+        """
+        return _UploadLock(os.path.join(self.upload_dir, upload_id))
+
+
+class _UploadLock:
+    def __init__(self, upload_path):
+        self.upload_path = upload_path
+        self._file = None
+
+    def __enter__(self):
+        try:
+            self._file = open(os.path.join(self.upload_path, '.lock'), 'w')
+        except FileNotFoundError:
+            raise UploadNotFoundError('Upload was finalized or discarded') from None
+        if fcntl is not None:
+            fcntl.flock(self._file, fcntl.LOCK_EX)
+        # Finalized or discarded while this process waited for the lock
+        if not os.path.exists(os.path.join(self.upload_path, 'data')):
+            self.__exit__()
+            raise UploadNotFoundError('Upload was finalized or discarded')
+        return self
+
+    def __exit__(self, *exc_info):
+        if fcntl is not None:
+            fcntl.flock(self._file, fcntl.LOCK_UN)
+        self._file.close()
@@ -1,286 +1,181 @@
-import datetime
-import json
 import os
-import re
 from datetime import datetime
+from services.bulk_validation import BulkValidator
+from services.document_store import get_document_store
+from services.reference_data import get_reference_store
+from services.rule_engine import validation_status
+from utils.file_handler import SpooledUpload
+from utils.metrics import log
+
+# OCR'd fields read with a word confidence (0-100) below this are flagged
+# for manual review; fields from text layers and text formats never are
+DEFAULT_REVIEW_MIN_CONFIDENCE = int(os.environ.get('REVIEW_MIN_CONFIDENCE', 80))
 
 class ValidationService:
     """
     Service for validating term sheet data against predefined rules
     """
     
-    def __init__(self):
+    def __init__(self, reference_store=None, document_store=None,
+                 review_min_confidence=DEFAULT_REVIEW_MIN_CONFIDENCE):
         """
         Initialize validation service with compliance rules
+        
+        Approved lists and validation rules come from the versioned reference
+        data (see services/reference_data.py), shared by every instance and
+        hot-reloaded when the files change, so construction is cheap.
+        """
+        self.reference_store = reference_store or get_reference_store()
+        self.document_store = document_store or get_document_store()
+        self.review_min_confidence = review_min_confidence
+    
+    @property
+    def validation_rules(self):
+        """Rule settings of the current reference data"""
+        return self.reference_store.current().rules
+    
+    def validate_term_sheet(self, term_sheet_data, document_id=None, filename=None, field_evidence=None):
+        """
+        Validate the term sheet data against predefined rules
+        
+        With a document_id, the fields and outcome are stored so the
+        document can be re-validated when the reference data changes.
+        field_evidence (see NLPService.field_evidence) marks the fields read
+        with low OCR confidence for review.
         """
-        # In a production environment, these would be loaded from a database
-        self.approved_counterparties = ["Acme Corporation", "Global Investments Ltd", 
-                                        "Stellar Financial", "Mercury Partners", 
-                                        "JP Morgan", "Goldman Sachs", "Morgan Stanley"]
+        # Take one snapshot so every rule sees the same reference data
+        # version, even if a reload happens meanwhile
+        reference = self.reference_store.current()
+        engine = reference.rule_engine
         
-        self.approved_issuers = ["Barclays Bank PLC", "HSBC", "Lloyds Banking Group", 
-                                 "Royal Bank of Scotland", "Standard Chartered"]
+        issues = engine.evaluate(term_sheet_data)
         
-        self.approved_products = ["Fixed Rate Note", "Floating Rate Note", "Swap", 
-                                 "Option", "Forward", "Future", "Equity Derivative"]
+        # Overall risk score (0.0 to 1.0), higher score = higher risk.
+        # Any HIGH severity issue marks the term sheet as invalid.
+        risk_score, is_valid = engine.score(issues)
         
-        self.approved_governing_laws = ["English Law", "UK Law", "New York Law", 
-                                       "US Law", "EU Law"]
+        if document_id is not None:
+            self.document_store.save(document_id, filename, term_sheet_data, reference, issues)
         
-        # For production, we would have a more comprehensive set of rules
-        self.validation_rules = {
-            'counterparty_check': {
-                'description': 'Ensure counterparty is on the approved list',
-                'severity': 'HIGH'
-            },
-            'issuer_check': {
-                'description': 'Ensure issuer is on the approved list',
-                'severity': 'HIGH'
-            },
-            'product_check': {
-                'description': 'Ensure product is on the approved list',
-                'severity': 'MEDIUM'
-            },
-            'principal_amount_check': {
-                'description': 'Ensure principal amount is within acceptable limits',
-                'severity': 'HIGH'
-            },
-            'maturity_date_check': {
-                'description': 'Ensure maturity date is valid and in the future',
-                'severity': 'MEDIUM'
-            },
-            'trade_date_check': {
-                'description': 'Ensure trade date is not in the future',
-                'severity': 'HIGH'
-            },
-            'settlement_vs_trade_check': {
-                'description': 'Ensure settlement date is after trade date',
-                'severity': 'MEDIUM'
-            },
-            'governing_law_check': {
-                'description': 'Ensure governing law is approved',
-                'severity': 'MEDIUM'
-            },
-            'risk_disclosure_check': {
-                'description': 'Ensure risk disclosure is present',
-                'severity': 'LOW'
-            }
+        return {
+            'is_valid': is_valid,
+            'risk_score': risk_score,
+            'issues': issues,
+            'timestamp': self._get_current_timestamp(),
+            'reference_data_version': reference.version,
+            'review': self.review_fields(field_evidence)
         }
     
-    def validate_term_sheet(self, term_sheet_data):
+    def review_fields(self, field_evidence):
         """
-        Validate the term sheet data against predefined rules
+        Return whether a manual review is needed and of which fields: those
+        whose OCR confidence is below review_min_confidence
+        """
+        fields = []
+        for field, evidence in (field_evidence or {}).items():
+            confidence = evidence.get('confidence')
+            if confidence is not None and confidence < self.review_min_confidence:
+                fields.append({'field': field, 'confidence': confidence,
+                               'page': evidence.get('page'), 'bbox': evidence.get('bbox')})
+        return {'required': bool(fields), 'fields': fields, 'min_confidence': self.review_min_confidence}
+    
+    def validate_bulk(self, frame):
         """
-        validation_results = {
-            'is_valid': True,
-            'risk_score': 0.0,
-            'issues': [],
-            'timestamp': self._get_current_timestamp()
+        Validate a DataFrame of extracted term sheets, one per row, with
+        column-wise rule evaluation (see services/bulk_validation.py)
+        """
+        return BulkValidator(self.reference_store.current()).validate(frame)
+    
+    def _format_duplicates(self, duplicates):
+        """
+        Format the duplicates found by the pipeline for the frontend
+        """
+        if duplicates is None:
+            return None
+        return {
+            'clusterId': duplicates['cluster_id'],
+            'clusterSize': duplicates['cluster_size'],
+            'match': duplicates['match'],
+            'duplicateOf': duplicates['duplicate_of'],
+            'reused': duplicates['reused']
+        }
+    
+    def _format_truncated(self, truncated):
+        """
+        Format the pages left out by the OCR budget, or the sheets cut short
+        at the workbook row limit, for the frontend
+        """
+        if truncated is None:
+            return None
+        if truncated['reason'] == 'row_limit':
+            return {
+                'reason': truncated['reason'],
+                'maxRows': truncated['max_rows'],
+                'sheetsTruncated': truncated['sheets_truncated']
+            }
+        return {
+            'reason': truncated['reason'],
+            'pagesTotal': truncated['pages_total'],
+            'pagesSkipped': truncated['pages_skipped']
         }
-        
-        # Run all validation checks
-        self._check_counterparty(term_sheet_data, validation_results)
-        self._check_issuer(term_sheet_data, validation_results)
-        self._check_product(term_sheet_data, validation_results)
-        self._check_principal_amount(term_sheet_data, validation_results)
-        self._check_maturity_date(term_sheet_data, validation_results)
-        self._check_trade_date(term_sheet_data, validation_results)
-        self._check_settlement_vs_trade(term_sheet_data, validation_results)
-        self._check_governing_law(term_sheet_data, validation_results)
-        self._check_risk_disclosure(term_sheet_data, validation_results)
-        
-        # Calculate overall risk score (0.0 to 1.0)
-        # Higher score = higher risk
-        if validation_results['issues']:
-            high_count = sum(1 for issue in validation_results['issues'] if issue['severity'] == 'HIGH')
-            medium_count = sum(1 for issue in validation_results['issues'] if issue['severity'] == 'MEDIUM')
-            low_count = sum(1 for issue in validation_results['issues'] if issue['severity'] == 'LOW')
-            
-            # Weight the issues by severity
-            weighted_score = (high_count * 0.5) + (medium_count * 0.3) + (low_count * 0.1)
-            max_possible_score = len(self.validation_rules) * 0.5  # If all were high severity
-            
-            validation_results['risk_score'] = min(1.0, weighted_score / max_possible_score)
-            
-            # If there are any HIGH severity issues, mark as invalid
-            if high_count > 0:
-                validation_results['is_valid'] = False
-        
-        return validation_results
     
     def _get_current_timestamp(self):
         """
         Get the current timestamp in ISO format
         """
         return datetime.now().isoformat()
-    
-    def _check_counterparty(self, data, results):
-        """Check if counterparty is on the approved list"""
-        if 'counterparty' not in data:
-            self._add_issue(results, 'counterparty_check', 'Counterparty information is missing', 'HIGH')
-        elif data['counterparty'] not in self.approved_counterparties:
-            self._add_issue(results, 'counterparty_check', 
-                           f"Counterparty '{data['counterparty']}' is not on the approved list", 'HIGH')
-    
-    def _check_issuer(self, data, results):
-        """Check if issuer is on the approved list"""
-        if 'issuer' not in data:
-            self._add_issue(results, 'issuer_check', 'Issuer information is missing', 'HIGH')
-        elif data['issuer'] not in self.approved_issuers:
-            self._add_issue(results, 'issuer_check', 
-                           f"Issuer '{data['issuer']}' is not on the approved list", 'HIGH')
-    
-    def _check_product(self, data, results):
-        """Check if product is on the approved list"""
-        if 'product' not in data:
-            self._add_issue(results, 'product_check', 'Product information is missing', 'MEDIUM')
-        elif data['product'] not in self.approved_products:
-            self._add_issue(results, 'product_check', 
-                           f"Product '{data['product']}' is not on the approved list", 'MEDIUM')
-    
-    def _check_principal_amount(self, data, results):
-        """Check if principal amount is within acceptable limits"""
-        if 'principal_amount' not in data:
-            self._add_issue(results, 'principal_amount_check', 'Principal amount is missing', 'HIGH')
-        else:
-            # Example rule: Principal amount must be between 1,000 and 50,000,000
-            if data['principal_amount'] < 1000 or data['principal_amount'] > 50000000:
-                self._add_issue(results, 'principal_amount_check', 
-                               f"Principal amount {data['principal_amount']} is outside acceptable limits (1,000 - 50,000,000)", 'HIGH')
-    
-    def _check_maturity_date(self, data, results):
-        """Check if maturity date is valid and in the future"""
-        if 'maturity_date' not in data:
-            self._add_issue(results, 'maturity_date_check', 'Maturity date is missing', 'MEDIUM')
-        else:
-            try:
-                maturity_date = datetime.strptime(data['maturity_date'], '%Y-%m-%d')
-                if maturity_date <= datetime.now():
-                    self._add_issue(results, 'maturity_date_check', 
-                                  f"Maturity date {data['maturity_date']} is not in the future", 'MEDIUM')
-            except ValueError:
-                self._add_issue(results, 'maturity_date_check', 
-                               f"Maturity date {data['maturity_date']} is in an invalid format", 'MEDIUM')
-    
-    def _check_trade_date(self, data, results):
-        """Check if trade date is not in the future"""
-        if 'trade_date' not in data:
-            self._add_issue(results, 'trade_date_check', 'Trade date is missing', 'HIGH')
-        else:
-            try:
-                trade_date = datetime.strptime(data['trade_date'], '%Y-%m-%d')
-                if trade_date > datetime.now():
-                    self._add_issue(results, 'trade_date_check', 
-                                  f"Trade date {data['trade_date']} is in the future", 'HIGH')
-            except ValueError:
-                self._add_issue(results, 'trade_date_check', 
-                               f"Trade date {data['trade_date']} is in an invalid format", 'HIGH')
-    
-    def _check_settlement_vs_trade(self, data, results):
-        """Check if settlement date is after trade date"""
-        if 'settlement_date' in data and 'trade_date' in data:
-            try:
-                settlement_date = datetime.strptime(data['settlement_date'], '%Y-%m-%d')
-                trade_date = datetime.strptime(data['trade_date'], '%Y-%m-%d')
-                
-                if settlement_date < trade_date:
-                    self._add_issue(results, 'settlement_vs_trade_check', 
-                                   f"Settlement date {data['settlement_date']} is before trade date {data['trade_date']}", 'MEDIUM')
-            except ValueError:
-                self._add_issue(results, 'settlement_vs_trade_check', 
-                               "Settlement or trade date is in an invalid format", 'MEDIUM')
-    
-    def _check_governing_law(self, data, results):
-        """Check if governing law is approved"""
-        if 'governing_law' not in data:
-            self._add_issue(results, 'governing_law_check', 'Governing law is missing', 'MEDIUM')
-        elif data['governing_law'] not in self.approved_governing_laws:
-            self._add_issue(results, 'governing_law_check', 
-                           f"Governing law '{data['governing_law']}' is not on the approved list", 'MEDIUM')
-    
-    def _check_risk_disclosure(self, data, results):
-        """Check if risk disclosure is present"""
-        if 'risk_disclosure' not in data or not data['risk_disclosure']:
-            self._add_issue(results, 'risk_disclosure_check', 'Risk disclosure is missing', 'LOW')
-    
-    def _add_issue(self, results, rule_id, description, severity=None):
-        """Add an issue to the validation results"""
-        if severity is None:
-            severity = self.validation_rules[rule_id]['severity']
-            
-        results['issues'].append({
-            'rule_id': rule_id,
-            'description': description,
-            'severity': severity
-        }) 
 
-    def validate(self, file_path):
+    def validate(self, source, progress_callback=None, reuse_duplicates=False):
         """
-        Validate a term sheet from a file path
-        This is a wrapper that combines OCR, NLP, and validation
+        Validate a term sheet file and format the result for the frontend
+        
+        source is a file path or a SpooledUpload. Runs the shared pipeline
+        (services/pipeline.py) with this service doing the validation step.
+        progress_callback is passed through to OCRService.extract_text and
+        reuse_duplicates to TermSheetPipeline.process
         """
         try:
-            # Import services here to avoid circular imports
-            import sys
-            import os
-            
-            # Add the backend directory to the path if needed
-            current_dir = os.path.dirname(os.path.abspath(__file__))
-            backend_dir = os.path.dirname(current_dir)
-            if backend_dir not in sys.path:
-                sys.path.append(backend_dir)
-            
-            from services.ocr_service import OCRService
-            from services.nlp_service import NLPService
+            # Imported here because the pipeline is built on ValidationService
+            from services.pipeline import get_pipeline
             
-            print(f"Processing file: {file_path}")
-            print(f"File exists: {os.path.exists(file_path)}")
-            
-            # Extract text using OCR
-            ocr_service = OCRService()
-            try:
-                extracted_text = ocr_service.extract_text(file_path)
-                print(f"Text extracted successfully. Length: {len(extracted_text)}")
-            except Exception as e:
-                import traceback
-                print(f"Error in OCR extraction: {str(e)}")
-                print(traceback.format_exc())
-                # Fall back to mock extraction
-                extracted_text = ocr_service._get_mock_term_sheet_text()
-            
-            # Analyze the text using NLP
-            nlp_service = NLPService()
-            try:
-                term_sheet_data = nlp_service.analyze_text(extracted_text)
-                print(f"NLP analysis completed. Found {len(term_sheet_data)} fields.")
-            except Exception as e:
-                import traceback
-                print(f"Error in NLP analysis: {str(e)}")
-                print(traceback.format_exc())
-                # Fall back to mock analysis
-                term_sheet_data = nlp_service._get_mock_nlp_analysis()
-            
-            # Validate the term sheet data
-            validation_results = self.validate_term_sheet(term_sheet_data)
-            print(f"Validation completed. Valid: {validation_results['is_valid']}, Issues: {len(validation_results['issues'])}")
+            if isinstance(source, SpooledUpload):
+                filename = source.filename
+                log(f"Processing upload: {filename} ({source.size} bytes)")
+            else:
+                filename = os.path.basename(source)
+                log(f"Processing file: {source}")
+            processed = get_pipeline().process(source, filename, progress_callback, validation_service=self,
+                                               fallback_on_error=True, reuse_duplicates=reuse_duplicates)
+            validation_results = processed['validation_results']
+            log(f"Validation completed. Valid: {validation_results['is_valid']}, Issues: {len(validation_results['issues'])}")
             
             # Format the response for the frontend
             response = {
-                'status': 'invalid' if not validation_results['is_valid'] else 'warning' if validation_results['issues'] else 'valid',
+                'status': validation_status(validation_results['is_valid'], validation_results['issues']),
                 'riskScore': int(validation_results['risk_score'] * 100),  # Convert to percentage
                 'issues': [
                     {
                         'severity': issue['severity'].capitalize(),
                         'description': issue['description']
                     } for issue in validation_results['issues']
-                ]
+                ],
+                'referenceDataVersion': validation_results['reference_data_version'],
+                'reviewFields': [
+                    {
+                        'field': field['field'],
+                        'confidence': field['confidence'],
+                        'page': field['page']
+                    } for field in validation_results['review']['fields']
+                ],
+                'duplicates': self._format_duplicates(processed['duplicates']),
+                'truncated': self._format_truncated(processed['truncated'])
             }
             
             return response
         except Exception as e:
             import traceback
-            print(f"Error in validation service: {str(e)}")
-            print(traceback.format_exc())
+            log(f"Error in validation service: {str(e)}")
+            log(traceback.format_exc())
             
             # Return mock data for demonstration purposes
             return {
@@ -0,0 +1,127 @@
+import asyncio
+import importlib
+import os
+import queue
+import tempfile
+import types
+from concurrent.futures import ThreadPoolExecutor
+import pytest
+from flask import Flask, Response, request
+
+BODY = b'x' * 300000
+
+
+@pytest.fixture
+def asgi(tmp_path, monkeypatch):
+    # Importing the app creates its upload folder in the working directory
+    monkeypatch.chdir(tmp_path)
+    module = importlib.import_module('asgi')
+
+    app = Flask(__name__)
+    app.config['MAX_CONTENT_LENGTH'] = 1024 * 1024
+
+    @app.route('/health')
+    def health():
+        return {'status': 'healthy'}
+
+    @app.route('/echo', methods=['POST'])
+    def echo():
+        return {'size': len(request.get_data())}
+
+    @app.route('/api/validate-term-sheet', methods=['POST'])
+    def validate():
+        return {'size': len(request.get_data()), 'files': sorted(os.listdir(tempfile.gettempdir()))}
+
+    @app.route('/api/validate-term-sheet/batch', methods=['POST'])
+    def batch():
+        size = len(request.get_data())
+        return Response((f'{{"line": {number}, "size": {size}}}\n' for number in range(3)),
+                        mimetype='application/x-ndjson')
+
+    # Workers run in threads of this process, so they see the test app
+    monkeypatch.setattr(module, 'flask_app', app)
+    monkeypatch.setattr(tempfile, 'tempdir', str(tmp_path))
+    asgi_app = module.AsgiApp(app, process_workers=1, max_pending=1)
+    asgi_app._pool = ThreadPoolExecutor(max_workers=1)
+    asgi_app._manager = types.SimpleNamespace(Queue=queue.Queue)
+    yield asgi_app
+    asgi_app._pool.shutdown()
+
+
+def call(app, method, path, body=b'', chunk_size=65536):
+    """
+    Send one request through an ASGI app in chunks and return the messages
+    it sent
+    """
+    chunks = [body[start:start + chunk_size] for start in range(0, len(body), chunk_size)] or [b'']
+    messages = [{'type': 'http.request', 'body': chunk, 'more_body': number < len(chunks) - 1}
+                for number, chunk in enumerate(chunks)]
+    sent = []
+
+    async def receive():
+        return messages.pop(0) if messages else {'type': 'http.disconnect'}
+
+    async def send(message):
+        sent.append(message)
+
+    scope = {'type': 'http', 'method': method, 'path': path, 'query_string': b'', 'http_version': '1.1',
+             'headers': [(b'content-type', b'application/octet-stream'),
+                         (b'content-length', str(len(body)).encode())],
+             'client': ('127.0.0.1', 5000)}
+    asyncio.run(app(scope, receive, send))
+    return sent
+
+
+def response_of(sent):
+    start = sent[0]
+    assert start['type'] == 'http.response.start'
+    body = b''.join(message.get('body', b'') for message in sent[1:])
+    assert not sent[-1].get('more_body', False)
+    return start['status'], dict(start['headers']), body
+
+
+def test_threaded_requests_read_the_spooled_body(asgi):
+    status, _, body = response_of(call(asgi, 'POST', '/echo', BODY))
+    assert status == 200
+    assert b'"size":300000' in body
+
+    status, _, body = response_of(call(asgi, 'GET', '/health'))
+    assert status == 200 and b'healthy' in body
+
+
+def test_offloaded_body_is_passed_as_a_file_and_removed(asgi, tmp_path):
+    status, _, body = response_of(call(asgi, 'POST', '/api/validate-term-sheet', BODY))
+
+    assert status == 200
+    assert b'"size":300000' in body
+    assert b'sheetwise-request-' in body
+    assert not [name for name in os.listdir(tmp_path) if name.startswith('sheetwise-request-')]
+
+
+def test_oversized_body_is_rejected(asgi):
+    status, _, _ = response_of(call(asgi, 'POST', '/api/validate-term-sheet', b'x' * (1024 * 1024 + 1)))
+
+    assert status == 413
+    assert asgi.pending == 0
+
+
+def test_validations_beyond_max_pending_get_429(asgi):
+    asgi.pending = asgi.max_pending
+
+    status, headers, body = response_of(call(asgi, 'POST', '/api/validate-term-sheet', BODY))
+
+    assert status == 429
+    assert headers[b'retry-after'] == b'5'
+    assert b'x-request-id' in headers
+    assert b'retry later' in body
+
+
+def test_batch_response_is_streamed_chunk_by_chunk(asgi):
+    sent = call(asgi, 'POST', '/api/validate-term-sheet/batch', BODY)
+
+    status, headers, body = response_of(sent)
+    assert status == 200
+    assert headers[b'content-type'] == b'application/x-ndjson'
+    chunks = [message['body'] for message in sent[1:] if message.get('more_body')]
+    assert chunks == [f'{{"line": {number}, "size": 300000}}\n'.encode() for number in range(3)]
+    assert body == b''.join(chunks)
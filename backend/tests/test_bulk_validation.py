@@ -0,0 +1,88 @@
+import random
+from datetime import datetime
+import numpy as np
+import pandas as pd
+import pytest
+from services.bulk_validation import BulkValidator, parse_dates
+from services.reference_data import ReferenceDataStore
+from services.rule_engine import INVALID_DATE, parse_date
+
+NOW = datetime(2024, 1, 1)
+
+CHOICES = {
+    'trade_date': ['2023-06-15', '2099-01-01', '2023-13-01', '15/06/2023', None],
+    'settlement_date': ['2023-06-20', '2023-06-10', 'soon', None],
+    'issuer': ['Barclays Bank PLC', 'HSBC', 'Nobody Bank', 'Barclays Bank PLX', None],
+    'counterparty': ['Acme Corporation', 'acme corporation', 'Acme Corporatlon', 'Wile E Coyote Ltd', None],
+    'product': ['Fixed Rate Note', 'Swap', 'Magic Bond', None],
+    'principal_amount': [10000000.0, 999.0, 50000001.0, np.nan],
+    'maturity_date': ['2099-06-15', '2001-01-01', '2028-02-30', None],
+    'governing_law': ['English Law', 'Martian Law', None],
+    'risk_disclosure': ['Market risk.', '', None],
+}
+
+
+@pytest.fixture(scope='module')
+def reference(tmp_path_factory):
+    store = ReferenceDataStore(snapshot_dir=str(tmp_path_factory.mktemp('reference')), reload_seconds=3600)
+    return store.current()
+
+
+def test_matches_the_rule_engine_row_by_row(reference):
+    rng = random.Random(3)
+    records = [{field: rng.choice(values) for field, values in CHOICES.items()} for _ in range(300)]
+    frame = pd.DataFrame(records, index=pd.RangeIndex(100, 400))
+
+    result = BulkValidator(reference).validate(frame, NOW)
+
+    engine = reference.rule_engine
+    for record, bulk in zip(records, result.to_dicts()):
+        fields = {field: value for field, value in record.items()
+                  if value is not None and not (isinstance(value, float) and np.isnan(value))}
+        issues = engine.evaluate(fields, NOW)
+        risk_score, is_valid = engine.score(issues)
+        assert bulk['issues'] == issues
+        assert bulk['is_valid'] == is_valid
+        assert bulk['risk_score'] == pytest.approx(risk_score)
+    assert list(result.summary.index) == list(frame.index)
+    assert set(result.issues['row']) <= set(frame.index)
+
+
+def test_summary_counts_and_statuses(reference):
+    frame = pd.DataFrame([
+        {field: values[0] for field, values in CHOICES.items()},
+        dict({field: values[0] for field, values in CHOICES.items()}, product='Magic Bond'),
+        dict({field: values[0] for field, values in CHOICES.items()}, counterparty=None),
+    ])
+
+    summary = BulkValidator(reference).validate(frame, NOW).summary
+
+    assert list(summary['status']) == ['valid', 'warning', 'invalid']
+    assert list(summary['issue_count']) == [0, 1, 1]
+
+
+def test_missing_columns_are_missing_fields(reference):
+    result = BulkValidator(reference).validate(pd.DataFrame({'issuer': ['HSBC']}), NOW)
+
+    rule_ids = list(result.issues['rule_id'])
+    assert 'issuer_check' not in rule_ids
+    assert 'counterparty_check' in rule_ids
+    assert not result.summary['is_valid'].iloc[0]
+
+
+def test_empty_frame(reference):
+    result = BulkValidator(reference).validate(pd.DataFrame(columns=list(CHOICES)), NOW)
+    assert len(result.summary) == 0
+    assert len(result.issues) == 0
+
+
+def test_parse_dates_agrees_with_parse_date():
+    values = np.array(['2023-06-15', '2023-02-29', '2024-02-29', '2023-6-5', '0001-01-01', '9999-12-31', 'x'],
+                      dtype=object)
+    parsed, invalid = parse_dates(values)
+
+    for value, date, is_invalid in zip(values, parsed, invalid):
+        expected = parse_date(value)
+        assert is_invalid == (expected is INVALID_DATE)
+        if not is_invalid:
+            assert date == np.datetime64(expected, 'us')
@@ -0,0 +1,97 @@
+import random
+import pytest
+from benchmarks.corpus import make_term_sheet, load_reference_lists, render_txt
+from services.dedup_index import DedupIndex, hamming_distance, is_misread, key_terms_agree, simhash
+from services.field_extractor import DEFAULT_FIELD_EXTRACTOR
+
+
+@pytest.fixture
+def index(tmp_path):
+    return DedupIndex(str(tmp_path / 'dedup.db'))
+
+
+@pytest.fixture(scope='module')
+def documents():
+    rng = random.Random(11)
+    lists = load_reference_lists()
+    return [render_txt(make_term_sheet(rng, lists, 3)[1]).decode('utf-8') for _ in range(2)]
+
+
+def add(index, name, text):
+    return index.add(name, name, simhash(text), DEFAULT_FIELD_EXTRACTOR.extract(text), {'name': name})
+
+
+def test_ocr_noise_is_a_near_duplicate(index, documents):
+    original = documents[0]
+    noisy = original.replace('business day', 'busincss day').replace('commercially', 'commerciaIly')
+    cluster_id = add(index, 'original', original)
+
+    match = index.find_near_duplicate(simhash(noisy), DEFAULT_FIELD_EXTRACTOR.extract(noisy))
+
+    assert match is not None
+    document, distance = match
+    assert document['cluster_id'] == cluster_id
+    assert document['result'] == {'name': 'original'}
+    assert distance == hamming_distance(simhash(original), simhash(noisy))
+
+
+def test_other_trade_is_not_a_duplicate(index, documents):
+    add(index, 'first', documents[0])
+    other = documents[1]
+
+    assert index.find_near_duplicate(simhash(other), DEFAULT_FIELD_EXTRACTOR.extract(other)) is None
+
+
+def test_same_template_with_different_key_terms_is_not_a_duplicate(index, documents):
+    original = documents[0]
+    fields = DEFAULT_FIELD_EXTRACTOR.extract(original)
+    amended = original.replace(fields['trade_date'], '2021-01-04')
+    add(index, 'original', original)
+
+    # Nearly identical text, but a different trade
+    assert hamming_distance(simhash(original), simhash(amended)) <= index.max_distance
+    assert index.find_near_duplicate(simhash(amended), DEFAULT_FIELD_EXTRACTOR.extract(amended)) is None
+
+
+def test_resubmission_joins_the_cluster(index, documents):
+    cluster_id = add(index, 'original', documents[0])
+    index.add('copy', 'copy.txt', simhash(documents[0]), {}, {}, cluster_id=cluster_id)
+    index.record_resubmission('original')
+
+    assert index.cluster_size(cluster_id) == 2
+    assert [member['seen_count'] for member in index.cluster(cluster_id)] == [2, 1]
+    assert index.get('original')['result'] == {'name': 'original'}
+
+
+def test_ocr_misread_in_a_key_term_is_a_near_duplicate(tmp_path, index, documents):
+    original = documents[0]
+    fields = DEFAULT_FIELD_EXTRACTOR.extract(original)
+    misread = original.replace(fields['counterparty'], fields['counterparty'][:-1] + 'v')
+    add(index, 'original', original)
+
+    match = index.find_near_duplicate(simhash(misread), DEFAULT_FIELD_EXTRACTOR.extract(misread))
+
+    assert match is not None and match[0]['document_hash'] == 'original'
+    strict = DedupIndex(str(tmp_path / 'strict.db'), max_misread_terms=0)
+    add(strict, 'original', original)
+    assert strict.find_near_duplicate(simhash(misread), DEFAULT_FIELD_EXTRACTOR.extract(misread)) is None
+
+
+def test_misreads_in_two_key_terms_are_not_a_duplicate(index, documents):
+    original = documents[0]
+    fields = DEFAULT_FIELD_EXTRACTOR.extract(original)
+    coupon = f"{fields['coupon_rate']}%"
+    misread = (original.replace(fields['counterparty'], fields['counterparty'][:-1] + 'v')
+               .replace(coupon, coupon[:-2] + ('1' if coupon[-2] != '1' else '2') + '%'))
+    add(index, 'original', original)
+
+    assert index.find_near_duplicate(simhash(misread), DEFAULT_FIELD_EXTRACTOR.extract(misread)) is None
+
+
+def test_only_single_character_substitutions_count_as_misreads():
+    assert is_misread('acme corporatlon', 'acme corporation')
+    assert is_misread(5.26, 5.25)
+    assert not is_misread(5.2, 5.25)
+    assert not is_misread('2021-01-04', '2024-04-09')
+    assert key_terms_agree({'coupon_rate': 5.26, 'currency': 'usd'}, {'coupon_rate': 5.25, 'currency': 'usd'}, 1)
+    assert not key_terms_agree({'coupon_rate': 5.26}, {'coupon_rate': 5.25})
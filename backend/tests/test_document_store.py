@@ -0,0 +1,129 @@
+import json
+import os
+import pytest
+from services import document_store
+from services.document_store import DocumentStore
+from services.reference_data import ReferenceDataStore
+
+RULES = {
+    'counterparty_check': {
+        'description': 'Ensure counterparty is on the approved list',
+        'severity': 'HIGH',
+        'type': 'approved_list',
+        'field': 'counterparty',
+        'list': 'counterparties',
+        'label': 'Counterparty',
+        'missing_message': 'Counterparty information is missing'
+    }
+}
+
+
+def write_source(directory, counterparties):
+    source_path = os.path.join(directory, 'reference_data.json')
+    with open(source_path, 'w') as f:
+        json.dump({'version': '1', 'lists': {'counterparties': counterparties}, 'rules': RULES}, f)
+    # Modification times may not change between quick rewrites
+    os.utime(source_path, ns=(0, len(counterparties)))
+    return source_path
+
+
+@pytest.fixture
+def references(tmp_path):
+    """
+    Return (before, after) snapshots where 'Globex Ltd' was added to the
+    approved counterparties
+    """
+    source_dir = tmp_path / 'source'
+    source_dir.mkdir()
+    source_path = write_source(str(source_dir), ['Acme Corporation'])
+    reference_store = ReferenceDataStore(source_path, str(tmp_path / 'snapshots'), reload_seconds=0)
+    before = reference_store.current()
+    write_source(str(source_dir), ['Acme Corporation', 'Globex Ltd'])
+    return before, reference_store.current()
+
+
+def save_documents(store, reference, count):
+    for number in range(count):
+        fields = {'counterparty': 'Globex Ltd'}
+        store.save(f'doc-{number}', f'doc-{number}.txt', fields, reference,
+                   reference.rule_engine.evaluate(fields))
+
+
+def test_revalidation_updates_affected_documents(tmp_path, references):
+    before, after = references
+    store = DocumentStore(str(tmp_path / 'documents.db'))
+    save_documents(store, before, 3)
+
+    changes = store.revalidate(before, after)
+
+    assert sorted(change['document_id'] for change in changes) == ['doc-0', 'doc-1', 'doc-2']
+    assert {change['status'] for change in changes} == {'valid'}
+    assert store.get('doc-0')['reference_data_version'] == after.version
+    assert len(store.status_changes()) == 3
+    assert store.revalidate(before, after) == []
+
+
+def test_failed_revalidation_is_redone(tmp_path, references, monkeypatch):
+    before, after = references
+    store = DocumentStore(str(tmp_path / 'documents.db'))
+    save_documents(store, before, 5)
+    monkeypatch.setattr(document_store, 'REVALIDATION_BATCH_SIZE', 2)
+    reevaluate = store._reevaluate
+    batches = []
+
+    def failing_reevaluate(*args, **kwargs):
+        batches.append(args)
+        if len(batches) == 2:
+            raise RuntimeError('disk full')
+        return reevaluate(*args, **kwargs)
+
+    monkeypatch.setattr(store, '_reevaluate', failing_reevaluate)
+    with pytest.raises(RuntimeError):
+        store.revalidate(before, after)
+    monkeypatch.setattr(store, '_reevaluate', reevaluate)
+
+    # The first batch is done but the version was not advanced, so the next
+    # run redoes the remaining documents
+    documents = [store.get(f'doc-{number}') for number in range(5)]
+    assert sum(document['status'] == 'valid' for document in documents) == 2
+    assert sum(document['reference_data_version'] == before.version for document in documents) == 3
+    changes = store.revalidate(None, after)
+    assert len(changes) == 3
+    assert all(store.get(f'doc-{number}')['status'] == 'valid' for number in range(5))
+
+
+def test_live_claim_of_another_process_is_respected(tmp_path, references, monkeypatch):
+    before, after = references
+    db_path = str(tmp_path / 'documents.db')
+    store = DocumentStore(db_path)
+    other = DocumentStore(db_path)
+    save_documents(store, before, 2)
+    retries = []
+    monkeypatch.setattr(document_store.threading, 'Timer',
+                        lambda delay, function, args: retries.append((delay, function, args)) or _Timer())
+
+    # A process that claimed the run and died before finishing it
+    with other._lock, other._connection:
+        other._connection.execute(
+            "INSERT INTO meta (key, value) VALUES ('revalidation', ?)",
+            (json.dumps({'version': after.version, 'token': 'dead',
+                         'claimed_at': document_store.time.time()}),))
+
+    assert store.revalidate(before, after) == []
+    assert store.get('doc-0')['status'] != 'valid'
+    assert len(retries) == 1
+    assert 0 < retries[0][0] <= document_store.REVALIDATION_CLAIM_SECONDS + 1
+
+    # Once the claim expires, the retry does the work
+    monkeypatch.setattr(document_store, 'REVALIDATION_CLAIM_SECONDS', 0)
+    delay, function, args = retries[0]
+    function(*args)
+    assert store.get('doc-0')['status'] == 'valid'
+    assert store.get('doc-1')['reference_data_version'] == after.version
+
+
+class _Timer:
+    daemon = False
+
+    def start(self):
+        pass
@@ -0,0 +1,107 @@
+from datetime import datetime
+from openpyxl import Workbook
+from services.document_store import DocumentStore
+from services.excel_reader import WorkbookReader
+from services.extraction_cache import ExtractionCache
+from services.ocr_service import OCRService
+from services import pipeline as pipeline_module
+from services.pipeline import TermSheetPipeline
+from services.validation_service import ValidationService
+from utils.file_handler import SpooledUpload
+
+BLOTTER_HEADER = ['Trade Date', 'Counterparty', 'Issuer', 'Product', 'Coupon Rate']
+
+
+def write_form(path):
+    workbook = Workbook()
+    sheet = workbook.active
+    sheet.title = 'Terms'
+    sheet.append(['Trade Date:', datetime(2023, 6, 15)])
+    sheet.append(['Coupon Rate', 0.0525])
+    sheet['B2'].number_format = '0.00%'
+    sheet.append(['Principal Amount', 'USD 10,000,000'])
+    sheet.append(['Confidential'])
+    workbook.save(path)
+    return str(path)
+
+
+def write_blotter(path, trades):
+    workbook = Workbook()
+    sheet = workbook.active
+    sheet.title = 'Blotter'
+    sheet.append(BLOTTER_HEADER)
+    for number in range(trades):
+        sheet.append([f'2023-06-{number % 28 + 1:02d}', 'Acme Corporation', 'Barclays Bank PLC',
+                      'Fixed Rate Note', f'{number % 5 + 1}%'])
+    workbook.save(path)
+    return str(path)
+
+
+def test_form_rows_read_as_label_and_value(tmp_path):
+    lines = list(WorkbookReader().iter_lines(write_form(tmp_path / 'form.xlsx')))
+
+    assert lines == ['[Terms]', 'Trade Date: 2023-06-15', 'Coupon Rate: 5.25%',
+                     'Principal Amount: USD 10,000,000', 'Confidential']
+
+
+def test_table_rows_are_labelled_by_their_header(tmp_path):
+    text = WorkbookReader().read_text(write_blotter(tmp_path / 'blotter.xlsx', 2))
+
+    assert text.split('\n')[:7] == ['[Blotter]', 'Trade Date: 2023-06-01', 'Counterparty: Acme Corporation',
+                                    'Issuer: Barclays Bank PLC', 'Product: Fixed Rate Note', 'Coupon Rate: 1%', '']
+
+
+def test_sheets_longer_than_max_rows_are_reported(tmp_path):
+    path = write_blotter(tmp_path / 'blotter.xlsx', 10)
+
+    workbook = WorkbookReader(max_rows=5).read(path)
+    assert workbook.truncated_sheets == ['Blotter']
+    # The header and four trades
+    assert workbook.text.count('Trade Date:') == 4
+
+    lines = WorkbookReader(max_rows=5).iter_lines(path, max_rows=0)
+    assert sum(line.startswith('Trade Date:') for line in lines) == 10
+    assert WorkbookReader().read(path).truncated_sheets == []
+
+
+def test_truncated_workbook_is_flagged_and_not_cached(tmp_path, monkeypatch):
+    # The reference data snapshot is compiled under the working directory
+    monkeypatch.chdir(tmp_path)
+    path = write_blotter(tmp_path / 'blotter.xlsx', 10)
+    cache = ExtractionCache(str(tmp_path / 'cache'), 1024 * 1024)
+    service = OCRService(cache=cache, workbook_reader=WorkbookReader(max_rows=5))
+
+    extraction = service.extract(path)
+
+    assert extraction.truncated == {'reason': 'row_limit', 'max_rows': 5, 'sheets_truncated': ['Blotter']}
+    assert cache.writes == 0
+    assert ValidationService(document_store=object())._format_truncated(extraction.truncated) == {
+        'reason': 'row_limit', 'maxRows': 5, 'sheetsTruncated': ['Blotter']}
+
+    complete = OCRService(cache=cache).extract(path)
+    assert complete.truncated is None
+    assert cache.writes == 1
+
+
+def test_bundles_stream_every_row(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(pipeline_module, 'get_history_store', lambda: _History())
+    path = write_blotter(tmp_path / 'blotter.xlsx', 12)
+    pipeline = TermSheetPipeline(
+        ocr_service=OCRService(use_cache=False, workbook_reader=WorkbookReader(max_rows=5)),
+        validation_service=ValidationService(document_store=DocumentStore(str(tmp_path / 'documents.db'))),
+        use_dedup=False, warm=False)
+
+    with open(path, 'rb') as f, SpooledUpload(f, 'blotter.xlsx') as upload:
+        document_hash, truncated, term_sheets = pipeline.process_bundle(upload, 'blotter.xlsx')
+        term_sheets = list(term_sheets)
+
+    assert truncated is None
+    assert len(term_sheets) == 12
+    assert [term_sheet['term_sheet_data']['coupon_rate'] for term_sheet in term_sheets[:6]] == [1, 2, 3, 4, 5, 1]
+    assert term_sheets[11]['document_id'] == f'{document_hash}:11'
+
+
+class _History:
+    def record(self, *args, **kwargs):
+        pass
@@ -0,0 +1,84 @@
+import os
+from services.extraction_cache import ExtractionCache, BYTES_SUFFIX
+
+
+def put_at(cache, key, text, mtime):
+    """Store an entry and date its last use"""
+    cache.put(key, text)
+    os.utime(cache._entry_path(key), (mtime, mtime))
+
+
+def test_get_returns_what_was_put(tmp_path):
+    cache = ExtractionCache(str(tmp_path), 1000)
+    key = cache.make_key('hash', 'settings')
+    assert cache.get(key) is None
+
+    cache.put(key, 'text')
+    cache.put_bytes(key, b'tokens')
+
+    assert cache.get(key) == 'text'
+    assert cache.get_bytes(key) == b'tokens'
+    assert cache.stats()['hits'] == 1
+    assert cache.stats()['misses'] == 1
+
+
+def test_settings_are_part_of_the_key(tmp_path):
+    cache = ExtractionCache(str(tmp_path), 1000)
+    assert cache.make_key('hash', 'dpi=200') != cache.make_key('hash', 'dpi=300')
+
+
+def test_evicts_least_recently_used_entries(tmp_path):
+    cache = ExtractionCache(str(tmp_path), 1000)
+    keys = [cache.make_key(str(number), 'settings') for number in range(4)]
+    for number, key in enumerate(keys[:3]):
+        put_at(cache, key, 'x' * 300, 1000 + number)
+
+    # Reading the oldest entry makes it the most recently used
+    assert cache.get(keys[0]) is not None
+    cache.put(keys[3], 'x' * 300)
+
+    assert cache.get(keys[1]) is None
+    assert cache.get(keys[0]) is not None
+    assert cache.get(keys[3]) is not None
+    assert cache.stats()['evictions'] == 1
+    assert cache.stats()['size_bytes'] == 900
+
+
+def test_evicts_binary_data_with_its_text(tmp_path):
+    cache = ExtractionCache(str(tmp_path), 1000)
+    old, new = cache.make_key('old', 'settings'), cache.make_key('new', 'settings')
+    put_at(cache, old, 'x' * 300, 1000)
+    cache.put_bytes(old, b'y' * 400)
+
+    cache.put(new, 'x' * 400)
+
+    assert not os.path.exists(cache._entry_path(old))
+    assert not os.path.exists(cache._entry_path(old) + BYTES_SUFFIX)
+    assert cache.stats()['size_bytes'] == 400
+
+
+def test_rewriting_an_entry_replaces_its_size(tmp_path):
+    cache = ExtractionCache(str(tmp_path), 1000)
+    key = cache.make_key('hash', 'settings')
+    for _ in range(5):
+        cache.put(key, 'x' * 300)
+        cache.put_bytes(key, b'y' * 100)
+
+    assert cache.stats()['size_bytes'] == 400
+    assert cache.stats()['evictions'] == 0
+
+
+def test_evicts_orphaned_binary_data(tmp_path):
+    cache = ExtractionCache(str(tmp_path), 1000)
+    orphan_path = cache._entry_path(cache.make_key('orphan', 'settings')) + BYTES_SUFFIX
+    os.makedirs(os.path.dirname(orphan_path), exist_ok=True)
+    with open(orphan_path, 'wb') as file:
+        file.write(b'y' * 900)
+    os.utime(orphan_path, (1000, 1000))
+
+    cache = ExtractionCache(str(tmp_path), 1000)
+    assert cache.stats()['size_bytes'] == 900
+    cache.put(cache.make_key('new', 'settings'), 'x' * 200)
+
+    assert not os.path.exists(orphan_path)
+    assert cache.stats()['size_bytes'] == 200
@@ -0,0 +1,46 @@
+import random
+import pytest
+from benchmarks.bench_field_extractor import make_document, legacy_analyze_text
+from services.field_extractor import DEFAULT_FIELD_EXTRACTOR, FieldExtractor, FieldSpec, FIELD_SPECS
+
+
+@pytest.mark.parametrize('missing', [0, 4, 11])
+def test_matches_the_previous_extraction(missing):
+    text = make_document(100000, random.Random(missing), missing)
+    assert DEFAULT_FIELD_EXTRACTOR.extract(text) == legacy_analyze_text(text)
+
+
+def test_canonical_label_wins_over_an_earlier_synonym():
+    text = 'Issue Date: 2023-06-01\nTrade Date: 2023-06-15\n'
+    assert DEFAULT_FIELD_EXTRACTOR.extract(text) == {'trade_date': '2023-06-15'}
+
+
+def test_synonym_is_used_without_the_canonical_label():
+    text = 'Notional: EUR 5,000,000\nApplicable Law: English Law'
+    assert DEFAULT_FIELD_EXTRACTOR.extract(text) == {
+        'currency': 'EUR', 'principal_amount': 5000000.0, 'governing_law': 'English Law'}
+
+
+def test_occurrence_without_a_matching_value_is_skipped():
+    text = 'Trade Date: to be confirmed\n  Trade Date: 2023-06-15\nCoupon Rate: TBD\nCoupon Rate: 5.25% p.a.'
+    assert DEFAULT_FIELD_EXTRACTOR.extract(text) == {'trade_date': '2023-06-15', 'coupon_rate': 5.25}
+
+
+def test_labels_are_read_at_the_start_of_lines_only():
+    text = 'The Co-Issuer: Acme Corporation\nIssuer: HSBC'
+    assert DEFAULT_FIELD_EXTRACTOR.extract(text) == {'issuer': 'HSBC'}
+
+
+def test_spans_point_at_the_values():
+    text = 'TERM SHEET\nIssuer: HSBC\nPrincipal Amount: USD 1,000'
+    fields, spans = DEFAULT_FIELD_EXTRACTOR.extract_spans(text)
+
+    assert text[slice(*spans['issuer'])] == 'HSBC'
+    assert spans['currency'] == spans['principal_amount']
+    assert text[slice(*spans['principal_amount'])] == 'USD 1,000'
+    assert fields == DEFAULT_FIELD_EXTRACTOR.extract(text)
+
+
+def test_labels_must_be_unique():
+    with pytest.raises(ValueError):
+        FieldExtractor(FIELD_SPECS + [FieldSpec('other', ['Issuer'], r'\s*(.+)', lambda value: {})])
@@ -0,0 +1,71 @@
+import io
+import os
+import zipfile
+import pytest
+from services.ocr_service import OCRService
+from utils.file_handler import SpooledUpload, extract_zip_archive, file_sha256
+
+TERM_SHEET = b'Trade Date: 2023-06-15\nCounterparty: Acme Corporation\n'
+
+
+def test_small_upload_stays_in_memory():
+    with SpooledUpload(io.BytesIO(TERM_SHEET), 'Sheet.TXT', max_memory_bytes=1024) as upload:
+        assert upload.in_memory
+        assert upload.extension == '.txt'
+        assert upload.size == len(TERM_SHEET)
+        assert upload.read() == TERM_SHEET
+        # open() rewinds, so the upload can be read more than once
+        assert upload.read() == TERM_SHEET
+
+
+def test_large_upload_spills_to_disk_and_hashes_like_a_saved_file(tmp_path):
+    data = os.urandom(3 * 1024 * 1024 + 17)
+    saved = tmp_path / 'saved.bin'
+    saved.write_bytes(data)
+
+    with SpooledUpload(io.BytesIO(data), 'scan.pdf', max_memory_bytes=1024) as upload:
+        assert not upload.in_memory
+        assert upload.sha256 == file_sha256(str(saved))
+        with upload.as_file() as path:
+            assert path.endswith('.pdf')
+            with open(path, 'rb') as f:
+                assert f.read() == data
+        assert not os.path.exists(path)
+
+
+def test_text_is_extracted_from_the_buffer(tmp_path):
+    service = OCRService(use_cache=False)
+    with SpooledUpload(io.BytesIO(TERM_SHEET), 'sheet.txt') as upload:
+        assert service.extract_text(upload) == TERM_SHEET.decode('utf-8')
+
+
+def make_zip(members):
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w') as archive:
+        for name, data in members.items():
+            archive.writestr(name, data)
+    buffer.seek(0)
+    return buffer
+
+
+def test_zip_members_are_extracted_under_generated_names(tmp_path):
+    archive = make_zip({'sheets/one.txt': TERM_SHEET, '../../escape.txt': TERM_SHEET, 'notes.exe': b'MZ'})
+    destination = tmp_path / 'extracted'
+
+    extracted, skipped = extract_zip_archive(archive, {'txt'}, str(destination), max_total_bytes=1024)
+
+    assert [member for member, _ in extracted] == ['sheets/one.txt', '../../escape.txt']
+    for _, path in extracted:
+        assert os.path.dirname(path) == str(destination)
+        with open(path, 'rb') as f:
+            assert f.read() == TERM_SHEET
+    assert skipped == [('notes.exe', 'File type not allowed')]
+    assert sorted(os.listdir(tmp_path)) == ['extracted']
+
+
+def test_zip_expanding_beyond_the_limit_is_rejected(tmp_path):
+    archive = make_zip({'big.txt': b'0' * 4096})
+
+    with pytest.raises(ValueError):
+        extract_zip_archive(archive, {'txt'}, str(tmp_path / 'extracted'), max_total_bytes=1024)
+    assert os.listdir(tmp_path / 'extracted') == []
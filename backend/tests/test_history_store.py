@@ -0,0 +1,70 @@
+import pytest
+from services import history_store
+from services.history_store import HistoryStore, decode_cursor, encode_cursor
+
+
+def validation(status):
+    if status == 'valid':
+        return {'is_valid': True, 'risk_score': 0.0, 'issues': []}
+    return {'is_valid': False, 'risk_score': 0.5,
+            'issues': [{'rule_id': 'counterparty_check', 'severity': 'HIGH', 'description': 'Not approved'}]}
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    store = HistoryStore(str(tmp_path / 'history.db'), flush_seconds=0.01)
+    # Rows 0-9 share a timestamp, so pages must break ties by id
+    timestamps = iter([100.0] * 10 + [200.0 + number for number in range(15)])
+    monkeypatch.setattr(history_store.time, 'time', lambda: next(timestamps))
+    for number in range(25):
+        store.record(f'hash-{number}', f'sheet-{number}.pdf',
+                     {'counterparty': 'Acme Corporation' if number % 2 else 'Globex Ltd'},
+                     validation('valid' if number % 3 else 'invalid'), timings={'total': number})
+    monkeypatch.undo()
+    store.flush()
+    yield store
+    store.close()
+
+
+def page_through(store, limit, **filters):
+    filenames = []
+    cursor = None
+    while True:
+        rows, cursor = store.query(limit=limit, cursor=cursor, **filters)
+        filenames.extend(row['filename'] for row in rows)
+        if cursor is None:
+            return filenames
+
+
+def test_pages_cover_every_row_once_newest_first(store):
+    filenames = page_through(store, 4)
+
+    assert filenames == [f'sheet-{number}.pdf' for number in reversed(range(25))]
+
+
+def test_rows_are_deserialized(store):
+    rows, cursor = store.query(limit=1)
+
+    assert rows[0]['fields'] == {'counterparty': 'Globex Ltd'}
+    assert rows[0]['issues'][0]['rule_id'] == 'counterparty_check'
+    assert rows[0]['timings'] == {'total': 24}
+    assert decode_cursor(cursor) == (rows[0]['created_at'], rows[0]['id'])
+
+
+def test_filters_and_time_range(store):
+    filenames = page_through(store, 3, status='invalid', counterparty='Acme Corporation')
+    assert filenames == ['sheet-21.pdf', 'sheet-15.pdf', 'sheet-9.pdf', 'sheet-3.pdf']
+
+    rows, cursor = store.query(limit=50, since=100.0, until=200.0)
+    assert len(rows) == 10 and cursor is None
+
+    rows, _ = store.query(document_hash='hash-7')
+    assert [row['filename'] for row in rows] == ['sheet-7.pdf']
+
+
+def test_unknown_filter_and_bad_cursor_are_rejected(store):
+    with pytest.raises(ValueError):
+        store.query(product='Swap')
+    with pytest.raises(ValueError):
+        store.query(cursor='not a cursor')
+    assert decode_cursor(encode_cursor(1.5, 3)) == (1.5, 3)
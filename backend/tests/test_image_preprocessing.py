@@ -0,0 +1,115 @@
+import numpy as np
+import pytest
+from PIL import Image, ImageDraw
+from services.image_preprocessing import (ImagePreprocessor, adaptive_threshold, estimate_skew, remove_specks,
+                                          trim_borders)
+
+DPI = 200
+
+
+def make_page(skew=0.0, border=0, lines=12):
+    """
+    Return a letter-size page at DPI of word-like blocks on text lines,
+    rotated so that the lines slope down to the right by skew degrees
+    """
+    page = Image.new('L', (int(8.5 * DPI), 11 * DPI), 255)
+    draw = ImageDraw.Draw(page)
+    for line in range(lines):
+        y = DPI + line * DPI // 3
+        x = DPI
+        for word in range(10):
+            width = 40 + (line * 7 + word * 13) % 60
+            draw.rectangle([x, y, x + width, y + 24], fill=20)
+            x += width + 25
+    if skew:
+        # PIL rotates counterclockwise, which lifts the right-hand side
+        page = page.rotate(-skew, resample=Image.BICUBIC, fillcolor=255)
+    if border:
+        framed = Image.new('L', (page.width + 2 * border, page.height + 2 * border), 0)
+        framed.paste(page, (border, border))
+        page = framed
+    page.info['dpi'] = (DPI, DPI)
+    return page
+
+
+def test_text_page_is_binarized_and_cropped():
+    page, details = ImagePreprocessor(deskew_max_angle=0).process(make_page())
+
+    assert not details['blank']
+    assert details['dpi'] == DPI and details['scale'] == 1.0
+    assert page.mode == 'L'
+    assert set(np.unique(np.asarray(page))) == {0, 255}
+    # Cropped to the text plus the margin
+    assert page.width < make_page().width // 2 + DPI
+
+
+def test_blank_page_with_specks_is_skipped():
+    page = Image.new('L', (int(8.5 * DPI), 11 * DPI), 255)
+    pixels = np.array(page)
+    rng = np.random.default_rng(0)
+    pixels[rng.integers(0, pixels.shape[0], 200), rng.integers(0, pixels.shape[1], 200)] = 0
+
+    result, details = ImagePreprocessor().process(Image.fromarray(pixels), dpi=DPI)
+
+    assert result is None
+    assert details['blank']
+
+
+def test_pages_are_scaled_into_the_dpi_range():
+    preprocessor = ImagePreprocessor(target_dpi=300, min_dpi=200)
+    small = make_page().resize((850, 1100))
+
+    _, details = preprocessor.process(small, dpi=100)
+    assert details['dpi'] == 200 and details['scale'] == 2.0
+
+    # Without plausible dpi metadata, the dpi is estimated from the page width
+    large = make_page().resize((int(8.5 * 600), 11 * 600))
+    large.info.pop('dpi', None)
+    _, details = preprocessor.process(large)
+    assert details['dpi'] == 300 and details['scale'] == 0.5
+
+
+@pytest.mark.parametrize('skew', [-3.0, 2.0])
+def test_skew_is_detected_and_corrected(skew):
+    page, details = ImagePreprocessor().process(make_page(skew=skew))
+
+    assert details['skew_degrees'] == pytest.approx(skew, abs=0.2)
+    # The corrected text lines are horizontal again
+    assert abs(estimate_skew(np.asarray(page) < 128, 5)) <= 0.2
+
+
+def test_scanner_border_is_trimmed():
+    framed = np.asarray(make_page(border=30))
+
+    trimmed = trim_borders(framed)
+
+    assert trimmed.shape == (framed.shape[0] - 60, framed.shape[1] - 60)
+
+
+def test_adaptive_threshold_handles_uneven_lighting():
+    # Background from white down to mid gray, with text a little darker
+    background = np.tile(np.linspace(255, 110, 400, dtype=np.float32), (100, 1))
+    gray = background.copy()
+    gray[40:60, ::20] *= 0.5
+    gray = gray.astype(np.uint8)
+
+    ink = adaptive_threshold(gray, 25)
+
+    assert ink[40:60, ::20].all()
+    assert not ink[:30].any()
+
+
+def test_isolated_specks_are_removed():
+    ink = np.zeros((10, 10), dtype=bool)
+    ink[1, 1] = True
+    ink[5:7, 5:7] = True
+
+    cleaned = remove_specks(ink)
+
+    assert not cleaned[1, 1]
+    assert cleaned[5:7, 5:7].all()
+
+
+def test_fingerprint_follows_the_settings():
+    assert ImagePreprocessor().fingerprint() == ImagePreprocessor().fingerprint()
+    assert ImagePreprocessor(target_dpi=250).fingerprint() != ImagePreprocessor().fingerprint()
@@ -0,0 +1,139 @@
+import threading
+import time
+import pytest
+from services.job_queue import (JobQueue, MemoryJobStore, SQLiteJobStore, QueueFullError, serialize_job,
+                                ABANDONED_JOB_ERROR, JOB_QUEUED, JOB_RUNNING, JOB_SUCCEEDED, JOB_FAILED)
+
+
+@pytest.fixture(params=['memory', 'sqlite'])
+def store(request, tmp_path):
+    if request.param == 'sqlite':
+        return SQLiteJobStore(str(tmp_path / 'jobs.db'))
+    return MemoryJobStore()
+
+
+def wait_for_status(queue, job_id, status, timeout=5):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        job = queue.get(job_id)
+        if job['status'] == status:
+            return job
+        time.sleep(0.01)
+    raise AssertionError(f"Job {job_id} is {queue.get(job_id)['status']}, not {status}")
+
+
+def test_job_runs_from_queued_to_succeeded(store):
+    queue = JobQueue(store, max_workers=1)
+    started = threading.Event()
+    release = threading.Event()
+
+    def blocker(progress_callback):
+        started.set()
+        release.wait(5)
+
+    def job(name, progress_callback):
+        progress_callback(1, 2)
+        progress_callback(2, 2)
+        return {'name': name}
+
+    queue.submit(blocker)
+    assert started.wait(5)
+    job_id = queue.submit(job, 'sheet.pdf')
+    assert queue.get(job_id)['status'] == JOB_QUEUED
+    assert queue.pending_count() == 2
+
+    release.set()
+    job = wait_for_status(queue, job_id, JOB_SUCCEEDED)
+
+    assert job['result'] == {'name': 'sheet.pdf'}
+    assert (job['pages_done'], job['pages_total']) == (2, 2)
+    assert job['error'] is None
+    assert serialize_job(job)['progress'] == {'pages_done': 2, 'pages_total': 2}
+    assert queue.pending_count() == 0
+
+
+def test_job_is_running_while_it_executes(store):
+    queue = JobQueue(store, max_workers=1)
+    started = threading.Event()
+    release = threading.Event()
+
+    def job(progress_callback):
+        started.set()
+        release.wait(5)
+
+    job_id = queue.submit(job)
+    assert started.wait(5)
+    assert queue.get(job_id)['status'] == JOB_RUNNING
+
+    release.set()
+    wait_for_status(queue, job_id, JOB_SUCCEEDED)
+
+
+def test_failing_job_records_its_error(store):
+    queue = JobQueue(store, max_workers=1)
+
+    def job(progress_callback):
+        raise ValueError('Unsupported file type')
+
+    job = wait_for_status(queue, queue.submit(job), JOB_FAILED)
+
+    assert job['error'] == 'Unsupported file type'
+    assert job['result'] is None
+    assert queue.pending_count() == 0
+
+
+def test_full_queue_rejects_jobs(store):
+    queue = JobQueue(store, max_workers=1, max_pending=1)
+    release = threading.Event()
+
+    job_id = queue.submit(lambda progress_callback: release.wait(5))
+    with pytest.raises(QueueFullError):
+        queue.submit(lambda progress_callback: None)
+
+    release.set()
+    wait_for_status(queue, job_id, JOB_SUCCEEDED)
+    wait_for_status(queue, queue.submit(lambda progress_callback: None), JOB_SUCCEEDED)
+
+
+def test_unknown_job_is_none(store):
+    assert JobQueue(store).get('0' * 32) is None
+
+
+def test_jobs_of_a_stopped_process_fail_at_startup(tmp_path):
+    db_path = str(tmp_path / 'jobs.db')
+    store = SQLiteJobStore(db_path)
+    # Left queued and running by a process that crashed a while ago
+    store.create('queued', 'crashed')
+    store.create('running', 'crashed')
+    store.update('running', status=JOB_RUNNING)
+    store._connection.execute('UPDATE jobs SET heartbeat_at = ?', (time.time() - 120,))
+    store._connection.commit()
+
+    queue = JobQueue(SQLiteJobStore(db_path), lease_seconds=60)
+
+    for job_id in ('queued', 'running'):
+        job = queue.get(job_id)
+        assert job['status'] == JOB_FAILED
+        assert job['error'] == ABANDONED_JOB_ERROR
+
+
+def test_polling_fails_a_job_whose_lease_ran_out(store):
+    queue = JobQueue(store, lease_seconds=60)
+    store.create('lost', 'crashed')
+    assert queue.get('lost')['status'] == JOB_QUEUED
+
+    # The lease of a crashed process is never renewed
+    queue.lease_seconds = 0
+    assert queue.get('lost')['status'] == JOB_FAILED
+
+
+def test_running_jobs_keep_their_lease(store):
+    queue = JobQueue(store, max_workers=1, lease_seconds=0.2)
+    release = threading.Event()
+
+    job_id = queue.submit(lambda progress_callback: release.wait(5))
+    time.sleep(0.5)
+    assert queue.get(job_id)['status'] == JOB_RUNNING
+
+    release.set()
+    wait_for_status(queue, job_id, JOB_SUCCEEDED)
@@ -0,0 +1,90 @@
+import importlib
+import threading
+from utils.metrics import (MetricsRegistry, REQUEST_ID_HEADER, STAGE_SECONDS, current_request_id, log,
+                           new_request_id, page_count_label, request_trace, set_document, timed_stage)
+
+
+def test_histogram_renders_cumulative_buckets():
+    registry = MetricsRegistry()
+    histogram = registry.histogram('test_seconds', 'Test latency', ('route',), buckets=(0.1, 1))
+    for value in (0.05, 0.5, 0.5, 5):
+        registry.observe(histogram, ('/a"b',), value)
+
+    lines = registry.render().splitlines()
+
+    assert '# TYPE test_seconds histogram' in lines
+    assert 'test_seconds_bucket{route="/a\\"b",le="0.1"} 1' in lines
+    assert 'test_seconds_bucket{route="/a\\"b",le="1"} 3' in lines
+    assert 'test_seconds_bucket{route="/a\\"b",le="+Inf"} 4' in lines
+    assert 'test_seconds_count{route="/a\\"b"} 4' in lines
+
+
+def test_collected_series_merge_into_another_registry():
+    worker = MetricsRegistry()
+    server = MetricsRegistry()
+    for registry in (worker, server):
+        registry.histogram('test_seconds', 'Test latency', buckets=(1,))
+        registry.counter('test_total', 'Test count', ('kind',))
+    worker.observe(worker.metrics['test_seconds'], (), 0.5)
+    worker.observe(worker.metrics['test_total'], ('a',), 2)
+    server.observe(server.metrics['test_total'], ('a',), 1)
+
+    server.merge(worker.collect(reset=True))
+
+    assert server.metrics['test_seconds'].series[()] == [[1, 0], 0.5, 1]
+    assert server.metrics['test_total'].series[('a',)] == [3]
+    assert worker.collect() == {}
+
+
+def test_gauges_are_read_when_rendered():
+    registry = MetricsRegistry()
+    value = {('interactive',): 1}
+    registry.gauge('test_slots', 'Slots in use', ('lane',), lambda: value)
+    value[('interactive',)] = 2
+
+    assert 'test_slots{lane="interactive"} 2' in registry.render().splitlines()
+
+
+def test_request_ids_are_kept_only_when_safe():
+    assert new_request_id('abc-123.x_y') == 'abc-123.x_y'
+    for unsafe in (None, '', 'a b', 'x' * 65, 'id\nInjected: 1'):
+        generated = new_request_id(unsafe)
+        assert generated != unsafe and len(generated) == 32
+
+
+def test_stage_timings_are_recorded_with_the_document_labels(capsys):
+    with request_trace('req-1'):
+        assert current_request_id() == 'req-1'
+        set_document(file_type='.pdf', pages=3)
+        with timed_stage('test_stage'):
+            pass
+        log('working')
+    assert current_request_id() is None
+
+    assert '[req-1] working' in capsys.readouterr().out
+    assert ('test_stage', 'pdf', '2-5') in STAGE_SECONDS.series
+    assert [page_count_label(pages) for pages in (None, 1, 20, 101)] == ['none', '1', '6-20', '101+']
+
+
+def test_request_ids_do_not_leak_between_threads():
+    seen = []
+    with request_trace('req-main'):
+        thread = threading.Thread(target=lambda: seen.append(current_request_id()))
+        thread.start()
+        thread.join()
+    assert seen == [None]
+
+
+def test_responses_carry_the_request_id(tmp_path, monkeypatch):
+    # Importing the app creates its upload folder in the working directory
+    monkeypatch.chdir(tmp_path)
+    client = importlib.import_module('app').app.test_client()
+
+    response = client.get('/health', headers={REQUEST_ID_HEADER: 'client-id-1'})
+    assert response.headers[REQUEST_ID_HEADER] == 'client-id-1'
+
+    response = client.get('/health', headers={REQUEST_ID_HEADER: 'not safe'})
+    assert response.headers[REQUEST_ID_HEADER] != 'not safe'
+
+    metrics = client.get('/metrics').get_data(as_text=True)
+    assert 'sheetwise_request_seconds_count{endpoint="/health",method="GET",status="200"}' in metrics
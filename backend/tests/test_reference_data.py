@@ -0,0 +1,111 @@
+import json
+import os
+import threading
+import pytest
+from services.reference_data import ReferenceDataStore, load_reference_source
+
+RULES = {
+    'counterparty_check': {
+        'description': 'Ensure counterparty is on the approved list',
+        'severity': 'HIGH',
+        'type': 'approved_list',
+        'field': 'counterparty',
+        'list': 'counterparties',
+        'label': 'Counterparty',
+        'missing_message': 'Counterparty information is missing'
+    }
+}
+
+
+def write_source(directory, version, counterparties):
+    with open(os.path.join(directory, 'counterparties.csv'), 'w') as f:
+        f.write('name\n' + ''.join(f'{name}\n' for name in counterparties))
+    source_path = os.path.join(directory, 'reference_data.json')
+    with open(source_path, 'w') as f:
+        json.dump({'version': version, 'lists': {'counterparties': {'file': 'counterparties.csv'},
+                                                 'products': ['Swap']},
+                   'rules': RULES}, f)
+    # Modification times may not change between quick rewrites
+    os.utime(source_path, ns=(0, len(counterparties)))
+    return source_path
+
+
+@pytest.fixture
+def source(tmp_path):
+    source_dir = tmp_path / 'source'
+    source_dir.mkdir()
+    return str(source_dir), write_source(str(source_dir), '1', ['Acme Corporation'])
+
+
+def make_store(tmp_path, source_path):
+    return ReferenceDataStore(source_path, str(tmp_path / 'snapshots'), reload_seconds=0)
+
+
+def test_lists_are_read_from_csv_and_inline(source):
+    document, source_sha256, paths = load_reference_source(source[1])
+
+    assert document['lists'] == {'counterparties': ['Acme Corporation'], 'products': ['Swap']}
+    assert len(paths) == 2
+    assert len(source_sha256) == 64
+
+
+def test_snapshot_serves_lists_and_rules(tmp_path, source):
+    snapshot = make_store(tmp_path, source[1]).current()
+
+    assert snapshot.version.startswith('1+')
+    assert snapshot.index('counterparties').match('ACME Corporation').exact
+    assert snapshot.severity('counterparty_check') == 'HIGH'
+    assert snapshot.describe()['lists'] == {'counterparties': 1, 'products': 1}
+    with pytest.raises(KeyError):
+        snapshot.index('issuers')
+
+
+def test_workers_share_one_snapshot_file(tmp_path, source):
+    first = make_store(tmp_path, source[1]).current()
+    second = make_store(tmp_path, source[1]).current()
+
+    assert first.path == second.path
+    assert len(os.listdir(tmp_path / 'snapshots')) == 2  # the snapshot and its build lock
+
+
+def test_changed_source_is_reloaded(tmp_path, source):
+    store = make_store(tmp_path, source[1])
+    previous = store.current()
+
+    write_source(source[0], '2', ['Acme Corporation', 'Mercury Partners'])
+    snapshot = store.current()
+
+    assert snapshot.version.startswith('2+')
+    assert 'Mercury Partners' in snapshot.index('counterparties')
+    # A snapshot already taken keeps its version
+    assert 'Mercury Partners' not in previous.index('counterparties')
+
+
+def test_broken_source_keeps_the_previous_version(tmp_path, source):
+    store = make_store(tmp_path, source[1])
+    version = store.current().version
+
+    with open(source[1], 'w') as f:
+        f.write('{not json')
+
+    assert store.current().version == version
+    with pytest.raises(ValueError):
+        store.reload()
+
+
+def test_listeners_are_called_after_a_swap(tmp_path, source):
+    store = make_store(tmp_path, source[1])
+    called = threading.Event()
+    swaps = []
+
+    def listener(previous, snapshot):
+        swaps.append((previous.version, snapshot.version, threading.current_thread().name))
+        called.set()
+
+    store.add_listener(listener)
+    first = store.current().version
+    write_source(source[0], '2', ['Mercury Partners'])
+    second = store.current().version
+
+    assert called.wait(5)
+    assert swaps == [(first, second, 'sheetwise-reference-listeners')]
@@ -0,0 +1,89 @@
+import random
+import string
+import pytest
+from services.reference_index import (ReferenceIndex, build_index_section, bounded_edit_distance, normalize_name,
+                                      DEFAULT_MAX_DISTANCE, DEFAULT_MIN_CONFIDENCE)
+
+NAMES = ['Acme Corporation', 'Global Investments Ltd', 'JP Morgan', 'Société Générale', 'HSBC']
+
+
+@pytest.fixture(scope='module')
+def index():
+    return ReferenceIndex(NAMES)
+
+
+def levenshtein(a, b):
+    previous = list(range(len(b) + 1))
+    for i, char_a in enumerate(a, 1):
+        current = [i]
+        for j, char_b in enumerate(b, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (char_a != char_b)))
+        previous = current
+    return previous[-1]
+
+
+def test_normalize_name():
+    assert normalize_name('  Société   Générale, S.A. ') == 'societe generale s a'
+
+
+@pytest.mark.parametrize('query', ['Acme Corporation', 'ACME corporation', 'acme  corporation.', 'Societe Generale'])
+def test_exact_match_ignores_case_accents_and_punctuation(index, query):
+    match = index.match(query)
+    assert match.exact
+    assert match.confidence == 1.0
+    assert query in index
+
+
+def test_close_name_is_a_fuzzy_match(index):
+    match = index.match('Acme Corporatlon')
+
+    assert match.name == 'Acme Corporation'
+    assert not match.exact
+    assert match.confidence == pytest.approx(1 - 1 / 16)
+    assert 'Acme Corporatlon' not in index
+
+
+@pytest.mark.parametrize('query', ['Acme Corp', 'Nobody Bank', 'HSBX', ''])
+def test_distant_or_short_names_do_not_match(index, query):
+    assert index.match(query) is None
+
+
+def test_index_wraps_a_buffer_without_copying():
+    section = build_index_section(NAMES)
+    index = ReferenceIndex.from_buffer(memoryview(section))
+
+    assert len(index) == len(NAMES)
+    assert sorted(index.names()) == sorted(NAMES)
+    assert index.match('JP Morgan').exact
+
+
+@pytest.mark.parametrize('a, b', [('kitten', 'sitting'), ('flaw', 'lawn'), ('abc', 'abc'), ('', 'ab'), ('ab', 'ba')])
+def test_bounded_edit_distance(a, b):
+    distance = levenshtein(a, b)
+    assert bounded_edit_distance(a, b, 3) == min(distance, 4)
+    assert bounded_edit_distance(a, b, 1) == min(distance, 2)
+
+
+def test_fuzzy_matches_agree_with_a_full_scan():
+    rng = random.Random(5)
+    names = [''.join(rng.choice(string.ascii_lowercase + ' ') for _ in range(rng.randrange(8, 20))).strip()
+             for _ in range(200)]
+    names = [name for name in dict.fromkeys(names) if name]
+    index = ReferenceIndex(names)
+
+    for _ in range(100):
+        query = list(rng.choice(names))
+        for _ in range(rng.randrange(1, 3)):
+            query[rng.randrange(len(query))] = rng.choice(string.ascii_lowercase)
+        query = ''.join(query)
+        key = normalize_name(query)
+
+        expected = None
+        for name in names:
+            distance = levenshtein(key, normalize_name(name))
+            confidence = 1 - distance / max(len(key), len(normalize_name(name)))
+            if distance <= DEFAULT_MAX_DISTANCE and confidence >= DEFAULT_MIN_CONFIDENCE:
+                expected = max(expected or 0, confidence)
+
+        match = index.match(query)
+        assert (match.confidence if match else None) == expected
@@ -0,0 +1,100 @@
+import threading
+import time
+from services.resource_governor import (LANE_BATCH, LANE_INTERACTIVE, OCRBudget, OCRGovernor, current_ocr_lane,
+                                        ocr_lane)
+
+
+def wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+
+
+def start_waiting(governor, lane, order):
+    def run():
+        governor.acquire(lane)
+        order.append(lane)
+        governor.release()
+    thread = threading.Thread(target=run)
+    thread.start()
+    wait_for(lambda: governor.state()['waiting'][lane] == 1)
+    return thread
+
+
+def test_interactive_pages_are_served_before_batch_pages():
+    governor = OCRGovernor(1)
+    governor.acquire(LANE_BATCH)
+    order = []
+    threads = [start_waiting(governor, LANE_BATCH, order), start_waiting(governor, LANE_INTERACTIVE, order)]
+
+    governor.release()
+    for thread in threads:
+        thread.join()
+
+    assert order == [LANE_INTERACTIVE, LANE_BATCH]
+    assert governor.state() == {'slots': 1, 'in_use': 0, 'waiting': {LANE_INTERACTIVE: 0, LANE_BATCH: 0}}
+
+
+def test_lane_follows_the_request():
+    assert current_ocr_lane() == LANE_BATCH
+    with ocr_lane(LANE_INTERACTIVE):
+        assert current_ocr_lane() == LANE_INTERACTIVE
+        assert OCRBudget().lane == LANE_INTERACTIVE
+    assert current_ocr_lane() == LANE_BATCH
+
+
+def test_page_budget_admits_max_pages():
+    budget = OCRBudget(max_pages=2, max_cpu_seconds=0)
+
+    assert [budget.admit_page() for _ in range(4)] == [True, True, False, False]
+    assert budget.pages == 2
+    assert budget.exhausted == 'page_budget'
+
+
+def test_cpu_budget_stops_admitting_once_spent():
+    budget = OCRBudget(max_pages=0, max_cpu_seconds=1.5)
+
+    assert budget.admit_page()
+    budget.charge(1.0)
+    assert budget.admit_page()
+    budget.charge(1.0)
+    assert not budget.admit_page()
+    assert budget.exhausted == 'cpu_budget'
+    assert OCRBudget(max_pages=0, max_cpu_seconds=0).admit_page()
+
+
+def test_slots_are_shared_through_the_slot_directory(tmp_path):
+    # Each governor opens its own lock files, as another process would
+    first = OCRGovernor(1, str(tmp_path))
+    second = OCRGovernor(1, str(tmp_path))
+    first.acquire()
+    acquired = threading.Event()
+
+    def run():
+        second.acquire()
+        acquired.set()
+    thread = threading.Thread(target=run)
+    thread.start()
+    assert not acquired.wait(0.3)
+
+    first.release()
+    thread.join(5)
+    assert acquired.is_set()
+    second.release()
+    assert first.acquire() == 0.0
+    first.release()
+
+
+def test_slots_of_a_closed_holder_are_free(tmp_path):
+    governor = OCRGovernor(2, str(tmp_path))
+    other = OCRGovernor(2, str(tmp_path))
+    other.acquire()
+    other.acquire()
+
+    # As when a worker dies: its lock files are closed, and their locks go
+    for slot_file in list(other._host_slots._held):
+        slot_file.close()
+
+    assert governor.acquire() == 0.0
+    governor.release()
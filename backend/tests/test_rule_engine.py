@@ -0,0 +1,117 @@
+"""
+Rule engine parity with the hard-coded checks of the original
+ValidationService, whose issues for each case are reproduced here
+"""
+from datetime import datetime
+import pytest
+from services.reference_data import ReferenceDataStore
+
+NOW = datetime(2024, 1, 1)
+
+VALID_TERM_SHEET = {
+    'trade_date': '2023-06-15',
+    'settlement_date': '2023-06-20',
+    'issuer': 'Barclays Bank PLC',
+    'counterparty': 'Acme Corporation',
+    'product': 'Fixed Rate Note',
+    'currency': 'USD',
+    'principal_amount': 10000000.0,
+    'maturity_date': '2099-06-15',
+    'coupon_rate': 5.25,
+    'governing_law': 'English Law',
+    'risk_disclosure': 'The investment involves market risk.'
+}
+
+# (changed fields, removed fields, issues, is_valid, risk_score) as reported
+# by the original validator
+PARITY_CASES = {
+    'valid': ({}, (), [], True, 0.0),
+    'unapproved_names': (
+        {'counterparty': 'Wile E Coyote Ltd', 'issuer': 'Nobody Bank', 'product': 'Magic Bond',
+         'governing_law': 'Martian Law'}, (),
+        [('counterparty_check', "Counterparty 'Wile E Coyote Ltd' is not on the approved list", 'HIGH'),
+         ('issuer_check', "Issuer 'Nobody Bank' is not on the approved list", 'HIGH'),
+         ('product_check', "Product 'Magic Bond' is not on the approved list", 'MEDIUM'),
+         ('governing_law_check', "Governing law 'Martian Law' is not on the approved list", 'MEDIUM')],
+        False, 0.3556),
+    'amount_below_limit': (
+        {'principal_amount': 999}, (),
+        [('principal_amount_check', 'Principal amount 999 is outside acceptable limits (1,000 - 50,000,000)',
+          'HIGH')],
+        False, 0.1111),
+    'amount_above_limit': (
+        {'principal_amount': 50000001}, (),
+        [('principal_amount_check', 'Principal amount 50000001 is outside acceptable limits (1,000 - 50,000,000)',
+          'HIGH')],
+        False, 0.1111),
+    'past_maturity': (
+        {'maturity_date': '2001-01-01'}, (),
+        [('maturity_date_check', 'Maturity date 2001-01-01 is not in the future', 'MEDIUM')],
+        True, 0.0667),
+    'future_trade': (
+        {'trade_date': '2099-01-01', 'settlement_date': '2099-01-03'}, (),
+        [('trade_date_check', 'Trade date 2099-01-01 is in the future', 'HIGH')],
+        False, 0.1111),
+    'settlement_before_trade': (
+        {'settlement_date': '2023-06-10'}, (),
+        [('settlement_vs_trade_check', 'Settlement date 2023-06-10 is before trade date 2023-06-15', 'MEDIUM')],
+        True, 0.0667),
+    'invalid_dates': (
+        {'maturity_date': '15/06/2099', 'trade_date': '2023-13-01'}, (),
+        [('maturity_date_check', 'Maturity date 15/06/2099 is in an invalid format', 'MEDIUM'),
+         ('trade_date_check', 'Trade date 2023-13-01 is in an invalid format', 'HIGH'),
+         ('settlement_vs_trade_check', 'Settlement or trade date is in an invalid format', 'MEDIUM')],
+        False, 0.2444),
+    'empty_disclosure': (
+        {'risk_disclosure': ''}, (),
+        [('risk_disclosure_check', 'Risk disclosure is missing', 'LOW')],
+        True, 0.0222),
+    'missing_fields': (
+        {}, ('counterparty', 'issuer', 'product', 'principal_amount', 'maturity_date', 'trade_date',
+             'governing_law', 'risk_disclosure'),
+        [('counterparty_check', 'Counterparty information is missing', 'HIGH'),
+         ('issuer_check', 'Issuer information is missing', 'HIGH'),
+         ('product_check', 'Product information is missing', 'MEDIUM'),
+         ('principal_amount_check', 'Principal amount is missing', 'HIGH'),
+         ('maturity_date_check', 'Maturity date is missing', 'MEDIUM'),
+         ('trade_date_check', 'Trade date is missing', 'HIGH'),
+         ('governing_law_check', 'Governing law is missing', 'MEDIUM'),
+         ('risk_disclosure_check', 'Risk disclosure is missing', 'LOW')],
+        False, 0.6667),
+}
+
+
+@pytest.fixture(scope='module')
+def engine(tmp_path_factory):
+    store = ReferenceDataStore(snapshot_dir=str(tmp_path_factory.mktemp('reference')), reload_seconds=3600)
+    return store.current().rule_engine
+
+
+@pytest.mark.parametrize('case', sorted(PARITY_CASES))
+def test_matches_original_validator(engine, case):
+    changes, removed, expected_issues, expected_valid, expected_score = PARITY_CASES[case]
+    data = dict(VALID_TERM_SHEET, **changes)
+    for field in removed:
+        del data[field]
+
+    issues = engine.evaluate(data, NOW)
+    risk_score, is_valid = engine.score(issues)
+
+    assert [(issue['rule_id'], issue['description'], issue['severity']) for issue in issues] == expected_issues
+    assert is_valid == expected_valid
+    assert round(risk_score, 4) == expected_score
+
+
+def test_evaluate_many_matches_evaluate(engine):
+    records = [dict(VALID_TERM_SHEET, **changes) for changes, _, _, _, _ in PARITY_CASES.values()]
+    expected = [engine.evaluate(data, NOW) for data in records]
+    assert [issues for issues, _, _ in engine.evaluate_many(records, NOW)] == expected
+
+
+def test_close_match_keeps_rule_severity(engine):
+    issues = engine.evaluate(dict(VALID_TERM_SHEET, counterparty='Acme Corporatlon'), NOW)
+
+    assert len(issues) == 1
+    assert issues[0]['severity'] == 'HIGH'
+    assert "closest approved name is 'Acme Corporation'" in issues[0]['description']
+    assert engine.score(issues)[1] is False
@@ -0,0 +1,56 @@
+import random
+import pytest
+from benchmarks.corpus import make_term_sheet, load_reference_lists
+from services.nlp_service import NLPService
+
+
+@pytest.fixture(scope='module')
+def term_sheets():
+    rng = random.Random(7)
+    lists = load_reference_lists()
+    return [make_term_sheet(rng, lists, 2) for _ in range(3)]
+
+
+def page_text(page_lines):
+    return '\n'.join('\n'.join(lines) for lines in page_lines)
+
+
+def test_bundle_splits_into_one_segment_per_term_sheet(term_sheets):
+    texts = [page_text(page_lines) for _, page_lines in term_sheets]
+    bundle = '\n\n'.join(texts)
+
+    segments = list(NLPService().split_term_sheets(bundle))
+
+    assert [segment.index for segment in segments] == [0, 1, 2]
+    for segment, (fields, _) in zip(segments, term_sheets):
+        assert bundle[segment.offset:segment.offset + len(segment.text)] == segment.text
+        for name in ('trade_date', 'issuer', 'counterparty', 'maturity_date'):
+            assert segment.fields[name] == fields[name]
+
+
+def test_repeated_field_label_starts_a_new_term_sheet():
+    text = ('Trade Date: 2023-06-15\nIssuer: HSBC\nCounterparty: JP Morgan\n\n'
+            'Trade Date: 2023-07-01\nIssuer: Barclays Bank PLC\nCounterparty: Goldman Sachs\n')
+
+    segments = list(NLPService().split_term_sheets(text))
+
+    assert [segment.fields['issuer'] for segment in segments] == ['HSBC', 'Barclays Bank PLC']
+    assert [segment.start_line for segment in segments] == [0, 4]
+
+
+def test_single_term_sheet_is_one_segment(term_sheets):
+    text = page_text(term_sheets[0][1])
+
+    segments = list(NLPService().split_term_sheets(text))
+
+    assert len(segments) == 1
+    assert segments[0].text == text.rstrip('\n')
+
+
+def test_quoted_label_stays_with_its_term_sheet():
+    text = ('TERM SHEET\nTrade Date: 2023-06-15\nIssuer: HSBC\nCounterparty: JP Morgan\n\n'
+            'Issuer: as defined above, acting through its London branch\n')
+
+    segments = list(NLPService().split_term_sheets(text))
+
+    assert len(segments) == 1
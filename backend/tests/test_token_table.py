@@ -0,0 +1,97 @@
+from services.nlp_service import NLPService
+from services.token_table import TokenTable, tesseract_tokens
+from services.validation_service import ValidationService
+
+
+def tesseract_data(words):
+    """
+    Build pytesseract.image_to_data output from (text, block, paragraph,
+    line, left, top, confidence) words
+    """
+    data = {key: [] for key in ('level', 'text', 'block_num', 'par_num', 'line_num', 'left', 'top', 'width',
+                                'height', 'conf')}
+    # A page-level row, which carries no word
+    for key, value in (('level', 1), ('text', ''), ('block_num', 0), ('par_num', 0), ('line_num', 0),
+                       ('left', 0), ('top', 0), ('width', 1000), ('height', 1000), ('conf', '-1')):
+        data[key].append(value)
+    for text, block, paragraph, line, left, top, confidence in words:
+        for key, value in (('level', 5), ('text', text), ('block_num', block), ('par_num', paragraph),
+                           ('line_num', line), ('left', left), ('top', top), ('width', 10 * len(text)),
+                           ('height', 20), ('conf', confidence)):
+            data[key].append(value)
+    return data
+
+
+PAGE_ONE = tesseract_data([
+    ('Counterparty:', 1, 1, 1, 10, 10, '96.2'), ('Acme', 1, 1, 1, 150, 12, '91'),
+    ('Corporatlon', 1, 1, 1, 200, 10, '42.7'),
+    ('Coupon', 1, 1, 2, 10, 40, '95'), ('Rate:', 1, 1, 2, 80, 40, '95'), ('5.25%', 1, 1, 2, 140, 40, '88'),
+    ('Confidential', 2, 1, 1, 10, 90, '99'),
+])
+
+
+def test_words_are_laid_out_like_tesseract_text():
+    text, tokens = tesseract_tokens(PAGE_ONE, page=1)
+
+    assert text == 'Counterparty: Acme Corporatlon\nCoupon Rate: 5.25%\n\nConfidential\n'
+    assert len(tokens) == 7
+    for token, word in zip(tokens.tokens, ['Counterparty:', 'Acme', 'Corporatlon']):
+        assert text[token['start']:token['end']] == word
+    assert tokens.tokens['confidence'].tolist()[:3] == [96, 91, 43]
+
+
+def test_evidence_covers_the_words_of_a_span():
+    text, tokens = tesseract_tokens(PAGE_ONE, page=1)
+    start = text.index('Acme')
+
+    evidence = tokens.evidence(start, start + len('Acme Corporatlon'))
+
+    assert evidence == {'confidence': 43, 'page': 1, 'bbox': [150, 10, 310, 32]}
+    assert tokens.evidence(len(text), len(text) + 5) is None
+
+
+def test_pages_are_concatenated_at_their_text_offsets():
+    first_text, first = tesseract_tokens(PAGE_ONE, page=1)
+    second_text, second = tesseract_tokens(tesseract_data([('Issuer:', 1, 1, 1, 5, 5, '90')]), page=2)
+    offset = len(first_text) + 1
+
+    table = TokenTable.concatenate([(0, first), (offset, None), (offset, second)])
+
+    assert len(table) == 8
+    assert table.evidence(offset, offset + 7)['page'] == 2
+    assert TokenTable.concatenate([(0, None)]) is None
+
+
+def test_serialized_table_round_trips():
+    _, tokens = tesseract_tokens(PAGE_ONE, page=3)
+
+    loaded = TokenTable.from_bytes(tokens.to_bytes())
+
+    assert (loaded.tokens == tokens.tokens).all()
+    assert len(tokens.to_bytes()) == len(b'SWTOK1\n') + 27 * 7
+    assert TokenTable.from_bytes(b'not a token table') is None
+
+
+def test_low_confidence_fields_are_flagged_for_review():
+    text, tokens = tesseract_tokens(PAGE_ONE, page=1)
+
+    fields, evidence = NLPService().analyze_with_evidence(text, tokens)
+
+    assert fields['counterparty'] == 'Acme Corporatlon'
+    assert evidence['counterparty']['confidence'] == 43
+    assert evidence['coupon_rate']['confidence'] == 88
+    service = ValidationService(reference_store=object(), document_store=object(), review_min_confidence=80)
+    review = service.review_fields(evidence)
+    assert review['required']
+    assert [field['field'] for field in review['fields']] == ['counterparty']
+    assert review['fields'][0]['bbox'] == [150, 10, 310, 32]
+
+
+def test_fields_not_ocrd_have_no_confidence():
+    text = 'Counterparty: Acme Corporation\n'
+
+    _, evidence = NLPService().analyze_with_evidence(text)
+
+    assert evidence['counterparty'] == {'span': [14, 30], 'confidence': None, 'page': None, 'bbox': None}
+    service = ValidationService(reference_store=object(), document_store=object())
+    assert not service.review_fields(evidence)['required']
@@ -0,0 +1,86 @@
+import hashlib
+import io
+import pytest
+from services.upload_store import ChunkedUploadStore, UploadNotFoundError, UploadOffsetError, UploadSizeError
+
+DATA = b'0123456789' * 10
+
+
+@pytest.fixture
+def store(tmp_path):
+    return ChunkedUploadStore(str(tmp_path), max_upload_bytes=1000, chunk_max_bytes=40)
+
+
+def test_chunks_are_assembled_in_order(store):
+    upload_id = store.create('sheet.pdf', len(DATA))['upload_id']
+    for offset in range(0, len(DATA), 40):
+        status = store.write_chunk(upload_id, offset, io.BytesIO(DATA[offset:offset + 40]))
+    assert status['complete']
+
+    path, filename, _ = store.finalize(upload_id, hashlib.sha256(DATA).hexdigest())
+
+    assert filename == 'sheet.pdf'
+    assert path.endswith('.pdf')
+    with open(path, 'rb') as f:
+        assert f.read() == DATA
+    with pytest.raises(UploadNotFoundError):
+        store.status(upload_id)
+
+
+def test_chunk_at_wrong_offset_reports_the_current_one(store):
+    upload_id = store.create('sheet.pdf', len(DATA))['upload_id']
+    store.write_chunk(upload_id, 0, io.BytesIO(DATA[:30]))
+
+    for offset in (0, 40):
+        with pytest.raises(UploadOffsetError) as error:
+            store.write_chunk(upload_id, offset, io.BytesIO(DATA[offset:offset + 10]))
+        assert error.value.offset == 30
+    assert store.status(upload_id)['offset'] == 30
+
+
+def test_oversized_chunk_leaves_the_offset_unchanged(store):
+    upload_id = store.create('sheet.pdf', len(DATA))['upload_id']
+    store.write_chunk(upload_id, 0, io.BytesIO(DATA[:30]))
+
+    with pytest.raises(UploadSizeError):
+        store.write_chunk(upload_id, 30, io.BytesIO(DATA[30:71]))
+    assert store.status(upload_id)['offset'] == 30
+
+
+def test_chunk_past_the_declared_size_is_rejected(store):
+    upload_id = store.create('sheet.pdf', 20)['upload_id']
+    with pytest.raises(UploadSizeError):
+        store.write_chunk(upload_id, 0, io.BytesIO(DATA[:21]))
+    assert store.status(upload_id)['offset'] == 0
+
+
+def test_upload_larger_than_the_limit_is_refused(store):
+    with pytest.raises(UploadSizeError):
+        store.create('sheet.pdf', 1001)
+
+
+def test_checksum_mismatch_discards_the_upload(store):
+    upload_id = store.create('sheet.pdf', len(DATA))['upload_id']
+    for offset in range(0, len(DATA), 40):
+        store.write_chunk(upload_id, offset, io.BytesIO(DATA[offset:offset + 40]))
+
+    with pytest.raises(ValueError, match='Checksum mismatch'):
+        store.finalize(upload_id, hashlib.sha256(b'other').hexdigest())
+    with pytest.raises(UploadNotFoundError):
+        store.status(upload_id)
+
+
+def test_incomplete_upload_cannot_be_finalized(store):
+    upload_id = store.create('sheet.pdf', len(DATA), sha256=hashlib.sha256(DATA).hexdigest())['upload_id']
+    store.write_chunk(upload_id, 0, io.BytesIO(DATA[:40]))
+
+    with pytest.raises(ValueError, match='incomplete'):
+        store.finalize(upload_id, None)
+    assert store.status(upload_id)['offset'] == 40
+
+
+def test_unknown_upload_is_not_found(store):
+    with pytest.raises(UploadNotFoundError):
+        store.write_chunk('0' * 32, 0, io.BytesIO(DATA))
+    with pytest.raises(UploadNotFoundError):
+        store.status('../metadata')
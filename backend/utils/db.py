@@ -0,0 +1,28 @@
+import os
+import sqlite3
+
+# How long a connection waits for another process's write lock before
+# raising "database is locked"
+SQLITE_BUSY_TIMEOUT_MS = 5000
+
+
+def connect_sqlite(db_path):
+    """
+    Open a SQLite connection configured for concurrent use by several
+    threads and worker processes
+
+    WAL mode lets readers proceed while a writer commits, and
+    synchronous=NORMAL is durable across application crashes without an
+    fsync on every commit. Callers must serialize use of the returned
+    connection across threads.
+    """
+    directory = os.path.dirname(db_path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+
+    connection = sqlite3.connect(db_path, check_same_thread=False)
+    connection.row_factory = sqlite3.Row
+    connection.execute('PRAGMA journal_mode=WAL')
+    connection.execute('PRAGMA synchronous=NORMAL')
+    connection.execute(f'PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}')
+    return connection
@@ -1,5 +1,15 @@
+import hashlib
 import os
+import shutil
+import tempfile
 import uuid
+import zipfile
+from contextlib import contextmanager
+from utils.metrics import set_document, timed_stage
+
+# Uploads up to this size are processed in memory; larger ones spill over to
+# an anonymous temporary file instead of the upload folder
+UPLOAD_SPOOL_MAX_BYTES = int(os.environ.get('UPLOAD_SPOOL_MAX_MB', 8)) * 1024 * 1024
 
 def allowed_file(filename, allowed_extensions):
     """
@@ -19,7 +29,9 @@ def save_file(file, filename, upload_folder):
     file_path = os.path.join(upload_folder, filename)
     
     # Save the file
-    file.save(file_path)
+    set_document(file_type=os.path.splitext(filename)[1].lower())
+    with timed_stage('upload_save'):
+        file.save(file_path)
     
     return file_path
 
@@ -33,4 +45,112 @@ def generate_unique_filename(original_filename):
     # Generate a unique filename
     unique_name = str(uuid.uuid4()) + ext
     
-    return unique_name 
\ No newline at end of file
+    return unique_name
+
+def file_sha256(file_path):
+    """
+    Compute the SHA-256 hex digest of a file's contents
+    """
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as file:
+        for chunk in iter(lambda: file.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def extract_zip_archive(archive, allowed_extensions, destination_folder, max_total_bytes):
+    """
+    Extract the supported documents of a zip archive into a folder
+
+    Members are written under generated names, so archive paths can never
+    escape the destination folder. Returns a list of (member name, saved
+    path) pairs and a list of (member name, reason) pairs for skipped
+    members. Raises ValueError if the archive would expand beyond
+    max_total_bytes.
+    """
+    os.makedirs(destination_folder, exist_ok=True)
+    extracted = []
+    skipped = []
+
+    with zipfile.ZipFile(archive) as zip_file:
+        members = [member for member in zip_file.infolist() if not member.is_dir()]
+        if sum(member.file_size for member in members) > max_total_bytes:
+            raise ValueError(f"Archive expands beyond {max_total_bytes} bytes")
+
+        for member in members:
+            name = os.path.basename(member.filename)
+            if not allowed_file(name, allowed_extensions):
+                skipped.append((member.filename, 'File type not allowed'))
+                continue
+
+            file_path = os.path.join(destination_folder, generate_unique_filename(name))
+            with zip_file.open(member) as source, open(file_path, 'wb') as target:
+                shutil.copyfileobj(source, target)
+            extracted.append((member.filename, file_path))
+
+    return extracted, skipped
+
+class SpooledUpload:
+    """
+    An uploaded file held in memory, or in an anonymous temporary file once
+    it exceeds max_memory_bytes
+
+    The upload is copied and hashed in a single pass, so extraction, the
+    extraction cache and the document store never need a saved copy. Use
+    open() for a readable binary stream positioned at the start, or
+    as_file() for the few tools that only accept a path.
+    """
+
+    def __init__(self, stream, filename, max_memory_bytes=UPLOAD_SPOOL_MAX_BYTES):
+        self.filename = filename
+        self.extension = os.path.splitext(filename)[1].lower()
+        self.buffer = tempfile.SpooledTemporaryFile(max_size=max_memory_bytes)
+        digest = hashlib.sha256()
+        self.size = 0
+        set_document(file_type=self.extension)
+        with timed_stage('upload_save'):
+            for chunk in iter(lambda: stream.read(1024 * 1024), b''):
+                digest.update(chunk)
+                self.buffer.write(chunk)
+                self.size += len(chunk)
+        self.sha256 = digest.hexdigest()
+
+    @property
+    def in_memory(self):
+        """Whether the upload is still held entirely in memory"""
+        return not self.buffer._rolled
+
+    def open(self):
+        """
+        Return the upload as a binary stream positioned at the start
+        """
+        self.buffer.seek(0)
+        return self.buffer
+
+    def read(self):
+        """
+        Return the upload's bytes
+        """
+        return self.open().read()
+
+    @contextmanager
+    def as_file(self):
+        """
+        Write the upload to a private temporary file for the duration of
+        the block and yield its path
+        """
+        fd, path = tempfile.mkstemp(prefix='sheetwise-upload-', suffix=self.extension)
+        try:
+            with os.fdopen(fd, 'wb') as target:
+                shutil.copyfileobj(self.open(), target)
+            yield path
+        finally:
+            os.remove(path)
+
+    def close(self):
+        self.buffer.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
@@ -0,0 +1,403 @@
+import bisect
+import contextvars
+import os
+import re
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+# Set METRICS_ENABLED=false to stop recording stage timings. Request ids are
+# assigned and logged either way.
+METRICS_ENABLED = os.environ.get('METRICS_ENABLED', 'true').lower() not in ('0', 'false', 'no')
+
+# Header carrying the request id in both directions. A client-supplied id
+# is kept when it is safe to log, otherwise a new one is generated.
+REQUEST_ID_HEADER = 'X-Request-ID'
+_REQUEST_ID = re.compile(r'[A-Za-z0-9._-]{1,64}')
+
+# Histogram bucket upper bounds, in seconds
+REQUEST_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+STAGE_BUCKETS = (0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 2.5, 5, 10, 30, 60)
+RULE_BUCKETS = (0.000001, 0.0000025, 0.000005, 0.00001, 0.000025, 0.00005, 0.0001, 0.001, 0.01)
+
+# Page counts are reported in ranges to keep the number of series bounded
+PAGE_COUNT_RANGES = ((1, '1'), (5, '2-5'), (20, '6-20'), (100, '21-100'))
+
+_request_id = contextvars.ContextVar('sheetwise_request_id', default=None)
+_trace = contextvars.ContextVar('sheetwise_trace', default=None)
+
+
+class Histogram:
+    """
+    Prometheus histogram with a fixed set of label names
+
+    Not thread-safe on its own; MetricsRegistry serializes updates.
+    """
+
+    def __init__(self, name, description, labelnames, buckets):
+        self.name = name
+        self.description = description
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        # Label values -> [per-bucket counts (last one is +Inf), sum, count]
+        self.series = {}
+
+    def observe(self, labels, value):
+        series = self.series.get(labels)
+        if series is None:
+            series = self.series[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+        series[0][bisect.bisect_left(self.buckets, value)] += 1
+        series[1] += value
+        series[2] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} histogram"]
+        for labels, (counts, total, count) in sorted(self.series.items()):
+            label_text = _label_text(self.labelnames, labels)
+            prefix = label_text + ',' if label_text else ''
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + ('+Inf',), counts):
+                cumulative += bucket_count
+                lines.append(f'{self.name}_bucket{{{prefix}le="{bound}"}} {cumulative}')
+            suffix = f'{{{label_text}}}' if label_text else ''
+            lines.append(f"{self.name}_sum{suffix} {total!r}")
+            lines.append(f"{self.name}_count{suffix} {count}")
+        return lines
+
+    def copy_series(self, series):
+        counts, total, count = series
+        return [list(counts), total, count]
+
+    def merge_series(self, labels, series):
+        counts, total, count = series
+        current = self.series.get(labels)
+        if current is None:
+            self.series[labels] = [list(counts), total, count]
+            return
+        current[0] = [a + b for a, b in zip(current[0], counts)]
+        current[1] += total
+        current[2] += count
+
+
+class Counter:
+    """
+    Prometheus counter with a fixed set of label names
+
+    Not thread-safe on its own; MetricsRegistry serializes updates.
+    """
+
+    def __init__(self, name, description, labelnames):
+        self.name = name
+        self.description = description
+        self.labelnames = tuple(labelnames)
+        # Label values -> [total]
+        self.series = {}
+
+    def observe(self, labels, value=1):
+        series = self.series.get(labels)
+        if series is None:
+            series = self.series[labels] = [0]
+        series[0] += value
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} counter"]
+        for labels, (total,) in sorted(self.series.items()):
+            label_text = _label_text(self.labelnames, labels)
+            lines.append(f"{self.name}{{{label_text}}} {total!r}" if label_text else f"{self.name} {total!r}")
+        return lines
+
+    def copy_series(self, series):
+        return list(series)
+
+    def merge_series(self, labels, series):
+        self.observe(labels, series[0])
+
+
+class Gauge:
+    """
+    Prometheus gauge whose values are read from a callback when rendered
+
+    callback returns {label values: value}. A gauge describes the process
+    that renders it, so it is neither collected nor merged.
+    """
+
+    def __init__(self, name, description, labelnames, callback):
+        self.name = name
+        self.description = description
+        self.labelnames = tuple(labelnames)
+        self.callback = callback
+        self.series = {}
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} gauge"]
+        for labels, value in sorted(self.callback().items()):
+            label_text = _label_text(self.labelnames, labels)
+            lines.append(f"{self.name}{{{label_text}}} {value!r}" if label_text else f"{self.name} {value!r}")
+        return lines
+
+
+class MetricsRegistry:
+    """
+    Histograms, counters and gauges of one process, rendered in the
+    Prometheus text format
+    """
+
+    def __init__(self):
+        self.metrics = {}
+        self._lock = threading.Lock()
+
+    def histogram(self, name, description, labelnames=(), buckets=STAGE_BUCKETS):
+        """
+        Register a histogram and return it
+        """
+        return self._register(name, lambda: Histogram(name, description, labelnames, buckets))
+
+    def counter(self, name, description, labelnames=()):
+        """
+        Register a counter and return it
+        """
+        return self._register(name, lambda: Counter(name, description, labelnames))
+
+    def gauge(self, name, description, labelnames, callback):
+        """
+        Register a gauge read from callback, replacing any gauge of that name
+        """
+        with self._lock:
+            self.metrics[name] = Gauge(name, description, labelnames, callback)
+            return self.metrics[name]
+
+    def _register(self, name, factory):
+        with self._lock:
+            if name not in self.metrics:
+                self.metrics[name] = factory()
+            return self.metrics[name]
+
+    def observe(self, metric, labels, value=1):
+        with self._lock:
+            metric.observe(labels, value)
+
+    def observe_many(self, observations):
+        """
+        Record an iterable of (metric, labels, value) under a single lock
+        """
+        with self._lock:
+            for metric, labels, value in observations:
+                metric.observe(labels, value)
+
+    def render(self):
+        """
+        Return every metric in the Prometheus text exposition format
+        """
+        with self._lock:
+            metrics = list(self.metrics.values())
+            lines = []
+            for metric in metrics:
+                if not isinstance(metric, Gauge):
+                    lines.extend(metric.render())
+        # Gauge callbacks take their own locks, so they run outside this one
+        for metric in metrics:
+            if isinstance(metric, Gauge):
+                lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+    def collect(self, reset=False):
+        """
+        Return a picklable copy of every series, optionally clearing them,
+        for merging into another process's registry
+        """
+        with self._lock:
+            state = {name: {labels: metric.copy_series(series) for labels, series in metric.series.items()}
+                     for name, metric in self.metrics.items() if metric.series}
+            if reset:
+                for metric in self.metrics.values():
+                    metric.series.clear()
+        return state
+
+    def merge(self, state):
+        """
+        Add the series returned by another registry's collect()
+        """
+        with self._lock:
+            for name, series in state.items():
+                metric = self.metrics.get(name)
+                if metric is None:
+                    continue
+                for labels, values in series.items():
+                    metric.merge_series(labels, values)
+
+
+_registry = MetricsRegistry()
+
+REQUEST_SECONDS = _registry.histogram(
+    'sheetwise_request_seconds', 'HTTP request latency by route, method and status code',
+    ('endpoint', 'method', 'status'), REQUEST_BUCKETS)
+JOB_SECONDS = _registry.histogram(
+    'sheetwise_job_seconds', 'Asynchronous validation job latency by outcome', ('status',), REQUEST_BUCKETS)
+STAGE_SECONDS = _registry.histogram(
+    'sheetwise_stage_seconds', 'Time spent in each processing stage by file type and page count',
+    ('stage', 'file_type', 'pages'), STAGE_BUCKETS)
+RULE_SECONDS = _registry.histogram(
+    'sheetwise_rule_seconds', 'Time spent evaluating each validation rule', ('rule_id',), RULE_BUCKETS)
+
+
+def get_metrics_registry():
+    """
+    Return the process-wide metrics registry
+    """
+    return _registry
+
+
+def page_count_label(pages):
+    """
+    Return the page count range label of a document, 'none' for formats
+    without pages
+    """
+    if pages is None:
+        return 'none'
+    for limit, label in PAGE_COUNT_RANGES:
+        if pages <= limit:
+            return label
+    return f'{PAGE_COUNT_RANGES[-1][0] + 1}+'
+
+
+class RequestTrace:
+    """
+    Stage timings of one request, turned into histogram observations when
+    the request finishes
+
+    Stages are appended to a list while the request runs, so the hot path
+    takes no locks; the labels (file type, page count) are only known part
+    way through and are applied at the end.
+    """
+
+    __slots__ = ('file_type', 'pages', 'stages', 'rules')
+
+    def __init__(self):
+        self.file_type = 'unknown'
+        self.pages = None
+        self.stages = []
+        self.rules = []
+
+    def observations(self):
+        pages = page_count_label(self.pages)
+        for stage, seconds in self.stages:
+            yield STAGE_SECONDS, (stage, self.file_type, pages), seconds
+        for rule_ids, elapsed in self.rules:
+            for rule_id, seconds in zip(rule_ids, elapsed):
+                yield RULE_SECONDS, (rule_id,), seconds
+
+
+def new_request_id(candidate=None):
+    """
+    Return candidate if it is a usable request id, else a new random one
+    """
+    if candidate and _REQUEST_ID.fullmatch(candidate):
+        return candidate
+    return uuid.uuid4().hex
+
+
+def start_trace(request_id=None):
+    """
+    Make request_id (or a new id) current and start collecting stage
+    timings for it; returns a token for finish_trace()
+    """
+    request_id = new_request_id(request_id)
+    trace = RequestTrace() if METRICS_ENABLED else None
+    return _request_id.set(request_id), _trace.set(trace)
+
+
+def finish_trace(token):
+    """
+    Record the stage timings collected since start_trace() and restore the
+    previous request id
+    """
+    request_token, trace_token = token
+    trace = _trace.get()
+    if trace is not None and (trace.stages or trace.rules):
+        _registry.observe_many(trace.observations())
+    _trace.reset(trace_token)
+    _request_id.reset(request_token)
+
+
+@contextmanager
+def request_trace(request_id=None):
+    """
+    Run the body of a with statement as (part of) the given request, for
+    work that continues outside it on another thread
+    """
+    token = start_trace(request_id)
+    try:
+        yield
+    finally:
+        finish_trace(token)
+
+
+def current_request_id():
+    """
+    Return the id of the request being handled, or None outside a request
+    """
+    return _request_id.get()
+
+
+def record_stage(stage, seconds):
+    """
+    Add a stage timing to the current request, if any
+    """
+    trace = _trace.get()
+    if trace is not None:
+        trace.stages.append((stage, seconds))
+
+
+def record_rule_timings(rule_ids, elapsed):
+    """
+    Add the time spent in each rule of one evaluation to the current request
+    """
+    trace = _trace.get()
+    if trace is not None:
+        trace.rules.append((rule_ids, elapsed))
+
+
+def set_document(file_type=None, pages=None):
+    """
+    Label the current request's stage timings with the document's file type
+    (its extension) and page count
+    """
+    trace = _trace.get()
+    if trace is None:
+        return
+    if file_type is not None:
+        trace.file_type = file_type.lstrip('.') or 'unknown'
+    if pages is not None:
+        trace.pages = pages
+
+
+@contextmanager
+def timed_stage(stage):
+    """
+    Time the body of a with statement as a stage of the current request
+    """
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_stage(stage, time.perf_counter() - started)
+
+
+def log(message):
+    """
+    Print a log line prefixed with the current request id
+    """
+    request_id = _request_id.get()
+    if request_id is None:
+        print(message)
+    else:
+        print(f"[{request_id}] {message}")
+
+
+def _label_text(labelnames, labels):
+    return ','.join(f'{name}="{_escape(value)}"' for name, value in zip(labelnames, labels))
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
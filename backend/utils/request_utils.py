@@ -0,0 +1,33 @@
+from datetime import datetime, timezone
+
+
+def parse_bool_arg(value, default=False):
+    """
+    Interpret a query-string or form value such as 'true', '1' or 'no' as a boolean
+    """
+    if value is None:
+        return default
+    return value.strip().lower() in ('1', 'true', 'yes', 'on')
+
+
+def parse_timestamp_arg(value):
+    """
+    Interpret a query-string timestamp, either epoch seconds or ISO 8601
+    (UTC unless it carries an offset), as epoch seconds
+
+    Raises ValueError if the value is neither.
+    """
+    if value is None or not value.strip():
+        return None
+    value = value.strip()
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    try:
+        parsed = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    except ValueError:
+        raise ValueError(f"Invalid timestamp '{value}'") from None
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed.timestamp()